@@ -1,9 +1,10 @@
-from ultralytics import YOLO
 import cv2
 import gc
 import atexit
 
-from .ocrprocess import OCRProcess
+from .ocrprocess import OCRProcess, OCRBatcher
+from .ocr_cache import OCRResultCache
+from modules.metrics import STAGE_SECONDS
 
 class Detect_License_Plate:
 
@@ -11,23 +12,60 @@ class Detect_License_Plate:
             self, 
             model_path, 
             text_detection_model_dir = None, 
-            text_recognition_model_dir = None 
+            text_recognition_model_dir = None,
+            ocr_batch_size = 8,
+            ocr_max_wait = 0.0,
+            ocr_cache_size = 64,
+            use_gpu = True,
+            detector = None,
+            ocr_engine = None,
+            registry = None
             ):
+        """
+        Args:
+            ocr_batch_size (int): 一批最多辨識幾個車牌 ROI；0 代表不批次，逐框呼叫完整 PaddleOCR
+            ocr_max_wait (float): 跨畫面湊批的最長等待秒數；0 代表只合併同一張畫面的 ROI
+            ocr_cache_size (int): 感知雜湊 OCR 快取的筆數上限；0 代表不使用快取
+            use_gpu (bool): OCR 是否使用 GPU (YOLO 依模型與環境自動選擇)
+            detector / ocr_engine: 直接使用已建立好的模型物件 (介面同 YOLO / PaddleOCR)，
+                                   不從檔案載入；供 benchmark 替換成 stub 或 CPU 後端使用
+            registry (PlateRegistry): 登記車輛名單，OCR 的每個候選修正到最接近的登記車牌；None 代表不使用
+        """
 
         #兩個ai模型
         self._ocr = None
         self._detector = None
+        self._batcher = None
+        self.ocr_cache = None
+        self.registry = registry
+        self._batch_ok = True
+
+        # 統計用
+        self.plates_found = 0
+        self._ocr_time = STAGE_SECONDS.labels("ocr")
 
         print("[Detect_License_Plate]: 正在加載模型 ocr and yolo")
         try:
 
+            self.ocr_cache = OCRResultCache(max_entries=ocr_cache_size) if ocr_cache_size > 0 else None
             self._ocr = OCRProcess(text_detection_model_dir,
-                                   text_recognition_model_dir
+                                   text_recognition_model_dir,
+                                   rec_batch_num=max(1, ocr_batch_size),
+                                   cache=self.ocr_cache,
+                                   use_gpu=use_gpu,
+                                   engine=ocr_engine,
+                                   registry=registry
                                    )
+            if ocr_batch_size > 0:
+                self._batcher = OCRBatcher(self._ocr, ocr_batch_size, ocr_max_wait)
             print("[Detect_License_Plate]: ocr模型成功載入")
             
 
-            self._detector = YOLO(model_path)
+            if detector is not None:
+                self._detector = detector
+            else:
+                from ultralytics import YOLO
+                self._detector = YOLO(model_path)
             print("[Detect_License_Plate]: yolo模型成功載入")
 
         except Exception as e:
@@ -36,48 +74,117 @@ class Detect_License_Plate:
         # 註冊cleanup
         atexit.register(self.cleanup)
 
-    def run(self, frame):
-        # === 修改 1：新增變數儲存最終車牌文字 ===
-        best_plate = None 
-
+    def detect(self, frame):
+        """
+        只執行 YOLO 偵測 (管線模式的第一階段)
+        Returns: [(x1, y1, x2, y2), ...]
+        """
+        boxes = []
         try:
-            # YOLO 偵測
             results = self._detector.predict(source=frame, verbose=False)
-            
             for result in results:
                 for box in result.boxes.xyxy:
-                    x1, y1, x2, y2 = map(int, box)
-                    
-                    # 擷取車牌區域進行 OCR
-                    roi = frame[y1:y2+1, x1:x2+1]
-
-                    # 進行 ocr
-                    if roi.size > 0:
-                        # 呼叫 OCR，同事的 ocrprocess 會回傳一個裝有合法車牌的 list
-                        ocr_results = self._ocr.run(roi)
-                        
-                        # === 修改 2：取出車牌並畫上文字與框線 ===
-                        if ocr_results and len(ocr_results) > 0:
-                            best_plate = ocr_results[0] # 抓取第一筆通過正則驗證的車牌
-                            
-                            # 畫框 (偵測到車牌)
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                            # 畫上辨識出的車牌文字
-                            cv2.putText(frame, best_plate, (x1, y1 - 10), 
-                                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            
-            # === 修改 3：同時回傳影像與車牌文字 ===
+                    boxes.append(tuple(map(int, box)))
+        except Exception as e:
+            print(f"[Detect_License_Plate] YOLO 偵測錯誤: {e}")
+        return boxes
+
+    def detect_batch(self, frames):
+        """
+        多個車道的畫面合併成一次 predict 呼叫
+        TensorRT 引擎需以 batch >= 車道數匯出 (例如 export(format="engine", batch=2))，
+        若模型不支援批次則自動退回逐張偵測
+        Returns: 與 frames 同順序，每個元素為 [(x1, y1, x2, y2), ...]
+        """
+        if len(frames) <= 1 or not self._batch_ok:
+            return [self.detect(frame) for frame in frames]
+        try:
+            results = self._detector.predict(source=list(frames), verbose=False)
+            return [[tuple(map(int, box)) for box in result.boxes.xyxy] for result in results]
+        except Exception as e:
+            print(f"[Detect_License_Plate] 模型不支援批次偵測，改為逐張偵測: {e}")
+            self._batch_ok = False
+            return [self.detect(frame) for frame in frames]
+
+    def recognize(self, frame, boxes):
+        """
+        對每個車牌框擷取 ROI 並執行 OCR (管線模式的第二階段)
+        Returns: [((x1, y1, x2, y2), plate_text), ...] 只包含通過正則驗證的結果
+        """
+        detections = []
+        for box, reads in zip(boxes, self.read_boxes(frame, boxes)):
+            if reads:
+                # 抓取第一筆通過正則驗證的車牌
+                detections.append((box, reads[0][0]))
+        return detections
+
+    def read_boxes(self, frame, boxes):
+        """
+        擷取所有車牌框的 ROI，整批送進 OCR
+        Returns: 與 boxes 同順序，每個元素為 [(plate, score), ...]
+        """
+        rois, index = [], []
+        for i, (x1, y1, x2, y2) in enumerate(boxes):
+            # 擷取車牌區域進行 OCR
+            roi = frame[y1:y2+1, x1:x2+1]
+            if roi.size > 0:
+                rois.append(roi)
+                index.append(i)
+
+        results = [[] for _ in boxes]
+        if not rois:
+            return results
+        try:
+            with self._ocr_time.time():
+                if self._batcher is not None:
+                    reads = self._batcher.run(rois)
+                else:
+                    # 不批次：逐框呼叫完整 PaddleOCR (含文字偵測)
+                    reads = [self._ocr.run_with_scores(roi) for roi in rois]
+        except Exception as e:
+            print(f"[Detect_License_Plate] OCR 執行錯誤: {e}")
+            return results
+
+        for i, r in zip(index, reads):
+            results[i] = r
+            if r:
+                self.plates_found += 1
+        return results
+
+    @staticmethod
+    def draw(frame, detections):
+        """在畫面上畫出車牌框與辨識文字"""
+        for (x1, y1, x2, y2), text in detections:
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(frame, text, (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        return frame
+
+    def run(self, frame):
+        """
+        單執行緒完整流程：偵測 -> OCR -> 畫框
+        Returns: (frame, best_plate)
+        """
+        try:
+            detections = self.recognize(frame, self.detect(frame))
+            self.draw(frame, detections)
+
+            # 與舊版行為一致：以最後一個成功辨識的車牌框為準
+            best_plate = detections[-1][1] if detections else None
             return frame, best_plate
 
         except Exception as e:
             print(f"[Detect_License_Plate] 執行錯誤: {e}")
             # 發生錯誤仍回傳原圖與 None，保證系統不中斷
-            return frame, None 
+            return frame, None
 
- 
     def cleanup(self):
         print("[ALPR] 啟動資源釋放程序...")
         try:
+            if self._batcher is not None:
+                self._batcher.close()
+            if self.registry is not None:
+                self.registry.close()
             # 顯式銷毀大型物件以釋放 TensorRT 與 Paddle 佔用的顯存
             if hasattr(self, '_detector'):
                 del self._detector
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def roi_hash(roi, hash_size=16):
+    """
+    車牌 ROI 的感知雜湊 (difference hash)
+    先正規化為固定大小的灰階影像，再比較相鄰像素亮度，對縮放與整體亮度變化不敏感
+    Returns: int (hash_size * hash_size 位元)
+    """
+    if roi.ndim == 3:
+        roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(roi, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    diff = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(diff).tobytes(), "big")
+
+
+class OCRResultCache:
+    def __init__(self, max_entries=64, ttl=10.0, max_distance=10, hash_size=16):
+        """
+        停在地磅上的車牌畫面幾乎不變，以感知雜湊快取 OCR 結果，命中時完全略過 OCR
+        Args:
+            max_entries (int): 最多保留幾筆 (LRU 淘汰)，記憶體用量固定
+            ttl (float): 每筆結果的有效秒數 (從寫入時起算，命中不會延長)
+            max_distance (int): 雜湊的 Hamming 距離小於等於此值即視為同一張車牌
+            hash_size (int): 雜湊邊長，位元數為 hash_size 的平方
+        """
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+
+        self._entries = OrderedDict()  # hash -> (寫入時間, 結果)
+        self._lock = threading.Lock()
+
+        # 統計用
+        self.hits = 0
+        self.misses = 0
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+
+    def key(self, roi):
+        return roi_hash(roi, self.hash_size)
+
+    def get(self, key, now=None):
+        """
+        查詢快取 (容許 max_distance 以內的差異)
+        Returns: 快取的 OCR 結果，沒有命中則回傳 None
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+
+            match = key if key in self._entries else None
+            if match is None and self.max_distance > 0:
+                best = self.max_distance + 1
+                for cached in self._entries:
+                    distance = bin(cached ^ key).count("1")
+                    if distance < best:
+                        best, match = distance, cached
+
+            if match is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(match)
+            self.hits += 1
+            return self._entries[match][1]
+
+    def put(self, key, results, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._entries[key] = (now, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted_lru += 1
+
+    def _expire(self, now):
+        """刪除過期的結果 (呼叫端需持有鎖)"""
+        expired = [k for k, (ts, _) in self._entries.items() if now - ts > self.ttl]
+        for k in expired:
+            del self._entries[k]
+        self.evicted_ttl += len(expired)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / float(total) if total else 0.0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate(), 3),
+            "evicted_lru": self.evicted_lru,
+            "evicted_ttl": self.evicted_ttl,
+        }
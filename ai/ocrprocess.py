@@ -1,29 +1,59 @@
-from paddleocr import PaddleOCR
+from concurrent.futures import Future
 import os
-import re
+import threading
+import time
+
+from .paddle_batch import BatchRecognizer
+from .plate_rules import PlateValidator
+from .plate_registry import STATUS_LABELS, UNKNOWN
+from modules.metrics import STAGE_SECONDS
 
 class OCRProcess: #回傳陣列，所有通過測試可能是正確的車牌
     def __init__(self, 
                  text_detection_model_dir = None, 
-                 text_recognition_model_dir = None
+                 text_recognition_model_dir = None,
+                 rec_batch_num = 8,
+                 plate_rules_path = None,
+                 cache = None,
+                 use_gpu = True,
+                 engine = None,
+                 registry = None
                  ):
         """
         初始化 OCR，若不傳入路徑則使用預設模型
+        rec_batch_num: 批次辨識時，每次送進辨識模型的影像數量
+        plate_rules_path: 車牌格式規則設定檔，預設為 ai/plate_rules.json
+        cache: OCRResultCache，相似的車牌畫面直接使用快取的 OCR 原始結果 (None 代表不使用快取)
+               快取存的是驗證前的 (文字, 分數)，命中時仍重新驗證，名單或規則重新載入後不會取到舊的修正結果
+        use_gpu: 是否使用 GPU (在沒有 GPU 的電腦上跑 benchmark 時設為 False)
+        engine: 直接使用已建立好的 OCR 引擎 (介面同 PaddleOCR)，不載入模型；供 benchmark 替換後端使用
+        registry: PlateRegistry，每個候選修正到最接近的登記車牌 (None 代表不使用登記名單)
         """
 
+        self._validator = PlateValidator(plate_rules_path)
+        self.registry = registry
+        self._validate_time = STAGE_SECONDS.labels("validate")
+        self.cache = cache
+
+        self._use_angle_cls = True
         common_config = {
             "use_angle_cls": True,             # 建議開啟，處理文字倒置
-            "use_gpu": True,                   # Jetson Nano 必開
+            "use_gpu": use_gpu,                # Jetson Nano 必開
             "lang": "en",                      # 語言設定
             "use_doc_orientation_classify": False,
             "use_doc_unwarping": False,
             "use_textline_orientation": False,
+            "rec_batch_num": rec_batch_num,
         }
 
+        self._ocr = None
         try:
 
+            if engine is not None:
+                self._ocr = engine
             #  判斷是否使用自定義模型路徑
-            if  text_detection_model_dir and  text_recognition_model_dir:
+            elif  text_detection_model_dir and  text_recognition_model_dir:
+                from paddleocr import PaddleOCR
                 print(f"[OCRProcess] 使用自定義模型路徑: \n{text_detection_model_dir}")
                 print(f"{text_detection_model_dir}")
                 self._ocr = PaddleOCR(
@@ -32,82 +62,206 @@ class OCRProcess: #回傳陣列，所有通過測試可能是正確的車牌
                     **common_config
                 )
             else:
+                from paddleocr import PaddleOCR
                 print("[OCRProcess] 使用 PaddleOCR 預設模型")
                 self._ocr = PaddleOCR(**common_config)
         except Exception as e:
             print("[OCRProcess]: 模型載入失敗")
 
+        # 批次辨識用到 PaddleOCR 的內部介面，版本確認與格式檢查都在 BatchRecognizer
+        self._batch = BatchRecognizer.from_engine(self._ocr, self._use_angle_cls)
+
     """
     過濾雜訊，回傳符合台灣車牌格式的字串與規則名稱
+    規則由 ai/plate_rules.json 載入並編譯 (見 PlateValidator)
+    有登記名單時先修正到最接近的登記車牌，登記車牌即使不符合任何格式規則也接受
     Returns: (is_valid, clean_text, rule_name)
     """
     def _validate_license_plate(self, raw_text):
+        t0 = time.perf_counter()
+        result = self._validator.validate(raw_text)
+        if self.registry is not None and result[1]:
+            plate, status, _ = self.registry.lookup(result[1])
+            if status != UNKNOWN:
+                result = (True, plate, STATUS_LABELS[status])
+        self._validate_time.observe(time.perf_counter() - t0)
+        return result
 
-        if not raw_text or str(raw_text).strip() == "": 
-            return False, "", ""
-
-        # 1. 先轉大寫並去除所有非英數符號 (包含空格與連字號)
-        clean_text = re.sub(r'[^A-Z0-9]', '', raw_text.upper())
-
-        # 2. 處理 I -> 1 與 O -> 0 的轉換
-        clean_text = clean_text.replace('I', '1').replace('O', '0')
-
-        if not clean_text: 
-            return False, "", "不含任何英數內容"
-    
-        # 2. 定義台灣常見車牌格式與名稱 (整合同事的標註邏輯)
-        rules = [
-            # --- 汽車類 ---
-            (r'^[0-9]{3}[A-Z]{2}$', "舊式汽車 (123-AB)"),
-            (r'^[A-Z]{2}[0-9]{3}$', "舊式汽車 (AB-123)"), # 補上 AB-123 格式
-            (r'^[A-Z]{3}[0-9]{4}$', "新式汽車/租賃車 (ABC-1234)"),
-
-            # --- 租賃車與特殊編碼 (如 393-R5) ---
-            (r'^[0-9]{3}[A-Z]{1}[0-9]{1}$', "舊式租賃/身障車 (123-A-1)"), # 393-R-5 變體
-            (r'^[0-9]{3}[A-Z]{2}$', "舊式租賃車 (123-RR)"), 
-            (r'^[A-Z]{1}[0-9]{1}[A-Z]{1}[0-9]{2}$', "身障車 (A1-B2)"), # 補上身障專用車
-            (r'^[0-9]{3}[A-Z]{2}$', "舊式汽車 (123-AB)"), 
-            (r'^[0-9]{2}[A-Z]{2}$', "舊式汽車 (12-AB)"), # 極早期
-
-            # --- 機車類 ---
-            (r'^[A-Z]{3}[0-9]{3}$', "舊式重機/普通機車 (ABC-123)"),
-            (r'^[0-9]{3}[A-Z]{3}$', "舊式機車反向 (123-ABC)"), # 補上機車反向編碼
-            (r'^[A-Z]{2}[0-9]{2}$', "舊式輕型機車 (AB-12)"),
-            (r'^[A-Z]{3}[0-9]{4}$', "新式機車 (ABC-1234)"),
-
-            # --- 電動車與特殊格式 ---
-            (r'^[0-9]{2}[A-Z]{1}[0-9]{1}$', "電動車/特殊格式 (22-A-1)"),
-            (r'^[E]{1}[A-Z]{1}[0-9]{4}$', "電動汽車 (EA-1234)"), # 補上 E 開頭電動車
-            (r'^[0-9]{4}[A-Z]{2}$', "電動機車 (1234-AB)"), # 補上電動機車 (如 1234-EM)
-
-            # --- 營業車/計程車 ---
-            (r'^[A-Z]{2}[0-9]{3,4}$', "營業/計程車 (AB-1234)"),
-            (r'^[0-9]{3}[A-Z]{2}$', "營業車 (123-AB)"),
-        ]
-
-        # 3. 比對規則
-        for pattern, label in rules:
-            if re.match(pattern, clean_text):
-                return True, clean_text, label
-    
-        return False, clean_text, "Unknown"
+    def _validate_reads(self, reads):
+        """
+        驗證 OCR 原始結果
+        Args: reads: [(text, score), ...]
+        Returns: [(plate, score), ...] 只包含通過驗證的結果
+        """
+        store_plate = []
+        for text, score in reads:
+            unfail, plate, _ = self._validate_license_plate(text)
+            if unfail:
+                store_plate.append((plate, score))
+        return store_plate
 
     def run(self, frame):
         """
         執行辨識的方法
         """
+        return [plate for plate, _ in self.run_with_scores(frame)]
+
+    def run_with_scores(self, frame):
+        """
+        與 run 相同，但連同 OCR 信心分數一起回傳
+        Returns: [(plate, score), ...]
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(frame)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return self._validate_reads(cached)
+
         result = self._ocr.ocr(frame, cls=True)
 
-        store_plate = []
-        if result and result[0]:
-            for line in result[0]:
-                # line[1][0] 就是辨識出的文字字串
-                text = line[1][0] 
-                unfail, plate, _ = self._validate_license_plate(text)
-                if unfail:
-                    store_plate.append(plate)
-        
-        return store_plate
+        # line[1][0] 是辨識出的文字字串，line[1][1] 是信心分數
+        reads = [(line[1][0], float(line[1][1])) for line in result[0]] if result and result[0] else []
+        if key is not None:
+            self.cache.put(key, reads)
+        return self._validate_reads(reads)
+
+    def run_batch(self, rois):
+        """
+        一次辨識多個車牌 ROI
+        YOLO 裁出的車牌框本身就是單行文字，因此略過文字偵測，
+        直接把所有 ROI 一起送進方向分類與文字辨識模型
+        Returns: 與 rois 同順序，每個元素為 [(plate, score), ...]
+        """
+        if not rois:
+            return []
+
+        if self._batch is None:
+            # 不支援批次的 PaddleOCR 版本，退回逐張辨識
+            return [self.run_with_scores(roi) for roi in rois]
+
+        # 先查快取，只把沒命中的 ROI 送進模型
+        reads = [None] * len(rois)
+        keys = [None] * len(rois)
+        if self.cache is not None:
+            for i, roi in enumerate(rois):
+                keys[i] = self.cache.key(roi)
+                reads[i] = self.cache.get(keys[i])
+        missing = [i for i, r in enumerate(reads) if r is None]
+        if not missing:
+            return [self._validate_reads(r) for r in reads]
+
+        try:
+            rec_res = self._batch([rois[i] for i in missing])
+        except ValueError as e:
+            print(f"{e}，之後改為逐張辨識")
+            self._batch = None
+            return [self.run_with_scores(roi) for roi in rois]
+
+        for i, (text, score) in zip(missing, rec_res):
+            reads[i] = [(text, score)]
+            if keys[i] is not None:
+                self.cache.put(keys[i], reads[i])
+        return [self._validate_reads(r) for r in reads]
+
+
+class OCRBatcher:
+    def __init__(self, ocr, max_batch=8, max_wait=0.0):
+        """
+        OCR 批次收集器：把多個畫面 (或多條執行緒) 的 ROI 湊成一批再辨識
+        Args:
+            ocr: OCRProcess
+            max_batch (int): 一批最多幾個 ROI，湊滿立即送出
+            max_wait (float): 第一個 ROI 進來後最多等幾秒湊批；0 代表不跨畫面等待，
+                              只合併同一張畫面的 ROI (不額外開執行緒)
+        """
+        self._ocr = ocr
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max_wait
+
+        # 統計用
+        self.batches = 0
+        self.rois = 0
+
+        self._pending = []  # [(rois, future), ...]
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        if self.max_wait > 0:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def submit(self, rois):
+        """
+        送出一組 ROI
+        Returns: Future，結果為與 rois 同順序的 [[(plate, score), ...], ...]
+        """
+        future = Future()
+        if not rois:
+            future.set_result([])
+            return future
+
+        if self._thread is not None:
+            with self._cond:
+                if not self._closed:
+                    self._pending.append((list(rois), future))
+                    self._cond.notify()
+                    return future
+
+        # 不跨畫面湊批，或已經 close (背景執行緒已結束)：直接在呼叫端執行
+        self._execute([(list(rois), future)])
+        return future
+
+    def run(self, rois):
+        """送出並等待結果"""
+        return self.submit(rois).result()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+
+                # 第一筆進來後，等到湊滿 max_batch 或超過 max_wait
+                deadline = time.monotonic() + self.max_wait
+                while sum(len(r) for r, _ in self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                # 依序取出請求，直到達到 max_batch (單一請求不拆開)
+                batch, count = [], 0
+                while self._pending and (not batch or count + len(self._pending[0][0]) <= self.max_batch):
+                    item = self._pending.pop(0)
+                    batch.append(item)
+                    count += len(item[0])
+
+            self._execute(batch)
+
+    def _execute(self, batch):
+        """執行一批辨識並把結果分送回各自的 Future"""
+        all_rois = [roi for rois, _ in batch for roi in rois]
+        try:
+            results = self._ocr.run_batch(all_rois)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.rois += len(all_rois)
+        offset = 0
+        for rois, future in batch:
+            future.set_result(results[offset:offset + len(rois)])
+            offset += len(rois)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
 
 # 使用範例
 if __name__ == "__main__":
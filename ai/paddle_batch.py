@@ -0,0 +1,66 @@
+from importlib import metadata
+
+# 已確認 text_classifier / text_recognizer 介面的 PaddleOCR 版本 (requirements.txt 鎖定 paddleocr==2.7.3)
+# 升級 PaddleOCR 前先以 python -m pytest tests/test_ocrprocess.py 與實機確認，再加入這裡
+SUPPORTED_PADDLEOCR = ("2.6.", "2.7.")
+
+
+def paddleocr_version():
+    try:
+        return metadata.version("paddleocr")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+class BatchRecognizer:
+    """
+    略過文字偵測、直接批次辨識車牌 ROI 的轉接層
+    PaddleOCR 2.6 / 2.7 的 PaddleOCR 物件 (predict_system.TextSystem) 內部有：
+        text_classifier(img_list) -> (img_list, cls_res, elapse)   方向分類 (use_angle_cls 時才有)
+        text_recognizer(img_list) -> (rec_res, elapse)             rec_res 為 [(text, score), ...]
+    這兩個不是公開 API，所有對它們的假設都集中在這裡：
+    版本不在 SUPPORTED_PADDLEOCR 時不使用 (from_engine 回傳 None)，回傳格式不符時拋出 ValueError，
+    由 OCRProcess 退回逐張呼叫公開的 ocr()
+    """
+
+    def __init__(self, recognizer, classifier=None):
+        self._recognizer = recognizer
+        self._classifier = classifier
+
+    @classmethod
+    def from_engine(cls, engine, use_angle_cls=True):
+        """
+        engine: PaddleOCR 物件，或介面相同的替代品 (benchmark 的 stub)
+        Returns: BatchRecognizer，不支援批次時回傳 None
+        """
+        recognizer = getattr(engine, "text_recognizer", None)
+        if recognizer is None:
+            return None
+        if type(engine).__module__.split(".")[0] == "paddleocr":
+            version = paddleocr_version()
+            if version is None or not version.startswith(SUPPORTED_PADDLEOCR):
+                print(f"[OCRProcess] PaddleOCR {version} 的批次辨識介面未經確認 "
+                      f"(支援 {', '.join(v + 'x' for v in SUPPORTED_PADDLEOCR)})，改為逐張辨識")
+                return None
+        classifier = getattr(engine, "text_classifier", None) if use_angle_cls else None
+        return cls(recognizer, classifier)
+
+    @staticmethod
+    def _unpack(output, fields, count, name):
+        if not isinstance(output, (tuple, list)) or len(output) != fields or len(output[0]) != count:
+            raise ValueError(f"[OCRProcess] {name} 的回傳格式不符 (PaddleOCR 版本變更?)")
+        return output[0]
+
+    def __call__(self, rois):
+        """
+        Returns: 與 rois 同順序的 [(text, score), ...]
+        Raises: ValueError 回傳格式與預期不同
+        """
+        img_list = list(rois)
+        if self._classifier is not None:
+            img_list = self._unpack(self._classifier(img_list), 3, len(rois), "text_classifier")
+        rec_res = self._unpack(self._recognizer(img_list), 2, len(rois), "text_recognizer")
+        try:
+            return [(str(text), float(score)) for text, score in rec_res]
+        except (TypeError, ValueError):
+            raise ValueError("[OCRProcess] text_recognizer 的回傳格式不符 (PaddleOCR 版本變更?)")
@@ -0,0 +1,294 @@
+import csv
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from .plate_rules import DEFAULT_RULES_PATH
+
+_NON_ALNUM = re.compile(r'[^A-Z0-9]')
+
+# 比對結果
+REGISTERED = "registered"   # OCR 結果本身就是登記車牌
+SNAPPED = "snapped"         # 修正到最接近的登記車牌
+UNKNOWN = "unknown"         # 不在名單內 (或有兩個以上同樣接近的登記車牌，不猜)
+
+# 寫入紀錄的車牌狀態 (plate_status 欄位)
+STATUS_LABELS = {
+    REGISTERED: "登記車輛",
+    SNAPPED: "校正為登記車輛",
+    UNKNOWN: "未登記車輛",
+}
+
+
+def _deletes(key, depth):
+    """刪除 0 ~ depth 個字元的所有變形 (含原字串)"""
+    variants = {key}
+    frontier = {key}
+    for _ in range(depth):
+        frontier = {s[:i] + s[i + 1:] for s in frontier for i in range(len(s))}
+        variants |= frontier
+    return variants
+
+
+def load_confusions(rules_path=None):
+    """由車牌規則檔的 confusions 取出易混淆字元對 (雙向)"""
+    with open(rules_path or DEFAULT_RULES_PATH, encoding="utf-8") as f:
+        confusions = json.load(f).get("confusions", {})
+    pairs = set()
+    for table in ("digit", "letter"):
+        for a, b in confusions.get(table, {}).items():
+            if len(a) == 1 and len(b) == 1:
+                pairs.add((a, b))
+                pairs.add((b, a))
+    return frozenset(pairs)
+
+
+def weighted_distance(a, b, confusions, confusion_cost, limit):
+    """
+    加權編輯距離：易混淆字元的替換成本為 confusion_cost，其餘替換、插入、刪除為 1
+    超過 limit 時提早結束並回傳 limit 以上的值
+    """
+    prev = [float(j) for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        cur = [float(i)] + [0.0] * len(b)
+        best = cur[0]
+        for j, cb in enumerate(b, 1):
+            if ca == cb:
+                sub = 0.0
+            elif (ca, cb) in confusions:
+                sub = confusion_cost
+            else:
+                sub = 1.0
+            cost = min(prev[j - 1] + sub, prev[j] + 1.0, cur[j - 1] + 1.0)
+            cur[j] = cost
+            if cost < best:
+                best = cost
+        if best > limit:
+            return best
+        prev = cur
+    return prev[-1]
+
+
+class _Index:
+    """一份名單的預先計算索引 (重新載入時整份換掉，查詢中的執行緒不受影響)"""
+
+    def __init__(self, plates, depth):
+        self.plates = frozenset(plates)
+        self.depth = depth
+        # 刪除字元變形 -> 登記車牌 (symmetric delete)：
+        # 編輯距離 d 以內的兩個字串，各自刪除最多 d 個字元後必有相同的變形
+        self.variants = {}
+        for plate in self.plates:
+            for v in _deletes(plate, depth):
+                entry = self.variants.get(v)
+                if entry is None:
+                    self.variants[v] = plate
+                elif isinstance(entry, str):
+                    if entry != plate:
+                        self.variants[v] = [entry, plate]
+                else:
+                    entry.append(plate)
+
+    def candidates(self, key):
+        found = set()
+        for v in _deletes(key, self.depth):
+            entry = self.variants.get(v)
+            if entry is None:
+                continue
+            if isinstance(entry, str):
+                found.add(entry)
+            else:
+                found.update(entry)
+        return found
+
+
+class PlateRegistry:
+    def __init__(self, path, max_distance=1, max_cost=1.0, confusion_cost=0.4, rules_path=None,
+                 reload_interval=5.0):
+        """
+        登記車輛名單：把 OCR 的每個候選修正到最接近的登記車牌
+        名單檔每行一個車牌 (# 開頭為註解)，或第一欄為車牌的 CSV；"-" 與空白不影響比對
+        Args:
+            path: 名單檔路徑
+            max_distance (int): 最多差幾個字 (替換、漏字、多字) 仍視為同一台車，決定索引的大小
+            max_cost (float): 加權後的成本上限；易混淆字元 (plate_rules.json 的 confusions，
+                              例如 8/B、0/D) 的替換成本為 confusion_cost，其他編輯為 1
+            confusion_cost (float): 易混淆字元的替換成本
+            rules_path: 車牌規則檔 (取 confusions)，預設為 ai/plate_rules.json
+            reload_interval (float): 每隔幾秒檢查名單檔是否變更並重新載入；None 或 0 代表不自動重新載入
+        """
+        self.path = path
+        self.max_distance = max(0, int(max_distance))
+        self.max_cost = max_cost
+        self.confusion_cost = confusion_cost
+        self._confusions = load_confusions(rules_path)
+
+        # 統計用
+        self.counts = {REGISTERED: 0, SNAPPED: 0, UNKNOWN: 0}
+        self.ambiguous = 0
+        self.reloads = 0
+
+        # 最近輸出的登記車牌是否曾被直接讀到 (供寫入紀錄時標記狀態，見 settle)
+        self._outcomes = OrderedDict()
+        self._outcome_lock = threading.Lock()
+
+        self._index = _Index((), self.max_distance)
+        self._mtime = None
+        self.reload()
+
+        self._stop = threading.Event()
+        self._thread = None
+        if reload_interval:
+            self._thread = threading.Thread(target=self._watch, args=(reload_interval,), daemon=True)
+            self._thread.start()
+
+    # ========================
+    # 載入
+    # ========================
+    @staticmethod
+    def read_plates(path):
+        plates = set()
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for row in csv.reader(f):
+                if not row or row[0].lstrip().startswith("#"):
+                    continue
+                key = _NON_ALNUM.sub("", row[0].upper())
+                if key:
+                    plates.add(key)
+        return plates
+
+    def reload(self):
+        """
+        重新讀取名單並建立新索引，建好後才替換 (查詢不必等待)
+        讀取失敗時保留原本的名單
+        Returns: 是否成功載入
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+            t0 = time.perf_counter()
+            index = _Index(self.read_plates(self.path), self.max_distance)
+        except (OSError, csv.Error, UnicodeDecodeError) as e:
+            print(f"[PlateRegistry] 無法載入登記車輛名單 {self.path}: {e}")
+            return False
+        self._index = index
+        self._mtime = mtime
+        self.reloads += 1
+        print(f"[PlateRegistry] 已載入 {len(index.plates)} 台登記車輛 "
+              f"({time.perf_counter() - t0:.2f}s, 索引 {len(index.variants)} 筆): {self.path}")
+        return True
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                continue
+            if mtime != self._mtime:
+                self.reload()
+
+    # ========================
+    # 查詢
+    # ========================
+    def lookup(self, text):
+        """
+        Returns: (車牌, 狀態, 成本)
+                 狀態為 REGISTERED / SNAPPED 時車牌為登記的車牌，UNKNOWN 時為原本的文字
+        """
+        index = self._index
+        key = _NON_ALNUM.sub("", str(text).upper())
+        if key in index.plates:
+            return self._count(key, REGISTERED, 0.0)
+        if not key or self.max_distance == 0:
+            return self._count(key, UNKNOWN, None)
+
+        best, best_cost, tie = None, None, False
+        for plate in index.candidates(key):
+            cost = weighted_distance(key, plate, self._confusions, self.confusion_cost, self.max_cost)
+            if cost > self.max_cost:
+                continue
+            if best_cost is None or cost < best_cost:
+                best, best_cost, tie = plate, cost, False
+            elif cost == best_cost:
+                tie = True
+        if best is None:
+            return self._count(key, UNKNOWN, None)
+        if tie:
+            # 兩台登記車輛一樣接近，無從判斷
+            self.ambiguous += 1
+            return self._count(key, UNKNOWN, None)
+        return self._count(best, SNAPPED, best_cost)
+
+    def _count(self, plate, status, cost):
+        self.counts[status] += 1
+        if status != UNKNOWN:
+            with self._outcome_lock:
+                exact, snapped = self._outcomes.pop(plate, (0, 0))
+                self._outcomes[plate] = (exact + (status == REGISTERED), snapped + (status == SNAPPED))
+                if len(self._outcomes) > 1024:
+                    self._outcomes.popitem(last=False)
+        return plate, status, cost
+
+    def settle(self, plate):
+        """
+        寫入紀錄時決定車牌狀態，並清除該車牌累積的查詢結果
+        投票後的車牌只要有一次是直接讀到的就算 REGISTERED；全部都是修正來的為 SNAPPED
+        """
+        key = _NON_ALNUM.sub("", str(plate).upper())
+        with self._outcome_lock:
+            exact, snapped = self._outcomes.pop(key, (0, 0))
+        if key not in self._index.plates:
+            return UNKNOWN
+        return SNAPPED if snapped and not exact else REGISTERED
+
+    def __len__(self):
+        return len(self._index.plates)
+
+    def __contains__(self, plate):
+        return _NON_ALNUM.sub("", str(plate).upper()) in self._index.plates
+
+    def stats(self):
+        return {
+            "plates": len(self._index.plates),
+            "reloads": self.reloads,
+            "ambiguous": self.ambiguous,
+            **self.counts,
+        }
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+
+# 微基準測試
+if __name__ == "__main__":
+    import random
+    import string
+    import tempfile
+
+    rng = random.Random(0)
+    letters = "ABCDEFGHJKLMNPQRSTUVWXYZ"
+    plates = {"".join(rng.choice(letters) for _ in range(3)) + "".join(rng.choice(string.digits) for _ in range(4))
+              for _ in range(30000)}
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("\n".join(sorted(plates)))
+    registry = PlateRegistry(f.name, reload_interval=None)
+
+    sample = rng.sample(sorted(plates), 2000)
+    queries = []
+    for plate in sample:
+        chars = list(plate)
+        pos = rng.randrange(len(chars))
+        chars[pos] = {"8": "B", "0": "D", "5": "S"}.get(chars[pos], rng.choice(string.digits))
+        queries.append("".join(chars))
+    queries += ["XYZ9999", "HELLO", "8BC-1234"]
+
+    t0 = time.perf_counter()
+    for q in queries:
+        registry.lookup(q)
+    per_call = (time.perf_counter() - t0) / len(queries) * 1e6
+    print(f"[PlateRegistry] {per_call:.1f} us / 查詢，統計: {registry.stats()}")
+    os.unlink(f.name)
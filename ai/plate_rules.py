@@ -0,0 +1,157 @@
+import json
+import os
+import re
+from collections import Counter
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plate_rules.json")
+
+# 去除所有非英數符號 (包含空格與連字號)
+_NON_ALNUM = re.compile(r'[^A-Z0-9]')
+_DIGITS = frozenset("0123456789")
+
+
+class PlateValidator:
+    def __init__(self, rules_path=None):
+        """
+        資料驅動的車牌格式驗證器
+        所有規則編譯成單一個正則 (具名群組的 alternation)，一次比對即可知道命中哪條規則；
+        比對失敗時依格式遮罩做「位置相關」的易混淆字元修正 (8/B、5/S、2/Z、0/D ...)
+        Args:
+            rules_path: 規則設定檔 (JSON)，預設為 ai/plate_rules.json
+        """
+        self.rules_path = rules_path or DEFAULT_RULES_PATH
+        with open(self.rules_path, encoding="utf-8") as f:
+            config = json.load(f)
+
+        self.letters = frozenset(config.get("letter_class", "ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+        self.rules = [(rule["name"], rule["mask"]) for rule in config["rules"]]
+        confusions = config.get("confusions", {})
+        self._to_digit = {k: v for k, v in confusions.get("digit", {}).items() if len(k) == 1}
+        self._to_letter = {k: v for k, v in confusions.get("letter", {}).items() if len(k) == 1}
+
+        letter_class = "[" + "".join(sorted(self.letters)) + "]"
+        parts = []
+        for idx, (_, mask) in enumerate(self.rules):
+            pattern = "".join("[0-9]" if c == "#" else letter_class if c == "@" else re.escape(c)
+                              for c in mask)
+            parts.append(f"(?P<r{idx}>{pattern})")
+        # 依規則順序嘗試，fullmatch 會回溯到第一條能完整比對的規則
+        self._compiled = re.compile("|".join(parts))
+
+        # 修正用：依長度分組的遮罩 (保持規則優先順序)
+        self._masks_by_len = {}
+        for idx, (_, mask) in enumerate(self.rules):
+            self._masks_by_len.setdefault(len(mask), []).append((idx, mask))
+
+        # 統計用：每條規則命中次數
+        self.hits = Counter()
+        self.corrected = 0
+        self.rejected = 0
+
+    def match(self, text):
+        """
+        Returns: 命中的規則索引，沒有則回傳 None
+        """
+        m = self._compiled.fullmatch(text)
+        if m is None:
+            return None
+        return int(m.lastgroup[1:])
+
+    def _correct(self, text):
+        """
+        依長度相同的遮罩逐位修正易混淆字元，取修正字元數最少的候選 (同分取規則優先者)
+        Returns: (修正後字串, 規則索引) 或 (None, None)
+        """
+        best = None
+        for idx, mask in self._masks_by_len.get(len(text), ()):
+            chars = []
+            cost = 0
+            for c, slot in zip(text, mask):
+                if slot == "#":
+                    if c not in _DIGITS:
+                        c = self._to_digit.get(c)
+                        cost += 1
+                elif slot == "@":
+                    if c not in self.letters:
+                        c = self._to_letter.get(c)
+                        cost += 1
+                elif c != slot:
+                    c = None
+                if c is None:
+                    break
+                chars.append(c)
+            else:
+                if best is None or cost < best[0]:
+                    best = (cost, "".join(chars), idx)
+        if best is None:
+            return None, None
+        return best[1], best[2]
+
+    def validate(self, raw_text):
+        """
+        過濾雜訊，回傳符合台灣車牌格式的字串與規則名稱
+        Returns: (is_valid, clean_text, rule_name)
+        """
+        if not raw_text or str(raw_text).strip() == "":
+            return False, "", ""
+
+        # 1. 先轉大寫並去除所有非英數符號
+        clean_text = _NON_ALNUM.sub('', str(raw_text).upper())
+        if not clean_text:
+            return False, "", "不含任何英數內容"
+
+        # 2. 一次比對所有規則
+        idx = self.match(clean_text)
+        if idx is None:
+            # 3. 依格式遮罩修正易混淆字元 (含舊版的 I -> 1、O -> 0)
+            corrected, idx = self._correct(clean_text)
+            if idx is None:
+                self.rejected += 1
+                return False, clean_text, "Unknown"
+            clean_text = corrected
+            self.corrected += 1
+
+        name = self.rules[idx][0]
+        self.hits[name] += 1
+        return True, clean_text, name
+
+    def stats(self):
+        return {
+            "hits": dict(self.hits),
+            "corrected": self.corrected,
+            "rejected": self.rejected,
+        }
+
+
+# 單元測試 + 微基準測試
+if __name__ == "__main__":
+    import timeit
+
+    validator = PlateValidator()
+    samples = ["ABC-1234", "abc 1234", "8BC-1234", "ABC-12S4", "123-AB", "EA-1234",
+               "1234-EM", "AB1234", "ABC1O34", "HELLO", "12", "", "###", "A1B23", "393R5"]
+    for s in samples:
+        print(f"{s!r:>12} -> {validator.validate(s)}")
+
+    # 舊版：逐條 re.match，只做全域 I->1、O->0
+    legacy_rules = [r'^[0-9]{3}[A-Z]{2}$', r'^[A-Z]{2}[0-9]{3}$', r'^[A-Z]{3}[0-9]{4}$',
+                    r'^[0-9]{3}[A-Z]{1}[0-9]{1}$', r'^[0-9]{3}[A-Z]{2}$',
+                    r'^[A-Z]{1}[0-9]{1}[A-Z]{1}[0-9]{2}$', r'^[0-9]{3}[A-Z]{2}$',
+                    r'^[0-9]{2}[A-Z]{2}$', r'^[A-Z]{3}[0-9]{3}$', r'^[0-9]{3}[A-Z]{3}$',
+                    r'^[A-Z]{2}[0-9]{2}$', r'^[A-Z]{3}[0-9]{4}$', r'^[0-9]{2}[A-Z]{1}[0-9]{1}$',
+                    r'^[E]{1}[A-Z]{1}[0-9]{4}$', r'^[0-9]{4}[A-Z]{2}$', r'^[A-Z]{2}[0-9]{3,4}$',
+                    r'^[0-9]{3}[A-Z]{2}$']
+
+    def legacy_validate(raw_text):
+        clean = re.sub(r'[^A-Z0-9]', '', raw_text.upper()).replace('I', '1').replace('O', '0')
+        for pattern in legacy_rules:
+            if re.match(pattern, clean):
+                return True
+        return False
+
+    n = 20000
+    for label, func in (("舊版逐條比對", legacy_validate), ("編譯規則引擎", validator.validate)):
+        elapsed = timeit.timeit(lambda: [func(s) for s in samples], number=n // len(samples))
+        per_call = elapsed / (n // len(samples) * len(samples)) * 1e6
+        print(f"[PlateValidator] {label}: {per_call:.2f} us / 字串")
+    print(f"[PlateValidator] 規則命中統計: {validator.stats()}")
@@ -0,0 +1,226 @@
+import time
+from collections import Counter
+
+
+def box_iou(a, b):
+    """兩個 (x1, y1, x2, y2) 框的 IoU"""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+def box_center_distance(a, b):
+    """中心點距離，以 a 框的對角線長度正規化"""
+    ax, ay = (a[0] + a[2]) / 2.0, (a[1] + a[3]) / 2.0
+    bx, by = (b[0] + b[2]) / 2.0, (b[1] + b[3]) / 2.0
+    diag = max(1.0, ((a[2] - a[0]) ** 2 + (a[3] - a[1]) ** 2) ** 0.5)
+    return ((ax - bx) ** 2 + (ay - by) ** 2) ** 0.5 / diag
+
+
+class PlateTrack:
+    def __init__(self, track_id, box, now):
+        """
+        單一車牌的追蹤狀態：跨多張畫面累積每個字元位置的投票
+        """
+        self.track_id = track_id
+        self.box = box
+        self.first_seen = now
+        self.last_seen = now
+        self.misses = 0
+
+        # 依字串長度分組，每個位置一個 Counter (權重為 OCR 信心分數)
+        self._votes = {}
+        self._length_votes = Counter()
+        self.reads = 0
+        self.ocr_calls = 0
+
+        # 證據畫面：保留信心分數最高那次的畫面與框
+        self.best_score = -1.0
+        self.best_frame = None
+        self.best_box = box
+
+        self.emitted = False
+
+    def add_read(self, text, score=1.0, frame=None):
+        """加入一次 OCR 結果"""
+        if not text:
+            return
+        n = len(text)
+        positions = self._votes.setdefault(n, [Counter() for _ in range(n)])
+        for i, ch in enumerate(text):
+            positions[i][ch] += score
+        self._length_votes[n] += score
+        self.reads += 1
+
+        if frame is not None and score > self.best_score:
+            self.best_score = score
+            # 複製一份，避免之後的畫面覆寫證據
+            self.best_frame = frame.copy()
+            self.best_box = self.box
+
+    def consensus(self):
+        """
+        Returns: (車牌文字, 信心度 0~1)
+        信心度取各字元位置中「最高票佔比」的最小值
+        """
+        if not self._length_votes:
+            return None, 0.0
+        n = self._length_votes.most_common(1)[0][0]
+        chars = []
+        confidence = 1.0
+        for counter in self._votes[n]:
+            ch, top = counter.most_common(1)[0]
+            chars.append(ch)
+            confidence = min(confidence, top / float(sum(counter.values())))
+        # 長度本身的共識也算進去
+        confidence *= self._length_votes[n] / float(sum(self._length_votes.values()))
+        return "".join(chars), confidence
+
+    @property
+    def text(self):
+        return self.consensus()[0]
+
+
+class PlateTracker:
+    def __init__(self, iou_threshold=0.3, max_center_distance=0.5, max_misses=15,
+                 min_reads=3, min_confidence=0.7, max_ocr_calls=10, repeat_cooldown=30.0):
+        """
+        輕量 IoU / 中心點追蹤器，取代單一 last_plate 的 3 秒防抖
+        Args:
+            iou_threshold: IoU 大於此值視為同一個車牌
+            max_center_distance: IoU 不足時，中心點距離 (以框對角線正規化) 小於此值仍視為同一個
+            max_misses: 連續幾張畫面沒看到就視為離開
+            min_reads: 至少幾次有效 OCR 才能判定穩定
+            min_confidence: 投票信心度門檻
+            max_ocr_calls: 每個 track 最多呼叫幾次 OCR
+            repeat_cooldown: 同一個車牌在幾秒內不重複輸出紀錄
+        """
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance
+        self.max_misses = max_misses
+        self.min_reads = min_reads
+        self.min_confidence = min_confidence
+        self.max_ocr_calls = max_ocr_calls
+        self.repeat_cooldown = repeat_cooldown
+
+        self._tracks = []
+        self._next_id = 1
+        self._finished = []
+        self._last_emit = {}  # plate -> 上次輸出時間
+
+        # 統計用
+        self.ocr_calls = 0
+        self.emitted_count = 0
+
+    def update(self, boxes, now=None):
+        """
+        將本張畫面的 YOLO 框配對到既有 track
+        Returns: [(track, box), ...] 與 boxes 同順序
+        """
+        now = time.time() if now is None else now
+        unmatched = list(range(len(boxes)))
+        matched = {}
+
+        # 貪婪配對：先配 IoU 最高的組合
+        pairs = []
+        for t_idx, track in enumerate(self._tracks):
+            for b_idx, box in enumerate(boxes):
+                iou = box_iou(track.box, box)
+                if iou >= self.iou_threshold:
+                    pairs.append((iou, t_idx, b_idx))
+                elif box_center_distance(track.box, box) <= self.max_center_distance:
+                    # IoU 不足時以中心點距離補救 (車輛移動較快)，排在 IoU 配對之後
+                    pairs.append((0.0, t_idx, b_idx))
+        pairs.sort(reverse=True)
+
+        used_tracks = set()
+        for _, t_idx, b_idx in pairs:
+            if t_idx in used_tracks or b_idx in matched:
+                continue
+            used_tracks.add(t_idx)
+            matched[b_idx] = self._tracks[t_idx]
+
+        for b_idx, track in matched.items():
+            track.box = boxes[b_idx]
+            track.last_seen = now
+            track.misses = 0
+            unmatched.remove(b_idx)
+
+        # 沒配到的框建立新 track
+        for b_idx in unmatched:
+            track = PlateTrack(self._next_id, boxes[b_idx], now)
+            self._next_id += 1
+            self._tracks.append(track)
+            matched[b_idx] = track
+
+        # 沒被看到的 track 累計 miss，超過門檻即視為離開
+        alive = []
+        for track in self._tracks:
+            if track.last_seen != now:
+                track.misses += 1
+            if track.misses > self.max_misses:
+                self._finish(track, now)
+            else:
+                alive.append(track)
+        self._tracks = alive
+
+        return [(matched[i], boxes[i]) for i in range(len(boxes))]
+
+    def needs_ocr(self, track):
+        """已經穩定或 OCR 次數用完的 track 不再呼叫 OCR"""
+        if track.emitted or track.ocr_calls >= self.max_ocr_calls:
+            return False
+        return not self.is_stable(track)
+
+    def add_reads(self, track, reads, frame=None):
+        """
+        記錄一次 OCR 呼叫的結果
+        Args:
+            reads: [(plate, score), ...]，取信心分數最高的一筆投票
+        """
+        track.ocr_calls += 1
+        self.ocr_calls += 1
+        if reads:
+            text, score = max(reads, key=lambda r: r[1])
+            track.add_read(text, score, frame)
+        if not track.emitted and self.is_stable(track):
+            self._finish(track, track.last_seen)
+
+    def is_stable(self, track):
+        text, confidence = track.consensus()
+        return text is not None and track.reads >= self.min_reads and confidence >= self.min_confidence
+
+    def _finish(self, track, now):
+        """track 穩定或離開時輸出一次 (同一 track 只會輸出一次)"""
+        if track.emitted:
+            return
+        text = track.text
+        if not text:
+            return
+        track.emitted = True
+
+        last = self._last_emit.get(text)
+        if last is not None and now - last < self.repeat_cooldown:
+            return
+        self._last_emit[text] = now
+        self._finished.append(track)
+        self.emitted_count += 1
+
+        # 清掉過期的冷卻紀錄，避免字典無限成長
+        if len(self._last_emit) > 256:
+            self._last_emit = {p: t for p, t in self._last_emit.items()
+                               if now - t < self.repeat_cooldown}
+
+    def collect(self):
+        """取出這段期間完成 (穩定或離開) 的 track，每個 track 只會出現一次"""
+        finished, self._finished = self._finished, []
+        return finished
+
+    @property
+    def tracks(self):
+        return list(self._tracks)
@@ -1,13 +1,15 @@
 from modules.maintenance import DataMaintenance
+from modules.retention import RetentionDaemon
 
 def main():
     print("=== 系統數據清理工具 ===")
     print("1. 清理舊圖片 (保留最近 7 天)")
-    print("2. 封存目前的 CSV 報表")
+    print("2. 封存目前的 CSV 報表 (壓縮並建立索引，用 tools/query_history.py 查詢)")
     print("3. 全部執行")
-    print("4. 離開")
+    print("4. 依容量上限清理 (只刪除已同步的圖片，系統執行中也會在背景自動進行)")
+    print("5. 離開")
     
-    choice = input("請選擇功能 (1-4): ")
+    choice = input("請選擇功能 (1-5): ")
     
     cleaner = DataMaintenance()
     
@@ -23,6 +25,12 @@ def main():
         cleaner.archive_csv()
         cleaner.clean_old_images(days_to_keep=7)
         cleaner.check_disk_usage()
+
+    elif choice == '4':
+        budget = input("runs 資料夾的容量上限 GB (預設為磁碟的 60%): ")
+        retention = RetentionDaemon(budget_bytes=int(float(budget) * 2**30) if budget else None, interval=None)
+        print(f"[Retention] 結果: {retention.run_once()}")
+        retention.close()
         
     else:
         print("離開")
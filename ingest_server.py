@@ -0,0 +1,34 @@
+import argparse
+import time
+
+from modules.ingest import IngestStore, IngestServer
+
+
+def main():
+    """
+    車隊資料匯入服務 (在伺服器上執行)
+    各閘口的 Jetson 以 sync_and_clean.py 搭配 HttpTransport 上傳，例如:
+        LPR_INGEST_URL=http://<伺服器>:8500 python sync_and_clean.py
+    """
+    parser = argparse.ArgumentParser(description="車隊資料匯入服務")
+    parser.add_argument("--root", default="fleet_data", help="資料庫與圖片存放的資料夾")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8500)
+    parser.add_argument("--token", default=None, help="設定後上傳與查詢都必須帶 Bearer token")
+    args = parser.parse_args()
+
+    store = IngestStore(args.root)
+    server = IngestServer(store, port=args.port, host=args.host, token=args.token)
+    print(f"[Ingest] 目前資料: {store.stats()}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n[Ingest] 接收到終止訊號，關閉服務...")
+    finally:
+        server.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 import Jetson.GPIO as GPIO
+import argparse
 import threading
 from multiprocessing import Queue
 import queue
 import time
+import os
 
 from modules.button import Button
 # 替換成你寫好的控制器
@@ -23,6 +25,13 @@ def listen_button(btn, q):
         time.sleep(0.1) # 釋放 CPU 資源
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="土資場車牌辨識系統")
+    parser.add_argument("--preview-port", type=int, default=None,
+                        help="啟動 MJPEG 預覽 (預設不啟動)，用瀏覽器開 http://<jetson>:<port>/")
+    parser.add_argument("--preview-host", default="127.0.0.1",
+                        help="預覽綁定的位址；0.0.0.0 開放區網觀看 (沒有驗證，任何人都能看到相機畫面)")
+    args = parser.parse_args()
+
     print("=== 啟動土資場車牌辨識系統 ===")
     
     # 1. 建立進程間通訊的 Queue
@@ -30,7 +39,16 @@ if __name__ == "__main__":
 
     # 2. 建立並「啟動」你的 SystemController 子進程
     # 注意：這裡的 model_path 記得確認實際路徑
-    main_process = SystemController(q, model_path="best.engine")
+    # 沒有接螢幕 (沒有 DISPLAY) 時以無螢幕模式執行；需要預覽時加上 --preview-port 8080
+    main_process = SystemController(q, model_path="best.engine",
+                                    headless=not os.environ.get("DISPLAY"),
+                                    use_tracker=True,
+                                    motion_gate=True,
+                                    metrics_port=9108,
+                                    metrics_file=os.path.join("runs", "metrics", "metrics.jsonl"),
+                                    plate_index=True,
+                                    preview_port=args.preview_port,
+                                    preview_host=args.preview_host)
     main_process.start() # [修正] 補上啟動指令
     print("[System] AI 子進程已啟動")
 
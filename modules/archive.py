@@ -0,0 +1,298 @@
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import struct
+import zlib
+from datetime import datetime
+
+from .record_store import LABEL_FIELDS, TIME_FORMAT, to_timestamp
+
+# 封存檔格式 (.lpa)：
+#   MAGIC | 區塊 1 | 區塊 2 | ... | 索引 (zlib 壓縮的 JSON) | 索引位置與長度 (<QQ) | MAGIC
+# 每個區塊是 zlib 壓縮的 CSV 列 (不含標頭)；索引記錄每個區塊的位置、時間範圍與車牌 bloom filter，
+# 以及整個檔案的時間範圍與 bloom filter。查詢時只讀檔尾的索引，不符合的檔案與區塊完全不解壓
+ARCHIVE_EXT = ".lpa"
+MAGIC = b"LPRARC1\n"
+_TRAILER = struct.Struct("<QQ")
+FORMAT_VERSION = 1
+
+
+class BloomFilter:
+    def __init__(self, n_items, bits_per_item=10, data=None, k=None):
+        """
+        車牌集合的 bloom filter：每個車牌約 10 bits，誤判率約 1%，不會漏判
+        Args:
+            n_items: 預計放入的數量 (決定大小)
+            data / k: 從索引還原時使用
+        """
+        self.m = max(64, int(n_items * bits_per_item + 7) // 8 * 8) if data is None else len(data) * 8
+        self.k = k or max(1, min(12, round(bits_per_item * 0.693)))
+        self.bits = bytearray(self.m // 8) if data is None else bytearray(data)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        return ((h1 + i * h2) % self.m for i in range(self.k))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def to_dict(self):
+        return {"k": self.k, "bits": base64.b64encode(bytes(self.bits)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(0, data=base64.b64decode(d["bits"]), k=d["k"])
+
+
+def _overlaps(t_min, t_max, since, until):
+    if t_min is None:
+        return True  # 沒有可解析的時間，無法排除
+    return (since is None or t_max >= since) and (until is None or t_min <= until)
+
+
+def _parse_time(value):
+    try:
+        return to_timestamp(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _row_filter(header, plate, since, until):
+    """
+    依標頭產生逐列判斷的函式 (row -> bool)
+    時間欄位格式固定，字串比較即等於時間比較，不必每列解析
+    """
+    names = [LABEL_FIELDS.get(label.strip()) for label in header]
+    time_col = names.index("time") if "time" in names else None
+    plate_col = names.index("plate") if "plate" in names else None
+    since_s = datetime.fromtimestamp(since).strftime(TIME_FORMAT) if since is not None else None
+    until_s = datetime.fromtimestamp(until).strftime(TIME_FORMAT) if until is not None else None
+
+    def match(row):
+        if plate is not None and (plate_col is None or plate_col >= len(row) or row[plate_col] != plate):
+            return False
+        if time_col is not None and time_col < len(row):
+            t = row[time_col]
+            if (since_s is not None and t < since_s) or (until_s is not None and t > until_s):
+                return False
+        return True
+    return match
+
+
+class ArchiveWriter:
+    def __init__(self, path, header, block_rows=2000, level=6):
+        """
+        逐列寫入封存檔，只保留一個區塊的資料在記憶體
+        Args:
+            path: 輸出路徑 (先寫入 path.tmp，close 時才改名，中斷不會留下寫一半的封存檔)
+            header: CSV 標頭 (與 data_log.csv 相同的欄位名稱)
+            block_rows: 每個區塊的列數 (越大壓縮率越好，查詢時解壓的單位也越大)
+            level: zlib 壓縮等級
+        """
+        self.path = path
+        self.header = list(header)
+        self.block_rows = block_rows
+        self.level = level
+        names = [LABEL_FIELDS.get(label.strip()) for label in self.header]
+        self._time_col = names.index("time") if "time" in names else None
+        self._plate_col = names.index("plate") if "plate" in names else None
+
+        self._tmp = path + ".tmp"
+        self._f = open(self._tmp, "wb")
+        self._f.write(MAGIC)
+        self._rows = []
+        self._t_min = self._t_max = None   # 時間字串 (格式固定，字串大小即時間先後)
+        self._plates = set()
+        self._blocks = []
+        self._all_plates = set()
+        self.rows = 0
+        self.raw_bytes = 0
+
+    def write_row(self, row):
+        self._rows.append(row)
+        if self._time_col is not None and self._time_col < len(row) and len(row[self._time_col]) == 19:
+            t = row[self._time_col]
+            if self._t_min is None or t < self._t_min:
+                self._t_min = t
+            if self._t_max is None or t > self._t_max:
+                self._t_max = t
+        if self._plate_col is not None and self._plate_col < len(row):
+            self._plates.add(row[self._plate_col])
+        if len(self._rows) >= self.block_rows:
+            self._flush_block()
+
+    def _flush_block(self):
+        if not self._rows:
+            return
+        buf = io.StringIO()
+        csv.writer(buf).writerows(self._rows)
+        raw = buf.getvalue().encode("utf-8")
+        data = zlib.compress(raw, self.level)
+        bloom = BloomFilter(len(self._plates))
+        for plate in self._plates:
+            bloom.add(plate)
+        self._blocks.append({
+            "offset": self._f.tell(),
+            "length": len(data),
+            "rows": len(self._rows),
+            "t_min": _parse_time(self._t_min),
+            "t_max": _parse_time(self._t_max),
+            "bloom": bloom.to_dict(),
+        })
+        self._f.write(data)
+        self.rows += len(self._rows)
+        self.raw_bytes += len(raw)
+        self._all_plates |= self._plates
+        self._rows, self._plates = [], set()
+        self._t_min = self._t_max = None
+
+    def close(self):
+        """
+        寫入最後一個區塊與索引
+        Returns: 索引 dict
+        """
+        self._flush_block()
+        times = [b["t_min"] for b in self._blocks if b["t_min"] is not None] + \
+                [b["t_max"] for b in self._blocks if b["t_max"] is not None]
+        bloom = BloomFilter(len(self._all_plates))
+        for plate in self._all_plates:
+            bloom.add(plate)
+        index = {
+            "version": FORMAT_VERSION,
+            "header": self.header,
+            "rows": self.rows,
+            "raw_bytes": self.raw_bytes,
+            "plates": len(self._all_plates),
+            "t_min": min(times) if times else None,
+            "t_max": max(times) if times else None,
+            "bloom": bloom.to_dict(),
+            "blocks": self._blocks,
+        }
+        data = zlib.compress(json.dumps(index, separators=(",", ":")).encode("utf-8"), self.level)
+        offset = self._f.tell()
+        self._f.write(data)
+        self._f.write(_TRAILER.pack(offset, len(data)))
+        self._f.write(MAGIC)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        os.replace(self._tmp, self.path)
+        return index
+
+    def abort(self):
+        self._f.close()
+        try:
+            os.remove(self._tmp)
+        except OSError:
+            pass
+
+
+def write_archive(csv_path, out_path, block_rows=2000, level=6):
+    """
+    把 CSV 逐列轉成封存檔 (記憶體只保留一個區塊)
+    Returns: 索引 dict
+    """
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        writer = ArchiveWriter(out_path, header, block_rows, level)
+        try:
+            for row in reader:
+                writer.write_row(row)
+        except Exception:
+            writer.abort()
+            raise
+    return writer.close()
+
+
+class ArchiveReader:
+    def __init__(self, path, fileobj=None):
+        """
+        讀取封存檔：開啟時只讀檔尾的索引
+        Args:
+            fileobj: 已經開啟的二進位檔案物件 (例如伺服器收到的批次內容)，此時 path 只用於訊息
+        """
+        self.path = path
+        self._fileobj = fileobj
+        f = self._open()
+        try:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"[Archive] 不是封存檔: {path}")
+            f.seek(-(_TRAILER.size + len(MAGIC)), os.SEEK_END)
+            trailer = f.read(_TRAILER.size + len(MAGIC))
+            if trailer[_TRAILER.size:] != MAGIC:
+                raise ValueError(f"[Archive] 封存檔不完整: {path}")
+            offset, length = _TRAILER.unpack(trailer[:_TRAILER.size])
+            f.seek(offset)
+            self.index = json.loads(zlib.decompress(f.read(length)).decode("utf-8"))
+        finally:
+            self._close(f)
+        self.header = self.index["header"]
+
+    def _open(self):
+        if self._fileobj is not None:
+            self._fileobj.seek(0)
+            return self._fileobj
+        return open(self.path, "rb")
+
+    def _close(self, f):
+        if f is not self._fileobj:
+            f.close()
+
+    def may_contain(self, plate=None, since=None, until=None):
+        """依索引判斷這個檔案是否可能有符合的紀錄 (False 代表一定沒有)"""
+        if not _overlaps(self.index["t_min"], self.index["t_max"], since, until):
+            return False
+        return plate is None or plate in BloomFilter.from_dict(self.index["bloom"])
+
+    def iter_rows(self, plate=None, since=None, until=None, stats=None):
+        """
+        逐列讀出符合條件的紀錄 (CSV 欄位 list，欄位順序為 self.header)
+        一次只解壓一個區塊；索引排除的區塊不讀取
+        Args:
+            stats (dict): 傳入時累計 blocks_read / blocks_skipped
+        """
+        match = _row_filter(self.header, plate, since, until)
+        f = self._open()
+        try:
+            for block in self.index["blocks"]:
+                if not _overlaps(block["t_min"], block["t_max"], since, until) or \
+                        (plate is not None and plate not in BloomFilter.from_dict(block["bloom"])):
+                    if stats is not None:
+                        stats["blocks_skipped"] = stats.get("blocks_skipped", 0) + 1
+                    continue
+                if stats is not None:
+                    stats["blocks_read"] = stats.get("blocks_read", 0) + 1
+                f.seek(block["offset"])
+                text = zlib.decompress(f.read(block["length"])).decode("utf-8")
+                for row in csv.reader(io.StringIO(text)):
+                    if match(row):
+                        yield row
+        finally:
+            self._close(f)
+
+
+def iter_csv_rows(path, plate=None, since=None, until=None):
+    """
+    沒有索引的 CSV (尚未轉換的封存或目前的 data_log.csv) 逐列過濾
+    Returns: (header, 產生 CSV 欄位 list 的 generator)
+    """
+    f = open(path, newline="", encoding="utf-8-sig")
+    reader = csv.reader(f)
+    header = next(reader, None) or []
+    match = _row_filter(header, plate, since, until)
+
+    def rows():
+        with f:
+            for row in reader:
+                if match(row):
+                    yield row
+    return header, rows()
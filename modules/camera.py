@@ -1,88 +1,217 @@
-import cv2
-import threading
-from queue import Queue, Empty,Full
-import atexit
-import time # [修正] 補上匯入 time 模組
-
-class Camera:
-    def __init__(self, width=1280, height=720,src=0):
-
-        self._cap = cv2.VideoCapture(src)
-
-        if not self._cap.isOpened():
-            print(f"[Camera] Error: Could not open camera ID {src}")
-            raise RuntimeError("[Camera]: can't open camera")
-        else:
-            print(f"[Camera] Initialized successfully (ID: {src})")
-        
-        # 設定解析度
-        self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-        self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-
-        # 註冊自己的 cleanup
-        atexit.register(self._InterCleanup)
-
-        self._new_frame = None
-
-        self._lock = threading.Lock() 
-
-        self._stop_event = threading.Event()
-        self._thread = threading.Thread(
-            target=self._loop,
-            daemon=True
-        )
-        self._thread.start()
-
-    # ========================
-    # private: thread loop
-    # ========================
-    def _loop(self):
-        try: 
-            while not self._stop_event.is_set():
-                ret, frame = self._cap.read()
-                if not ret:
-                    print("[Camera]:Camera read failed continue")
-                else:
-                    with self._lock:
-                        self._new_frame = frame
-                    time.sleep(0.01)
-        except Exception as e:
-            print(f"[Camera]: {e}")
-            
-
-    # ========================
-    # public API
-    # ========================
-    def get(self):
-        with self._lock:
-            return self._new_frame
-
-
-    def _InterCleanup(self): #強制退出
-        if self._cap.isOpened():
-            self._cap.release()
-        print("[Camera] 成功釋放")
-
-    def cleanup(self): #使用者退出
-        """
-        請求停止 camera thread
-        等待釋放資源
-        """
-        self._stop_event.set()
-        self._thread.join()
-
-
-if __name__ == "__main__" :
-    test_cm = Camera()
-    while(1):
-        frame = test_cm.get()
-        if frame is not None: 
-            cv2.imshow("test", frame)
-        if cv2.waitKey(1) & 0xFF == 27:
-            test_cm.cleanup()
-            cv2.destroyAllWindows()
-            break
-        
-
-#優化 加入sleep釋放cpu資源
-#如果cam創建失敗會直接raise
+import cv2
+import numpy as np
+import threading
+from collections import namedtuple
+import atexit
+import time # [修正] 補上匯入 time 模組
+
+from .capture_source import open_source
+from .metrics import STAGE_SECONDS
+
+# 一張影像與它的序號、擷取時間；dropped 為上一次取得後被跳過的張數
+FramePacket = namedtuple("FramePacket", ["seq", "timestamp", "frame", "dropped"])
+
+class Camera:
+    def __init__(self, width=1280, height=720,src=0, buffers=4):
+        """
+        Args:
+            src: 影像來源，可為裝置編號、RTSP 網址、GStreamer pipeline、影片檔路徑
+                 或 CaptureSource 物件 (見 modules/capture_source.py)
+            buffers (int): 預先配置的影像緩衝數量 (環形緩衝)，讀取時直接寫入緩衝區不另外配置記憶體
+        """
+
+        self._source = open_source(src, width, height)
+
+        if not self._source.open():
+            print(f"[Camera] Error: Could not open camera ({self._source.name})")
+            raise RuntimeError("[Camera]: can't open camera")
+        else:
+            print(f"[Camera] Initialized successfully ({self._source.name})")
+
+        # 註冊自己的 cleanup
+        atexit.register(self._InterCleanup)
+
+        # 環形緩衝：第一張影像讀到後依實際解析度配置，之後都直接讀進這組緩衝區
+        self._ring = [None] * max(3, buffers)
+        self._timestamps = [0.0] * len(self._ring)
+        self._seq = 0            # 最新一張的序號 (從 1 開始)
+        self._latest_slot = None
+        self._leases = {}        # seq -> slot，消費者正在使用的緩衝區不會被覆寫
+        self._consumed_seq = 0   # 消費者拿走的最新序號 (離線重播不丟畫面時使用)
+        self.finished = False    # 來源已結束 (例如影片播完)
+
+        # 統計用
+        self.frames_read = 0
+        self.read_failures = 0
+        self.reclaimed = 0       # 消費者沒有歸還、被強制收回的緩衝區數
+        self.fps = 0.0           # 實際擷取幀率 (指數移動平均)
+        self._last_frame_time = None
+        self._capture_time = STAGE_SECONDS.labels("capture")
+
+        self._cond = threading.Condition()
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._loop,
+            daemon=True
+        )
+        self._thread.start()
+
+    # ========================
+    # private: thread loop
+    # ========================
+    def _next_slot(self):
+        """挑選下一個可寫入的緩衝區 (跳過最新一張與被租用中的)"""
+        with self._cond:
+            busy = set(self._leases.values())
+            busy.add(self._latest_slot)
+            start = 0 if self._latest_slot is None else self._latest_slot + 1
+            for i in range(len(self._ring)):
+                slot = (start + i) % len(self._ring)
+                if slot not in busy:
+                    return slot
+
+            # 所有緩衝區都被租用 (消費者沒有歸還)，強制收回最舊的一個
+            oldest = min(self._leases)
+            self.reclaimed += 1
+            print(f"[Camera] 警告: 緩衝區不足，強制收回序號 {oldest} 的緩衝區")
+            return self._leases.pop(oldest)
+
+    def _loop(self):
+        try:
+            while not self._stop_event.is_set():
+                if self._source.lossless:
+                    # 離線重播：等消費者拿走上一張才讀下一張
+                    with self._cond:
+                        self._cond.wait_for(
+                            lambda: self._consumed_seq >= self._seq or self._stop_event.is_set())
+
+                slot = self._next_slot()
+                buf = self._ring[slot]
+
+                # read 會阻塞到下一張影像 (重播時依幀率等待)，不需要額外 sleep
+                t0 = time.perf_counter()
+                ret, frame, now = self._source.read(buf)
+                t1 = time.perf_counter()
+
+                if self._source.eof:
+                    print(f"[Camera] 影像來源已結束 ({self._source.name})")
+                    break
+
+                if not ret:
+                    self.read_failures += 1
+                    print("[Camera]:Camera read failed continue")
+                    time.sleep(0.01)
+                    continue
+
+                with self._cond:
+                    if buf is None:
+                        # 第一張影像：依實際解析度一次配置好所有緩衝區
+                        self._ring = [b if b is not None else np.empty_like(frame) for b in self._ring]
+                    # 解析度改變時 OpenCV 會回傳新的陣列，直接換掉舊緩衝區
+                    self._ring[slot] = frame
+                    self._timestamps[slot] = now
+                    self._seq += 1
+                    self._latest_slot = slot
+                    self.frames_read += 1
+                    self._cond.notify_all()
+
+                # read 的耗時包含等待下一張的時間，相機正常時約等於 1/fps
+                self._capture_time.observe(t1 - t0)
+                if self._last_frame_time is not None and t1 > self._last_frame_time:
+                    instant = 1.0 / (t1 - self._last_frame_time)
+                    self.fps = instant if self.fps == 0.0 else self.fps * 0.9 + instant * 0.1
+                self._last_frame_time = t1
+        except Exception as e:
+            print(f"[Camera]: {e}")
+        finally:
+            with self._cond:
+                self.finished = True
+                self._cond.notify_all()
+
+
+    # ========================
+    # public API
+    # ========================
+    def get(self):
+        """取得最新一張影像 (舊版 API，回傳複本，呼叫端可以任意修改)"""
+        with self._cond:
+            if self._latest_slot is None:
+                return None
+            return self._ring[self._latest_slot].copy()
+
+    def get_next(self, after_seq=0, timeout=None):
+        """
+        阻塞等待序號大於 after_seq 的新影像，永遠不會重複拿到同一張
+        回傳的 frame 直接指向環形緩衝區 (不複製)，在下一次以此序號呼叫 get_next 之前不會被覆寫；
+        需要長時間保留 (例如交給其他執行緒) 時請自行 copy
+        Args:
+            after_seq (int): 上一次拿到的序號，第一次呼叫傳 0
+            timeout (float): 最多等待秒數，None 代表一直等
+        Returns: FramePacket，逾時或相機已停止則回傳 None (可用 finished 判斷來源是否已結束)
+        """
+        with self._cond:
+            # 上一張用完了，歸還緩衝區
+            self._leases.pop(after_seq, None)
+
+            ready = self._cond.wait_for(
+                lambda: self._seq > after_seq or self.finished, timeout)
+            if not ready or self._seq <= after_seq:
+                return None
+
+            slot = self._latest_slot
+            self._leases[self._seq] = slot
+            self._consumed_seq = self._seq
+            self._cond.notify_all()
+            dropped = self._seq - after_seq - 1 if after_seq > 0 else 0
+            return FramePacket(self._seq, self._timestamps[slot], self._ring[slot], dropped)
+
+    def stats(self):
+        return {
+            "frames_read": self.frames_read,
+            "read_failures": self.read_failures,
+            "reclaimed": self.reclaimed,
+            "fps": round(self.fps, 1),
+            "buffers": len(self._ring),
+        }
+
+
+    def _InterCleanup(self): #強制退出
+        self._source.release()
+        print("[Camera] 成功釋放")
+
+    def cleanup(self): #使用者退出
+        """
+        請求停止 camera thread
+        等待釋放資源
+        """
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join()
+
+
+if __name__ == "__main__" :
+    import sys
+    # python -m modules.camera [裝置編號 | rtsp://... | 影片檔]
+    test_cm = Camera(src=sys.argv[1] if len(sys.argv) > 1 else 0)
+    seq = 0
+    while(1):
+        packet = test_cm.get_next(seq, timeout=1.0)
+        if packet is None and test_cm.finished:
+            test_cm.cleanup()
+            break
+        if packet is not None:
+            seq = packet.seq
+            if packet.dropped:
+                print(f"[Camera] 跳過 {packet.dropped} 張")
+            cv2.imshow("test", packet.frame)
+        if cv2.waitKey(1) & 0xFF == 27:
+            test_cm.cleanup()
+            cv2.destroyAllWindows()
+            break
+
+
+#優化 加入sleep釋放cpu資源
+#如果cam創建失敗會直接raise
+#環形緩衝 + get_next：消費者不需輪詢，也不會重複處理同一張
@@ -0,0 +1,183 @@
+import os
+import time
+from abc import ABC, abstractmethod
+
+import cv2
+
+
+class CaptureSource(ABC):
+    """
+    影像來源的共同介面，Camera 只透過這幾個方法取得影像
+    read(buf) 回傳 (ok, frame, timestamp)；eof 為 True 代表來源已結束 (例如影片播完)
+    """
+    name = "source"
+    # True 代表消費者還沒拿走上一張之前不要讀下一張 (離線重播時不丟畫面)
+    lossless = False
+
+    def __init__(self):
+        self._cap = None
+        self.eof = False
+
+    @abstractmethod
+    def open(self):
+        """開啟來源 (建立 self._cap)"""
+
+    def read(self, buf=None):
+        if buf is not None:
+            ok, frame = self._cap.read(buf)
+        else:
+            ok, frame = self._cap.read()
+        return ok, frame, time.time()
+
+    def is_opened(self):
+        return self._cap is not None and self._cap.isOpened()
+
+    def release(self):
+        if self._cap is not None and self._cap.isOpened():
+            self._cap.release()
+
+
+class DeviceSource(CaptureSource):
+    def __init__(self, index=0, width=1280, height=720):
+        """USB / CSI 相機 (裝置編號)"""
+        super().__init__()
+        self.index = index
+        self.width = width
+        self.height = height
+        self.name = f"device:{index}"
+
+    def open(self):
+        self._cap = cv2.VideoCapture(self.index)
+        if self._cap.isOpened():
+            # 設定解析度
+            self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        return self._cap.isOpened()
+
+
+class RTSPSource(CaptureSource):
+    def __init__(self, url, reconnect_delay=2.0):
+        """
+        IP 攝影機 (RTSP / HTTP 串流，FFmpeg 解碼)
+        讀取失敗時自動重新連線
+        """
+        super().__init__()
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+        self.name = url.split("@")[-1]  # 不要把帳號密碼印在 log 裡
+
+    def open(self):
+        self._cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+        # 只保留最新的一張，避免串流延遲累積
+        self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return self._cap.isOpened()
+
+    def read(self, buf=None):
+        ok, frame, ts = super().read(buf)
+        if not ok:
+            print(f"[Camera] 串流中斷，{self.reconnect_delay} 秒後重新連線: {self.name}")
+            self.release()
+            time.sleep(self.reconnect_delay)
+            self.open()
+        return ok, frame, ts
+
+
+class GStreamerSource(CaptureSource):
+    def __init__(self, pipeline):
+        """GStreamer pipeline (Jetson 硬體解碼)，pipeline 最後必須是 appsink"""
+        super().__init__()
+        self.pipeline = pipeline
+        self.name = "gstreamer"
+
+    def open(self):
+        self._cap = cv2.VideoCapture(self.pipeline, cv2.CAP_GSTREAMER)
+        return self._cap.isOpened()
+
+
+def jetson_rtsp_pipeline(url, width=1280, height=720, latency=200, codec="h264"):
+    """產生 Jetson 硬體解碼 RTSP 串流的 GStreamer pipeline 字串"""
+    depay = "rtph265depay ! h265parse" if codec == "h265" else "rtph264depay ! h264parse"
+    return (
+        f"rtspsrc location={url} latency={latency} ! {depay} ! nvv4l2decoder ! "
+        f"nvvidconv ! video/x-raw,width={width},height={height},format=BGRx ! "
+        f"videoconvert ! video/x-raw,format=BGR ! appsink drop=true max-buffers=1 sync=false"
+    )
+
+
+class FileReplaySource(CaptureSource):
+    def __init__(self, path, realtime=True, loop=False, start_time=0.0):
+        """
+        錄影檔重播，可在沒有相機的情況下驅動整個 SystemController 並做效能分析
+        Args:
+            realtime (bool): True 依影片原始幀率播放；False 盡可能快，且不丟任何一張
+            loop (bool): 播完後從頭重播
+            start_time (float): 第一張影像的時間戳，時間戳 = start_time + 第幾張 / fps，每次重播結果一致
+        """
+        super().__init__()
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.start_time = start_time
+        self.lossless = not realtime
+        self.name = os.path.basename(path)
+
+        self.fps = 0.0
+        self._index = 0
+        self._wall_start = None
+
+    def open(self):
+        self._cap = cv2.VideoCapture(self.path)
+        if self._cap.isOpened():
+            self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 30.0
+        return self._cap.isOpened()
+
+    def read(self, buf=None):
+        if buf is not None:
+            ok, frame = self._cap.read(buf)
+        else:
+            ok, frame = self._cap.read()
+
+        if not ok and self.loop and self._index > 0:
+            # 從頭重播，時間戳繼續往後遞增
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self._cap.read(buf) if buf is not None else self._cap.read()
+
+        if not ok:
+            self.eof = True
+            return False, None, None
+
+        timestamp = self.start_time + self._index / self.fps
+
+        if self.realtime:
+            # 依原始幀率等待，模擬真實相機
+            if self._wall_start is None:
+                self._wall_start = time.monotonic()
+            delay = self._wall_start + self._index / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        self._index += 1
+        return True, frame, timestamp
+
+
+def open_source(src, width=1280, height=720):
+    """
+    依參數型態建立影像來源：
+        CaptureSource 物件    -> 直接使用
+        int / "0"             -> DeviceSource
+        "rtsp://..."、"http://..." -> RTSPSource
+        含有 "!" 的字串       -> GStreamerSource
+        存在的影片檔路徑      -> FileReplaySource (依原始幀率播放)
+    """
+    if isinstance(src, CaptureSource):
+        return src
+    if isinstance(src, int) or (isinstance(src, str) and src.isdigit()):
+        return DeviceSource(int(src), width, height)
+    if isinstance(src, str):
+        if src.startswith(("rtsp://", "rtsps://", "http://", "https://")):
+            return RTSPSource(src)
+        if "!" in src:
+            return GStreamerSource(src)
+        if os.path.isfile(src):
+            return FileReplaySource(src)
+    raise ValueError(f"[Camera] 無法辨識的影像來源: {src}")
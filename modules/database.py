@@ -1,105 +1,451 @@
-import csv
 import os
-import cv2
 import time
-from datetime import datetime
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np # 建議引入 numpy 以協助判斷影像格式
 
+from .record_store import LEGACY_FIELDS, CsvRecordStore, SqliteRecordStore, make_record
+from .metrics import REGISTRY, STAGE_SECONDS
+from .evidence import EvidenceProfile
+from .plate_index import PlateIndex
+
+# 寫入執行緒的停止訊號
+_STOP = object()
+
+# 每筆紀錄所有證據圖片的總大小，比較不同 evidence 設定的頻寬與 SD 卡寫入量
+RECORD_IMAGE_BYTES = REGISTRY.histogram(
+    "lpr_record_image_bytes", "每筆紀錄所有證據圖片的總大小 (bytes)",
+    buckets=(10e3, 25e3, 50e3, 100e3, 200e3, 400e3, 800e3, 1.6e6))
+
+# 圖片資料夾的分區方式
+IMAGE_LAYOUTS = {
+    "flat": None,               # 舊版：全部放在 images/ 底下
+    "day": "%Y/%m/%d",          # images/2025/02/07/
+    "hour": "%Y/%m/%d/%H",      # images/2025/02/07/08/ (車流量很大的閘口)
+}
+
+
+def image_partition(ts, layout="day"):
+    """
+    圖片所在的分區 (相對於 images/ 的子資料夾，使用本地時間)
+    Returns: 例如 "2025/02/07"；flat 回傳空字串
+    """
+    try:
+        fmt = IMAGE_LAYOUTS[layout]
+    except KeyError:
+        raise ValueError(f"[Database] 不支援的圖片分區方式: {layout}")
+    return time.strftime(fmt, time.localtime(ts)) if fmt else ""
+
 class DatabaseManager:
-    def __init__(self, base_dir="runs", csv_name="data_log.csv", enable_scale_img=False):
+    def __init__(self, base_dir="runs", csv_name="data_log.csv", enable_scale_img=False,
+                 async_write=False, encode_workers=2, max_pending=64, enqueue_timeout=2.0, sync_fallback=True,
+                 flush_rows=20, flush_interval=1.0, backend="csv", db_name="records.db",
+                 enable_lane=False, enable_transaction=False, image_layout="day", evidence=None,
+                 plate_index=False):
         """
         將儲存邏輯統包：寫入 CSV，也負責將圖片存入硬碟
+        Args:
+            backend (str): "csv" 寫入 data_log.csv；"sqlite" 寫入有索引的 SQLite 資料庫
+            enable_lane (bool): 多車道時在 CSV 加上「車道」欄位 (SQLite 一律有此欄位)
+            enable_transaction (bool): 過磅交易模式時在 CSV 加上「方向」「空重」「淨重」欄位
+            image_layout (str): 圖片分區 "day" (images/YYYY/MM/DD/)、"hour" (再依小時分) 或 "flat" (舊版)；
+                                清理過期圖片時可整個資料夾刪除，不必逐檔檢查
+            evidence (str | dict | EvidenceProfile): 證據圖片的設定 (見 modules/evidence.py)，
+                                例如 "compact" 存 640 寬的現場畫面與車牌特寫；None 與舊版相同 (原尺寸 JPEG)
+            plate_index (bool): 寫入紀錄時同步更新車牌模糊搜尋索引 runs/plate_index.db (見 modules/plate_index.py)
+            async_write (bool): 非同步寫入模式，save_record 放入佇列後立即返回
+            encode_workers (int): 非同步模式下負責 JPEG 編碼與寫檔的執行緒數量
+            max_pending (int): 等待寫入的紀錄上限
+            enqueue_timeout (float): 佇列已滿時最多等待幾秒 (SD 卡短暫停頓)
+            sync_fallback (bool): 等待後佇列仍滿時改在呼叫端直接寫入，不丟紀錄；
+                                  False 代表寧可丟棄紀錄 (計入 dropped_count) 也不阻塞辨識
+            flush_rows (int): 累積幾筆紀錄後一次寫入 CSV
+            flush_interval (float): 最久幾秒一定寫入一次 CSV
         """
         self.base_dir = os.path.abspath(base_dir)
         self.img_dir = os.path.join(self.base_dir, "images")
         self.file_path = os.path.join(self.base_dir, csv_name)
-        self.enable_scale_img = enable_scale_img 
-        
+        self.db_path = os.path.join(self.base_dir, db_name)
+        self.enable_scale_img = enable_scale_img
+        self.enable_lane = enable_lane
+        self.enable_transaction = enable_transaction
+        self.backend = backend
+        self.image_layout = image_layout
+        image_partition(0, image_layout)  # 提早檢查參數
+        self.evidence = EvidenceProfile.from_config(evidence)
+        self._partitions = set()  # 已建立的分區資料夾，避免每筆都呼叫 makedirs
+
         os.makedirs(self.img_dir, exist_ok=True)
-        self.ensure_file_exists()
+
+        # 可抽換的儲存後端 (對外 API 一律是 save_record)
+        if backend == "sqlite":
+            self.store = SqliteRecordStore(self.db_path)
+        elif backend == "csv":
+            fields = list(LEGACY_FIELDS)
+            if self.evidence.crop:
+                fields.append("plate_crop")
+            if self.enable_scale_img:
+                fields.append("scale_image")
+            if self.enable_lane:
+                fields.append("lane")
+            if self.enable_transaction:
+                fields += ["direction", "tare_weight", "net_weight"]
+            self.store = CsvRecordStore(self.file_path, fields)
+        else:
+            raise ValueError(f"[Database] 不支援的儲存後端: {backend}")
+
+        # 車牌模糊搜尋索引：與紀錄在同一個寫入點增量更新 (非同步模式下在寫入執行緒中，不影響辨識)
+        self.plate_index = PlateIndex(os.path.join(self.base_dir, "plate_index.db")) if plate_index else None
+
+        # 非同步寫入 (write-behind) 相關狀態
+        self.async_write = async_write
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.sync_fallback = sync_fallback
+        self._lock = threading.Lock()
+
+        # 統計用計數器
+        self.written_count = 0
+        self.dropped_count = 0
+        self.sync_count = 0         # 佇列已滿而改為直接寫入的紀錄數
+        self.error_count = 0
+        self.image_bytes = 0        # 已寫入的證據圖片總大小
+        self.encode_seconds = 0.0   # 已寫入的證據圖片編碼總時間
+        # save: 圖片編碼與寫檔；encode: 其中的編碼時間；commit: 紀錄寫入 CSV / SQLite
+        self._save_time = STAGE_SECONDS.labels("save")
+        self._encode_time = STAGE_SECONDS.labels("encode")
+        self._commit_time = STAGE_SECONDS.labels("commit")
+
+        if self.async_write:
+            self._pool = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix="db-encode")
+            self._write_q = queue.Queue(maxsize=max_pending)
+            self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+            self._writer.start()
+            print(f"[Database] 非同步寫入模式啟動 (編碼執行緒: {encode_workers}, 佇列上限: {max_pending})")
+        print(f"[Database] 證據圖片: {self.evidence.describe()}")
 
     def ensure_file_exists(self):
-        """確保 CSV 檔案存在，若不存在則建立並寫入標頭"""
-        if not os.path.exists(self.file_path):
-            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
-            header = ["時間(Time)", "車牌狀態(Plate_Status)", "車牌(Plate)", "車牌照片(Plate_Image)", "地磅狀態(Scale_Status)", "重量(Weight_KG)"]
-            if self.enable_scale_img: 
-                header.append("地磅照片(Scale_Image)")
-                
-            with open(self.file_path, mode='w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                writer.writerow(header)
-            print(f"[Database] 已建立新資料庫: {self.file_path}")
-
-    def save_record(self, plate_status, plate, frame, scale_status, weight, scale_img=None):
+        """確保 CSV 檔案存在，若不存在則建立並寫入標頭 (僅 CSV 後端)"""
+        if isinstance(self.store, CsvRecordStore):
+            self.store.ensure_file_exists()
+
+    def crop_plate(self, frame, box):
+        """
+        依 evidence 設定裁出車牌特寫，應在畫框之前呼叫 (特寫不含框線與文字)
+        Returns: 影像，沒有啟用特寫時為 None；直接傳給 save_record(plate_crop=...)
         """
-        寫入一筆新資料 (儲存圖片並寫入 CSV)
+        return self.evidence.crop_plate(frame, box)
+
+    def save_record(self, plate_status, plate, frame, scale_status, weight, scale_img=None, lane=None,
+                    direction=None, tare_weight=None, net_weight=None, plate_crop=None):
+        """
+        寫入一筆新資料 (儲存圖片並寫入 CSV / SQLite)
+        lane: 多車道時標記這筆紀錄來自哪個車道
+        direction / tare_weight / net_weight: 過磅交易模式的行駛方向與空重配對結果
+        plate_crop: crop_plate 裁出的車牌特寫
+        非同步模式下只做排隊，實際編碼與寫檔在背景執行緒完成
         """
         try:
-            now_ts = int(time.time())
-            
-            # ==========================================
-            # 1. 處理並儲存「車牌」圖片
-            # ==========================================
-            img_filename = f"{plate}_{now_ts}.jpg"
-            img_absolute_path = os.path.join(self.img_dir, img_filename)
-            
-            # 儲存到實體硬碟
-            cv2.imwrite(img_absolute_path, frame)
-            
-            # CSV 存相對路徑
-            relative_img_path = f"runs/images/{img_filename}"
+            images, record = self._prepare_record(plate_status, plate, frame, scale_status, weight, scale_img,
+                                                  plate_crop)
+            record["lane"] = lane
+            record["direction"] = direction
+            record["tare_weight"] = tare_weight
+            record["net_weight"] = net_weight
 
-            # ==========================================
-            # 2. 處理並儲存「地磅」圖片 (本次修正重點)
-            # ==========================================
-            relative_scale_img_path = "N/A"
-            
-            if self.enable_scale_img:
-                # 檢查 scale_img 是否為有效的 OpenCV 影像 (具有 shape 屬性)
-                if scale_img is not None and hasattr(scale_img, 'shape'):
-                    scale_img_filename = f"scale_{plate}_{now_ts}.jpg"
-                    scale_img_absolute_path = os.path.join(self.img_dir, scale_img_filename)
-                    
-                    # 儲存地磅照片到實體硬碟
-                    cv2.imwrite(scale_img_absolute_path, scale_img)
-                    
-                    # CSV 存地磅照片的相對路徑
-                    relative_scale_img_path = f"runs/images/{scale_img_filename}"
-                elif scale_img is None:
-                    # 系統開啟了地磅截圖功能，但沒有傳入圖片
-                    print(f"[Database] 警告: 未收到地磅圖片 (車牌: {plate})")
-                else:
-                    print(f"[Database] 錯誤: 傳入的地磅影像格式不符 (車牌: {plate})")
+            if self.async_write:
+                return self._enqueue(images, record, plate)
 
             # ==========================================
-            # 3. 寫入 CSV 紀錄
+            # 同步模式：直接寫圖與紀錄
             # ==========================================
-            now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            row_data = [now_str, plate_status, plate, relative_img_path, scale_status, weight]
-            
-            if self.enable_scale_img: 
-                row_data.append(relative_scale_img_path)
-                
-            with open(self.file_path, mode='a', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                writer.writerow(row_data)
-                
+            self._record_images([self._write_image(path, img, quality) for path, img, quality, _ in images])
+
+            with self._lock, self._commit_time.time():
+                self.store.append([record])
+            self.written_count += 1
+            self._index_rows([record])
+
             print(f"[Database] 成功儲存照片並寫入紀錄: {plate} | {weight}kg")
             return True
-            
+
+        except Exception as e:
+            self.error_count += 1
+            print(f"[Database] 寫入失敗: {e}")
+            return False
+
+    def _prepare_record(self, plate_status, plate, frame, scale_status, weight, scale_img, plate_crop=None):
+        """
+        決定圖片檔名與紀錄欄位 (不做任何 I/O，也不編碼)
+        Returns: ([(絕對路徑, 影像, 編碼品質, 影像是否為呼叫端的原始畫面), ...], 紀錄 dict)
+        """
+        ts = time.time()
+        now_ts = int(ts)
+        images = []
+
+        # 依日期分區 (例如 2025/02/07/)，同步模式與非同步模式都在這裡決定路徑
+        partition = image_partition(ts, self.image_layout)
+        img_dir = self.img_dir
+        rel_dir = "runs/images"
+        if partition:
+            img_dir = os.path.join(self.img_dir, *partition.split("/"))
+            rel_dir = f"runs/images/{partition}"
+            if partition not in self._partitions:
+                os.makedirs(img_dir, exist_ok=True)
+                self._partitions.add(partition)
+
+        ext = self.evidence.ext
+        quality = self.evidence.quality
+
+        # ==========================================
+        # 1. 處理「車牌」圖片 (現場畫面，依設定縮小) 與車牌特寫
+        # ==========================================
+        img_filename = f"{plate}_{now_ts}{ext}"
+        scene = self.evidence.scene(frame)
+        images.append((os.path.join(img_dir, img_filename), scene, quality, scene is frame))
+
+        # CSV 存相對路徑
+        relative_img_path = f"{rel_dir}/{img_filename}"
+
+        relative_crop_path = None
+        if self.evidence.crop:
+            relative_crop_path = "N/A"
+            if plate_crop is not None:
+                crop_filename = f"crop_{plate}_{now_ts}{ext}"
+                images.append((os.path.join(img_dir, crop_filename), plate_crop, self.evidence.crop_quality, False))
+                relative_crop_path = f"{rel_dir}/{crop_filename}"
+
+        # ==========================================
+        # 2. 處理「地磅」圖片
+        # ==========================================
+        relative_scale_img_path = "N/A"
+
+        if self.enable_scale_img:
+            # 檢查 scale_img 是否為有效的 OpenCV 影像 (具有 shape 屬性)
+            if scale_img is not None and hasattr(scale_img, 'shape'):
+                scale_img_filename = f"scale_{plate}_{now_ts}{ext}"
+                scale_scene = self.evidence.scene(scale_img)
+                images.append((os.path.join(img_dir, scale_img_filename), scale_scene, quality,
+                               scale_scene is scale_img))
+
+                # CSV 存地磅照片的相對路徑
+                relative_scale_img_path = f"{rel_dir}/{scale_img_filename}"
+            elif scale_img is None:
+                # 系統開啟了地磅截圖功能，但沒有傳入圖片
+                print(f"[Database] 警告: 未收到地磅圖片 (車牌: {plate})")
+            else:
+                print(f"[Database] 錯誤: 傳入的地磅影像格式不符 (車牌: {plate})")
+
+        # ==========================================
+        # 3. 組合紀錄
+        # ==========================================
+        record = make_record(plate_status, plate, relative_img_path, scale_status, weight,
+                             scale_image=relative_scale_img_path, ts=ts)
+        record["plate_crop"] = relative_crop_path
+        return images, record
+
+    # ========================
+    # 非同步寫入 (write-behind)
+    # ========================
+    def _enqueue(self, images, record, plate):
+        """
+        把紀錄放入寫入佇列
+        佇列已滿代表儲存裝置暫時跟不上：先等待最多 enqueue_timeout 秒，仍然滿時改在呼叫端直接寫入
+        (這筆紀錄可能比佇列中較早的紀錄先寫入)；只有關閉 sync_fallback 時才丟棄並計數
+        """
+        # 呼叫端的原始畫面複製一份，之後可以放心覆寫；縮小後的畫面與特寫本來就是新的影像
+        futures = [self._pool.submit(self._write_image, path, img.copy() if borrowed else img, quality)
+                   for path, img, quality, borrowed in images]
+        try:
+            self._write_q.put((futures, record), timeout=self.enqueue_timeout)
+            return True
+        except queue.Full:
+            pass
+
+        if not self.sync_fallback:
+            for fut in futures:
+                fut.cancel()
+            self.dropped_count += 1
+            print(f"[Database] 警告: 寫入佇列已滿，丟棄紀錄 (車牌: {plate}, 累計丟棄 {self.dropped_count})")
+            return False
+
+        self.sync_count += 1
+        print(f"[Database] 警告: 寫入佇列已滿，改為直接寫入 (車牌: {plate}, 累計 {self.sync_count} 筆)")
+        written = self.written_count
+        self._commit_rows([self._collect_images(futures, record)])
+        return self.written_count > written
+
+    def _write_image(self, path, img, quality):
+        """
+        在編碼執行緒中完成編碼與寫檔
+        Returns: (檔案大小, 編碼秒數)
+        """
+        with self._save_time.time():
+            data, seconds = self.evidence.encode(img, quality)
+            self._encode_time.observe(seconds)
+            with open(path, "wb") as f:
+                f.write(data)
+        return len(data), seconds
+
+    def _record_images(self, results):
+        """累計一筆紀錄的圖片大小與編碼時間"""
+        size = sum(n for n, _ in results)
+        self.image_bytes += size
+        self.encode_seconds += sum(s for _, s in results)
+        RECORD_IMAGE_BYTES.observe(size)
+
+    def _writer_loop(self):
+        """唯一的紀錄寫入者：等圖片寫完後收集紀錄，達到筆數或時間門檻才一次寫入"""
+        pending_rows = []
+        batch_start = 0.0  # 這一批第一筆紀錄進來的時間
+
+        while True:
+            if pending_rows:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - batch_start))
+            else:
+                timeout = None
+            try:
+                item = self._write_q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._commit_rows(pending_rows)
+                break
+
+            if isinstance(item, threading.Event):
+                # flush() 的標記：前面的紀錄都已處理完畢
+                self._commit_rows(pending_rows)
+                pending_rows = []
+                item.set()
+                continue
+
+            if item is not None:
+                futures, record = item
+                record = self._collect_images(futures, record)
+                if not pending_rows:
+                    batch_start = time.monotonic()
+                pending_rows.append(record)
+
+            if pending_rows and (len(pending_rows) >= self.flush_rows or
+                                 time.monotonic() - batch_start >= self.flush_interval):
+                self._commit_rows(pending_rows)
+                pending_rows = []
+
+    def _collect_images(self, futures, record):
+        """等待一筆紀錄的圖片寫完 (寫入失敗只計數，紀錄照樣寫入)"""
+        results = []
+        for fut in futures:
+            try:
+                results.append(fut.result())
+            except Exception as e:
+                self.error_count += 1
+                print(f"[Database] 圖片寫入失敗: {e}")
+        self._record_images(results)
+        return record
+
+    def _commit_rows(self, rows):
+        """批次寫入 (group commit)"""
+        if not rows:
+            return
+        try:
+            with self._lock, self._commit_time.time():
+                self.store.append(rows)
+            self.written_count += len(rows)
+            print(f"[Database] 批次寫入 {len(rows)} 筆紀錄")
         except Exception as e:
+            self.error_count += len(rows)
             print(f"[Database] 寫入失敗: {e}")
+            return
+        self._index_rows(rows)
+
+    def _index_rows(self, rows):
+        """更新車牌搜尋索引；失敗不影響紀錄本身 (之後可用 tools/plate_search.py build 補建)"""
+        if self.plate_index is None:
+            return
+        try:
+            self.plate_index.add(rows)
+        except Exception as e:
+            print(f"[Database] 車牌索引更新失敗: {e}")
+
+    def flush(self, timeout=5.0):
+        """
+        等待佇列中所有紀錄寫入完成
+        Returns: True 代表在期限內全部寫完
+        """
+        if not self.async_write or not self._writer.is_alive():
+            return True
+        deadline = time.monotonic() + timeout
+        marker = threading.Event()
+        try:
+            self._write_q.put(marker, timeout=timeout)
+        except queue.Full:
             return False
+        return marker.wait(max(0.0, deadline - time.monotonic()))
+
+    def close(self, timeout=5.0):
+        """排空佇列並關閉檔案，供 SystemController.cleanup 呼叫"""
+        drained = True
+        deadline = time.monotonic() + timeout
+        if self.async_write and self._writer.is_alive():
+            drained = self.flush(timeout)
+            try:
+                self._write_q.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                drained = False
+            self._writer.join(max(0.0, deadline - time.monotonic()))
+            self._pool.shutdown(wait=False)
+            if not drained:
+                print(f"[Database] 警告: 關閉時仍有 {self._write_q.qsize()} 筆紀錄未寫入")
+
+        # 寫入執行緒可能仍卡在儲存裝置上，超過期限就不關閉檔案，避免關機流程被卡住
+        if not self._lock.acquire(timeout=max(0.0, deadline - time.monotonic()) if self.async_write else -1):
+            print("[Database] 警告: 紀錄仍在寫入中，未關閉紀錄檔")
+            return False
+        try:
+            self.store.close()
+        finally:
+            self._lock.release()
+        if self.plate_index is not None:
+            self.plate_index.close()
+        return drained
+
+    def stats(self):
+        """寫入佇列狀態，用來判斷 SD 卡是否跟不上"""
+        return {
+            "queue_depth": self._write_q.qsize() if self.async_write else 0,
+            "written": self.written_count,
+            "dropped": self.dropped_count,
+            "sync_writes": self.sync_count,
+            "errors": self.error_count,
+            # 每筆紀錄的證據圖片大小與編碼時間，用來比較不同 evidence 設定
+            "image_kb_per_record": round(self.image_bytes / 1024 / self.written_count, 1) if self.written_count else None,
+            "encode_ms_per_record": round(self.encode_seconds * 1000 / self.written_count, 2) if self.written_count else None,
+        }
 
 if __name__ == "__main__":
     # 簡單的單元測試
     import numpy as np
     db = DatabaseManager(enable_scale_img=True)
-    
+
     # 建立假的影像陣列來模擬攝影機畫面
     dummy_frame = np.zeros((480, 640, 3), dtype=np.uint8)
     dummy_scale = np.zeros((480, 640, 3), dtype=np.uint8)
-    
+
     # 測試寫入
     db.save_record("Valid", "ABC-1234", dummy_frame, "Stable", 3500.0, scale_img=dummy_scale)
+
+    # 測試 SQLite 後端 + 非同步寫入
+    async_db = DatabaseManager(enable_scale_img=True, async_write=True, backend="sqlite")
+    for i in range(5):
+        async_db.save_record("Valid", f"ABC-{i:04d}", dummy_frame, "Stable", 3500.0, scale_img=dummy_scale)
+    print(f"[Database] 佇列狀態: {async_db.stats()}")
+    async_db.close()
+    print(f"[Database] 關閉後狀態: {async_db.stats()}")
+
+    store = SqliteRecordStore(async_db.db_path)
+    print(f"[Database] ABC-0003 最後進場: {store.last_seen('ABC-0003')}")
+    print(f"[Database] 總重量: {store.total_weight()} kg")
+    store.close()
@@ -0,0 +1,105 @@
+import time
+
+import cv2
+
+# 編碼格式：(副檔名, 品質參數)
+CODECS = {
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+# 常用設定，可依閘口的頻寬與 SD 卡壽命挑選 (用 tools/evidence_report.py 比較實際大小)
+EVIDENCE_PRESETS = {
+    # 與舊版相同：原尺寸畫面，OpenCV 預設 JPEG 品質
+    "full": {},
+    # 640 寬的現場畫面 + 車牌特寫，JPEG 品質 80
+    "compact": {"scene_width": 640, "crop": True, "quality": 80},
+    # 480 寬灰階 WebP + 車牌特寫，頻寬很小的閘口
+    "minimal": {"scene_width": 480, "crop": True, "codec": "webp", "quality": 60, "grayscale": True},
+}
+
+
+class EvidenceProfile:
+    def __init__(self, scene_width=None, crop=False, crop_margin=0.15, crop_quality=None,
+                 codec="jpg", quality=95, grayscale=False):
+        """
+        每筆紀錄要存哪些證據圖片與編碼方式
+        Args:
+            scene_width (int): 現場畫面 (車牌照片欄位) 縮到多寬；None 代表原尺寸
+            crop (bool): 另存一張原解析度的車牌特寫 (車牌特寫欄位)
+            crop_margin (float): 特寫在車牌框外多留的比例 (相對於框的寬高)
+            crop_quality (int): 特寫的編碼品質；None 代表與 quality 相同
+            codec (str): "jpg" 或 "webp"
+            quality (int): 編碼品質 0~100
+            grayscale (bool): 存成灰階 (車牌與地磅畫面通常不需要顏色)
+        """
+        if codec not in CODECS:
+            raise ValueError(f"[Evidence] 不支援的編碼格式: {codec}")
+        self.scene_width = scene_width
+        self.crop = crop
+        self.crop_margin = crop_margin
+        self.codec = codec
+        self.ext, self._quality_flag = CODECS[codec]
+        self.quality = int(quality)
+        self.crop_quality = int(crop_quality if crop_quality is not None else quality)
+        self.grayscale = grayscale
+
+    @classmethod
+    def from_config(cls, config):
+        """None / 預設名稱 ("compact") / 參數 dict / EvidenceProfile 統一轉成 EvidenceProfile"""
+        if isinstance(config, cls):
+            return config
+        if config is None:
+            return cls()
+        if isinstance(config, str):
+            if config not in EVIDENCE_PRESETS:
+                raise ValueError(f"[Evidence] 沒有這個預設設定: {config}")
+            return cls(**EVIDENCE_PRESETS[config])
+        return cls(**config)
+
+    def scene(self, frame):
+        """
+        縮小後的現場畫面；不需要縮小時回傳原本的 frame (呼叫端自行決定是否複製)
+        縮小 (INTER_AREA) 本身就產生新的影像，比複製整張原圖還省時間
+        """
+        if self.scene_width is None or frame.shape[1] <= self.scene_width:
+            return frame
+        h, w = frame.shape[:2]
+        height = max(1, int(round(h * self.scene_width / w)))
+        return cv2.resize(frame, (self.scene_width, height), interpolation=cv2.INTER_AREA)
+
+    def crop_plate(self, frame, box):
+        """
+        從畫面裁出車牌特寫 (複製一份，之後在原畫面上畫框不影響特寫)
+        Returns: 影像；沒有啟用特寫或沒有車牌框時為 None
+        """
+        if not self.crop or box is None or frame is None:
+            return None
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = (int(v) for v in box)
+        mx = int((x2 - x1) * self.crop_margin)
+        my = int((y2 - y1) * self.crop_margin)
+        x1, y1 = max(0, x1 - mx), max(0, y1 - my)
+        x2, y2 = min(w, x2 + mx), min(h, y2 + my)
+        if x2 <= x1 or y2 <= y1:
+            return None
+        return frame[y1:y2, x1:x2].copy()
+
+    def encode(self, img, quality=None):
+        """
+        依設定編碼 (在編碼執行緒中呼叫)
+        Returns: (bytes, 編碼秒數)
+        """
+        t0 = time.perf_counter()
+        if self.grayscale and img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        params = [int(self._quality_flag), self.quality if quality is None else quality]
+        ok, buf = cv2.imencode(self.ext, img, params)
+        if not ok:
+            raise RuntimeError(f"{self.codec} 編碼失敗")
+        return buf.tobytes(), time.perf_counter() - t0
+
+    def describe(self):
+        width = f"{self.scene_width}px" if self.scene_width else "原尺寸"
+        return (f"{self.codec} q{self.quality} {width}" + (" +特寫" if self.crop else "") +
+                (" 灰階" if self.grayscale else ""))
@@ -0,0 +1,490 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import tarfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .archive import ARCHIVE_EXT, ArchiveReader
+from .record_store import FIELDS, LABEL_FIELDS, to_timestamp
+from .sync import BATCH_MANIFEST, file_sha256
+
+# 裝置代號與批次檔名可用的字元 (也避免路徑穿越)
+_NAME_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_.")
+
+# 取回照片時的 Content-Type
+CONTENT_TYPES = {".jpg": "image/jpeg", ".webp": "image/webp", ".png": "image/png"}
+
+
+def valid_name(name):
+    return bool(name) and len(name) <= 128 and set(name) <= _NAME_CHARS and name not in (".", "..")
+
+
+def _unsafe_member(name):
+    return os.path.isabs(name) or ".." in name.split("/")
+
+
+class IngestStore:
+    def __init__(self, root="fleet_data"):
+        """
+        車隊資料匯入的儲存端 (伺服器上執行)
+        紀錄：SQLite 單一資料表，(裝置, 車牌, 時間) 唯一，重送的 CSV 不會產生重複紀錄
+        檔案：以 SHA-256 命名存放 (content-addressed)，相同的圖片只存一份
+            objects/ab/abcdef....jpg
+        CSV 只解析上次之後新增的列 (前段內容不變時從上次的位置繼續)，歷史再長也不會重複解析
+        """
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.incoming_dir = os.path.join(self.root, "incoming")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.incoming_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # 匯入一次只處理一個批次 (CSV 解析位置必須依序更新)，上傳可同時進行
+        self._commit_lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.root, "fleet.db"), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        print(f"[Ingest] 資料庫已開啟: {self.root}")
+
+    def _create_schema(self):
+        columns = ",\n".join(f"{name} {sql_type}" for name, _, sql_type in FIELDS)
+        with self._lock, self._conn:
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    device TEXT NOT NULL,
+                    ts REAL NOT NULL,
+                    {columns},
+                    image_path TEXT,
+                    batch TEXT
+                )""")
+            # 舊版資料庫缺少的欄位補上 (裝置端新增紀錄欄位時不需手動遷移)
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(records)")}
+            for name, _, sql_type in FIELDS:
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE records ADD COLUMN {name} {sql_type}")
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_records_unique ON records(device, plate, ts)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_plate_ts ON records(plate, ts)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_ts ON records(ts)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_device_ts ON records(device, ts)")
+
+            # 裝置上的相對路徑 -> 內容雜湊 (紀錄的圖片路徑透過這張表找到檔案)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    device TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    received REAL NOT NULL,
+                    PRIMARY KEY (device, path)
+                )""")
+            # 每個 CSV 已解析到的位置
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS csv_progress (
+                    device TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    prefix_sha256 TEXT NOT NULL,
+                    header TEXT NOT NULL,
+                    PRIMARY KEY (device, path)
+                )""")
+            # 已匯入的批次 (確認收據)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS batches (
+                    device TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    received REAL NOT NULL,
+                    records INTEGER NOT NULL,
+                    files INTEGER NOT NULL,
+                    PRIMARY KEY (device, name)
+                )""")
+
+    # ========================
+    # 上傳 (續傳)
+    # ========================
+    def _part(self, device, name):
+        return os.path.join(self.incoming_dir, device, name + ".part")
+
+    def received_bytes(self, device, name):
+        try:
+            return os.path.getsize(self._part(device, name))
+        except FileNotFoundError:
+            return 0
+
+    def append(self, device, name, offset, stream, length, chunk_size=1 << 20):
+        """
+        把上傳的內容寫入 .part 的 offset 位置 (之後的內容截掉)
+        Returns: 寫入後的大小；offset 超過已收到的大小時回傳 None
+        """
+        part = self._part(device, name)
+        os.makedirs(os.path.dirname(part), exist_ok=True)
+        with open(part, "ab") as f:
+            if offset > f.tell():
+                return None
+            f.truncate(offset)
+            remaining = length
+            while remaining > 0:
+                chunk = stream.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+            return f.tell()
+
+    def is_committed(self, device, name):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM batches WHERE device = ? AND name = ?",
+                                      (device, name)).fetchone() is not None
+
+    def commit(self, device, name, sha256):
+        """
+        驗證雜湊並匯入批次 (同一個批次重複 commit 不會重複匯入)
+        Returns: {"records": 新增紀錄數, "files": 檔案數, "new_objects": 新存入的檔案數}；雜湊不符回傳 None
+        """
+        with self._commit_lock:
+            if self.is_committed(device, name):
+                return {"records": 0, "files": 0, "new_objects": 0, "duplicate": True}
+            part = self._part(device, name)
+            if not os.path.exists(part) or file_sha256(part) != sha256:
+                if os.path.exists(part):
+                    os.remove(part)
+                return None
+            size = os.path.getsize(part)
+            result = self.ingest_archive(device, name, part, sha256, size)
+            os.remove(part)
+            return result
+
+    # ========================
+    # 匯入
+    # ========================
+    def ingest_archive(self, device, name, archive_path, sha256, size):
+        """解開批次：檔案存成 objects，CSV 解析出紀錄後一次寫入"""
+        t0 = time.perf_counter()
+        files = []
+        rows = []
+        progress = []
+        rewritten = []
+        new_objects = 0
+        now = time.time()
+
+        with tarfile.open(archive_path, "r:gz") as tar:
+            for member in tar:
+                if not member.isfile() or member.name == BATCH_MANIFEST:
+                    continue
+                if _unsafe_member(member.name):
+                    print(f"[Ingest] 略過不安全的路徑: {device}/{member.name}")
+                    continue
+                data = tar.extractfile(member).read()
+                digest = hashlib.sha256(data).hexdigest()
+                files.append((device, member.name, digest, len(data), now))
+                if member.name.endswith(".csv"):
+                    # CSV 每次附加都會重送，內容已經寫入資料庫，不另外保存每個版本
+                    csv_rows, csv_progress, csv_rewritten = self._parse_csv(device, member.name, data, name)
+                    rows.extend(csv_rows)
+                    if csv_rewritten:
+                        rewritten.extend(csv_rows)
+                    if csv_progress is not None:
+                        progress.append(csv_progress)
+                else:
+                    if member.name.endswith(ARCHIVE_EXT):
+                        # 封存檔：封存前最後一次同步之後才寫入的紀錄只在封存檔裡，整份解析 (重複的列由唯一索引略過)
+                        rows.extend(self._parse_archive(device, member.name, data, name))
+                    new_objects += self._put_object(digest, data, os.path.splitext(member.name)[1])
+
+        names = ["device", "ts"] + [n for n, _, _ in FIELDS] + ["image_path", "batch"]
+        sql = f"INSERT OR IGNORE INTO records ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(sql, [[rec.get(n) for n in names] for rec in rows])
+            inserted = self._conn.total_changes - before
+            if rewritten:
+                # 裝置上的 CSV 被改寫過 (例如 tools/migrate_images.py 搬移圖片到日期分區)，
+                # 已存在的紀錄跟著更新照片路徑
+                self._conn.executemany(
+                    "UPDATE records SET plate_image = ?, scale_image = ?, plate_crop = ?, image_path = ? "
+                    "WHERE device = ? AND plate = ? AND ts = ? AND image_path IS NOT ?",
+                    [(rec.get("plate_image"), rec.get("scale_image"), rec.get("plate_crop"), rec["image_path"],
+                      device, rec.get("plate"), rec["ts"], rec["image_path"]) for rec in rewritten])
+            self._conn.executemany("INSERT OR REPLACE INTO files (device, path, sha256, size, received) "
+                                   "VALUES (?, ?, ?, ?, ?)", files)
+            self._conn.executemany("INSERT OR REPLACE INTO csv_progress (device, path, offset, prefix_sha256, header) "
+                                   "VALUES (?, ?, ?, ?, ?)", progress)
+            self._conn.execute("INSERT INTO batches (device, name, sha256, size, received, records, files) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)", (device, name, sha256, size, now, inserted, len(files)))
+
+        print(f"[Ingest] {device}/{name}: {len(files)} 個檔案 (新檔 {new_objects})，"
+              f"紀錄 {len(rows)} 列，新增 {inserted} 筆 ({time.perf_counter() - t0:.2f}s)")
+        return {"records": inserted, "files": len(files), "new_objects": new_objects}
+
+    def _put_object(self, digest, data, ext):
+        """Returns: 1 代表新存入，0 代表已經有相同內容"""
+        path = self.object_path(digest, ext)
+        if os.path.exists(path):
+            return 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return 1
+
+    def object_path(self, digest, ext=""):
+        return os.path.join(self.objects_dir, digest[:2], digest + ext.lower())
+
+    def _parse_csv(self, device, path, data, batch):
+        """
+        解析 CSV 中尚未匯入的列
+        前段內容與上次相同 (只有附加) 時從上次的位置繼續，否則整份重新解析 (重複的列由唯一索引略過)
+        Returns: (紀錄 list, 新的解析位置, 是否為改寫過的 CSV)；沒有新的完整列時位置為 None
+        """
+        with self._lock:
+            prog = self._conn.execute("SELECT * FROM csv_progress WHERE device = ? AND path = ?",
+                                      (device, path)).fetchone()
+        start, header, rewritten = 0, None, False
+        if prog is not None:
+            if len(data) >= prog["offset"] and \
+                    hashlib.sha256(data[:prog["offset"]]).hexdigest() == prog["prefix_sha256"]:
+                start, header = prog["offset"], json.loads(prog["header"])
+            else:
+                rewritten = True
+
+        # 只解析完整的列，最後一列還沒寫完的留到下次
+        end = data.rfind(b"\n") + 1
+        if end <= start:
+            return [], None, False
+        reader = csv.reader(io.StringIO(data[start:end].decode("utf-8-sig", "replace")))
+        if header is None:
+            header = [LABEL_FIELDS.get(label.strip()) for label in next(reader, [])]
+
+        rows = self._to_records(header, reader, device, batch)
+        return rows, (device, path, end, hashlib.sha256(data[:end]).hexdigest(), json.dumps(header)), rewritten
+
+    def _parse_archive(self, device, path, data, batch):
+        """解析封存檔 (.lpa，見 modules/archive.py) 中的所有紀錄"""
+        try:
+            reader = ArchiveReader(path, fileobj=io.BytesIO(data))
+            header = [LABEL_FIELDS.get(label.strip()) for label in reader.header]
+            return self._to_records(header, reader.iter_rows(), device, batch)
+        except (ValueError, zlib.error) as e:
+            print(f"[Ingest] 無法解析封存檔 {device}/{path}: {e}")
+            return []
+
+    def _to_records(self, header, rows, device, batch):
+        """CSV 列 (欄位順序為 header 的欄位名稱) 轉成紀錄 dict，時間格式錯誤的列略過"""
+        records = []
+        for row in rows:
+            rec = {name: value for name, value in zip(header, row) if name}
+            try:
+                rec["ts"] = to_timestamp(rec.get("time"))
+            except (TypeError, ValueError):
+                continue
+            for name in ("weight", "tare_weight", "net_weight"):
+                try:
+                    rec[name] = float(rec[name]) if rec.get(name) not in (None, "") else None
+                except ValueError:
+                    rec[name] = None
+            rec["device"] = device
+            rec["batch"] = batch
+            # 紀錄中的路徑為 runs/images/...，裝置上同步的相對路徑為 images/...
+            image = rec.get("plate_image") or ""
+            rec["image_path"] = image[len("runs/"):] if image.startswith("runs/") else image
+            records.append(rec)
+        return records
+
+    # ========================
+    # 查詢
+    # ========================
+    def query(self, plate=None, device=None, since=None, until=None, limit=100):
+        """
+        依車牌 / 裝置 / 時間區間查詢，最新的在前
+        每筆附上 image_sha256 (紀錄的車牌照片在 objects 中的雜湊，尚未收到則為 None)
+        """
+        where, params = [], []
+        if plate:
+            where.append("r.plate = ?")
+            params.append(plate)
+        if device:
+            where.append("r.device = ?")
+            params.append(device)
+        if since is not None:
+            where.append("r.ts >= ?")
+            params.append(to_timestamp(since))
+        if until is not None:
+            where.append("r.ts < ?")
+            params.append(to_timestamp(until))
+        sql = ("SELECT r.*, f.sha256 AS image_sha256 FROM records r "
+               "LEFT JOIN files f ON f.device = r.device AND f.path = r.image_path")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY r.ts DESC LIMIT ?"
+        params.append(int(limit))
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def stats(self):
+        with self._lock:
+            records = self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+            devices = [dict(row) for row in self._conn.execute(
+                "SELECT device, COUNT(*) AS records, MAX(ts) AS last_ts FROM records GROUP BY device")]
+            batches = self._conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+            # CSV 不另存 objects
+            files = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT CASE WHEN path NOT LIKE '%.csv' "
+                                       "THEN sha256 END) FROM files").fetchone()
+        return {"records": records, "batches": batches, "files": files[0], "objects": files[1], "devices": devices}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _IngestHandler(BaseHTTPRequestHandler):
+    """
+    裝置上傳 (與 modules/sync.py 的 HttpTransport 對應)：
+        GET  /v1/devices/<裝置>/batches/<批次>            {"received": 已收到的位元組數, "committed": bool}
+        PUT  /v1/devices/<裝置>/batches/<批次>?offset=N   從 offset 寫入 (續傳)
+        POST /v1/devices/<裝置>/batches/<批次>/commit?sha256=...
+    查詢：
+        GET  /v1/records?plate=&device=&since=&until=&limit=
+        GET  /v1/objects/<sha256>
+        GET  /v1/stats
+    """
+    store = None
+    token = None
+
+    def _send_json(self, obj, status=200):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        """Returns: (路徑片段, 查詢參數)；token 不符時回傳 (None, None)"""
+        url = urlsplit(self.path)
+        if self.token is not None and self.headers.get("Authorization") != f"Bearer {self.token}":
+            self.send_error(401)
+            return None, None
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        return parts, query
+
+    def _batch_target(self, parts):
+        """/v1/devices/<裝置>/batches/<批次>[/commit]"""
+        if len(parts) in (5, 6) and parts[:2] == ["v1", "devices"] and parts[3] == "batches" \
+                and valid_name(parts[2]) and valid_name(parts[4]):
+            return parts[2], parts[4]
+        return None, None
+
+    def do_GET(self):
+        parts, query = self._route()
+        if parts is None:
+            return
+        device, name = self._batch_target(parts)
+        if device is not None and len(parts) == 5:
+            self._send_json({"received": self.store.received_bytes(device, name),
+                             "committed": self.store.is_committed(device, name)})
+        elif parts == ["v1", "records"]:
+            try:
+                rows = self.store.query(query.get("plate"), query.get("device"), query.get("since"),
+                                        query.get("until"), min(int(query.get("limit", 100)), 10000))
+            except ValueError as e:
+                self._send_json({"error": str(e)}, 400)
+                return
+            self._send_json(rows)
+        elif len(parts) == 3 and parts[:2] == ["v1", "objects"] and valid_name(parts[2]):
+            self._send_object(parts[2])
+        elif parts == ["v1", "stats"]:
+            self._send_json(self.store.stats())
+        else:
+            self.send_error(404)
+
+    def _send_object(self, digest):
+        folder = os.path.join(self.store.objects_dir, digest[:2])
+        matches = [f for f in os.listdir(folder) if f.startswith(digest)] if os.path.isdir(folder) else []
+        if not matches:
+            self.send_error(404)
+            return
+        with open(os.path.join(folder, matches[0]), "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(os.path.splitext(matches[0])[1], "application/octet-stream"))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        parts, query = self._route()
+        if parts is None:
+            return
+        device, name = self._batch_target(parts)
+        if device is None or len(parts) != 5:
+            self.send_error(404)
+            return
+        try:
+            offset = int(query.get("offset", 0))
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            self.send_error(400)
+            return
+        received = self.store.append(device, name, offset, self.rfile, length)
+        if received is None:
+            # 用戶端的續傳位置超過已收到的內容，請它重新查詢
+            self._send_json({"received": self.store.received_bytes(device, name)}, 409)
+            return
+        self._send_json({"received": received})
+
+    def do_POST(self):
+        parts, query = self._route()
+        if parts is None:
+            return
+        device, name = self._batch_target(parts)
+        if device is None or len(parts) != 6 or parts[5] != "commit":
+            self.send_error(404)
+            return
+        try:
+            result = self.store.commit(device, name, query.get("sha256", ""))
+        except (tarfile.TarError, OSError, sqlite3.Error) as e:
+            print(f"[Ingest] {device}/{name} 匯入失敗: {e}")
+            self._send_json({"error": str(e)}, 500)
+            return
+        if result is None:
+            self._send_json({"error": "sha256 mismatch"}, 422)
+            return
+        self._send_json(result)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class IngestServer:
+    def __init__(self, store, port=8500, host="0.0.0.0", token=None):
+        """
+        車隊資料匯入的 HTTP 服務 (各閘口的 Jetson 以 HttpTransport 上傳批次)
+        Args:
+            store (IngestStore): 儲存端
+            token (str): 設定後所有請求都必須帶 Authorization: Bearer <token>
+        """
+        self.store = store
+        handler = type("IngestHandler", (_IngestHandler,), {"store": store, "token": token})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"[Ingest] HTTP 服務已啟動: http://{host}:{self.port}/v1/stats")
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -1,8 +1,28 @@
 import os
 import time
 import shutil
-import glob
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from .archive import ARCHIVE_EXT, write_archive
+
+# 視為證據圖片的副檔名 (見 modules/evidence.py 的編碼格式)
+IMAGE_EXTS = (".jpg", ".webp")
+
+def day_partitions(img_dir):
+    """
+    images/ 底下的日期分區資料夾 (images/YYYY/MM/DD)，由舊到新排序
+    Returns: [(當天 00:00 的 datetime, 資料夾路徑), ...]
+    """
+    days = []
+    for year in DataMaintenance._numeric_dirs(img_dir, 4):
+        for month in DataMaintenance._numeric_dirs(year.path, 2):
+            for day in DataMaintenance._numeric_dirs(month.path, 2):
+                try:
+                    days.append((datetime(int(year.name), int(month.name), int(day.name)), day.path))
+                except ValueError:
+                    continue
+    return days
+
 
 class DataMaintenance:
     def __init__(self, img_dir="runs/images", csv_path="runs/data_log.csv", archive_dir="runs/history"):
@@ -21,39 +41,133 @@ class DataMaintenance:
         os.makedirs(self.img_dir, exist_ok=True)
         os.makedirs(self.archive_dir, exist_ok=True)
 
-    def clean_old_images(self, days_to_keep=7):
+    def clean_old_images(self, days_to_keep=7, is_synced=None):
         """
         刪除超過 N 天的圖片
+        日期分區 (images/YYYY/MM/DD[/HH]/) 整個過期時直接刪除整個資料夾，不必逐檔檢查修改時間；
+        尚未遷移的舊版平面結構 (images/*.jpg、*.webp) 以 scandir 逐檔檢查
+        Args:
+            is_synced: 判斷圖片是否已安全送達伺服器的函式 (path -> bool)；
+                       有指定時只刪除已確認同步的圖片
         """
         now = time.time()
         cutoff = now - (days_to_keep * 86400) # 86400秒 = 1天
         
         count = 0
-        deleted_size_mb = 0
-        
-        # 取得所有 jpg 檔案
-        files = glob.glob(os.path.join(self.img_dir, "*.jpg"))
+        skipped = 0
+        free_before = shutil.disk_usage(self.img_dir).free
         
         print(f"[Maintenance] 檢查圖片過期狀況 (保留 {days_to_keep} 天)...")
         
-        for f in files:
+        # 1. 日期分區：以資料夾名稱判斷，只看天數 (或小時數) 個資料夾
+        partitions = 0
+        for path in self._expired_partitions(cutoff):
+            if is_synced is None:
+                n = sum(len(files) for _, _, files in os.walk(path))
+                try:
+                    shutil.rmtree(path)
+                    count += n
+                    partitions += 1
+                except OSError as e:
+                    print(f"[Error] 無法刪除 {path}: {e}")
+                continue
+            # 需要確認同步狀態時只能逐檔判斷，但也只限於過期的分區
+            for dirpath, _, files in os.walk(path):
+                for name in files:
+                    f = os.path.join(dirpath, name)
+                    if not is_synced(f):
+                        skipped += 1
+                        continue
+                    try:
+                        os.remove(f)
+                        count += 1
+                    except OSError as e:
+                        print(f"[Error] 無法刪除 {f}: {e}")
+            self._remove_empty_dirs(path)
+        self._prune_partitions()
+        
+        # 2. 舊版平面結構
+        with os.scandir(self.img_dir) as it:
+            for entry in it:
+                if not entry.is_file() or not entry.name.endswith(IMAGE_EXTS):
+                    continue
+                try:
+                    # 檢查檔案修改時間
+                    if entry.stat().st_mtime < cutoff:
+                        if is_synced is not None and not is_synced(entry.path):
+                            skipped += 1
+                            continue
+                        os.remove(entry.path)
+                        count += 1
+                except Exception as e:
+                    print(f"[Error] 無法刪除 {entry.path}: {e}")
+
+        deleted_size_mb = max(0, shutil.disk_usage(self.img_dir).free - free_before) / (1024 * 1024)
+        print(f"[Maintenance] 已刪除 {count} 張過期圖片 (整個刪除 {partitions} 個日期資料夾)，"
+              f"釋放空間: {deleted_size_mb:.2f} MB")
+        if skipped:
+            print(f"[Maintenance] {skipped} 張過期圖片尚未確認同步，暫不刪除")
+
+    @staticmethod
+    def _numeric_dirs(path, digits):
+        """path 底下名稱為 digits 位數字的子資料夾 (依名稱排序)"""
+        try:
+            with os.scandir(path) as it:
+                dirs = [e for e in it if e.is_dir() and len(e.name) == digits and e.name.isdigit()]
+        except FileNotFoundError:
+            return []
+        return sorted(dirs, key=lambda e: e.name)
+
+    def _expired_partitions(self, cutoff):
+        """
+        整個時段都早於 cutoff 的分區資料夾
+        整天過期的日期資料夾直接回傳 (不列出裡面的檔案)；跨越 cutoff 的那一天才檢查是否有小時分區
+        """
+        expired = []
+        for start, path in day_partitions(self.img_dir):
+            if (start + timedelta(days=1)).timestamp() <= cutoff:
+                expired.append(path)
+            elif start.timestamp() < cutoff:
+                for hour in self._numeric_dirs(path, 2):
+                    if (start + timedelta(hours=int(hour.name) + 1)).timestamp() <= cutoff:
+                        expired.append(hour.path)
+        return expired
+
+    @staticmethod
+    def _remove_empty_dirs(path):
+        """由下往上刪除 path (含) 底下空的資料夾"""
+        for dirpath, _, _ in os.walk(path, topdown=False):
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+
+    def _prune_partitions(self):
+        """移除已經清空的日 / 月 / 年資料夾 (rmdir 遇到非空資料夾直接失敗，不會列出檔案)"""
+        for year in self._numeric_dirs(self.img_dir, 4):
+            for month in self._numeric_dirs(year.path, 2):
+                for day in self._numeric_dirs(month.path, 2):
+                    try:
+                        os.rmdir(day.path)
+                    except OSError:
+                        pass
+                try:
+                    os.rmdir(month.path)
+                except OSError:
+                    pass
             try:
-                # 檢查檔案修改時間
-                if os.path.getmtime(f) < cutoff:
-                    size = os.path.getsize(f)
-                    os.remove(f)
-                    count += 1
-                    deleted_size_mb += size
-            except Exception as e:
-                print(f"[Error] 無法刪除 {f}: {e}")
-
-        deleted_size_mb /= (1024 * 1024)
-        print(f"[Maintenance] 已刪除 {count} 張過期圖片，釋放空間: {deleted_size_mb:.2f} MB")
-
-    def archive_csv(self):
+                os.rmdir(year.path)
+            except OSError:
+                pass
+
+    def archive_csv(self, compress=True):
         """
         將目前的 CSV 封存並重開一個新的
-        例如: data_log.csv -> runs/history/data_log_20250207.csv
+        例如: data_log.csv -> runs/history/data_log_20250207.lpa
+        Args:
+            compress (bool): 轉成有索引的區塊壓縮封存檔 (見 modules/archive.py)，
+                             tools/query_history.py 可依時間與車牌直接略過不相關的檔案；
+                             False 則與舊版相同，保留原本的 CSV
         """
         if not os.path.exists(self.csv_path):
             print("[Maintenance] CSV 檔案不存在，無需封存")
@@ -72,6 +186,34 @@ class DataMaintenance:
             # 注意：這裡不需建立新檔，DatabaseManager下次啟動時會自動建立
         except Exception as e:
             print(f"[Error] CSV 封存失敗: {e}")
+            return
+
+        if compress:
+            self.compress_archive(dest_path)
+
+    def compress_archive(self, csv_path):
+        """
+        把封存的 CSV 轉成壓縮封存檔，成功後才刪除 CSV
+        搬走的瞬間寫入執行緒可能還有一批紀錄寫進舊檔，轉換後檔案變大就重新轉換
+        Returns: 封存檔路徑；失敗時為 None (CSV 保留，查詢工具仍可讀取)
+        """
+        out_path = os.path.splitext(csv_path)[0] + ARCHIVE_EXT
+        try:
+            for _ in range(3):
+                size = os.path.getsize(csv_path)
+                index = write_archive(csv_path, out_path)
+                if os.path.getsize(csv_path) == size:
+                    break
+            else:
+                print(f"[Error] {csv_path} 持續被寫入，保留 CSV")
+                return None
+            os.remove(csv_path)
+        except Exception as e:
+            print(f"[Error] 封存檔轉換失敗，保留 CSV: {e}")
+            return None
+        print(f"[Maintenance] 已轉成封存檔 {out_path}: {index['rows']} 筆，"
+              f"{size / 1024:.0f} KB -> {os.path.getsize(out_path) / 1024:.0f} KB")
+        return out_path
 
     def check_disk_usage(self, warning_percent=90):
         """檢查硬碟空間，若不足則發出警告"""
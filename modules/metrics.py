@@ -0,0 +1,374 @@
+import bisect
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 處理時間的預設分桶 (秒)：涵蓋 1ms 的驗證到數秒的存檔
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    """指標的共同部分：依 label 值保存子項目"""
+    kind = ""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    @abstractmethod
+    def _new_child(self):
+        """建立一組 label 值的子項目"""
+
+    def labels(self, *values):
+        """
+        取得某組 label 值的子項目 (呼叫端應保存回傳值，熱路徑上不要每次查詢)
+        """
+        values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"[Metrics] {self.name} 需要 {len(self.labelnames)} 個 label")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def items(self):
+        with self._lock:
+            return list(self._children.items())
+
+    # 沒有 label 的指標可以直接呼叫子項目的方法
+    def __getattr__(self, attr):
+        if attr.startswith("_") or self.__dict__.get("labelnames", True):
+            raise AttributeError(attr)
+        return getattr(self._children[()], attr)
+
+
+class _Value:
+    """計數器 / 量表的值；可改由回呼函式在讀取時計算 (熱路徑完全不需要更新)"""
+    __slots__ = ("_value", "_fn", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._fn = None
+        self._lock = threading.Lock()
+
+    def set_function(self, fn):
+        """讀取時呼叫 fn() 取得數值，適合已經有統計屬性的物件 (例如 camera.frames_read)"""
+        self._fn = fn
+
+    def get(self):
+        if self._fn is not None:
+            try:
+                return float(self._fn())
+            except Exception:
+                return float("nan")
+        return self._value
+
+
+class _CounterValue(_Value):
+    __slots__ = ()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+
+class _GaugeValue(_Value):
+    __slots__ = ()
+
+    def set(self, value):
+        self._value = float(value)
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class _Timer:
+    __slots__ = ("_hist", "_t0")
+
+    def __init__(self, hist):
+        self._hist = hist
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.observe(time.perf_counter() - self._t0)
+        return False
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最後一格是 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """with hist.time(): ... 量測區塊的執行時間"""
+        return _Timer(self)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        """由分桶線性內插估計分位數 (只是估計值，精度取決於分桶)"""
+        counts, _, count = self.snapshot()
+        if count == 0:
+            return 0.0
+        target = q * count
+        seen = 0
+        lower = 0.0
+        for bound, n in zip(self.bounds + (float("inf"),), counts):
+            if n and seen + n >= target:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (target - seen) / n
+            seen += n
+            lower = bound if bound != float("inf") else lower
+        return lower
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """所有指標的集合，負責輸出 Prometheus 文字格式與 JSON 快照"""
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"[Metrics] 指標 {name} 已以不同型態註冊")
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for values, child in metric.items():
+                if metric.kind == "histogram":
+                    counts, total, count = child.snapshot()
+                    cumulative = 0
+                    for bound, n in zip(metric.buckets + (float("inf"),), counts):
+                        cumulative += n
+                        labels = _format_labels(metric.labelnames, values, ("le", _format_value(bound)))
+                        lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(metric.labelnames, values)
+                    lines.append(f"{metric.name}_sum{labels} {_format_value(total)}")
+                    lines.append(f"{metric.name}_count{labels} {count}")
+                else:
+                    labels = _format_labels(metric.labelnames, values)
+                    lines.append(f"{metric.name}{labels} {_format_value(child.get())}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        目前所有指標的數值 (寫入紀錄檔用)
+        直方圖只保留次數、總和與估計的 p50/p95/p99，檔案不會太大
+        """
+        result = {}
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            entries = {}
+            for values, child in metric.items():
+                key = ",".join(f"{k}={v}" for k, v in zip(metric.labelnames, values)) or "_"
+                if metric.kind == "histogram":
+                    _, total, count = child.snapshot()
+                    entries[key] = {
+                        "count": count,
+                        "sum": round(total, 6),
+                        "p50": round(child.quantile(0.50), 6),
+                        "p95": round(child.quantile(0.95), 6),
+                        "p99": round(child.quantile(0.99), 6),
+                    }
+                else:
+                    value = child.get()
+                    entries[key] = None if value != value else value  # NaN (回呼失敗) 寫成 null
+            result[metric.name] = entries
+        return result
+
+
+# 全程式共用的指標集合
+REGISTRY = MetricsRegistry()
+
+# 熱路徑上的指標：各模組取得自己的子項目後直接 observe / inc
+STAGE_SECONDS = REGISTRY.histogram(
+    "lpr_stage_seconds", "各處理階段的耗時 (capture/detect/ocr/validate/save)", ["stage"])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path in ("/metrics", "/"):
+            body = self.registry.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(self.registry.snapshot(), ensure_ascii=False).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        # 每次抓取都印 log 會洗版
+        pass
+
+
+class MetricsServer:
+    def __init__(self, port=9108, host="127.0.0.1", registry=REGISTRY):
+        """
+        本機 HTTP 端點：/metrics (Prometheus 文字格式) 與 /metrics.json
+        預設只綁定 127.0.0.1，需要讓外部 Prometheus 抓取時改成 "0.0.0.0"
+        """
+        handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"[Metrics] HTTP 端點已啟動: http://{host}:{self.port}/metrics")
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsFileWriter:
+    def __init__(self, path, interval=60.0, max_bytes=5 * 1024 * 1024, backups=3, registry=REGISTRY):
+        """
+        定期把指標快照寫成一行 JSON (JSON Lines)，沒有 Prometheus 時也能事後查看
+        檔案超過 max_bytes 時輪替為 path.1 ~ path.{backups}，磁碟用量固定
+        """
+        self.path = path
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._registry = registry
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        print(f"[Metrics] 每 {interval} 秒寫入指標紀錄: {path}")
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def write(self):
+        """立即寫入一筆快照"""
+        line = json.dumps({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "metrics": self._registry.snapshot()},
+                          ensure_ascii=False)
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                self._rotate()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"[Metrics] 指標紀錄寫入失敗: {e}")
+
+    def _loop(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
+
+    def close(self):
+        """停止並寫入最後一筆"""
+        self._stop_event.set()
+        self._thread.join(timeout=2.0)
+        self.write()
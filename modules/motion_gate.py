@@ -0,0 +1,112 @@
+import time
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    def __init__(self, scale_width=160, diff_threshold=25, min_changed_ratio=0.01,
+                 learning_rate=0.05, force_interval=2.0, hold_time=3.0, zones=None):
+        """
+        YOLO 前的低成本畫面變化過濾器 (縮小灰階 + 移動平均背景模型)
+        車道空著時跳過偵測，降低 Jetson 的功耗與溫度
+        Args:
+            scale_width (int): 縮小後的寬度 (像素)，高度依比例計算
+            diff_threshold (int): 與背景的灰階差超過此值才算「變化像素」
+            min_changed_ratio (float): 預設靈敏度，變化像素佔區域比例超過此值即喚醒偵測
+            learning_rate (float): 背景模型更新速度 (0~1)，越大越快適應光線變化
+            force_interval (float): 即使沒有變化，每隔幾秒仍強制偵測一次
+            hold_time (float): 偵測到變化後，持續偵測幾秒 (車輛停在地磅上時背景會慢慢吸收車輛)
+            zones (list): 靈敏度區域，座標為 0~1 的相對值
+                          [(x1, y1, x2, y2), ...] 或 [(x1, y1, x2, y2, min_changed_ratio), ...]
+                          未設定則使用整張畫面
+        """
+        self.scale_width = scale_width
+        self.diff_threshold = diff_threshold
+        self.min_changed_ratio = min_changed_ratio
+        self.learning_rate = learning_rate
+        self.force_interval = force_interval
+        self.hold_time = hold_time
+        self.zones = zones or [(0.0, 0.0, 1.0, 1.0)]
+
+        self._background = None
+        self._zone_slices = None
+        self._last_motion = 0.0
+        self._last_forced = 0.0
+
+        # 統計用
+        self.processed = 0
+        self.skipped = 0
+        self.forced = 0
+
+    def _prepare(self, frame):
+        """縮小、轉灰階、模糊 (去除雜訊)"""
+        h, w = frame.shape[:2]
+        scale_height = max(1, int(h * self.scale_width / float(w)))
+        small = cv2.resize(frame, (self.scale_width, scale_height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def _build_zones(self, shape):
+        """把相對座標換算成縮小後影像的 slice (只算一次)"""
+        h, w = shape
+        slices = []
+        for zone in self.zones:
+            x1, y1, x2, y2 = zone[:4]
+            ratio = zone[4] if len(zone) > 4 else self.min_changed_ratio
+            ys = slice(int(y1 * h), max(int(y1 * h) + 1, int(y2 * h)))
+            xs = slice(int(x1 * w), max(int(x1 * w) + 1, int(x2 * w)))
+            slices.append((ys, xs, ratio))
+        return slices
+
+    def has_motion(self, frame):
+        """與背景模型比較，任一區域的變化比例超過該區靈敏度即回傳 True"""
+        gray = self._prepare(frame)
+
+        if self._background is None:
+            self._background = gray.astype(np.float32)
+            self._zone_slices = self._build_zones(gray.shape)
+            return True
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        changed = diff > self.diff_threshold
+        cv2.accumulateWeighted(gray, self._background, self.learning_rate)
+
+        for ys, xs, ratio in self._zone_slices:
+            region = changed[ys, xs]
+            if np.count_nonzero(region) >= ratio * region.size:
+                return True
+        return False
+
+    def should_process(self, frame, now=None):
+        """
+        決定這張畫面是否需要送進 YOLO
+        每張畫面都要呼叫 (即使最後不偵測)，背景模型才會持續更新
+        """
+        now = time.time() if now is None else now
+
+        if self.has_motion(frame):
+            self._last_motion = now
+
+        if now - self._last_motion < self.hold_time:
+            self.processed += 1
+            self._last_forced = now
+            return True
+
+        if now - self._last_forced >= self.force_interval:
+            self.processed += 1
+            self.forced += 1
+            self._last_forced = now
+            return True
+
+        self.skipped += 1
+        return False
+
+    def stats(self):
+        total = self.processed + self.skipped
+        return {
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "forced": self.forced,
+            "skip_ratio": round(self.skipped / float(total), 3) if total else 0.0,
+        }
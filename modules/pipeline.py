@@ -0,0 +1,211 @@
+import threading
+import time
+from collections import deque
+
+
+class DropOldestQueue:
+    def __init__(self, maxsize=2, name="queue"):
+        """
+        有界佇列：滿了就丟掉最舊的項目
+        下游階段落後時只保留最新的畫面，端到端延遲不會無限累積
+        與 queue.Queue 相同，消費者處理完取出的項目後呼叫 task_done()，join() 等到所有項目處理完畢
+        """
+        self.maxsize = max(1, int(maxsize))
+        self.name = name
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._unfinished = 0  # 已放入但還沒呼叫 task_done 的項目數 (含已取出、處理中的項目)
+
+        # 統計用計數器
+        self.put_count = 0
+        self.drop_count = 0
+
+    def put(self, item):
+        """
+        放入一筆項目，若佇列已滿則丟棄最舊的一筆
+        Returns: 被丟棄的項目，沒有丟棄則回傳 None
+        """
+        with self._cond:
+            dropped = None
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.drop_count += 1
+            else:
+                self._unfinished += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+            return dropped
+
+    def get(self, timeout=None):
+        """取出最舊的一筆，逾時或佇列已關閉時回傳 None"""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def get_batch(self, max_items, timeout=None):
+        """等待至少一筆後，一次取出最多 max_items 筆 (逾時回傳空 list)"""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            batch = []
+            while self._items and len(batch) < max_items:
+                batch.append(self._items.popleft())
+            return batch
+
+    def task_done(self, count=1):
+        """消費者處理完 count 筆取出的項目 (不論成功與否)"""
+        with self._cond:
+            self._unfinished = max(0, self._unfinished - count)
+            if not self._unfinished:
+                self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """
+        等待所有放入的項目都被取出並呼叫 task_done
+        Returns: True 代表全部處理完畢，False 代表逾時
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._unfinished:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items)
+
+    def close(self):
+        """喚醒所有等待中的消費者"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class BlockingQueue(DropOldestQueue):
+    def __init__(self, maxsize=2, name="queue"):
+        """
+        有界佇列：滿了就讓生產者等待，絕不丟棄項目 (用於存檔，每個項目都可能是一筆紀錄)
+        關閉後 put 不再等待，直接放入，留給關閉流程排空
+        """
+        super().__init__(maxsize, name)
+        # 統計用：生產者因佇列已滿而等待的次數與秒數
+        self.block_count = 0
+        self.blocked_seconds = 0.0
+
+    def put(self, item):
+        """放入一筆項目，佇列已滿時等到有空位 (或佇列關閉) 為止；Returns: None (不會丟棄)"""
+        with self._cond:
+            if len(self._items) >= self.maxsize and not self._closed:
+                self.block_count += 1
+                t0 = time.perf_counter()
+                while len(self._items) >= self.maxsize and not self._closed:
+                    self._cond.wait()
+                self.blocked_seconds += time.perf_counter() - t0
+            self._items.append(item)
+            self._unfinished += 1
+            self.put_count += 1
+            self._cond.notify_all()
+            return None
+
+    def get(self, timeout=None):
+        item = super().get(timeout)
+        if item is not None:
+            with self._cond:
+                self._cond.notify_all()  # 喚醒等待空位的生產者
+        return item
+
+    def get_batch(self, max_items, timeout=None):
+        batch = super().get_batch(max_items, timeout)
+        if batch:
+            with self._cond:
+                self._cond.notify_all()
+        return batch
+
+    def drain(self):
+        """取出所有剩餘的項目 (關閉流程使用，由呼叫端直接處理，視為已完成)"""
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+            self._unfinished = max(0, self._unfinished - len(items))
+            self._cond.notify_all()
+            return items
+
+
+class FrameJob:
+    """在各階段之間傳遞的一張影像與它的處理結果"""
+    __slots__ = ("seq", "timestamp", "frame", "boxes", "detections", "plate", "finished", "lane",
+                 "transactions")
+
+    def __init__(self, frame, seq=0, timestamp=None, lane=None):
+        self.lane = lane  # 多車道時，這張畫面來自哪個車道
+        self.seq = seq
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.frame = frame
+        self.boxes = []
+        self.detections = []
+        self.plate = None
+        self.finished = []  # 追蹤模式下本張畫面完成的 track
+        self.transactions = []  # 過磅交易模式下這時完成的過磅
+
+
+class StageWorker(threading.Thread):
+    def __init__(self, name, func, in_q, out_q=None, stop_event=None, batch_size=None):
+        """
+        管線中的單一階段：從 in_q 取出項目，交給 func 處理後放入 out_q
+        func 回傳 None 代表此項目不再往下游傳遞
+        結果放入 out_q 之後才對 in_q 呼叫 task_done，in_q.join() 返回時所有結果都已在下游佇列中
+        指定 batch_size 時，func 一次收到最多 batch_size 筆的 list，並回傳要往下游傳遞的 list
+        """
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.in_q = in_q
+        self.out_q = out_q
+        self.batch_size = batch_size
+        self._stop_event = stop_event or threading.Event()
+
+        # 統計用
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if self.batch_size:
+                item = self.in_q.get_batch(self.batch_size, timeout=0.1) or None
+            else:
+                item = self.in_q.get(timeout=0.1)
+            if item is None:
+                continue
+
+            try:
+                self._process(item)
+            finally:
+                self.in_q.task_done(len(item) if self.batch_size else 1)
+
+    def _process(self, item):
+        t0 = time.perf_counter()
+        try:
+            result = self.func(item)
+        except Exception as e:
+            self.errors += 1
+            print(f"[Pipeline] {self.name} 階段錯誤: {e}")
+            return
+        finally:
+            self.busy_time += time.perf_counter() - t0
+        self.processed += 1
+
+        if result is None or self.out_q is None:
+            return
+        for out in (result if self.batch_size else [result]):
+            self.out_q.put(out)
+
+    def stop(self):
+        self._stop_event.set()
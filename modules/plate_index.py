@@ -0,0 +1,298 @@
+import csv
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from .archive import ARCHIVE_EXT, ArchiveReader
+from .record_store import LABEL_FIELDS, TIME_FORMAT, to_timestamp
+
+# 不是車牌的值 (未辨識的過磅紀錄)
+_NOT_PLATES = {"", "UNKNOWN", "NA"}
+_WILDCARDS = "*?"
+
+
+def plate_key(plate):
+    """比對用的車牌：轉大寫並去掉 "-" 與空白 (誤讀常常漏掉或多出 "-")"""
+    return "".join(c for c in str(plate).upper() if c.isalnum())
+
+
+def _grams(key):
+    """前後加上邊界符號的 2-gram (去重)"""
+    padded = f"^{key}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def edit_distance(a, b, limit):
+    """
+    Levenshtein 距離；超過 limit 時提早結束並回傳 limit + 1
+    只計算對角線附近 limit 寬的範圍，車牌長度下每次比對只要幾微秒
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+    over = limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        lo, hi = max(1, i - limit), min(len(b), i + limit)
+        cur = [over] * (len(b) + 1)
+        cur[0] = i if i <= limit else over
+        best = cur[0]
+        for j in range(lo, hi + 1):
+            cost = prev[j - 1] + (ca != b[j - 1])
+            if prev[j] + 1 < cost:
+                cost = prev[j] + 1
+            if cur[j - 1] + 1 < cost:
+                cost = cur[j - 1] + 1
+            cur[j] = cost
+            if cost < best:
+                best = cost
+        if best > limit:
+            return over
+        prev = cur
+    return min(prev[len(b)], over)
+
+
+class PlateIndex:
+    def __init__(self, db_path="runs/plate_index.db"):
+        """
+        車牌模糊搜尋索引：給操作人員用誤讀一兩個字的車牌 (或 ABC12?4、ABC* 這類萬用字元) 找出進場紀錄
+        - 磁碟 (SQLite)：不重複的車牌表與每次進場的時間、重量，依 (車牌, 時間) 排序存放
+        - 記憶體：車牌的 2-gram 反向索引 (只有不重複的車牌，數百萬筆紀錄通常只有數萬個車牌)
+        DatabaseManager 每次寫入紀錄時呼叫 add() 增量更新；既有的 CSV / 封存檔用 index_file() 補建
+        其他行程新增的車牌在下次查詢時自動載入，不需重建
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        # 寫入來自 DatabaseManager 的寫入執行緒，查詢可能來自其他執行緒，以鎖保護
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS plates (id INTEGER PRIMARY KEY, plate TEXT NOT NULL UNIQUE)")
+            # 同一車牌同一秒只算一次，重複匯入不會重複
+            self._conn.execute("CREATE TABLE IF NOT EXISTS visits (plate_id INTEGER NOT NULL, ts INTEGER NOT NULL, "
+                               "weight REAL, PRIMARY KEY (plate_id, ts)) WITHOUT ROWID")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_visits_ts ON visits(ts)")
+            # 已建入索引的檔案，未變更的檔案 index_file 時略過
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, size INTEGER, mtime REAL)")
+
+        self._ids = {}      # 車牌 -> id
+        self._plates = {}   # id -> (車牌, 比對用的 key)
+        self._grams = {}    # 2-gram -> [id, ...]
+        self._max_id = 0
+        t0 = time.perf_counter()
+        self._refresh()
+        print(f"[PlateIndex] 已載入 {len(self._plates)} 個車牌 ({time.perf_counter() - t0:.2f}s): {db_path}")
+
+    def _refresh(self):
+        """載入 id 大於已載入範圍的車牌 (本行程或其他行程新增的)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, plate FROM plates WHERE id > ? ORDER BY id",
+                                      (self._max_id,)).fetchall()
+            for pid, plate in rows:
+                key = plate_key(plate)
+                self._ids[plate] = pid
+                self._plates[pid] = (plate, key)
+                for gram in _grams(key):
+                    self._grams.setdefault(gram, []).append(pid)
+                self._max_id = pid
+
+    # ========================
+    # 寫入
+    # ========================
+    def add(self, records):
+        """
+        增量加入紀錄 (dict，至少有 plate 與 ts 或 time，weight 可省略)
+        Returns: 新增的進場筆數 (重複的忽略)
+        """
+        rows = []
+        new_plates = []
+        for rec in records:
+            plate = str(rec.get("plate") or "").strip()
+            if plate_key(plate) in _NOT_PLATES:
+                continue
+            ts = rec.get("ts")
+            try:
+                ts = int(ts) if ts is not None else int(to_timestamp(rec.get("time")))
+            except (TypeError, ValueError):
+                continue
+            try:
+                weight = float(rec.get("weight"))
+            except (TypeError, ValueError):
+                weight = None
+            if plate not in self._ids:
+                new_plates.append((plate,))
+            rows.append((plate, ts, weight))
+        if not rows:
+            return 0
+
+        with self._lock:
+            if new_plates:
+                with self._conn:
+                    self._conn.executemany("INSERT OR IGNORE INTO plates (plate) VALUES (?)", new_plates)
+                self._refresh()
+            with self._conn:
+                before = self._conn.total_changes
+                self._conn.executemany("INSERT OR IGNORE INTO visits (plate_id, ts, weight) VALUES (?, ?, ?)",
+                                       [(self._ids[plate], ts, weight) for plate, ts, weight in rows])
+                return self._conn.total_changes - before
+
+    def add_rows(self, header, rows, batch_size=5000):
+        """加入 CSV 格式的列 (header 為 CSV 標頭)，例如 data_log.csv 或 ArchiveReader.iter_rows()"""
+        names = [LABEL_FIELDS.get(label.strip()) for label in header]
+        added = 0
+        batch = []
+        for row in rows:
+            batch.append({name: value for name, value in zip(names, row) if name})
+            if len(batch) >= batch_size:
+                added += self.add(batch)
+                batch = []
+        return added + self.add(batch)
+
+    def index_file(self, path, force=False):
+        """
+        把 CSV 或封存檔 (.lpa) 建入索引；大小與修改時間沒變的檔案略過
+        Returns: 新增的進場筆數；略過時為 None
+        """
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime FROM sources WHERE path = ?", (key,)).fetchone()
+        if not force and row is not None and tuple(row) == (st.st_size, st.st_mtime):
+            return None
+        if path.endswith(ARCHIVE_EXT):
+            reader = ArchiveReader(path)
+            added = self.add_rows(reader.header, reader.iter_rows())
+        else:
+            with open(path, newline="", encoding="utf-8-sig") as f:
+                reader = csv.reader(f)
+                added = self.add_rows(next(reader, None) or [], reader)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO sources (path, size, mtime) VALUES (?, ?, ?)",
+                               (key, st.st_size, st.st_mtime))
+        return added
+
+    # ========================
+    # 查詢
+    # ========================
+    def match(self, query, max_distance=1):
+        """
+        找出相近的車牌
+        query 含 * (任意長度) 或 ? (任一字元) 時為萬用字元比對，距離一律為 0
+        Returns: [(車牌, 距離), ...]，距離小的在前
+        """
+        self._refresh()
+        if any(c in query for c in _WILDCARDS):
+            return self._match_wildcard(query)
+
+        key = plate_key(query)
+        if not key:
+            return []
+        with self._lock:
+            grams = _grams(key)
+            # 每一處編輯最多破壞 2 個 2-gram，相近的車牌至少有 len(grams) - 2d 個相同的 2-gram；
+            # 因此只要取最少見的 2d + 1 個 2-gram，候選必定出現在其中之一
+            need = 2 * max_distance + 1
+            if len(grams) > need:
+                rare = sorted(grams, key=lambda g: len(self._grams.get(g, ())))[:need]
+                candidates = set()
+                for gram in rare:
+                    candidates.update(self._grams.get(gram, ()))
+            else:
+                candidates = self._plates.keys()   # 查詢太短，過濾不了，直接逐一比對
+
+            matches = []
+            for pid in candidates:
+                plate, cand = self._plates[pid]
+                d = edit_distance(key, cand, max_distance)
+                if d <= max_distance:
+                    matches.append((plate, d))
+        matches.sort(key=lambda m: (m[1], m[0]))
+        return matches
+
+    def _match_wildcard(self, query):
+        pattern = "".join(c for c in query.upper() if c.isalnum() or c in _WILDCARDS)
+        regex = re.compile("".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern))
+        # 萬用字元以外的 2-gram (含頭尾邊界) 必定全部出現
+        padded = f"^{pattern}$"
+        grams = {padded[i:i + 2] for i in range(len(padded) - 1)
+                 if padded[i] not in _WILDCARDS and padded[i + 1] not in _WILDCARDS}
+        with self._lock:
+            if grams:
+                lists = sorted((self._grams.get(g, []) for g in grams), key=len)
+                candidates = set(lists[0])
+                for ids in lists[1:]:
+                    if len(candidates) < 64:
+                        break   # 候選已經很少，直接用正規表示式確認
+                    candidates.intersection_update(ids)
+            else:
+                candidates = self._plates.keys()
+            matches = [(self._plates[pid][0], 0) for pid in candidates if regex.fullmatch(self._plates[pid][1])]
+        matches.sort()
+        return matches
+
+    def search(self, query, max_distance=1, since=None, until=None, limit=100):
+        """
+        模糊搜尋進場紀錄
+        Args:
+            query: 車牌 (可含 * / ?)
+            max_distance: 允許的編輯距離 (錯、漏、多幾個字)
+            since / until: 時間範圍 (時間字串或 timestamp)
+            limit: 最多回傳幾筆
+        Returns: [{"plate", "distance", "ts", "time", "weight"}, ...]，距離小的在前，同距離新的在前
+        """
+        since = to_timestamp(since) if since is not None else None
+        until = to_timestamp(until) if until is not None else None
+        matches = self.match(query, max_distance)
+        results = []
+        with self._lock:
+            # 依距離分組查詢，近的先填滿 limit
+            tiers = {}
+            for plate, d in matches:
+                tiers.setdefault(d, []).append(self._ids[plate])
+            for d in sorted(tiers):
+                if len(results) >= limit:
+                    break
+                ids = tiers[d]
+                rows = []
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    sql = f"SELECT plate_id, ts, weight FROM visits WHERE plate_id IN ({','.join('?' * len(chunk))})"
+                    params = list(chunk)
+                    if since is not None:
+                        sql += " AND ts >= ?"
+                        params.append(since)
+                    if until is not None:
+                        sql += " AND ts <= ?"
+                        params.append(until)
+                    sql += " ORDER BY ts DESC LIMIT ?"
+                    params.append(limit - len(results))
+                    rows += self._conn.execute(sql, params).fetchall()
+                rows.sort(key=lambda r: -r[1])
+                for pid, ts, weight in rows[:limit - len(results)]:
+                    results.append({
+                        "plate": self._plates[pid][0],
+                        "distance": d,
+                        "ts": ts,
+                        "time": datetime.fromtimestamp(ts).strftime(TIME_FORMAT),
+                        "weight": weight,
+                    })
+        return results
+
+    def __len__(self):
+        return len(self._plates)
+
+    def stats(self):
+        with self._lock:
+            visits = self._conn.execute("SELECT COUNT(*) FROM visits").fetchone()[0]
+        return {"plates": len(self._plates), "visits": visits, "grams": len(self._grams)}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,240 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+_BOUNDARY = "lprframe"
+
+_INDEX_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Smart LPR Preview</title></head>
+<body style="background:#222;color:#eee;font-family:sans-serif">
+{body}
+</body></html>
+"""
+
+
+class _Channel:
+    """單一車道的預覽狀態：最新的 JPEG、連線中的觀看者數量"""
+
+    def __init__(self, name):
+        self.name = name
+        self.clients = 0
+        self.pending = None      # 等待編碼的畫面 (已縮小)
+        self.jpeg = None         # 最新編碼好的 JPEG
+        self.seq = 0
+        self.last_publish = 0.0
+
+
+class PreviewServer:
+    def __init__(self, port=8080, host="127.0.0.1", max_fps=5.0, max_width=640, quality=70):
+        """
+        MJPEG over HTTP 預覽 (不需要接螢幕，用瀏覽器開 http://<jetson>:<port>/ 觀看)
+        只有在有人連線時才縮圖、畫框與 JPEG 編碼，沒人看時 wants_frame() 直接回傳 False
+        Args:
+            host (str): 綁定的位址；預設只有本機可看，設為 "0.0.0.0" 才開放區網 (沒有驗證，任何人都能看到相機畫面)
+            max_fps (float): 每個車道最多每秒推送幾張
+            max_width (int): 畫面寬度上限，超過則等比例縮小
+            quality (int): JPEG 品質 (0~100)
+        """
+        self.max_fps = max_fps
+        self.max_width = max_width
+        self.quality = int(quality)
+        self._interval = 1.0 / max_fps if max_fps > 0 else 0.0
+
+        self._channels = {}
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # 統計用
+        self.encoded = 0
+
+        server = self
+
+        class Handler(_PreviewHandler):
+            preview = server
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+
+        self._encoder = threading.Thread(target=self._encode_loop, daemon=True)
+        self._encoder.start()
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"[Preview] MJPEG 預覽已啟動: http://{host}:{self.port}/ "
+              f"(最多 {max_fps} fps, 寬度 {max_width})")
+
+    def _channel(self, name):
+        channel = self._channels.get(name)
+        if channel is None:
+            with self._cond:
+                channel = self._channels.setdefault(name, _Channel(name))
+        return channel
+
+    def add_channel(self, name):
+        """預先建立車道，讓首頁列出所有車道"""
+        self._channel(name)
+
+    # ========================
+    # 影像來源端 (SystemController)
+    # ========================
+    def wants_frame(self, channel="main", now=None):
+        """有人在看且距離上一張已超過 1/max_fps 秒才回傳 True；呼叫端據此決定要不要準備畫面"""
+        ch = self._channels.get(channel)
+        if ch is None or ch.clients <= 0:
+            return False
+        now = time.monotonic() if now is None else now
+        return now - ch.last_publish >= self._interval
+
+    def publish(self, frame, channel="main"):
+        """
+        送出一張畫面 (只做縮圖，JPEG 編碼在背景執行緒)
+        縮圖會產生新的陣列，呼叫端之後可以繼續修改原畫面
+        """
+        ch = self._channel(channel)
+        h, w = frame.shape[:2]
+        if self.max_width and w > self.max_width:
+            small = cv2.resize(frame, (self.max_width, int(h * self.max_width / w)),
+                               interpolation=cv2.INTER_AREA)
+        else:
+            small = frame.copy()
+        with self._cond:
+            ch.pending = small
+            ch.last_publish = time.monotonic()
+            self._cond.notify_all()
+
+    # ========================
+    # 背景編碼
+    # ========================
+    def _encode_loop(self):
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+        while True:
+            with self._cond:
+                while not self._closed and not any(ch.pending is not None for ch in self._channels.values()):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                work = [(ch, ch.pending) for ch in self._channels.values() if ch.pending is not None]
+                for ch, _ in work:
+                    ch.pending = None
+
+            for ch, frame in work:
+                ok, buf = cv2.imencode(".jpg", frame, params)
+                if not ok:
+                    continue
+                with self._cond:
+                    ch.jpeg = buf.tobytes()
+                    ch.seq += 1
+                    self.encoded += 1
+                    self._cond.notify_all()
+
+    # ========================
+    # HTTP 端 (觀看者)
+    # ========================
+    def _wait_frame(self, ch, after_seq, timeout):
+        """等待比 after_seq 新的 JPEG，Returns: (seq, jpeg)；逾時或關閉時 jpeg 為 None"""
+        with self._cond:
+            self._cond.wait_for(lambda: ch.seq > after_seq or self._closed, timeout)
+            if ch.seq > after_seq and not self._closed:
+                return ch.seq, ch.jpeg
+            return after_seq, None
+
+    def _attach(self, ch, delta):
+        with self._cond:
+            ch.clients += delta
+
+    def stats(self):
+        return {
+            "clients": {name: ch.clients for name, ch in self._channels.items()},
+            "encoded": self.encoded,
+        }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _PreviewHandler(BaseHTTPRequestHandler):
+    preview = None
+
+    def _resolve(self, parts):
+        """/stream 或 /stream/<車道>；未指定時使用第一個車道"""
+        channels = list(self.preview._channels)
+        if len(parts) > 1:
+            return self.preview._channels.get(parts[1])
+        return self.preview._channels.get(channels[0]) if channels else None
+
+    def do_GET(self):
+        parts = [p for p in self.path.split("?", 1)[0].split("/") if p]
+        if not parts:
+            self._send_index()
+        elif parts[0] == "stream":
+            self._send_stream(self._resolve(parts))
+        elif parts[0] == "snapshot.jpg" or parts[0] == "snapshot":
+            self._send_snapshot(self._resolve(parts))
+        else:
+            self.send_error(404)
+
+    def _send_index(self):
+        names = list(self.preview._channels)
+        body = "".join(f'<h3>{name}</h3><img src="/stream/{name}"><br>' for name in names) or "<p>尚無畫面</p>"
+        data = _INDEX_HTML.format(body=body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, ch):
+        if ch is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Cache-Control", "no-cache, private")
+        self.send_header("Pragma", "no-cache")
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={_BOUNDARY}")
+        self.end_headers()
+
+        self.preview._attach(ch, 1)
+        seq = 0
+        try:
+            while not self.preview._closed:
+                seq, jpeg = self.preview._wait_frame(ch, seq, timeout=5.0)
+                if jpeg is None:
+                    continue
+                self.wfile.write(f"--{_BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                 f"Content-Length: {len(jpeg)}\r\n\r\n".encode("ascii"))
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # 觀看者關閉瀏覽器
+            pass
+        finally:
+            self.preview._attach(ch, -1)
+
+    def _send_snapshot(self, ch):
+        if ch is None:
+            self.send_error(404)
+            return
+        # 暫時算一個觀看者，讓影像來源送出一張新的畫面
+        self.preview._attach(ch, 1)
+        try:
+            _, jpeg = self.preview._wait_frame(ch, ch.seq, timeout=3.0)
+        finally:
+            self.preview._attach(ch, -1)
+        jpeg = jpeg or ch.jpeg
+        if jpeg is None:
+            self.send_error(503, "no frame")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(jpeg)))
+        self.end_headers()
+        self.wfile.write(jpeg)
+
+    def log_message(self, fmt, *args):
+        pass
@@ -0,0 +1,345 @@
+import csv
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# 紀錄欄位：(欄位名稱, CSV 標頭, SQLite 型別)
+# CSV 標頭與舊版 data_log.csv 完全相同，匯入/匯出都靠這張表對應
+FIELDS = [
+    ("time", "時間(Time)", "TEXT"),
+    ("plate_status", "車牌狀態(Plate_Status)", "TEXT"),
+    ("plate", "車牌(Plate)", "TEXT"),
+    ("plate_image", "車牌照片(Plate_Image)", "TEXT"),
+    ("scale_status", "地磅狀態(Scale_Status)", "TEXT"),
+    ("weight", "重量(Weight_KG)", "REAL"),
+    ("scale_image", "地磅照片(Scale_Image)", "TEXT"),
+    ("lane", "車道(Lane)", "TEXT"),
+    ("direction", "方向(Direction)", "TEXT"),
+    ("tare_weight", "空重(Tare_KG)", "REAL"),
+    ("net_weight", "淨重(Net_KG)", "REAL"),
+    ("plate_crop", "車牌特寫(Plate_Crop)", "TEXT"),
+]
+FIELD_LABELS = {name: label for name, label, _ in FIELDS}
+LABEL_FIELDS = {label: name for name, label, _ in FIELDS}
+# 舊版 data_log.csv 的欄位 (沒有開啟任何選用欄位時的 CSV 格式)
+LEGACY_FIELDS = ["time", "plate_status", "plate", "plate_image", "scale_status", "weight"]
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def to_timestamp(value):
+    """把 datetime / 'YYYY-mm-dd HH:MM:SS' 字串 / epoch 秒數 統一轉成 epoch 秒數"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.strptime(value.strip(), TIME_FORMAT).timestamp()
+    return float(value)
+
+
+class CsvRecordStore:
+    def __init__(self, file_path, fields):
+        """
+        CSV 後端：與舊版 data_log.csv 格式相同
+        檔案保持開啟，批次寫入；若檔案被封存 (搬走) 會自動重建並寫入標頭
+        既有檔案的標頭與設定的欄位不同時 (例如新開啟車牌特寫)，沿用檔案的標頭，封存後的新檔才使用新欄位
+        Args:
+            file_path: CSV 路徑
+            fields: 要寫入的欄位名稱 (順序即為 CSV 欄位順序)
+        """
+        self.file_path = file_path
+        self._wanted = list(fields)
+        self.fields = list(fields)
+        self._file = None
+        self._inode = None
+        self._header_inode = None  # 已讀過標頭的檔案
+        self.ensure_file_exists()
+
+    def ensure_file_exists(self):
+        """確保 CSV 檔案存在，若不存在則建立並寫入標頭；已存在則依檔案的標頭決定寫入的欄位"""
+        if not os.path.exists(self.file_path) or os.path.getsize(self.file_path) == 0:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            with open(self.file_path, mode='w', newline='', encoding='utf-8-sig') as f:
+                writer = csv.writer(f)
+                writer.writerow([FIELD_LABELS[name] for name in self._wanted])
+            self.fields = list(self._wanted)
+            self._header_inode = os.stat(self.file_path).st_ino
+            print(f"[Database] 已建立新資料庫: {self.file_path}")
+            return
+
+        inode = os.stat(self.file_path).st_ino
+        if inode == self._header_inode:
+            return
+        self._header_inode = inode
+        with open(self.file_path, newline='', encoding='utf-8-sig') as f:
+            header = next(csv.reader(f), None)
+        if not header:
+            return
+        # 不認得的欄位寫入空字串，保持每列的欄位數與標頭一致
+        self.fields = [LABEL_FIELDS.get(label.strip(), "") for label in header]
+        missing = [name for name in self._wanted if name not in self.fields]
+        if missing:
+            print(f"[Database] 警告: {self.file_path} 的標頭沒有 {missing} 欄位，封存後的新檔才會寫入")
+
+    def _open(self):
+        try:
+            inode = os.stat(self.file_path).st_ino
+        except FileNotFoundError:
+            inode = None
+
+        if self._file is not None and inode == self._inode:
+            return self._file
+
+        if self._file is not None:
+            self._file.close()
+        self.ensure_file_exists()
+        self._file = open(self.file_path, mode='a', newline='', encoding='utf-8-sig')
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        return self._file
+
+    def append(self, records):
+        """批次寫入多筆紀錄 (group commit)"""
+        f = self._open()
+        writer = csv.writer(f)
+        writer.writerows([[rec.get(name, "") for name in self.fields] for rec in records])
+        f.flush()
+
+    def query_time_range(self, start=None, end=None, limit=None):
+        """
+        依時間區間查詢 (start <= ts < end)，與 SqliteRecordStore 相同的回傳格式
+        只讀目前的 CSV (已封存的部分不在內)，每次都從頭讀，只適合啟動時這類偶爾的查詢
+        """
+        start_ts = to_timestamp(start)
+        end_ts = to_timestamp(end)
+        result = []
+        if not os.path.exists(self.file_path):
+            return result
+        if self._file is not None:
+            self._file.flush()
+        with open(self.file_path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            header = next(reader, None) or []
+            names = [LABEL_FIELDS.get(label.strip()) for label in header]
+            for row in reader:
+                rec = {name: value for name, value in zip(names, row) if name}
+                try:
+                    rec["ts"] = to_timestamp(rec.get("time"))
+                except (TypeError, ValueError):
+                    continue
+                if (start_ts is not None and rec["ts"] < start_ts) or (end_ts is not None and rec["ts"] >= end_ts):
+                    continue
+                for name in ("weight", "tare_weight", "net_weight"):
+                    try:
+                        rec[name] = float(rec[name]) if name in rec else None
+                    except (TypeError, ValueError):
+                        rec[name] = None
+                result.append(rec)
+                if limit and len(result) >= limit:
+                    break
+        return result
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SqliteRecordStore:
+    def __init__(self, db_path):
+        """
+        SQLite 後端 (WAL 模式)：車牌、時間與同步狀態都有索引
+        可快速回答「某車牌上次何時進場」「今天總重量」等問題
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        # 非同步模式下由寫入執行緒使用，查詢可能來自其他執行緒，以鎖保護
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 NORMAL 已能保證資料庫一致性，且大幅減少 SD 卡 fsync 次數
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        print(f"[Database] SQLite 資料庫已開啟: {db_path}")
+
+    def _create_schema(self):
+        columns = ",\n".join(f"{name} {sql_type}" for name, _, sql_type in FIELDS)
+        with self._lock, self._conn:
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ts REAL NOT NULL,
+                    {columns},
+                    synced INTEGER NOT NULL DEFAULT 0
+                )""")
+
+            # 舊版資料庫缺少的欄位補上 (新增欄位時不需手動遷移)
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(records)")}
+            for name, _, sql_type in FIELDS:
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE records ADD COLUMN {name} {sql_type}")
+
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_plate_ts ON records(plate, ts)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_ts ON records(ts)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_unsynced ON records(synced) WHERE synced = 0")
+            # 匯入舊 CSV 時用來避免重複
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_records_unique ON records(ts, plate, plate_image)")
+
+    # ========================
+    # 寫入
+    # ========================
+    def append(self, records):
+        """
+        批次寫入 (單一交易)
+        Returns: 實際新增的筆數 (重複的紀錄會被忽略)
+        """
+        names = ["ts"] + [name for name, _, _ in FIELDS]
+        sql = (f"INSERT OR IGNORE INTO records ({', '.join(names)}) "
+               f"VALUES ({', '.join('?' * len(names))})")
+        rows = [[rec.get(name) for name in names] for rec in records]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(sql, rows)
+            return self._conn.total_changes - before
+
+    def mark_synced(self, ids):
+        """將指定紀錄標記為已同步"""
+        ids = list(ids)
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE records SET synced = 1 WHERE id = ?", [(i,) for i in ids])
+
+    # ========================
+    # 查詢
+    # ========================
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def query_by_plate(self, plate, limit=20):
+        """依車牌查詢，最新的在前"""
+        return self._query(
+            "SELECT * FROM records WHERE plate = ? ORDER BY ts DESC LIMIT ?", (plate, limit))
+
+    def last_seen(self, plate):
+        """某車牌最後一次進場的紀錄，沒有則回傳 None"""
+        rows = self.query_by_plate(plate, limit=1)
+        return rows[0] if rows else None
+
+    def query_time_range(self, start=None, end=None, limit=None):
+        """依時間區間查詢 (start <= ts < end)，時間可為 datetime、字串或 epoch 秒數"""
+        start_ts = to_timestamp(start)
+        end_ts = to_timestamp(end)
+        sql = "SELECT * FROM records WHERE ts >= ? AND ts < ? ORDER BY ts"
+        params = [start_ts if start_ts is not None else float("-inf"),
+                  end_ts if end_ts is not None else float("inf")]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, params)
+
+    def total_weight(self, start=None, end=None):
+        """時間區間內的總重量 (kg)"""
+        start_ts = to_timestamp(start)
+        end_ts = to_timestamp(end)
+        rows = self._query(
+            "SELECT COALESCE(SUM(weight), 0) AS total FROM records WHERE ts >= ? AND ts < ?",
+            (start_ts if start_ts is not None else float("-inf"),
+             end_ts if end_ts is not None else float("inf")))
+        return rows[0]["total"]
+
+    def unsynced(self, limit=500, after_id=0):
+        """尚未同步到伺服器的紀錄 (id 大於 after_id，依 id 排序)"""
+        return self._query(
+            "SELECT * FROM records WHERE synced = 0 AND id > ? ORDER BY id LIMIT ?", (after_id, limit))
+
+    # ========================
+    # 匯入 / 匯出 CSV
+    # ========================
+    def import_csv(self, csv_path, batch_size=1000):
+        """
+        一次性匯入舊版 data_log.csv (可重複執行，重複的紀錄會被忽略)
+        Returns: 新增的筆數
+        """
+        with open(csv_path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if not header:
+                return 0
+            inserted = self.import_rows(header, reader, batch_size)
+        print(f"[Database] 已匯入 {csv_path}: 新增 {inserted} 筆")
+        return inserted
+
+    def import_rows(self, header, rows, batch_size=1000):
+        """
+        匯入 CSV 格式的列 (header 為 CSV 標頭，rows 為欄位 list)，例如封存檔 ArchiveReader.iter_rows()
+        Returns: 新增的筆數
+        """
+        inserted = 0
+        batch = []
+        names = [LABEL_FIELDS.get(label.strip()) for label in header]
+        for row in rows:
+            rec = {name: value for name, value in zip(names, row) if name}
+            try:
+                rec["ts"] = to_timestamp(rec.get("time"))
+            except (TypeError, ValueError):
+                print(f"[Database] 略過時間格式錯誤的資料: {row}")
+                continue
+            try:
+                rec["weight"] = float(rec.get("weight"))
+            except (TypeError, ValueError):
+                rec["weight"] = None
+            batch.append(rec)
+
+            if len(batch) >= batch_size:
+                inserted += self.append(batch)
+                batch = []
+
+        if batch:
+            inserted += self.append(batch)
+        return inserted
+
+    def export_csv(self, csv_path, start=None, end=None, fields=None):
+        """
+        匯出成 CSV (標頭與 data_log.csv 相同)
+        Args:
+            fields: 要匯出的欄位名稱；預設為舊版 data_log.csv 的欄位 (LEGACY_FIELDS)，
+                    既有的報表與 Excel 範本可直接使用；"all" 代表所有欄位 (車道、方向、空重等)
+        Returns: 匯出的筆數
+        """
+        if fields == "all":
+            fields = [name for name, _, _ in FIELDS]
+        fields = list(fields or LEGACY_FIELDS)
+        count = 0
+        with open(csv_path, mode='w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow([FIELD_LABELS[name] for name in fields])
+            for rec in self.query_time_range(start, end):
+                writer.writerow(["" if rec.get(name) is None else rec[name] for name in fields])
+                count += 1
+        print(f"[Database] 已匯出 {count} 筆至 {csv_path}")
+        return count
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def make_record(plate_status, plate, plate_image, scale_status, weight, scale_image="N/A", ts=None,
+                lane=None):
+    """組合一筆紀錄 (dict)，時間欄位由同一個 timestamp 產生確保一致"""
+    ts = time.time() if ts is None else ts
+    return {
+        "ts": ts,
+        "time": datetime.fromtimestamp(ts).strftime(TIME_FORMAT),
+        "plate_status": plate_status,
+        "plate": plate,
+        "plate_image": plate_image,
+        "scale_status": scale_status,
+        "weight": weight,
+        "scale_image": scale_image,
+        "lane": lane,
+    }
@@ -0,0 +1,265 @@
+import os
+import shutil
+import threading
+import time
+from datetime import timedelta
+
+from .maintenance import IMAGE_EXTS, DataMaintenance, day_partitions
+from .sync import SyncManifest
+
+
+class _Stopped(Exception):
+    """清理進行中收到停止訊號"""
+
+
+class RetentionDaemon:
+    def __init__(self, runs_dir="runs", budget_bytes=None, min_free_bytes=1 << 30, is_synced=None,
+                 require_sync=True, interval=300.0, slice_files=200, slice_pause=0.1, low_water=0.9,
+                 full_scan_interval=6 * 3600.0):
+        """
+        容量保留策略：runs/ 超過容量上限 (或磁碟剩餘空間不足) 時，由最舊的圖片開始刪除
+        只刪圖片，CSV / 資料庫 / 同步清單不會動；尚未確認同步的圖片一律保留
+        所有磁碟操作切成小段 (每 slice_files 個檔案暫停 slice_pause 秒)，辨識時不會出現 I/O 尖峰；
+        已經過去的日期分區大小會快取，每次檢查只重新計算當天的分區與分區以外的檔案
+        Args:
+            runs_dir: runs 資料夾
+            budget_bytes (int): runs/ 的容量上限；None 代表磁碟總容量的 60%
+            min_free_bytes (int): 磁碟剩餘空間低於此值時也開始清理
+            is_synced: 判斷圖片是否已送達伺服器的函式 (path -> bool)；
+                       None 時讀取同步清單 runs/.sync/manifest.db (見 modules/sync.py)
+            require_sync (bool): True (預設) 代表圖片一律要確認同步才能刪除，沒有同步清單 (從未同步、
+                                 同步失敗或清單遺失) 時不刪任何圖片；False 只用於沒有設定同步的裝置，
+                                 圖片不需確認即可刪除
+            interval (float): 背景檢查的間隔秒數；None 代表不啟動背景執行緒 (手動呼叫 run_once)
+            slice_files (int): 每一小段處理的檔案數
+            slice_pause (float): 每一小段之間暫停的秒數
+            low_water (float): 超過上限時清到 上限 * low_water 為止，避免每次檢查都只刪幾張
+            full_scan_interval (float): 每隔多久捨棄快取，重新計算所有分區的大小
+        """
+        self.runs_dir = os.path.abspath(runs_dir)
+        self.img_dir = os.path.join(self.runs_dir, "images")
+        os.makedirs(self.img_dir, exist_ok=True)
+        if budget_bytes is None:
+            budget_bytes = int(shutil.disk_usage(self.runs_dir).total * 0.6)
+        self.budget_bytes = budget_bytes
+        self.min_free_bytes = min_free_bytes
+        self.interval = interval
+        self.slice_files = slice_files
+        self.slice_pause = slice_pause
+        self.low_water = low_water
+        self.full_scan_interval = full_scan_interval
+
+        self._manifest = None
+        if is_synced is None and require_sync:
+            self._manifest = SyncManifest(os.path.join(self.runs_dir, ".sync", "manifest.db"))
+            is_synced = lambda path: self._manifest.is_synced(self.runs_dir, os.path.relpath(path, self.runs_dir))
+        self.is_synced = is_synced
+
+        self._sizes = {}        # 已經過去的日期分區 -> bytes
+        self._last_full_scan = 0.0
+        self._ops = 0
+        self._paused = 0.0
+
+        # 統計 (由 SystemController 註冊成指標)
+        self.passes = 0
+        self.usage_bytes = 0
+        self.deleted_files = 0
+        self.reclaimed_bytes = 0
+        self.skipped_unsynced = 0
+        self.busy_seconds = 0.0
+
+        self._stop_event = threading.Event()
+        self._thread = None
+        if interval is not None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+            print(f"[Retention] 每 {interval:.0f} 秒檢查 runs/ 容量 "
+                  f"(上限 {budget_bytes / 2**30:.1f} GB，磁碟至少保留 {min_free_bytes / 2**30:.1f} GB)")
+
+    def _loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.run_once()
+            except _Stopped:
+                break
+            except Exception as e:
+                print(f"[Retention] 清理時發生錯誤: {e}")
+
+    def _pause(self):
+        """每處理 slice_files 個檔案讓出磁碟一段時間；收到停止訊號時中止"""
+        self._ops += 1
+        if self._ops < self.slice_files:
+            return
+        self._ops = 0
+        t = time.perf_counter()
+        stopped = self._stop_event.wait(self.slice_pause)
+        self._paused += time.perf_counter() - t
+        if stopped:
+            raise _Stopped()
+
+    def _iter_files(self, path, skip=()):
+        """依名稱順序列出 path 底下所有檔案 (path, size, mtime)，分區名稱為數字所以由舊到新"""
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            self._pause()
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path not in skip:
+                        yield from self._iter_files(entry.path, skip)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    yield entry.path, st.st_size, st.st_mtime
+            except FileNotFoundError:
+                continue
+
+    def _is_open(self, start, now):
+        """當天 (以及剛過午夜，背景寫入可能還沒完成) 的分區仍在寫入，不快取大小也不刪除資料夾"""
+        return (start + timedelta(days=1, hours=1)).timestamp() > now
+
+    def _measure(self):
+        """
+        runs/ 目前的用量
+        Returns: (總 bytes, 日期分區 list, 舊版平面結構的圖片 [(mtime, path, size), ...])
+        """
+        now = time.time()
+        if now - self._last_full_scan > self.full_scan_interval:
+            self._sizes.clear()
+            self._last_full_scan = now
+
+        days = day_partitions(self.img_dir)
+        total = 0
+        for start, path in days:
+            size = self._sizes.get(path)
+            if size is None:
+                size = sum(s for _, s, _ in self._iter_files(path))
+                if not self._is_open(start, now):
+                    self._sizes[path] = size
+            total += size
+        live = {path for _, path in days}
+        self._sizes = {path: size for path, size in self._sizes.items() if path in live}
+
+        # 分區以外的檔案：CSV、資料庫、封存、同步暫存與舊版平面結構的圖片
+        years = {e.path for e in DataMaintenance._numeric_dirs(self.img_dir, 4)}
+        flat = []
+        for path, size, mtime in self._iter_files(self.runs_dir, skip=years):
+            total += size
+            if os.path.dirname(path) == self.img_dir and path.endswith(IMAGE_EXTS):
+                flat.append((mtime, path, size))
+        return total, days, flat
+
+    def _delete(self, path, size, result):
+        if self.is_synced is not None and not self.is_synced(path):
+            result["skipped"] += 1
+            return 0
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"[Retention] 無法刪除 {path}: {e}")
+            return 0
+        result["deleted"] += 1
+        result["reclaimed"] += size
+        return size
+
+    def _prune(self, path):
+        """刪除清空的分區資料夾 (小時、日、月、年)，不會超出 images/"""
+        for dirpath, _, _ in os.walk(path, topdown=False):
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+        parent = os.path.dirname(path)
+        while parent != self.img_dir and parent.startswith(self.img_dir):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+    def _evict(self, need, days, flat, result):
+        """由最舊的圖片開始刪除，直到釋放 need bytes"""
+        now = time.time()
+        candidates = [(mtime, path, size) for mtime, path, size in flat]
+        candidates += [(start.timestamp(), path, None) for start, path in days]
+        candidates.sort(key=lambda c: c[0])
+        for _, path, size in candidates:
+            if result["reclaimed"] >= need:
+                break
+            if size is not None:
+                self._pause()
+                self._delete(path, size, result)
+                continue
+            # 日期分區：資料夾內依名稱順序刪除
+            freed = 0
+            for f, f_size, _ in self._iter_files(path):
+                freed += self._delete(f, f_size, result)
+                if result["reclaimed"] >= need:
+                    break
+            if path in self._sizes:
+                self._sizes[path] -= freed
+            start = next(s for s, p in days if p == path)
+            if not self._is_open(start, now):
+                self._prune(path)
+
+    def run_once(self):
+        """
+        檢查一次容量，超過上限時清理
+        Returns: dict，包含 usage / free / deleted / reclaimed / skipped / seconds
+        """
+        t0 = time.perf_counter()
+        self._ops = 0
+        self._paused = 0.0
+        result = {"usage": 0, "free": 0, "deleted": 0, "reclaimed": 0, "skipped": 0, "seconds": 0.0}
+        try:
+            usage, days, flat = self._measure()
+            free = shutil.disk_usage(self.runs_dir).free
+            result["usage"], result["free"] = usage, free
+
+            need = 0
+            if usage > self.budget_bytes:
+                need = usage - int(self.budget_bytes * self.low_water)
+            if free < self.min_free_bytes:
+                need = max(need, self.min_free_bytes - free)
+            if need > 0:
+                self._evict(need, days, flat, result)
+                result["usage"] = usage - result["reclaimed"]
+        finally:
+            # 只計算實際工作的時間，不含分段之間的暫停
+            result["seconds"] = time.perf_counter() - t0 - self._paused
+            self.passes += 1
+            self.usage_bytes = result["usage"]
+            self.deleted_files += result["deleted"]
+            self.reclaimed_bytes += result["reclaimed"]
+            self.skipped_unsynced += result["skipped"]
+            self.busy_seconds += result["seconds"]
+
+        if need > 0:
+            print(f"[Retention] runs/ 用量 {usage / 2**30:.2f} GB (上限 {self.budget_bytes / 2**30:.2f} GB，"
+                  f"剩餘空間 {free / 2**30:.2f} GB)：刪除 {result['deleted']} 張最舊的圖片，"
+                  f"釋放 {result['reclaimed'] / 2**20:.1f} MB，耗時 {result['seconds']:.2f}s")
+            if result["reclaimed"] < need:
+                print(f"[Retention] 警告: 仍需釋放 {(need - result['reclaimed']) / 2**20:.1f} MB，"
+                      f"{result['skipped']} 張圖片尚未確認同步，暫不刪除")
+        return result
+
+    def stats(self):
+        return {
+            "passes": self.passes,
+            "usage_bytes": self.usage_bytes,
+            "budget_bytes": self.budget_bytes,
+            "deleted_files": self.deleted_files,
+            "reclaimed_bytes": self.reclaimed_bytes,
+            "skipped_unsynced": self.skipped_unsynced,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+    def close(self):
+        """停止背景執行緒 (進行中的清理會在下一個分段中止)"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+        if self._manifest is not None:
+            self._manifest.close()
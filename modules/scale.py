@@ -1,75 +1,279 @@
 import serial
 import time
 import random
-import re
+import math
+import threading
+from collections import deque, namedtuple
+
+from .scale_protocol import StreamParser, to_kg
+
+# 一筆地磅讀值；stable 為當下是否已穩定，mean 為穩定時視窗內的平均重量，overload 為儀表回報超載
+ScaleReading = namedtuple("ScaleReading", ["ts", "weight", "stable", "mean", "overload"])
+
+STATUS_STABLE = "穩定"
+STATUS_UNSTABLE = "不穩定"
+STATUS_OVERLOAD = "超載"
+STATUS_NO_SIGNAL = "無訊號"
+
 
 class ScaleDriver:
-    def __init__(self, port='/dev/ttyUSB0', baud=9600, simulate=True):
+    def __init__(self, port='/dev/ttyUSB0', baud=9600, simulate=True,
+                 buffer_size=512, window=1.0, tolerance=10.0, settle_time=1.5,
+                 min_samples=3, signal_timeout=3.0, sample_rate=10.0, protocol="csv"):
         """
         地磅訊號驅動程式
+        背景執行緒持續讀取 Serial Port，所有讀值附上時間戳存入環形緩衝，
+        get_weight() 只查詢最新一筆，不會阻塞偵測迴圈
         Args:
-            port (str): Serial Port 路徑 (例如 /dev/ttyUSB0)
+            port (str): Serial Port 路徑 (例如 /dev/ttyUSB0，或 tools/fake_scale.py 建立的虛擬終端)
             baud (int): 傳輸速率
             simulate (bool): 是否啟用模擬模式
+            buffer_size (int): 環形緩衝保留的讀值筆數
+            window (float): 穩定判斷的滑動視窗秒數
+            tolerance (float): 視窗內重量的標準差上限 (kg)，低於此值才視為靜止
+            settle_time (float): 必須連續靜止幾秒才算「穩定」
+            min_samples (int): 視窗內至少要有幾筆讀值才能判斷
+            signal_timeout (float): 超過幾秒沒有新讀值視為無訊號
+            sample_rate (float): 模擬模式每秒產生幾筆讀值
+            protocol: 儀表輸出格式 ("csv" / "stx_etx" / "toledo" 或 Protocol 物件，見 modules/scale_protocol.py)
         """
         self.port = port
         self.baud = baud
         self.simulate = simulate
         self.ser = None
-        
+
+        self.window = window
+        self.tolerance = tolerance
+        self.settle_time = settle_time
+        self.min_samples = max(2, int(min_samples))
+        self.signal_timeout = signal_timeout
+        self.sample_rate = sample_rate
+        self._parser = StreamParser(protocol)
+
+        self._ring = deque(maxlen=max(16, int(buffer_size)))
+        self._lock = threading.Lock()
+        self._latest = None          # 最新一筆 ScaleReading (單一屬性指派，讀取不需要鎖)
+        self._settle_start = None    # 目前這段連續靜止從何時開始
+
+        # 統計用
+        self.samples = 0
+        self.reconnects = 0
+        self.unit_errors = 0    # 不認得的單位 (計入 parse_errors)
+        self.net_frames = 0     # 淨重 (NT) 讀值：紀錄的重量一律為總重，淨重讀值不採用
+
         if not self.simulate:
             try:
-                self.ser = serial.Serial(self.port, self.baud, timeout=1)
+                self._open()
                 print(f"[Scale] Hardware connected at {self.port}")
             except serial.SerialException as e:
                 print(f"[Scale] Connection failed ({e}), switching to simulation mode")
                 self.simulate = True
 
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        # timeout 讓背景執行緒能定期檢查停止訊號
+        self.ser = serial.Serial(self.port, self.baud, timeout=0.2)
+
+    # ========================
+    # 背景讀取
+    # ========================
+    def _loop(self):
+        while not self._stop_event.is_set():
+            if self.simulate:
+                self._add_sample(self._simulated_weight())
+                self._stop_event.wait(1.0 / self.sample_rate)
+                continue
+
+            try:
+                if self.ser is None or not self.ser.is_open:
+                    self._open()
+                    self._parser.reset()
+                    self.reconnects += 1
+                    print(f"[Scale] Reconnected at {self.port}")
+                # 有多少讀多少 (至少等 1 個位元組或逾時)，框的切割交給 StreamParser
+                data = self.ser.read(self.ser.in_waiting or 1)
+            except (serial.SerialException, OSError) as e:
+                print(f"[Scale] Read error ({e}), retrying in 1s")
+                self._close_port()
+                self._stop_event.wait(1.0)
+                continue
+
+            if not data:
+                continue
+            for frame in self._parser.feed(data):
+                self._on_frame(frame)
+
+    def _on_frame(self, frame, ts=None):
+        """處理解析出的一框：換算單位、過濾後加入環形緩衝"""
+        frame = self._accept(frame)
+        if frame is None:
+            return
+        weight = frame.weight
+        if weight is None:
+            # 超載時儀表不一定送出數值，沿用上一筆
+            weight = self._latest.weight if self._latest is not None else 0.0
+        self._add_sample(weight, ts, motion=not frame.stable, overload=frame.overload)
+
+    def _accept(self, frame):
+        """換算成 kg 並拒絕淨重讀值；Returns: 可用的 ScaleFrame 或 None"""
+        converted = to_kg(frame)
+        if converted is None:
+            self.unit_errors += 1
+            if self.unit_errors == 1:
+                print(f"[Scale] 不支援的重量單位 {frame.unit!r}，讀值不採用")
+            return None
+        if converted.net:
+            # 儀表設在淨重模式 (已扣皮重)：當作總重記錄會與空重配對重複扣除
+            self.net_frames += 1
+            if self.net_frames == 1:
+                print("[Scale] 儀表輸出為淨重 (NT)，讀值不採用；請將儀表設定為總重 (GS) 輸出")
+            return None
+        return converted
+
+    @staticmethod
+    def _simulated_weight():
+        base = 3500.0
+        noise = random.uniform(-5.0, 5.0)
+        return round(base + noise, 1)
+
+    @property
+    def parse_errors(self):
+        return self._parser.errors + self.unit_errors
+
+    def _add_sample(self, weight, ts=None, motion=False, overload=False):
+        """
+        加入一筆讀值並更新穩定狀態
+        motion / overload: 儀表自己回報的晃動中 (US) 與超載 (OL)，任一成立都不算靜止
+        """
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            # 視窗內 (含本筆) 的讀值
+            values = [weight]
+            for r in reversed(self._ring):
+                if ts - r.ts > self.window:
+                    break
+                values.append(r.weight)
+
+            still = False
+            mean = None
+            if len(values) >= self.min_samples:
+                mean = sum(values) / len(values)
+                std = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+                still = std <= self.tolerance and not motion and not overload
+
+            if not still:
+                self._settle_start = None
+            elif self._settle_start is None:
+                self._settle_start = ts
+            stable = still and ts - self._settle_start >= self.settle_time
+
+            reading = ScaleReading(ts, weight, stable, round(mean, 1) if stable else None, overload)
+            self._ring.append(reading)
+            self._latest = reading
+            self.samples += 1
+
+    # ========================
+    # 查詢
+    # ========================
     def get_weight(self):
         """
-        讀取當前重量
+        讀取當前重量 (最新一筆讀值，不阻塞)
         Returns:
-            float: 重量 (kg)，若讀取失敗回傳 0.0
+            float: 重量 (kg)，尚無讀值或訊號中斷回傳 0.0
+        """
+        reading = self.latest()
+        return reading.weight if reading is not None else 0.0
+
+    def latest(self):
+        """最新一筆 ScaleReading；超過 signal_timeout 沒有新讀值則回傳 None"""
+        reading = self._latest
+        if reading is None or time.time() - reading.ts > self.signal_timeout:
+            return None
+        return reading
+
+    def is_stable(self):
+        reading = self.latest()
+        return reading is not None and reading.stable
+
+    def status(self):
+        """Returns: "穩定" / "不穩定" / "超載" / "無訊號" (寫入紀錄的地磅狀態)"""
+        reading = self.latest()
+        if reading is None:
+            return STATUS_NO_SIGNAL
+        if reading.overload:
+            return STATUS_OVERLOAD
+        return STATUS_STABLE if reading.stable else STATUS_UNSTABLE
+
+    def stable_weight_at(self, ts, max_age=None):
         """
-        # --- 模擬模式 ---
-        if self.simulate:
-            base = 3500.0
-            noise = random.uniform(-5.0, 5.0)
-            return round(base + noise, 1)
-
-        # --- 真實硬體模式 ---
-        if self.ser and self.ser.in_waiting:
+        時間點 ts (epoch 秒) 當下或之前最近一次的穩定重量
+        Args:
+            max_age (float): 穩定讀值最多可以比 ts 早幾秒，預設為 window + settle_time
+        Returns: 穩定視窗的平均重量 (kg)，找不到則回傳 None
+        """
+        max_age = self.window + self.settle_time if max_age is None else max_age
+        # 由新到舊直接掃描環形緩衝 (不複製)，通常查詢的是最近的時間點，只會看到最後幾筆
+        with self._lock:
+            for reading in reversed(self._ring):
+                if reading.ts > ts:
+                    continue
+                if ts - reading.ts > max_age:
+                    break
+                if reading.stable:
+                    return reading.mean
+        return None
+
+    def readings(self, since=None):
+        """環形緩衝中的讀值 (時間由舊到新)，可指定只取 since 之後的"""
+        with self._lock:
+            readings = list(self._ring)
+        if since is not None:
+            readings = [r for r in readings if r.ts >= since]
+        return readings
+
+    def stats(self):
+        return {
+            "samples": self.samples,
+            "parse_errors": self.parse_errors,
+            "net_frames": self.net_frames,
+            "discarded_bytes": self._parser.discarded,
+            "reconnects": self.reconnects,
+            "status": self.status(),
+        }
+
+    def _close_port(self):
+        if self.ser:
             try:
-                # 讀取並解碼，忽略解碼錯誤
-                line = self.ser.readline().decode('utf-8', errors='ignore').strip()
-                
-                # 使用正則表達式 (Regex) 提取數字 (支援整數與浮點數)
-                # 例如: "ST,GS,+ 3500kg" -> ['3500']
-                numbers = re.findall(r"[-+]?\d*\.\d+|\d+", line)
-                
-                if numbers:
-                    return float(numbers[0])
-            except Exception as e:
-                print(f"[Scale] Parse error: {e}")
-        
-        return 0.0
+                self.ser.close()
+            except Exception:
+                pass
+        self.ser = None
 
     def close(self):
-        """關閉連線"""
+        """停止背景讀取並關閉連線"""
+        self._stop_event.set()
+        self._thread.join(timeout=2.0)
         if self.ser:
-            self.ser.close()
+            self._close_port()
             print("[Scale] Connection closed")
 
 # --- 單元測試區塊 ---
 if __name__ == "__main__":
-    print("[Scale] Running module self-check (Simulation)...")
-    driver = ScaleDriver(simulate=True)
+    import sys
+    # python -m modules.scale [port]  (可搭配 tools/fake_scale.py 的虛擬終端)
+    port = sys.argv[1] if len(sys.argv) > 1 else None
+    print(f"[Scale] Running module self-check ({port or 'Simulation'})...")
+    driver = ScaleDriver(port=port, simulate=False) if port else ScaleDriver(simulate=True)
     try:
-        for _ in range(5):
+        for _ in range(10):
             w = driver.get_weight()
-            print(f"[Scale] Readout: {w} kg")
+            print(f"[Scale] Readout: {w} kg ({driver.status()}), "
+                  f"stable weight now: {driver.stable_weight_at(time.time())}")
             time.sleep(0.5)
-        print("[Scale] Test passed.")
+        print(f"[Scale] Test passed. {driver.stats()}")
     except KeyboardInterrupt:
         print("[Scale] Test interrupted.")
     finally:
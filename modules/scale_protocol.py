@@ -0,0 +1,312 @@
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+# 一筆解析完成的儀表輸出
+# weight: 重量 (有正負號；超載時可能為 None)，stable: 儀表判定靜止，overload: 超載 / 超出範圍，
+# net: True 為淨重 (NT)、False 為總重 (GS)，unit: 單位 (例如 "kg")
+ScaleFrame = namedtuple("ScaleFrame", ["weight", "stable", "overload", "net", "unit"])
+
+STX = b"\x02"
+ETX = b"\x03"
+
+# 儀表單位 -> kg 的倍數 (單位欄空白的儀表以 kg 計)
+UNIT_TO_KG = {
+    "": 1.0,
+    "kg": 1.0,
+    "t": 1000.0,
+    "lb": 0.45359237,
+    "lbs": 0.45359237,
+}
+
+_DIGITS = frozenset(b"0123456789.")
+_NUMBER_START = frozenset(b"+-0123456789.")
+
+
+def parse_weight(field):
+    """
+    從 ASCII 欄位取出有號數值與單位 (不使用 regex)
+    例如 b"+0035000kg" -> (35000.0, "kg")、b"- 12.5 t" -> (-12.5, "t")
+    Returns: (weight 或 None, unit)
+    """
+    n = len(field)
+    i = 0
+    while i < n and field[i] not in _NUMBER_START:
+        i += 1
+    sign = 1.0
+    if i < n and field[i] in (43, 45):  # '+' / '-'
+        if field[i] == 45:
+            sign = -1.0
+        i += 1
+        while i < n and field[i] == 32:  # 正負號與數字之間的空白
+            i += 1
+    j = i
+    while j < n and field[j] in _DIGITS:
+        j += 1
+    if j == i:
+        return None, ""
+    try:
+        value = float(field[i:j]) * sign
+    except ValueError:
+        return None, ""
+    return value, field[j:].strip().decode("ascii", "ignore").lower()
+
+
+def to_kg(frame):
+    """
+    把讀值換算成 kg
+    Returns: 單位為 "kg" 的 ScaleFrame；不認得的單位回傳 None (不能當作 kg 記錄)
+    """
+    factor = UNIT_TO_KG.get(frame.unit)
+    if factor is None:
+        return None
+    if factor == 1.0 or frame.weight is None:
+        return frame._replace(unit="kg")
+    return frame._replace(weight=round(frame.weight * factor, 3), unit="kg")
+
+
+class Protocol(ABC):
+    """
+    儀表連續輸出格式的定義
+    start / end 決定分框方式：start 為 None 代表以行為單位 (CR/LF)，否則從 start 開始到 end 結束
+    trailer 為 end 之後還有幾個位元組 (例如校驗碼)
+    """
+    name = "protocol"
+    start = None
+    end = b"\n"
+    trailer = 0
+    max_length = 64
+
+    @abstractmethod
+    def decode(self, payload, trailer):
+        """
+        payload: start 與 end 之間的內容；trailer: end 之後的位元組
+        Returns: ScaleFrame，格式或校驗碼錯誤回傳 None
+        """
+
+
+class CsvLineProtocol(Protocol):
+    """
+    常見的逗號分隔連續輸出 (A&D、多數台製儀表)，以 CR/LF 結尾
+    例如 "ST,GS,+0035000kg"、"US,NT,-0000120kg"、"OL,GS,+9999999kg"
+    """
+    name = "csv"
+
+    def __init__(self, end=b"\n"):
+        # 只送 CR 的儀表傳入 end=b"\r"
+        self.end = end
+
+    def decode(self, payload, trailer):
+        fields = payload.strip(b"\r\n").split(b",")
+        if len(fields) < 3:
+            return None
+        # 狀態只看最後兩個字元，容許前面夾雜斷線時的殘留位元組
+        status = fields[0][-2:]
+        if status not in (b"ST", b"US", b"OL"):
+            return None
+        weight, unit = parse_weight(fields[-1])
+        overload = status == b"OL"
+        if weight is None and not overload:
+            return None
+        return ScaleFrame(weight, status == b"ST", overload, fields[1].strip()[-2:] == b"NT", unit)
+
+
+class StxEtxProtocol(Protocol):
+    """
+    STX <狀態><數值><單位> ETX [BCC]
+    例如 b"\\x02ST+0035000kg\\x03"；checksum=True 時 ETX 之後多一個位元組，為內容的 XOR 校驗
+    """
+    name = "stx_etx"
+    start = STX
+    end = ETX
+    max_length = 32
+
+    def __init__(self, checksum=False):
+        self.checksum = checksum
+        self.trailer = 1 if checksum else 0
+
+    def decode(self, payload, trailer):
+        if self.checksum:
+            bcc = 0
+            for b in payload:
+                bcc ^= b
+            if bytes((bcc,)) != trailer:
+                return None
+        status = payload[:2]
+        if status in (b"ST", b"US", b"OL"):
+            body = payload[2:]
+        else:
+            # 沒有狀態字元的儀表視為一律靜止，由 ScaleDriver 自行判斷穩定
+            status, body = b"ST", payload
+        weight, unit = parse_weight(body)
+        overload = status == b"OL"
+        if weight is None and not overload:
+            return None
+        return ScaleFrame(weight, status == b"ST", overload, False, unit or "kg")
+
+
+class ToledoProtocol(Protocol):
+    """
+    Mettler Toledo 標準連續輸出 (Toledo Continuous)
+    STX SWA SWB SWC <6 位顯示重量> <6 位皮重> CR [CHK]
+    SWA bit0-2: 小數點位置；SWB bit0: 淨重、bit1: 負號、bit2: 超出範圍、bit3: 晃動中、bit4: kg
+    校驗碼為 STX~CR 總和的 7 位元二補數 (總和加上校驗碼後低 7 位元為 0)
+    """
+    name = "toledo"
+    start = STX
+    end = b"\r"
+    max_length = 15
+
+    # SWA 小數點位置 -> 顯示值要乘上的倍數
+    _SCALE = (100.0, 10.0, 1.0, 0.1, 0.01, 0.001, 0.0001, 0.00001)
+
+    def __init__(self, checksum=True):
+        self.checksum = checksum
+        self.trailer = 1 if checksum else 0
+
+    def decode(self, payload, trailer):
+        if len(payload) != 15:
+            return None
+        if self.checksum:
+            total = 2 + sum(payload) + 13  # STX + 內容 + CR
+            if (total + trailer[0]) & 0x7F != 0:
+                return None
+        swa, swb = payload[0], payload[1]
+        digits = payload[3:9]
+        try:
+            value = float(digits.replace(b" ", b"0"))
+        except ValueError:
+            return None
+        value *= self._SCALE[swa & 0x07]
+        if swb & 0x02:
+            value = -value
+        return ScaleFrame(round(value, 5), not swb & 0x08, bool(swb & 0x04), bool(swb & 0x01),
+                          "kg" if swb & 0x10 else "lb")
+
+
+PROTOCOLS = {
+    CsvLineProtocol.name: CsvLineProtocol,
+    StxEtxProtocol.name: StxEtxProtocol,
+    ToledoProtocol.name: ToledoProtocol,
+}
+
+
+def register_protocol(cls):
+    """註冊自訂格式 (可當作 decorator)，之後即可以名稱指定"""
+    PROTOCOLS[cls.name] = cls
+    return cls
+
+
+def get_protocol(protocol, **options):
+    """protocol 可為名稱 ("csv" / "stx_etx" / "toledo") 或 Protocol 物件"""
+    if isinstance(protocol, Protocol):
+        return protocol
+    try:
+        return PROTOCOLS[protocol](**options)
+    except KeyError:
+        raise ValueError(f"[Scale] 不支援的地磅格式: {protocol} (可用: {', '.join(sorted(PROTOCOLS))})")
+
+
+class StreamParser:
+    def __init__(self, protocol="csv", **options):
+        """
+        逐段餵入 Serial 讀到的位元組，回傳完整的框
+        框可以被切成任意多段送進來；遇到亂碼、斷線殘留或校驗錯誤只丟棄該段，下一框即可重新同步
+        """
+        self.protocol = get_protocol(protocol, **options)
+        self._buf = bytearray()
+        self._skip_line = False   # 行格式：丟棄到下一個換行為止 (過長的行已經計過錯誤)
+
+        # 統計用
+        self.frames = 0
+        self.errors = 0           # 分框成功但內容或校驗碼錯誤
+        self.discarded = 0        # 為了重新同步而丟棄的位元組數
+
+    def feed(self, data):
+        """
+        Args: data (bytes)
+        Returns: [ScaleFrame, ...]
+        """
+        p = self.protocol
+        buf = self._buf
+        buf += data
+        frames = []
+        pos = 0
+        n = len(buf)
+
+        while pos < n:
+            if p.start is not None:
+                s = buf.find(p.start, pos)
+                if s < 0:
+                    # 沒有起始位元組：之前的都是雜訊
+                    self.discarded += n - pos
+                    pos = n
+                    break
+                self.discarded += s - pos
+                body = s + len(p.start)
+            else:
+                body = pos
+                if self._skip_line:
+                    e = buf.find(p.end, body)
+                    end = n if e < 0 else e + len(p.end)
+                    self.discarded += end - pos
+                    pos = end
+                    self._skip_line = e < 0
+                    continue
+
+            e = buf.find(p.end, body)
+            if e < 0 or e - body > p.max_length:
+                if e < 0 and n - body <= p.max_length:
+                    # 框還沒收完，保留到下一次
+                    if p.start is not None:
+                        pos = body - len(p.start)
+                    break
+                # 太長還沒看到結束位元組：跳過這個起點重新同步
+                self.errors += 1
+                if p.start is not None:
+                    self.discarded += len(p.start)
+                    pos = body
+                else:
+                    end = n if e < 0 else e + len(p.end)
+                    self.discarded += end - pos
+                    pos = end
+                    self._skip_line = e < 0
+                continue
+
+            frame_end = e + len(p.end) + p.trailer
+            if frame_end > n:
+                # 等待校驗碼
+                pos = body - len(p.start) if p.start is not None else pos
+                break
+
+            payload = bytes(buf[body:e])
+            if p.start is None and not payload.strip():
+                # 空行 (例如 CR LF 之間的多餘換行) 不算錯誤
+                pos = frame_end
+                continue
+
+            frame = p.decode(payload, bytes(buf[e + len(p.end):frame_end]))
+            if frame is None:
+                self.errors += 1
+                if p.start is not None:
+                    # 錯誤的起始位元組可能是雜訊，從它之後繼續找下一個起點
+                    self.discarded += len(p.start)
+                    pos = body
+                else:
+                    self.discarded += frame_end - pos
+                    pos = frame_end
+                continue
+
+            frames.append(frame)
+            self.frames += 1
+            pos = frame_end
+
+        del buf[:pos]
+        return frames
+
+    def reset(self):
+        """重新連線後清掉殘留的半框"""
+        self._buf.clear()
+        self._skip_line = False
+
+    def stats(self):
+        return {"frames": self.frames, "errors": self.errors, "discarded": self.discarded}
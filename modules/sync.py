@@ -0,0 +1,760 @@
+import csv
+import fnmatch
+import hashlib
+import io
+import json
+import os
+import posixpath
+import re
+import shlex
+import shutil
+import sqlite3
+import subprocess
+import tarfile
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from .record_store import FIELD_LABELS, FIELDS, SqliteRecordStore
+
+# 檔案在 manifest 中的狀態
+STATE_PENDING = "pending"       # 新檔或內容已變更，尚未打包
+STATE_BATCHED = "batched"       # 已打包進某個批次，等待遠端確認
+STATE_CONFIRMED = "confirmed"   # 遠端已確認收到目前的內容
+
+# 批次內的清單檔 (遠端解開時略過)
+BATCH_MANIFEST = "MANIFEST.json"
+
+# 預設不同步的檔案：執行中的 SQLite 資料庫 (複製到一半會損毀)、同步暫存與指標紀錄
+# SQLite 後端的紀錄由 RecordExporter 匯出成 CSV 後同步
+DEFAULT_EXCLUDE = ["*.db", "*.db-wal", "*.db-shm", "*.tmp", ".sync/*", "metrics/*"]
+
+# SQLite 紀錄匯出的資料夾 (相對於 runs) 與檔名：records/records_<第一筆 id>-<最後一筆 id>.csv
+RECORD_EXPORT_DIR = "records"
+_EXPORT_NAME = re.compile(r"^records_(\d+)-(\d+)\.csv$")
+
+
+def file_sha256(path, limit=None, chunk_size=1 << 20):
+    """
+    計算檔案的 SHA-256
+    Args:
+        limit (int): 只計算前 limit 個位元組 (持續附加中的 CSV 以掃描當下的大小為準)
+    """
+    h = hashlib.sha256()
+    remaining = limit
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            n = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = f.read(n)
+            if not chunk:
+                break
+            h.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return h.hexdigest()
+
+
+class SyncManifest:
+    def __init__(self, db_path):
+        """
+        本地同步清單 (SQLite)：記錄每個檔案的大小、修改時間、SHA-256 與同步狀態
+        大小與修改時間沒變的檔案不重新計算雜湊；內容相同 (只被 touch) 的檔案不重送
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    batch_id INTEGER,
+                    confirmed_sha256 TEXT,
+                    confirmed_ts REAL
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS batches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT,
+                    size INTEGER,
+                    sha256 TEXT,
+                    state TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    confirmed REAL
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS batch_files (
+                    batch_id INTEGER NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_state ON files(state)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_batch_files_batch ON batch_files(batch_id)")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    # ========================
+    # 掃描
+    # ========================
+    def scan(self, root, exclude=None):
+        """
+        比對 root 底下的檔案與清單，新檔與內容有變更的檔案標記為 pending
+        已不存在的檔案從清單移除
+        Returns: {"scanned": 檔案數, "changed": 需要同步的檔案數, "hashed": 重新計算雜湊的檔案數}
+        """
+        exclude = DEFAULT_EXCLUDE if exclude is None else exclude
+        known = {row["path"]: row for row in self._query("SELECT * FROM files")}
+        seen = set()
+        updates = []
+        stats = {"scanned": 0, "changed": 0, "hashed": 0}
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                full = os.path.join(dirpath, filename)
+                rel = os.path.relpath(full, root).replace(os.sep, "/")
+                if any(fnmatch.fnmatch(rel, pattern) for pattern in exclude):
+                    continue
+                try:
+                    st = os.stat(full)
+                except FileNotFoundError:
+                    continue
+                seen.add(rel)
+                stats["scanned"] += 1
+
+                row = known.get(rel)
+                if row is not None and row["size"] == st.st_size and row["mtime"] == st.st_mtime:
+                    continue
+
+                sha = file_sha256(full, limit=st.st_size)
+                stats["hashed"] += 1
+                if row is not None and row["sha256"] == sha:
+                    # 內容沒變 (例如只被 touch)，只更新大小與時間
+                    updates.append(("touch", rel, st.st_size, st.st_mtime, sha))
+                    continue
+                updates.append(("change", rel, st.st_size, st.st_mtime, sha))
+                stats["changed"] += 1
+
+        removed = [path for path in known if path not in seen]
+        with self._lock, self._conn:
+            for kind, rel, size, mtime, sha in updates:
+                if kind == "touch":
+                    self._conn.execute("UPDATE files SET size = ?, mtime = ? WHERE path = ?", (size, mtime, rel))
+                else:
+                    # JetPack 4 (Ubuntu 18.04) 的 SQLite 沒有 UPSERT，先更新再新增
+                    cur = self._conn.execute(
+                        "UPDATE files SET size = ?, mtime = ?, sha256 = ?, state = ?, batch_id = NULL "
+                        "WHERE path = ?", (size, mtime, sha, STATE_PENDING, rel))
+                    if cur.rowcount == 0:
+                        self._conn.execute("INSERT INTO files (path, size, mtime, sha256, state) "
+                                           "VALUES (?, ?, ?, ?, ?)", (rel, size, mtime, sha, STATE_PENDING))
+            self._conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in removed])
+        return stats
+
+    # ========================
+    # 批次
+    # ========================
+    def pending(self):
+        return self._query("SELECT * FROM files WHERE state = ? ORDER BY path", (STATE_PENDING,))
+
+    def open_batches(self):
+        """已打包但尚未確認的批次 (上次中斷的傳輸)，舊的在前"""
+        return self._query("SELECT * FROM batches WHERE state = ? ORDER BY id", (STATE_BATCHED,))
+
+    def discard_unfinished(self):
+        """打包到一半就中斷的批次 (沒有任何檔案指向它) 直接刪除"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM batches WHERE state = ?", (STATE_PENDING,))
+
+    def new_batch(self):
+        with self._lock, self._conn:
+            cur = self._conn.execute("INSERT INTO batches (state, created) VALUES (?, ?)",
+                                     (STATE_PENDING, time.time()))
+            return cur.lastrowid
+
+    def finish_batch(self, batch_id, name, size, sha256, members):
+        """
+        打包完成：記錄批次檔與實際打包的內容
+        Args:
+            members: [(path, size, sha256), ...]
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE batches SET name = ?, size = ?, sha256 = ?, state = ? WHERE id = ?",
+                               (name, size, sha256, STATE_BATCHED, batch_id))
+            self._conn.executemany("INSERT INTO batch_files (batch_id, path, size, sha256) VALUES (?, ?, ?, ?)",
+                                   [(batch_id, p, s, h) for p, s, h in members])
+            # 打包期間又被修改的檔案維持 pending，下次再送
+            self._conn.executemany(
+                "UPDATE files SET state = ?, batch_id = ? WHERE path = ? AND sha256 = ? AND state = ?",
+                [(STATE_BATCHED, batch_id, p, h, STATE_PENDING) for p, _, h in members])
+
+    def drop_batch(self, batch_id):
+        """批次檔遺失或打包失敗：內容退回 pending 重新打包"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE files SET state = ?, batch_id = NULL WHERE batch_id = ? AND state = ?",
+                               (STATE_PENDING, batch_id, STATE_BATCHED))
+            self._conn.execute("DELETE FROM batch_files WHERE batch_id = ?", (batch_id,))
+            self._conn.execute("DELETE FROM batches WHERE id = ?", (batch_id,))
+
+    def confirm_batch(self, batch_id):
+        """
+        遠端確認收到批次：批次內容與目前內容相同的檔案標記為 confirmed
+        Returns: 批次內的檔案數
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            members = self._conn.execute("SELECT path, sha256 FROM batch_files WHERE batch_id = ?",
+                                         (batch_id,)).fetchall()
+            for path, sha in members:
+                self._conn.execute("""
+                    UPDATE files SET confirmed_sha256 = ?, confirmed_ts = ?,
+                        state = CASE WHEN sha256 = ? THEN ? ELSE state END,
+                        batch_id = CASE WHEN sha256 = ? THEN NULL ELSE batch_id END
+                    WHERE path = ?""", (sha, now, sha, STATE_CONFIRMED, sha, path))
+            self._conn.execute("UPDATE batches SET state = ?, confirmed = ? WHERE id = ?",
+                               (STATE_CONFIRMED, now, batch_id))
+            self._conn.execute("DELETE FROM batch_files WHERE batch_id = ?", (batch_id,))
+        return len(members)
+
+    # ========================
+    # 查詢
+    # ========================
+    def is_synced(self, root, rel_path):
+        """
+        檔案目前的內容是否已被遠端確認 (清理前的安全檢查)
+        大小或修改時間與清單不同代表之後又被修改，視為未同步
+        """
+        rel_path = rel_path.replace(os.sep, "/")
+        rows = self._query("SELECT * FROM files WHERE path = ?", (rel_path,))
+        if not rows or rows[0]["state"] != STATE_CONFIRMED:
+            return False
+        try:
+            st = os.stat(os.path.join(root, rel_path))
+        except FileNotFoundError:
+            return False
+        return st.st_size == rows[0]["size"] and st.st_mtime == rows[0]["mtime"]
+
+    def batch_paths(self, batch_id):
+        """批次內的檔案 (確認前查詢，confirm_batch 會清掉批次內容)"""
+        return [row["path"] for row in self._query("SELECT path FROM batch_files WHERE batch_id = ?", (batch_id,))]
+
+    def stats(self):
+        rows = self._query("SELECT state, COUNT(*) AS n, COALESCE(SUM(size), 0) AS bytes FROM files GROUP BY state")
+        return {row["state"]: {"files": row["n"], "bytes": row["bytes"]} for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RecordExporter:
+    def __init__(self, root, db_path, batch_rows=5000):
+        """
+        SQLite 後端的紀錄同步：資料庫本身不能在寫入中複製，
+        因此把尚未同步的紀錄匯出成與 data_log.csv 相同格式的 CSV，隨批次送出 (匯入服務照常解析)；
+        遠端確認收到該批次後才將紀錄標記為已同步並刪除匯出檔
+        Args:
+            root (str): runs 資料夾，匯出檔放在 <root>/records/
+            db_path (str): SQLite 紀錄資料庫
+            batch_rows (int): 每個匯出檔最多幾筆
+        """
+        self.export_dir = os.path.join(root, RECORD_EXPORT_DIR)
+        self.db_path = db_path
+        self.batch_rows = batch_rows
+        self._store = None
+
+    def _open(self):
+        if self._store is None:
+            self._store = SqliteRecordStore(self.db_path)
+        return self._store
+
+    def _pending_ranges(self):
+        """已匯出但尚未確認的檔案：[(第一筆 id, 最後一筆 id, 檔名), ...]"""
+        ranges = []
+        if os.path.isdir(self.export_dir):
+            for name in os.listdir(self.export_dir):
+                m = _EXPORT_NAME.match(name)
+                if m:
+                    ranges.append((int(m.group(1)), int(m.group(2)), name))
+        return sorted(ranges)
+
+    def export(self):
+        """
+        匯出尚未同步、也還沒匯出過的紀錄 (id 大於已匯出檔案的範圍)
+        Returns: 匯出的筆數
+        """
+        store = self._open()
+        after = max((hi for _, hi, _ in self._pending_ranges()), default=0)
+        names = [name for name, _, _ in FIELDS]
+        exported = 0
+        while True:
+            rows = store.unsynced(limit=self.batch_rows, after_id=after)
+            if not rows:
+                break
+            lo, hi = rows[0]["id"], rows[-1]["id"]
+            os.makedirs(self.export_dir, exist_ok=True)
+            path = os.path.join(self.export_dir, f"records_{lo}-{hi}.csv")
+            with open(path + ".tmp", "w", newline="", encoding="utf-8-sig") as f:
+                writer = csv.writer(f)
+                writer.writerow([FIELD_LABELS[name] for name in names])
+                writer.writerows([["" if rec.get(name) is None else rec[name] for name in names] for rec in rows])
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+            exported += len(rows)
+            after = hi
+        if exported:
+            print(f"[Sync] 已匯出 {exported} 筆 SQLite 紀錄待同步")
+        return exported
+
+    def confirmed(self, rel_paths):
+        """
+        遠端已確認的檔案中，屬於紀錄匯出檔的：標記為已同步並刪除匯出檔
+        id 依序遞增，範圍內未同步的紀錄就是當初匯出的那些
+        Returns: 標記為已同步的匯出檔數
+        """
+        prefix = RECORD_EXPORT_DIR + "/"
+        count = 0
+        for rel in rel_paths:
+            if not rel.startswith(prefix):
+                continue
+            m = _EXPORT_NAME.match(rel[len(prefix):])
+            if not m:
+                continue
+            self._open().mark_synced(range(int(m.group(1)), int(m.group(2)) + 1))
+            try:
+                os.remove(os.path.join(self.export_dir, rel[len(prefix):]))
+            except FileNotFoundError:
+                pass
+            count += 1
+        return count
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+
+class _HashingReader:
+    """讀取固定長度並同時計算雜湊 (打包的內容就是實際被計算雜湊的內容)"""
+
+    def __init__(self, f, size):
+        self._f = f
+        self._remaining = size
+        self.sha = hashlib.sha256()
+
+    def read(self, n=-1):
+        if self._remaining <= 0:
+            return b""
+        n = self._remaining if n is None or n < 0 else min(n, self._remaining)
+        data = self._f.read(n)
+        self._remaining -= len(data)
+        self.sha.update(data)
+        return data
+
+
+def build_batch(root, files, out_path, batch_name):
+    """
+    將檔案打包成 tar.gz (含一份 MANIFEST.json 清單)
+    每個檔案只打包掃描當下的大小 (持續附加中的 CSV 不會打包到寫到一半的列)
+    Returns: [(path, size, sha256), ...] 實際打包的內容
+    """
+    members = []
+    tmp_path = out_path + ".tmp"
+    with tarfile.open(tmp_path, "w:gz", compresslevel=6) as tar:
+        for rec in files:
+            full = os.path.join(root, rec["path"])
+            try:
+                f = open(full, "rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                size = min(rec["size"], os.fstat(f.fileno()).st_size)
+                info = tarfile.TarInfo(rec["path"])
+                info.size = size
+                info.mtime = rec["mtime"]
+                reader = _HashingReader(f, size)
+                tar.addfile(info, reader)
+                members.append((rec["path"], size, reader.sha.hexdigest()))
+
+        listing = json.dumps({
+            "batch": batch_name,
+            "created": time.time(),
+            "files": [{"path": p, "size": s, "sha256": h} for p, s, h in members],
+        }, ensure_ascii=False, indent=1).encode("utf-8")
+        info = tarfile.TarInfo(BATCH_MANIFEST)
+        info.size = len(listing)
+        info.mtime = time.time()
+        tar.addfile(info, io.BytesIO(listing))
+    os.replace(tmp_path, out_path)
+    return members
+
+
+# ==========================================
+# 傳輸方式 (可抽換)
+# ==========================================
+class Transport(ABC):
+    """
+    批次檔的傳輸介面；遠端的目錄結構：
+        incoming/<批次>.part    傳輸中 (可續傳)
+        batches/<批次>          已驗證的批次檔，batches/<批次>.ok 為確認收據
+        runs/...                解開後的檔案 (與本機 runs 相同結構)
+    """
+    name = "transport"
+
+    @abstractmethod
+    def received_bytes(self, batch_name):
+        """遠端已收到的位元組數 (續傳位置)"""
+
+    @abstractmethod
+    def upload(self, local_path, batch_name, offset=0):
+        """從 offset 開始把批次檔附加到遠端的 .part"""
+
+    @abstractmethod
+    def commit(self, batch_name, sha256):
+        """
+        請遠端驗證雜湊並解開批次
+        Returns: True 代表遠端已確認；雜湊不符時遠端會刪掉 .part，下次重新傳送
+        """
+
+    @abstractmethod
+    def is_committed(self, batch_name):
+        """遠端是否已有這個批次的確認收據 (本機在確認前中斷時使用)"""
+
+
+class LocalDirTransport(Transport):
+    name = "local"
+
+    def __init__(self, dest_dir, chunk_size=1 << 20, fail_after=None):
+        """
+        傳到本機 (或掛載的網路) 資料夾，也用於不連線測試同步流程
+        Args:
+            fail_after (int): 測試用，傳送超過這麼多位元組後模擬斷線
+        """
+        self.dest_dir = os.path.abspath(dest_dir)
+        self.chunk_size = chunk_size
+        self.fail_after = fail_after
+
+    def _part(self, batch_name):
+        return os.path.join(self.dest_dir, "incoming", batch_name + ".part")
+
+    def received_bytes(self, batch_name):
+        try:
+            return os.path.getsize(self._part(batch_name))
+        except FileNotFoundError:
+            return 0
+
+    def upload(self, local_path, batch_name, offset=0):
+        part = self._part(batch_name)
+        os.makedirs(os.path.dirname(part), exist_ok=True)
+        sent = 0
+        with open(local_path, "rb") as src, open(part, "ab") as dst:
+            dst.truncate(offset)
+            src.seek(offset)
+            while True:
+                chunk = src.read(self.chunk_size)
+                if not chunk:
+                    break
+                if self.fail_after is not None and sent + len(chunk) > self.fail_after:
+                    dst.write(chunk[:max(0, self.fail_after - sent)])
+                    raise ConnectionError("模擬傳輸中斷")
+                dst.write(chunk)
+                sent += len(chunk)
+
+    def commit(self, batch_name, sha256):
+        part = self._part(batch_name)
+        if not os.path.exists(part):
+            return False
+        if file_sha256(part) != sha256:
+            os.remove(part)
+            return False
+
+        batches = os.path.join(self.dest_dir, "batches")
+        runs = os.path.join(self.dest_dir, "runs")
+        os.makedirs(batches, exist_ok=True)
+        archive = os.path.join(batches, batch_name)
+        os.replace(part, archive)
+        with tarfile.open(archive, "r:gz") as tar:
+            for member in tar.getmembers():
+                name = member.name
+                if name == BATCH_MANIFEST or not member.isfile():
+                    continue
+                if os.path.isabs(name) or ".." in name.split("/"):
+                    raise ValueError(f"[Sync] 批次內有不安全的路徑: {name}")
+                target = os.path.join(runs, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with tar.extractfile(member) as src, open(target + ".tmp", "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(target + ".tmp", target)
+        open(archive + ".ok", "w").close()
+        return True
+
+    def is_committed(self, batch_name):
+        return os.path.exists(os.path.join(self.dest_dir, "batches", batch_name + ".ok"))
+
+
+class SshTransport(Transport):
+    name = "ssh"
+
+    def __init__(self, host, remote_dir, timeout=600):
+        """
+        經由 ssh 傳輸 (與原本的 scp 使用相同的金鑰設定)
+        以 `cat >>` 附加到遠端 .part，斷線後從遠端已收到的位置續傳，不需要 rsync
+        遠端指令中的路徑與批次名稱一律以 shlex.quote 包起來，不會被遠端 shell 解讀
+        Args:
+            host (str): user@hostname
+            remote_dir (str): 遠端資料夾 (可使用 ~ 開頭，代表登入後的家目錄)
+        """
+        self.host = host
+        remote_dir = remote_dir.rstrip("/") or "/"
+        # 加上引號後 ~ 不會展開；ssh 的指令本來就在家目錄執行，改成相對路徑即可
+        if remote_dir == "~" or remote_dir.startswith("~/"):
+            remote_dir = remote_dir[2:] or "."
+        self.remote_dir = remote_dir
+        self.timeout = timeout
+
+    def _path(self, *parts):
+        """遠端路徑，已加上引號"""
+        return shlex.quote(posixpath.join(self.remote_dir, *parts))
+
+    def _ssh(self, command, stdin=None):
+        return subprocess.run(["ssh", "-o", "BatchMode=yes", self.host, command], stdin=stdin,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=stdin is None,
+                              timeout=self.timeout)
+
+    def received_bytes(self, batch_name):
+        result = self._ssh(f"stat -c %s {self._path('incoming', batch_name + '.part')} 2>/dev/null || echo 0")
+        if result.returncode != 0:
+            raise ConnectionError(f"ssh 失敗: {result.stderr.strip()}")
+        return int(result.stdout.strip() or 0)
+
+    def upload(self, local_path, batch_name, offset=0):
+        # 以無緩衝開檔，seek 之後子程序從同一個檔案位置開始讀
+        with open(local_path, "rb", buffering=0) as f:
+            f.seek(offset)
+            result = self._ssh(f"mkdir -p {self._path('incoming')} && "
+                               f"cat >> {self._path('incoming', batch_name + '.part')}", stdin=f)
+        if result.returncode != 0:
+            raise ConnectionError(f"上傳失敗: {result.stderr.decode('utf-8', 'ignore').strip()}")
+
+    def commit(self, batch_name, sha256):
+        part = f"incoming/{batch_name}.part"
+        batch = shlex.quote(f"batches/{batch_name}")
+        ok = shlex.quote(f"batches/{batch_name}.ok")
+        result = self._ssh(
+            f"cd {self._path()} && "
+            f"if echo {shlex.quote(f'{sha256}  {part}')} | sha256sum -c --status; then "
+            f"mkdir -p batches runs && mv {shlex.quote(part)} {batch} && "
+            f"tar -xzf {batch} -C runs --exclude={shlex.quote(BATCH_MANIFEST)} && "
+            f"touch {ok}; "
+            f"else rm -f {shlex.quote(part)}; exit 1; fi")
+        return result.returncode == 0
+
+    def is_committed(self, batch_name):
+        return self._ssh(f"test -e {self._path('batches', batch_name + '.ok')}").returncode == 0
+
+
+class HttpTransport(Transport):
+    name = "http"
+
+    def __init__(self, url, device_id, token=None, timeout=60, chunk_size=4 * 1024 * 1024):
+        """
+        上傳到車隊匯入服務 (modules/ingest.py 的 IngestServer)
+        伺服器依 (裝置, 車牌, 時間) 去除重複紀錄，圖片以內容雜湊保存
+        Args:
+            url (str): 服務位址，例如 http://fleet-server:8500
+            device_id (str): 本裝置代號 (英數字、-、_)，預設可用主機名稱
+            token (str): 伺服器有設定時的存取權杖
+            chunk_size (int): 每次 PUT 的大小，中斷時最多重送一段
+        """
+        self.url = url.rstrip("/")
+        self.device_id = device_id
+        self.token = token
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+
+    def _request(self, method, path, body=None):
+        from urllib.request import Request, urlopen
+        from urllib.error import HTTPError
+        req = Request(f"{self.url}/v1/devices/{self.device_id}/batches/{path}", data=body, method=method)
+        if self.token:
+            req.add_header("Authorization", f"Bearer {self.token}")
+        if body is not None:
+            req.add_header("Content-Type", "application/octet-stream")
+        try:
+            with urlopen(req, timeout=self.timeout) as resp:
+                return resp.status, json.loads(resp.read().decode("utf-8"))
+        except HTTPError as e:
+            try:
+                return e.code, json.loads(e.read().decode("utf-8"))
+            except ValueError:
+                return e.code, {}
+
+    def _status(self, batch_name):
+        status, info = self._request("GET", batch_name)
+        if status != 200:
+            raise ConnectionError(f"HTTP {status}")
+        return info
+
+    def received_bytes(self, batch_name):
+        return self._status(batch_name)["received"]
+
+    def upload(self, local_path, batch_name, offset=0):
+        with open(local_path, "rb") as f:
+            f.seek(offset)
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                status, info = self._request("PUT", f"{batch_name}?offset={offset}", chunk)
+                if status != 200:
+                    raise ConnectionError(f"上傳失敗: HTTP {status} {info}")
+                offset = info["received"]
+
+    def commit(self, batch_name, sha256):
+        status, info = self._request("POST", f"{batch_name}/commit?sha256={sha256}", b"")
+        if status == 200:
+            return True
+        if status == 422:
+            return False
+        raise ConnectionError(f"匯入失敗: HTTP {status} {info}")
+
+    def is_committed(self, batch_name):
+        return self._status(batch_name)["committed"]
+
+
+class IncrementalSync:
+    def __init__(self, root, transport, manifest_path=None, staging_dir=None,
+                 batch_bytes=64 * 1024 * 1024, exclude=None, record_db=None):
+        """
+        以 manifest 為基礎的增量同步：只送新檔與內容有變更的檔案，打包成壓縮批次，中斷後續傳
+        Args:
+            root (str): 要同步的資料夾 (runs)
+            transport (Transport): 傳輸方式
+            manifest_path (str): 本地同步清單，預設 <root>/.sync/manifest.db
+            staging_dir (str): 批次檔暫存資料夾，預設 <root>/.sync/outgoing
+            batch_bytes (int): 每個批次最多打包多少位元組 (壓縮前)
+            exclude (list): 不同步的檔案 (fnmatch 樣式，相對於 root)
+            record_db (str): SQLite 後端的紀錄資料庫，未同步的紀錄匯出成 CSV 一起送出；
+                             預設為 <root>/records.db (存在時)
+        """
+        self.root = os.path.abspath(root)
+        self.transport = transport
+        sync_dir = os.path.join(self.root, ".sync")
+        self.manifest = SyncManifest(manifest_path or os.path.join(sync_dir, "manifest.db"))
+        self.staging_dir = staging_dir or os.path.join(sync_dir, "outgoing")
+        self.batch_bytes = batch_bytes
+        self.exclude = DEFAULT_EXCLUDE if exclude is None else exclude
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+        record_db = record_db or os.path.join(self.root, "records.db")
+        self.records = RecordExporter(self.root, record_db) if os.path.exists(record_db) else None
+
+    def run(self):
+        """
+        掃描 -> 打包 -> 傳送 (含上次未完成的批次)
+        Returns: 統計 dict；傳輸失敗時 "error" 欄位為錯誤訊息，已確認的批次不受影響
+        """
+        result = {"batches": 0, "files": 0, "bytes_sent": 0, "resumed": 0, "error": None}
+        if self.records is not None:
+            try:
+                self.records.export()
+            except (sqlite3.Error, OSError) as e:
+                # 紀錄匯出失敗不影響圖片同步，下次再匯出
+                print(f"[Sync Error] SQLite 紀錄匯出失敗: {e}")
+        scan = self.manifest.scan(self.root, self.exclude)
+        print(f"[Sync] 掃描 {scan['scanned']} 個檔案，{scan['changed']} 個需要同步 "
+              f"(重新計算雜湊 {scan['hashed']} 個)")
+
+        self.manifest.discard_unfinished()
+        self._build_batches()
+        for batch in self.manifest.open_batches():
+            try:
+                self._send(batch, result)
+            except Exception as e:
+                result["error"] = str(e)
+                print(f"[Sync Error] 批次 {batch['name']} 傳輸失敗，下次從中斷處續傳: {e}")
+                break
+        return result
+
+    def _build_batches(self):
+        batch, total = [], 0
+        for rec in self.manifest.pending():
+            if batch and total + rec["size"] > self.batch_bytes:
+                self._build(batch)
+                batch, total = [], 0
+            batch.append(rec)
+            total += rec["size"]
+        if batch:
+            self._build(batch)
+
+    def _build(self, files):
+        batch_id = self.manifest.new_batch()
+        name = f"batch_{time.strftime('%Y%m%d_%H%M%S')}_{batch_id:06d}.tar.gz"
+        path = os.path.join(self.staging_dir, name)
+        try:
+            members = build_batch(self.root, files, path, name)
+        except Exception as e:
+            print(f"[Sync Error] 打包失敗: {e}")
+            self.manifest.drop_batch(batch_id)
+            return
+        self.manifest.finish_batch(batch_id, name, os.path.getsize(path), file_sha256(path), members)
+        print(f"[Sync] 已打包 {name}: {len(members)} 個檔案")
+
+    def _send(self, batch, result):
+        name = batch["name"]
+        path = os.path.join(self.staging_dir, name)
+
+        if self.transport.is_committed(name):
+            # 上次遠端已確認，只是本機還沒來得及記錄
+            self._confirmed(batch, path, result)
+            return
+        if not os.path.exists(path):
+            print(f"[Sync] 批次檔 {name} 已遺失，內容重新打包")
+            self.manifest.drop_batch(batch["id"])
+            return
+
+        offset = self.transport.received_bytes(name)
+        if offset > batch["size"]:
+            offset = 0
+        if offset:
+            result["resumed"] += 1
+            print(f"[Sync] 批次 {name} 從 {offset}/{batch['size']} bytes 續傳")
+        if offset < batch["size"]:
+            self.transport.upload(path, name, offset)
+            result["bytes_sent"] += batch["size"] - offset
+
+        if not self.transport.commit(name, batch["sha256"]):
+            raise ConnectionError("遠端驗證雜湊失敗，下次重新傳送")
+        self._confirmed(batch, path, result)
+
+    def _confirmed(self, batch, path, result):
+        paths = self.manifest.batch_paths(batch["id"])
+        count = self.manifest.confirm_batch(batch["id"])
+        if self.records is not None:
+            self.records.confirmed(paths)
+        if os.path.exists(path):
+            os.remove(path)
+        result["batches"] += 1
+        result["files"] += count
+        print(f"[Sync] 批次 {batch['name']} 遠端已確認 ({count} 個檔案)")
+
+    def is_synced(self, path):
+        """path (絕對路徑或相對於 root) 目前的內容是否已被遠端確認"""
+        rel = os.path.relpath(os.path.abspath(path), self.root) if os.path.isabs(path) else path
+        return self.manifest.is_synced(self.root, rel)
+
+    def close(self):
+        self.manifest.close()
+        if self.records is not None:
+            self.records.close()
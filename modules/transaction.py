@@ -0,0 +1,337 @@
+import time
+from collections import OrderedDict
+
+# 地磅過磅週期的狀態：空磅 -> 上磅中 -> 靜止 -> 下磅中 -> 空磅
+STATE_EMPTY = "empty"
+STATE_LOADING = "loading"
+STATE_STABLE = "stable"
+STATE_LEAVING = "leaving"
+
+# 只看到車牌、沒有上磅的紀錄寫入的地磅狀態
+STATUS_NOT_WEIGHED = "未過磅"
+
+
+class PlateCandidate:
+    """同一次過磅中某個車牌文字的累積分數與證據畫面"""
+    __slots__ = ("plate", "score", "count", "best_score", "frame", "box", "lane", "last_seen")
+
+    def __init__(self, plate):
+        self.plate = plate
+        self.score = 0.0
+        self.count = 0
+        self.best_score = -1.0
+        self.frame = None
+        self.box = None
+        self.lane = None
+        self.last_seen = 0.0
+
+
+class WeighingTransaction:
+    def __init__(self, visit_id, now):
+        """
+        一台車的一次過磅 (一筆輸出紀錄)
+        weighed 為 False 代表只看到車牌、沒有上磅
+        weight 為靜止時的穩定重量；上磅但從未靜止則為 None，改以 peak_weight 記錄
+        """
+        self.visit_id = visit_id
+        self.start_ts = now
+        self.end_ts = None
+        self.weighed = False
+        self.weight = None
+        self.peak_weight = 0.0
+        self.stable_since = None
+        self.candidates = {}     # plate -> PlateCandidate
+        self.fallback_frame = None  # 沒有辨識到車牌時使用的畫面 (穩定時擷取一次)
+
+    def add_plate(self, plate, score, frame, box, lane, now, copy_frame=True):
+        cand = self.candidates.get(plate)
+        if cand is None:
+            cand = self.candidates[plate] = PlateCandidate(plate)
+        cand.score += score
+        cand.count += 1
+        cand.last_seen = now
+        if frame is not None and score > cand.best_score:
+            cand.best_score = score
+            # 只保留每個車牌分數最高的那一張畫面
+            cand.frame = frame.copy() if copy_frame else frame
+            cand.box = box
+            cand.lane = lane
+
+    def best(self):
+        """累積分數最高的車牌；沒有辨識到車牌則回傳 None"""
+        if not self.candidates:
+            return None
+        return max(self.candidates.values(), key=lambda c: (c.score, c.best_score))
+
+    @property
+    def plate(self):
+        cand = self.best()
+        return cand.plate if cand is not None else None
+
+    @property
+    def frame(self):
+        cand = self.best()
+        return cand.frame if cand is not None and cand.frame is not None else self.fallback_frame
+
+    @property
+    def box(self):
+        cand = self.best()
+        return cand.box if cand is not None else None
+
+    @property
+    def lane(self):
+        cand = self.best()
+        return cand.lane if cand is not None else None
+
+    @property
+    def last_plate_ts(self):
+        return max((c.last_seen for c in self.candidates.values()), default=None)
+
+
+class TransactionMonitor:
+    def __init__(self, scale, empty_weight=200.0, occupied_weight=500.0, empty_hold=2.0,
+                 pre_roll=20.0, post_roll=10.0, plate_timeout=60.0, max_visit=1800.0):
+        """
+        把車牌辨識結果與地磅的過磅週期對應起來，每台車每次過磅只輸出一筆紀錄
+        (最佳車牌、穩定重量、一張證據畫面)
+
+        Args:
+            scale: ScaleDriver，共用同一台地磅的車道共用同一個 TransactionMonitor
+            empty_weight (float): 低於此重量視為空磅 (kg)
+            occupied_weight (float): 高於此重量視為有車上磅 (kg)，與 empty_weight 之間為遲滯區
+            empty_hold (float): 必須連續空磅幾秒才算下磅完成
+            pre_roll (float): 上磅前幾秒內看到的車牌歸入這次過磅 (車頭先經過相機)
+            post_roll (float): 下磅後還沒有車牌時，最多再等幾秒 (出口相機較晚看到車牌)
+            plate_timeout (float): 看到車牌後超過幾秒都沒有上磅，單獨輸出一筆沒有重量的紀錄
+            max_visit (float): 單次過磅最長秒數，超過強制結束 (例如有車停在磅上)
+        """
+        self.scale = scale
+        self.empty_weight = empty_weight
+        self.occupied_weight = occupied_weight
+        self.empty_hold = empty_hold
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.plate_timeout = plate_timeout
+        self.max_visit = max_visit
+
+        self.state = STATE_EMPTY
+        self._visit = None       # 目前在磅上的過磅
+        self._pending = None     # 空磅時看到的車牌 (尚未上磅)
+        self._closing = []       # 已下磅、等待車牌的過磅 (post_roll)
+        self._empty_since = None
+        self._next_id = 1
+
+        # 統計用
+        self.visits = 0          # 有過磅的紀錄數
+        self.unweighed = 0       # 只有車牌沒有過磅的紀錄數
+        self.unidentified = 0    # 有過磅但沒有辨識到車牌的紀錄數
+
+    def _new_transaction(self, now):
+        trans = WeighingTransaction(self._next_id, now)
+        self._next_id += 1
+        return trans
+
+    # ========================
+    # 輸入
+    # ========================
+    def observe(self, plate, score, frame, box, lane, now=None, copy_frame=True):
+        """
+        加入一次車牌辨識結果
+        Args:
+            score (float): 這次結果的權重 (追蹤模式為有效 OCR 次數 x 信心度，防抖模式為 1)
+            lane: 看到車牌的車道 (紀錄的車道與行駛方向取自最佳車牌)
+            copy_frame (bool): frame 之後會被覆寫時必須複製 (追蹤器的證據畫面已經是複本)
+        """
+        now = time.time() if now is None else now
+        if self._visit is not None:
+            target = self._visit
+        else:
+            # 剛下磅且還沒有車牌的過磅優先 (出口相機在下磅後才看到車牌)
+            target = next((t for t in self._closing if not t.candidates), None)
+            if target is None:
+                if self._pending is None:
+                    self._pending = self._new_transaction(now)
+                target = self._pending
+        target.add_plate(plate, score, frame, box, lane, now, copy_frame)
+
+    def update(self, now=None, frame=None):
+        """
+        依地磅最新讀值推進狀態機
+        Args:
+            frame: 目前的畫面；磅上有車且還沒有任何畫面時複製一張，作為沒有車牌時的證據
+        Returns: 這次完成的 [WeighingTransaction, ...]
+        """
+        now = time.time() if now is None else now
+        done = []
+        reading = self.scale.latest()
+        visit = self._visit
+
+        if reading is not None:
+            weight = reading.weight
+            if visit is None:
+                if weight >= self.occupied_weight:
+                    self._start_visit(now, done)
+                    visit = self._visit
+            if visit is not None:
+                visit.peak_weight = max(visit.peak_weight, weight)
+                self._step(visit, reading, now, frame)
+
+        if self._visit is not None and now - self._visit.start_ts > self.max_visit:
+            print(f"[Transaction] 過磅 #{self._visit.visit_id} 超過 {self.max_visit:.0f} 秒，強制結束")
+            self._end_visit(now)
+
+        # 下磅後等待車牌的過磅
+        still_closing = []
+        for trans in self._closing:
+            if trans.candidates or now - trans.end_ts >= self.post_roll:
+                done.append(trans)
+            else:
+                still_closing.append(trans)
+        self._closing = still_closing
+
+        # 看到車牌卻一直沒有上磅
+        pending = self._pending
+        if pending is not None and now - pending.last_plate_ts > self.plate_timeout:
+            self._pending = None
+            done.extend(self._split_unweighed(pending, now))
+
+        self._count(done)
+        return done
+
+    def _start_visit(self, now, done):
+        """有車上磅：最近 pre_roll 秒內看到的車牌歸入這次過磅，更早的單獨輸出"""
+        visit = self._new_transaction(now)
+        visit.weighed = True
+        pending = self._pending
+        self._pending = None
+        if pending is not None:
+            for plate, cand in list(pending.candidates.items()):
+                if now - cand.last_seen <= self.pre_roll:
+                    visit.candidates[plate] = cand
+                    del pending.candidates[plate]
+            if pending.candidates:
+                done.extend(self._split_unweighed(pending, now))
+        self._visit = visit
+        self._empty_since = None
+        self.state = STATE_LOADING
+
+    def _step(self, visit, reading, now, frame):
+        weight = reading.weight
+        if reading.stable and weight >= self.occupied_weight:
+            # 重新靜止 (例如車輛前後調整位置) 時以最後一次的穩定重量為準
+            visit.weight = reading.mean
+            if visit.stable_since is None:
+                visit.stable_since = now
+            self.state = STATE_STABLE
+            if frame is not None and visit.fallback_frame is None:
+                visit.fallback_frame = frame.copy()
+        elif self.state == STATE_STABLE:
+            self.state = STATE_LEAVING
+            visit.stable_since = None
+
+        if weight < self.empty_weight:
+            if self._empty_since is None:
+                self._empty_since = now
+            elif now - self._empty_since >= self.empty_hold:
+                self._end_visit(now)
+        else:
+            self._empty_since = None
+
+    def _end_visit(self, now):
+        visit = self._visit
+        self._visit = None
+        self._empty_since = None
+        self.state = STATE_EMPTY
+        visit.end_ts = now
+        self._closing.append(visit)
+
+    def _split_unweighed(self, pending, now):
+        """沒有過磅的車牌：每個車牌各輸出一筆沒有重量的紀錄"""
+        result = []
+        for cand in pending.candidates.values():
+            trans = self._new_transaction(cand.last_seen)
+            trans.candidates[cand.plate] = cand
+            trans.end_ts = now
+            result.append(trans)
+        return result
+
+    def _count(self, done):
+        for trans in done:
+            if not trans.weighed:
+                self.unweighed += 1
+            else:
+                self.visits += 1
+                if not trans.candidates:
+                    self.unidentified += 1
+
+    def close(self, now=None):
+        """關機時輸出所有尚未完成的紀錄 (磅上的車以目前為止的結果輸出)"""
+        now = time.time() if now is None else now
+        if self._visit is not None:
+            self._end_visit(now)
+        done = list(self._closing)
+        self._closing = []
+        if self._pending is not None:
+            done.extend(self._split_unweighed(self._pending, now))
+            self._pending = None
+        self._count(done)
+        return done
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "visits": self.visits,
+            "unweighed": self.unweighed,
+            "unidentified": self.unidentified,
+        }
+
+
+class TarePairing:
+    def __init__(self, max_gap=12 * 3600.0, max_open=1024):
+        """
+        空重 / 總重配對：同一個車牌的進場與出場過磅配成一組，算出淨重
+        空車進、重車出 (載土出場) 或重車進、空車出 (運土進場) 都適用，較輕的一次即為空重
+        等待配對的車牌只存在記憶體中，重新啟動後以 restore() 從已寫入的紀錄重建
+        Args:
+            max_gap (float): 進出場最多相隔幾秒仍視為同一趟
+            max_open (int): 最多保留幾個等待配對的車牌
+        """
+        self.max_gap = max_gap
+        self.max_open = max_open
+        self._open = OrderedDict()  # plate -> (ts, weight, direction)
+
+    def pair(self, plate, weight, ts, direction=None):
+        """
+        Args:
+            direction: 車道方向 ("in" / "out")；有設定時只和相反方向的過磅配對
+        Returns: (空重, 淨重)，這是該車牌的第一次過磅則回傳 (None, None)
+        """
+        if not plate or weight is None:
+            return None, None
+
+        prev = self._open.pop(plate, None)
+        if prev is not None:
+            prev_ts, prev_weight, prev_direction = prev
+            opposite = direction is None or prev_direction is None or direction != prev_direction
+            if ts - prev_ts <= self.max_gap and opposite:
+                tare = min(prev_weight, weight)
+                return tare, round(max(prev_weight, weight) - tare, 1)
+
+        self._open[plate] = (ts, weight, direction)
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)
+        return None, None
+
+    def restore(self, weighings, now=None):
+        """
+        依時間順序重播最近 max_gap 秒內的過磅，重建等待配對的車牌 (重新啟動後使用)
+        已配對過的進出場在重播時同樣互相抵銷，只留下還沒有出場的那一次
+        Args:
+            weighings: [(plate, weight, ts, direction), ...]，只包含當初有穩定重量的過磅
+        Returns: 重建後等待配對的車牌數
+        """
+        now = time.time() if now is None else now
+        for plate, weight, ts, direction in sorted(weighings, key=lambda w: w[2]):
+            if now - ts <= self.max_gap:
+                self.pair(plate, weight, ts, direction)
+        return len(self._open)
@@ -1,10 +1,18 @@
 import subprocess
 import os
+import socket
 from datetime import datetime
 from modules.maintenance import DataMaintenance 
+from modules.sync import IncrementalSync, SshTransport, HttpTransport
 
 class SyncManager:
-    def __init__(self):
+    def __init__(self, transport=None):
+        """
+        Args:
+            transport: 傳輸方式 (見 modules/sync.py)，預設以 ssh 傳到下方的伺服器；
+                       多台閘口時改用 HttpTransport 上傳到車隊匯入服務 (ingest_server.py)；
+                       測試時可傳入 LocalDirTransport 傳到本機資料夾
+        """
         self.server_user = "aelab-1" 
         self.server_hostname = "aelab-1-MS-7D18" 
         
@@ -14,7 +22,10 @@ class SyncManager:
         
         # 拆分遠端路徑，方便用指令建立目錄
         self.remote_folder = "~/Desktop/Jetson_Data"
-        self.remote_dest_dir = f"{self.server_user}@{self.server_hostname}:{self.remote_folder}/"
+
+        # 增量同步：只送新檔與有變更的檔案，打包成壓縮批次，中斷後從斷點續傳
+        self.transport = transport or SshTransport(f"{self.server_user}@{self.server_hostname}", self.remote_folder)
+        self.sync = IncrementalSync(self.local_runs_dir, self.transport)
 
         self.cleaner = DataMaintenance(
             img_dir=os.path.join(self.local_runs_dir, "images"),
@@ -33,30 +44,41 @@ class SyncManager:
             print(f"[Sync Warning] 建立遠端目錄時發生異常: {e}")
 
     def run_sync(self):
-        print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 啟動 SCP 傳輸模組...")
+        print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 啟動增量同步模組 ({self.transport.name})...")
         
         # 🌟 新增的檢查機制：傳輸前先確保遠端有家可以回
-        self._check_and_create_remote_dir()
-        
-        scp_cmd = ["scp", "-r", "-q", self.local_runs_dir, self.remote_dest_dir]
+        if isinstance(self.transport, SshTransport):
+            self._check_and_create_remote_dir()
         
         try:
-            result = subprocess.run(scp_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            if result.returncode == 0:
-                print("[Sync] 🎉 資料同步成功！檔案已送達伺服器。")
-                self.post_sync_cleanup()
+            result = self.sync.run()
+            if result["error"] is None:
+                print(f"[Sync] 🎉 資料同步成功！{result['batches']} 個批次、{result['files']} 個檔案已送達伺服器。")
             else:
-                print(f"[Sync Error] ❌ 同步失敗：\n{result.stderr}")
+                print(f"[Sync Error] ❌ 同步未完成：{result['error']}")
+            # 只清理伺服器已確認收到的資料，部分失敗時已確認的部分仍可清理
+            self.post_sync_cleanup()
         except Exception as e:
             print(f"[Sync Exception] 程式發生未預期錯誤: {e}")
 
     def post_sync_cleanup(self):
         print("[Cleanup] 開始清理 Jetson 記憶體與過期資料...")
-        self.cleaner.clean_old_images(days_to_keep=3)
-        self.cleaner.archive_csv()
+        self.cleaner.clean_old_images(days_to_keep=3, is_synced=self.sync.is_synced)
+        # CSV 封存前必須確認目前的內容已送達 (同步後又新增的紀錄會讓檢查失敗，留到下次)
+        if self.sync.is_synced(self.cleaner.csv_path):
+            self.cleaner.archive_csv()
+        elif os.path.exists(self.cleaner.csv_path):
+            print("[Cleanup] CSV 尚有未同步的紀錄，暫不封存")
         self.cleaner.check_disk_usage()
         print("[Cleanup] 系統維護完成。")
 
 if __name__ == "__main__":
-    job = SyncManager()
+    # 有設定 LPR_INGEST_URL 時上傳到車隊匯入服務，裝置代號預設為主機名稱
+    ingest_url = os.environ.get("LPR_INGEST_URL")
+    transport = None
+    if ingest_url:
+        transport = HttpTransport(ingest_url, os.environ.get("LPR_DEVICE_ID", socket.gethostname()),
+                                  token=os.environ.get("LPR_INGEST_TOKEN"))
+    job = SyncManager(transport)
     job.run_sync()
+    job.sync.close()
@@ -1,115 +1,738 @@
-from multiprocessing import Process, Queue 
+from multiprocessing import Process, Queue
 import cv2
 import queue
 import time
 import threading
 import os
+import shutil
 
 # 引入所有硬體與系統模組
 from modules.camera import Camera
 from modules.database import DatabaseManager
-from modules.scale import ScaleDriver
+from modules.scale import ScaleDriver, STATUS_STABLE, STATUS_UNSTABLE
+from modules.pipeline import BlockingQueue, DropOldestQueue, FrameJob, StageWorker
+from modules.motion_gate import MotionGate
+from modules.metrics import REGISTRY, STAGE_SECONDS, MetricsServer, MetricsFileWriter
+from modules.preview import PreviewServer
+from modules.retention import RetentionDaemon
+from modules.transaction import TransactionMonitor, TarePairing, STATUS_NOT_WEIGHED
 
 # 引入 AI 模組
-from ai.lpr_engine import Detect_License_Plate 
+from ai.lpr_engine import Detect_License_Plate
+from ai.plate_tracker import PlateTracker
+from ai.plate_registry import PlateRegistry, STATUS_LABELS
+
+
+class Lane:
+    def __init__(self, name="main", src=0, roi=None, scale=None, direction=None, motion_gate=False):
+        """
+        單一車道的設定與狀態 (相機、地磅、追蹤器、防抖都各自獨立)
+        Args:
+            name (str): 車道名稱，會寫入每筆紀錄
+            src: 影像來源 (見 Camera)
+            roi (tuple): 偵測區域 (x1, y1, x2, y2)，0~1 的相對座標；None 代表整張畫面
+            scale (dict): ScaleDriver 參數，相同 port 的車道共用同一台地磅；None 使用模擬地磅
+            direction (str): 行駛方向，例如 "in" / "out"
+            motion_gate (bool | dict): 見 SystemController，可依車道個別設定；只看 roi 內的變化
+        """
+        self.name = name
+        self.src = src
+        self.roi = roi
+        self.scale_options = scale or {"simulate": True}
+        self.direction = direction
+        self.motion_gate = motion_gate
+
+        # 以下在子進程中初始化
+        self.cam = None
+        self.scale = None
+        self.gate = None
+        self.tracker = None
+        self.weighing = None
+        self.last_seq = 0
+        self.dropped_frames = 0
+
+        # 簡單的防抖變數，避免 Terminal 被同一個車牌洗頻，也避免狂存相同的照片
+        self.last_plate = ""
+        self.last_detect_time = 0
+
+    @classmethod
+    def from_config(cls, config, motion_gate=False):
+        """由 dict 建立 (SystemController 的 lanes 參數)，未指定 motion_gate 時沿用 SystemController 的設定"""
+        if isinstance(config, Lane):
+            return config
+        config = dict(config)
+        config.setdefault("motion_gate", motion_gate)
+        return cls(**config)
+
+    def crop(self, frame):
+        """
+        擷取偵測區域
+        Returns: (roi 影像, x 位移, y 位移)
+        """
+        if self.roi is None:
+            return frame, 0, 0
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = self.roi
+        x1, y1, x2, y2 = int(x1 * w), int(y1 * h), int(x2 * w), int(y2 * h)
+        return frame[y1:y2, x1:x2], x1, y1
+
 
 class SystemController(Process):
-    def __init__(self, q, model_path, text_det=None, text_rec=None):
+    def __init__(self, q, model_path, text_det=None, text_rec=None, pipeline=False, queue_depth=2,
+                 use_tracker=False, motion_gate=False, camera_src=0, lanes=None,
+                 metrics_port=None, metrics_file=None,
+                 metrics_interval=60.0, headless=False, preview_port=None, preview_host="127.0.0.1", preview_fps=5.0,
+                 preview_width=640, weighing=False, retention=True, evidence=None,
+                 plate_index=False, registered_plates=None):
+        """
+        Args:
+            pipeline (bool): 啟用分段管線模式 (擷取 / 偵測 / OCR / 存檔 各自一條執行緒)
+            queue_depth (int): 管線各階段之間的佇列深度，滿了會丟棄最舊的畫面
+            use_tracker (bool): 以多畫面追蹤與投票決定車牌，每個 track 只輸出一筆紀錄；
+                                預設 False 與舊版相同 (3 秒防抖)
+            motion_gate (bool | dict): 車道偵測區域 (roi) 沒有變化時跳過 YOLO，預設 False 每張都偵測；
+                                       傳入 dict 則作為 MotionGate 的參數 (靈敏度區域等，座標相對於 roi)
+            camera_src: 影像來源 (裝置編號、RTSP 網址、GStreamer pipeline、影片檔或 CaptureSource)，
+                        以影片檔重播可在沒有相機的情況下測試與分析整個流程
+            lanes (list): 多車道設定，每個元素為 Lane 的參數 dict，例如
+                          [{"name": "entry", "src": 0, "direction": "in"},
+                           {"name": "exit", "src": 1, "direction": "out", "roi": (0.2, 0.3, 1.0, 1.0)}]
+                          所有車道共用同一組 AI 模型，各車道的畫面合併成一次 YOLO 批次推論；
+                          None 代表單一車道 (使用 camera_src 與 motion_gate)
+            metrics_port (int): 本機 Prometheus 指標端點 http://127.0.0.1:<port>/metrics (例如 9108)；預設 None 不啟動
+            metrics_file (str): 定期寫入指標快照的 JSON Lines 檔 (自動輪替)，例如 runs/metrics/metrics.jsonl；預設 None 不寫入
+            metrics_interval (float): 指標快照的寫入間隔秒數
+            headless (bool): 無螢幕模式，完全不呼叫 OpenCV GUI (imshow / waitKey)
+            preview_port (int): 啟動 MJPEG 預覽 http://<ip>:<port>/；None 代表不啟動
+                                只有在有人觀看時才畫框與編碼，沒人看時沒有額外負擔
+            preview_host (str): 預覽綁定的位址；預設只有本機可看，"0.0.0.0" 開放區網觀看 (沒有驗證)
+            preview_fps (float): 預覽每個車道最多每秒幾張
+            preview_width (int): 預覽畫面寬度上限
+            weighing (bool | dict): 過磅交易模式，依地磅的 空磅 -> 上磅 -> 靜止 -> 下磅 週期
+                                    每台車每次過磅只寫一筆紀錄 (最佳車牌、穩定重量、一張證據畫面)，
+                                    並將同一車牌的進出場過磅配對算出淨重；
+                                    傳入 dict 則作為 TransactionMonitor 的參數，
+                                    另可用 "pair_window" 指定進出場配對的最長間隔秒數
+            retention (bool | dict): 背景容量保留，runs/ 超過上限或磁碟快滿時由最舊的圖片開始刪除，
+                                     只刪同步清單確認伺服器已收到的圖片；傳入 dict 則作為 RetentionDaemon 的參數
+                                     (例如 {"budget_bytes": 20 * 2**30})，沒有設定同步的裝置才加上 "require_sync": False
+            evidence (str | dict): 每筆紀錄的證據圖片設定 (見 modules/evidence.py)，例如 "compact" 存
+                                   640 寬的現場畫面與一張車牌特寫；None 與舊版相同 (原尺寸 JPEG)
+            plate_index (bool): 每筆紀錄同步更新車牌模糊搜尋索引 (runs/plate_index.db)，
+                                操作人員可用 tools/plate_search.py 以誤讀的車牌或萬用字元找出進場紀錄；
+                                預設 False 不建立索引
+            registered_plates (str | dict): 登記車輛名單檔 (見 ai/plate_registry.py)，OCR 的每個候選修正到
+                                            最接近的登記車牌，紀錄的車牌狀態標記為 登記車輛 / 校正為登記車輛 /
+                                            未登記車輛；名單檔變更時自動重新載入。傳入 dict 則作為 PlateRegistry
+                                            的參數 (例如 {"path": "config/registered.txt", "max_distance": 2})；
+                                            None 代表不使用名單
+        """
         super().__init__()
         self.model_path = model_path
         self._text_det = text_det
         self._text_rec = text_rec
-        self._q = q 
-        self._status = "detect" 
-        
-        # 簡單的防抖變數，避免 Terminal 被同一個車牌洗頻，也避免狂存相同的照片
-        self.last_plate = ""
-        self.last_detect_time = 0
+        self._q = q
+        self._status = "detect"
+        self._pipeline = pipeline
+        self._queue_depth = queue_depth
+        self._use_tracker = use_tracker
+
+        if lanes:
+            self._lanes = [Lane.from_config(cfg, motion_gate) for cfg in lanes]
+        else:
+            self._lanes = [Lane("main", camera_src, motion_gate=motion_gate)]
+        self._multi_lane = len(self._lanes) > 1
+
+        self._metrics_port = metrics_port
+        self._metrics_file = metrics_file
+        self._metrics_interval = metrics_interval
+
+        self._headless = headless
+        self._preview_options = None
+        if preview_port is not None:
+            self._preview_options = {"port": preview_port, "host": preview_host, "max_fps": preview_fps,
+                                     "max_width": preview_width}
+
+        self._weighing_options = None
+        self._pair_window = 12 * 3600.0
+        if weighing:
+            self._weighing_options = dict(weighing) if isinstance(weighing, dict) else {}
+            self._pair_window = self._weighing_options.pop("pair_window", self._pair_window)
+
+        self._evidence = evidence
+        self._plate_index = plate_index
+
+        self._registry_options = None
+        if registered_plates:
+            self._registry_options = (dict(registered_plates) if isinstance(registered_plates, dict)
+                                      else {"path": registered_plates})
+
+        self._retention_options = None
+        if retention:
+            self._retention_options = dict(retention) if isinstance(retention, dict) else {}
 
     def _init_components(self):
         """在子進程中安全初始化所有硬體與模組"""
         print("[SystemController] 正在子進程初始化所有硬體與模組...")
-        
-        # 1. 啟動相機
-        self._cam = Camera()
-        
-        # 2. 載入 AI 引擎 (YOLO + PaddleOCR)
-        self._detect = Detect_License_Plate(self.model_path, self._text_det, self._text_rec)
-        
-        # 3. 初始化資料庫 (封裝了存圖與寫入 CSV 功能)
-        self._db = DatabaseManager(base_dir="runs", enable_scale_img=False)
-        
-        # 4. 初始化地磅 (Demo 階段開啟 simulate=True 模擬假重量)
-        self._scale = ScaleDriver(simulate=True)
+        self._stop_event = threading.Event()
+        self._last_gate_report = time.time()
+
+        # 1. 載入 AI 引擎 (YOLO + PaddleOCR)，所有車道共用
+        #    登記車輛名單：OCR 結果修正到最接近的登記車牌
+        self._registry = None
+        if self._registry_options is not None:
+            self._registry = PlateRegistry(**self._registry_options)
+        self._detect = Detect_License_Plate(self.model_path, self._text_det, self._text_rec,
+                                            registry=self._registry)
+
+        # 2. 初始化資料庫 (封裝了存圖與寫入 CSV 功能)
+        #    非同步寫入：存圖與 CSV 在背景執行緒完成，不拖慢偵測
+        self._db = DatabaseManager(base_dir="runs", enable_scale_img=False, async_write=True,
+                                   enable_lane=self._multi_lane,
+                                   enable_transaction=self._weighing_options is not None,
+                                   evidence=self._evidence, plate_index=self._plate_index)
+
+        #    背景容量保留：以小段、低優先的方式刪除最舊且已同步的圖片，不必手動執行 clean_data.py
+        self._retention = None
+        if self._retention_options is not None:
+            self._retention = RetentionDaemon(self._db.base_dir, **self._retention_options)
+
+        # 3. 各車道的相機、地磅、追蹤器與畫面過濾器
+        scales = {}
+        monitors = {}
+        for lane in self._lanes:
+            lane.cam = Camera(src=lane.src)
+
+            # 地磅 (Demo 階段開啟 simulate=True 模擬假重量)，相同 port 的車道共用
+            options = lane.scale_options
+            key = "simulate" if options.get("simulate", True) else options.get("port", "/dev/ttyUSB0")
+            if key not in scales:
+                scales[key] = ScaleDriver(**options)
+            lane.scale = scales[key]
+
+            # 過磅交易：同一台地磅的車道共用一個狀態機 (例如進出共用地磅)
+            if self._weighing_options is not None:
+                if key not in monitors:
+                    monitors[key] = TransactionMonitor(lane.scale, **self._weighing_options)
+                lane.weighing = monitors[key]
+
+            # 車牌追蹤器 (跨畫面投票，穩定後不再 OCR)
+            lane.tracker = PlateTracker() if self._use_tracker else None
+
+            # 畫面變化過濾器 (車道空著時不喚醒 YOLO)
+            if lane.motion_gate:
+                gate_options = lane.motion_gate if isinstance(lane.motion_gate, dict) else {}
+                lane.gate = MotionGate(**gate_options)
+        self._scales = list(scales.values())
+        self._monitors = list(monitors.values())
+        self._pairing = TarePairing(self._pair_window)
+        if self._weighing_options is not None:
+            self._restore_pairing()
+        print(f"[SystemController] 已啟動 {len(self._lanes)} 個車道: {[lane.name for lane in self._lanes]}")
+
+        # 4. 執行期指標 (Prometheus 端點與定期快照)
+        self._init_metrics()
+
+        # 5. 網頁預覽 (無螢幕的 Jetson 用瀏覽器觀看)
+        self._preview = None
+        if self._preview_options is not None:
+            try:
+                self._preview = PreviewServer(**self._preview_options)
+                for lane in self._lanes:
+                    self._preview.add_channel(lane.name)
+            except OSError as e:
+                print(f"[SystemController] 預覽伺服器啟動失敗: {e}")
+        if self._headless:
+            print("[SystemController] 無螢幕模式：不開啟顯示視窗")
+
+    def _init_metrics(self):
+        """
+        註冊指標：計數與量表都以回呼在抓取時讀取各模組既有的統計屬性，熱路徑不需要額外更新
+        各階段耗時則由各模組直接寫入 lpr_stage_seconds 直方圖
+        """
+        self._detect_time = STAGE_SECONDS.labels("detect")
+        self._metrics_server = None
+        self._metrics_writer = None
+
+        frames_read = REGISTRY.counter("lpr_frames_read_total", "相機讀到的畫面數", ["lane"])
+        scale_weight = REGISTRY.gauge("lpr_scale_weight_kg", "地磅最新讀值", ["lane"])
+        scale_stable = REGISTRY.gauge("lpr_scale_stable", "地磅是否穩定 (1 = 穩定)", ["lane"])
+        frames_skipped = REGISTRY.counter("lpr_frames_skipped_total", "沒有經過 YOLO 的畫面數", ["lane", "reason"])
+        fps = REGISTRY.gauge("lpr_camera_fps", "相機實際擷取幀率", ["lane"])
+        reclaimed = REGISTRY.counter("lpr_camera_buffers_reclaimed_total", "消費者沒有歸還而被強制收回的影像緩衝區數",
+                                     ["lane"])
+        for lane in self._lanes:
+            frames_read.labels(lane.name).set_function(lambda cam=lane.cam: cam.frames_read)
+            reclaimed.labels(lane.name).set_function(lambda cam=lane.cam: cam.reclaimed)
+            fps.labels(lane.name).set_function(lambda cam=lane.cam: cam.fps)
+            scale_weight.labels(lane.name).set_function(lane.scale.get_weight)
+            scale_stable.labels(lane.name).set_function(lane.scale.is_stable)
+            # dropped: 處理端來不及，相機已經讀到更新的畫面；motion: 畫面沒有變化
+            frames_skipped.labels(lane.name, "dropped").set_function(lambda l=lane: l.dropped_frames)
+            if lane.gate is not None:
+                frames_skipped.labels(lane.name, "motion").set_function(lambda g=lane.gate: g.skipped)
+
+        REGISTRY.counter("lpr_plates_found_total", "OCR 辨識出合格車牌的車牌框數").set_function(
+            lambda: self._detect.plates_found)
+        if self._monitors:
+            visits = REGISTRY.counter("lpr_weighing_transactions_total", "過磅交易輸出的紀錄數", ["kind"])
+            for kind in ("visits", "unweighed", "unidentified"):
+                visits.labels(kind).set_function(lambda k=kind: sum(getattr(m, k) for m in self._monitors))
+
+        REGISTRY.counter("lpr_records_written_total", "已寫入的紀錄數").set_function(
+            lambda: self._db.written_count)
+        REGISTRY.counter("lpr_records_dropped_total", "寫入佇列已滿而丟棄的紀錄數").set_function(
+            lambda: self._db.dropped_count)
+        REGISTRY.counter("lpr_records_sync_written_total", "寫入佇列已滿而改為直接寫入的紀錄數").set_function(
+            lambda: self._db.sync_count)
+        REGISTRY.counter("lpr_record_errors_total", "寫入失敗的紀錄數").set_function(
+            lambda: self._db.error_count)
+        REGISTRY.gauge("lpr_queue_depth", "佇列中等待處理的項目數", ["queue"]).labels("db_write").set_function(
+            lambda: self._db.stats()["queue_depth"])
+
+        disk = REGISTRY.gauge("lpr_disk_bytes", "runs 資料夾所在磁碟的空間", ["kind"])
+        disk.labels("free").set_function(lambda: shutil.disk_usage(self._db.base_dir).free)
+        disk.labels("total").set_function(lambda: shutil.disk_usage(self._db.base_dir).total)
+        if self._retention is not None:
+            r = self._retention
+            runs = REGISTRY.gauge("lpr_runs_bytes", "runs 資料夾的用量與容量上限", ["kind"])
+            runs.labels("used").set_function(lambda: r.usage_bytes)
+            runs.labels("budget").set_function(lambda: r.budget_bytes)
+            REGISTRY.counter("lpr_retention_reclaimed_bytes_total", "容量保留刪除圖片釋放的空間").set_function(
+                lambda: r.reclaimed_bytes)
+            REGISTRY.counter("lpr_retention_deleted_files_total", "容量保留刪除的圖片數").set_function(
+                lambda: r.deleted_files)
+            REGISTRY.counter("lpr_retention_skipped_files_total", "尚未同步而保留的過期圖片數").set_function(
+                lambda: r.skipped_unsynced)
+            REGISTRY.counter("lpr_retention_seconds_total", "容量保留實際工作的時間 (不含分段暫停)").set_function(
+                lambda: r.busy_seconds)
+        if self._db.plate_index is not None:
+            index = self._db.plate_index
+            REGISTRY.gauge("lpr_plate_index_plates", "車牌搜尋索引中不重複的車牌數").set_function(lambda: len(index))
+        if self._registry is not None:
+            reg = self._registry
+            REGISTRY.gauge("lpr_registry_plates", "登記車輛名單的車牌數").set_function(lambda: len(reg))
+            lookups = REGISTRY.counter("lpr_registry_lookups_total", "OCR 候選比對登記名單的結果", ["result"])
+            for result in reg.counts:
+                lookups.labels(result).set_function(lambda r=result: reg.counts[r])
+
+        try:
+            if self._metrics_port is not None:
+                self._metrics_server = MetricsServer(self._metrics_port)
+            if self._metrics_file:
+                self._metrics_writer = MetricsFileWriter(self._metrics_file, self._metrics_interval)
+        except OSError as e:
+            # 指標只是輔助功能，埠號被占用時不影響辨識
+            print(f"[SystemController] 指標端點啟動失敗: {e}")
+
+    def _register_queue_metrics(self, queues):
+        depth = REGISTRY.gauge("lpr_queue_depth", "佇列中等待處理的項目數", ["queue"])
+        dropped = REGISTRY.counter("lpr_queue_dropped_total", "佇列已滿而丟棄的項目數", ["queue"])
+        for q in queues:
+            depth.labels(q.name).set_function(q.qsize)
+            dropped.labels(q.name).set_function(lambda q=q: q.drop_count)
+            if isinstance(q, BlockingQueue):
+                REGISTRY.counter("lpr_queue_blocked_seconds_total", "佇列已滿而讓上游等待的時間",
+                                 ["queue"]).labels(q.name).set_function(lambda q=q: q.blocked_seconds)
 
     def run(self):
         # 啟動所有資源
-        self._init_components() 
-        
+        self._init_components()
+
         # 啟動按鈕監聽執行緒
         ListenButtonTh = threading.Thread(target=self._ListenMainButton, daemon=True)
         ListenButtonTh.start()
 
         try:
-            while True:
-                # 取得影像幀
-                frame = self._cam.get()
-                if frame is None:
-                    time.sleep(0.01)
-                    continue
+            if self._pipeline:
+                self._run_pipeline()
+            else:
+                self._run_serial()
 
-                display_frame = frame.copy()
-
-                # ==========================================
-                # 模式 A: 偵測模式 (核心業務邏輯)
-                # ==========================================
-                if self._status == "detect":
-                    # 1. 執行 AI 辨識
-                    processed_frame, plate_text = self._detect.run(frame)
-                    display_frame = processed_frame
-
-                    # 2. 整合資料流：抓重量、交給資料庫統一存圖與寫入
-                    if plate_text:
-                        now = time.time()
-                        
-                        # 防抖機制：同一個車牌 3 秒內不重複紀錄
-                        if (plate_text != self.last_plate) or (now - self.last_detect_time > 3.0):
-                            
-                            # A. 抓取地磅重量
-                            weight = self._scale.get_weight()
-                            
-                            # B. 將畫面與文字直接丟給 Database 處理 (高度封裝)
-                            self._db.save_record(
-                                plate_status="辨識成功", 
-                                plate=plate_text, 
-                                frame=display_frame, # 直接傳遞影像陣列，讓資料庫模組去存
-                                scale_status="穩定", 
-                                weight=weight
-                            )
-
-                            # 更新防抖狀態
-                            self.last_plate = plate_text
-                            self.last_detect_time = now
-
-                # ==========================================
-                # 模式 B: 純顯示模式 (僅供監視)
-                # ==========================================
-                elif self._status == "show":
-                    cv2.putText(display_frame, "VIEW ONLY MODE", (10, 50), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 165, 255), 2)
-
-                # ==========================================
-                # 畫面顯示與離開判定
-                # ==========================================
-                cv2.imshow("Smart LPR System", display_frame)
-                if cv2.waitKey(1) & 0xFF == 27: # 按下 ESC 鍵離開
-                    break
-                    
         except Exception as e:
             print(f"[SystemController] 執行階段發生未預期錯誤: {e}")
         finally:
             self.cleanup()
 
+    def _next_packet(self, lane, timeout):
+        """取得車道的下一張新影像，不輪詢也不會重複處理"""
+        packet = lane.cam.get_next(lane.last_seq, timeout=timeout)
+        if packet is not None:
+            lane.last_seq = packet.seq
+            lane.dropped_frames += packet.dropped
+        return packet
+
+    def _run_serial(self):
+        """單執行緒模式：每輪收集各車道的最新畫面，依序跑完所有階段"""
+        while True:
+            # 取得影像幀：frame 直接指向相機的緩衝區，在下一次 get_next 之前不會被覆寫
+            # 第一個車道阻塞等待，其餘車道只拿已經到的畫面
+            jobs = []
+            for i, lane in enumerate(self._lanes):
+                packet = self._next_packet(lane, timeout=(1.0 if i == 0 else 0.0))
+                if packet is not None:
+                    jobs.append(FrameJob(packet.frame, packet.seq, packet.timestamp, lane))
+
+            if not jobs:
+                if all(lane.cam.finished for lane in self._lanes):
+                    print("[SystemController] 影像來源已結束")
+                    break
+                continue
+
+            jobs = self._stage_detect(jobs)
+            for job in jobs:
+                job = self._stage_ocr(job)
+                self._stage_persist(job)
+
+            if not all(self._show(job) for job in jobs):
+                break
+
+    def _run_pipeline(self):
+        """
+        管線模式：擷取 -> 偵測 -> OCR -> 存檔 各自一條執行緒，以有界佇列串接
+        YOLO 處理第 N+1 張時，OCR 可同時處理第 N 張，存檔處理第 N-1 張
+        每個車道一條擷取執行緒，偵測階段一次取出多個車道的畫面合併推論
+        畫面顯示仍留在本執行緒 (OpenCV GUI 必須在同一條執行緒操作)
+        """
+        depth = self._queue_depth
+        n_lanes = len(self._lanes)
+        self._detect_q = DropOldestQueue(depth * n_lanes, "detect")
+        self._ocr_q = DropOldestQueue(depth * n_lanes, "ocr")
+        # 存檔佇列不可丟棄 (完成的 track 與過磅交易只經過這裡)：滿了就讓 OCR 階段等待
+        self._persist_q = BlockingQueue(depth * n_lanes, "persist")
+        self._display_q = DropOldestQueue(n_lanes, "display")
+        self._register_queue_metrics((self._detect_q, self._ocr_q, self._persist_q))
+
+        capture_threads = [threading.Thread(target=self._capture_loop, args=(lane,), daemon=True)
+                           for lane in self._lanes]
+        self._workers = [
+            StageWorker("detect", self._stage_detect, self._detect_q, self._ocr_q, self._stop_event,
+                        batch_size=n_lanes),
+            StageWorker("ocr", self._pipeline_ocr, self._ocr_q, self._display_q, self._stop_event),
+            StageWorker("persist", self._stage_persist, self._persist_q, None, self._stop_event),
+        ]
+        for th in capture_threads:
+            th.start()
+        for worker in self._workers:
+            worker.start()
+        print(f"[SystemController] 管線模式啟動 (佇列深度: {depth}, 車道數: {n_lanes})")
+
+        try:
+            while not self._stop_event.is_set():
+                if all(lane.cam.finished for lane in self._lanes):
+                    self._drain_and_stop()
+                    break
+                job = self._display_q.get(timeout=0.1)
+                if job is None:
+                    continue
+                if not self._show(job):
+                    break
+        finally:
+            self._stop_event.set()
+            for q in (self._detect_q, self._ocr_q, self._persist_q, self._display_q):
+                q.close()
+            for worker in self._workers:
+                worker.join(timeout=2.0)
+            # 存檔佇列中剩下的紀錄在關閉資料庫之前寫完，不能隨管線一起丟掉
+            remaining = self._persist_q.drain()
+            for job in remaining:
+                try:
+                    self._stage_persist(job)
+                except Exception as e:
+                    print(f"[SystemController] 關閉前寫入紀錄失敗: {e}")
+            dropped = {q.name: q.drop_count for q in (self._detect_q, self._ocr_q)}
+            print(f"[SystemController] 管線已停止，各佇列丟棄畫面數: {dropped}，"
+                  f"存檔佇列等待 {self._persist_q.block_count} 次 ({self._persist_q.blocked_seconds:.1f}s)，"
+                  f"關閉前補寫 {len(remaining)} 張")
+
+    def _capture_loop(self, lane):
+        """管線擷取階段：把車道的每張新畫面送進偵測佇列"""
+        while not self._stop_event.is_set():
+            packet = self._next_packet(lane, timeout=0.5)
+            if packet is None:
+                if lane.cam.finished:
+                    return
+                continue
+
+            # 畫面會跨執行緒停留好幾個階段，必須複製一份再歸還相機緩衝區
+            self._detect_q.put(FrameJob(packet.frame.copy(), packet.seq, packet.timestamp, lane))
+
+    def _drain_and_stop(self):
+        """影像來源結束 (影片重播完畢)：等各階段把佇列處理完再停止管線"""
+        print("[SystemController] 影像來源已結束，等待管線處理完畢...")
+        # 依管線順序等待：上游的佇列處理完 (含處理中的項目) 時，它的結果都已放進下游佇列
+        for q in (self._detect_q, self._ocr_q, self._persist_q):
+            while not q.join(timeout=0.1):
+                if self._stop_event.is_set():
+                    return
+        self._stop_event.set()
+
+    # ==========================================
+    # 各處理階段 (單執行緒與管線模式共用)
+    # ==========================================
+    def _stage_detect(self, jobs):
+        """
+        YOLO 偵測 (多個車道的畫面合併成一次推論)；純顯示模式或畫面沒有變化時跳過
+        只對各車道的偵測區域推論，框座標再換算回整張畫面
+        """
+        if self._status != "detect":
+            return jobs
+
+        pending = [job for job in jobs if self._gate_allows(job)]
+        if not pending:
+            return jobs
+        crops = [job.lane.crop(job.frame) for job in pending]
+        with self._detect_time.time():
+            results = self._detect.detect_batch([roi for roi, _, _ in crops])
+
+        for job, (_, dx, dy), boxes in zip(pending, crops, results):
+            job.boxes = [(x1 + dx, y1 + dy, x2 + dx, y2 + dy) for x1, y1, x2, y2 in boxes]
+        return jobs
+
+    def _gate_allows(self, job):
+        """畫面變化過濾：仍有追蹤中的車牌時一律偵測，讓 track 能穩定或正常離開"""
+        lane = job.lane
+        if lane.gate is None:
+            return True
+        # 只看偵測區域，roi 外的路人、車流與光影變化不會喚醒 YOLO
+        roi, _, _ = lane.crop(job.frame)
+        moving = lane.gate.should_process(roi, job.timestamp)
+
+        if job.timestamp - self._last_gate_report >= 600:
+            for l in self._lanes:
+                if l.gate is not None:
+                    print(f"[SystemController] 車道 {l.name} 畫面過濾統計: {l.gate.stats()}")
+            self._last_gate_report = job.timestamp
+
+        return moving or (lane.tracker is not None and bool(lane.tracker.tracks))
+
+    def _stage_ocr(self, job):
+        """對偵測到的車牌框執行 OCR (畫框留到顯示時才做，沒人看就不畫)"""
+        if job.lane.tracker is not None:
+            job = self._stage_track(job)
+        elif job.boxes:
+            job.detections = self._detect.recognize(job.frame, job.boxes)
+            if job.detections:
+                job.plate = job.detections[-1][1]
+
+        if job.lane.weighing is not None:
+            self._stage_weigh(job)
+        return job
+
+    def _stage_track(self, job):
+        """
+        追蹤模式：框配對到 track，只對尚未穩定的 track 呼叫 OCR
+        穩定或離開畫面的 track 放進 job.finished 交給存檔階段
+        """
+        tracker = job.lane.tracker
+
+        # 純顯示模式下 job.boxes 為空，仍要更新追蹤器讓 track 正常離開
+        pairs = tracker.update(job.boxes, job.timestamp)
+
+        # 需要 OCR 的 track 整批辨識
+        pending = [(track, box) for track, box in pairs if tracker.needs_ocr(track)]
+        if pending:
+            reads = self._detect.read_boxes(job.frame, [box for _, box in pending])
+            for (track, _), track_reads in zip(pending, reads):
+                tracker.add_reads(track, track_reads, job.frame)
+
+        for track, box in pairs:
+            text = track.text
+            if text:
+                job.detections.append((box, text))
+
+        job.finished = tracker.collect()
+        return job
+
+    def _stage_weigh(self, job):
+        """
+        過磅交易：把這張畫面的車牌結果交給地磅狀態機，完成的過磅放進 job.transactions
+        以牆上時間推進，地磅讀值的時間戳是真實時間 (影片重播的畫面時間戳不是)
+        """
+        lane = job.lane
+        now = time.time()
+        if lane.tracker is not None:
+            # 追蹤模式：每個 track 只進來一次，證據畫面已經是複本
+            for track in job.finished:
+                _, confidence = track.consensus()
+                lane.weighing.observe(track.text, track.reads * confidence, track.best_frame,
+                                      track.best_box, lane, now, copy_frame=False)
+        elif job.plate:
+            box = job.detections[-1][0] if job.detections else None
+            lane.weighing.observe(job.plate, 1.0, job.frame, box, lane, now)
+        job.transactions = lane.weighing.update(now, job.frame)
+
+    def _pipeline_ocr(self, job):
+        """管線 OCR 階段：有車牌的畫面另外送往存檔佇列，其餘只送去顯示"""
+        job = self._stage_ocr(job)
+        if job.plate or job.finished or job.transactions:
+            self._persist_q.put(job)
+        return job
+
+    def _stage_persist(self, job):
+        """整合資料流：抓重量、交給資料庫統一存圖與寫入"""
+        lane = job.lane
+        lane_name = lane.name if self._multi_lane else None
+
+        # 過磅交易模式：只有完成的過磅才寫紀錄，不走下方的逐 track / 防抖輸出
+        if lane.weighing is not None:
+            for trans in job.transactions:
+                self._save_transaction(trans)
+            return None
+
+        # 追蹤模式：每個完成的 track 輸出一筆，使用投票結果與最佳證據畫面
+        for track in job.finished:
+            # 沒有證據畫面時複製本張畫面：job.frame 同時在顯示階段使用，不能在上面畫框
+            frame = track.best_frame if track.best_frame is not None else job.frame.copy()
+            crop = self._db.crop_plate(frame, track.best_box)  # 畫框之前裁切，特寫不含框線
+            self._detect.draw(frame, [(track.best_box, track.text)])
+            scale_status, weight = self._weigh(lane)
+            self._db.save_record(
+                plate_status=self._plate_status(track.text),
+                plate=track.text,
+                frame=frame,
+                scale_status=scale_status,
+                weight=weight,
+                lane=lane_name,
+                plate_crop=crop
+            )
+            print(f"[SystemController] 車道 {lane.name} Track #{track.track_id} 完成: {track.text} "
+                  f"(OCR {track.ocr_calls} 次, 有效 {track.reads} 次)")
+
+        plate_text = job.plate
+        if not plate_text:
+            return None
+
+        now = job.timestamp
+
+        # 防抖機制：同一個車牌 3 秒內不重複紀錄 (每個車道各自判斷)
+        if (plate_text != lane.last_plate) or (now - lane.last_detect_time > 3.0):
+
+            # A. 抓取地磅重量
+            scale_status, weight = self._weigh(lane)
+
+            # B. 將畫面與文字直接丟給 Database 處理 (高度封裝)，存檔的照片帶有車牌框
+            #    管線模式下同一個 job 也在顯示階段，存檔的畫框與裁切都在自己的複本上做
+            frame = job.frame.copy()
+            crop = self._db.crop_plate(frame, job.detections[-1][0] if job.detections else None)
+            self._detect.draw(frame, job.detections)
+            self._db.save_record(
+                plate_status=self._plate_status(plate_text),
+                plate=plate_text,
+                frame=frame, # 直接傳遞影像陣列，讓資料庫模組去存
+                scale_status=scale_status,
+                weight=weight,
+                lane=lane_name,
+                plate_crop=crop
+            )
+
+            # 更新防抖狀態
+            lane.last_plate = plate_text
+            lane.last_detect_time = now
+        return None
+
+    def _save_transaction(self, trans):
+        """寫入一次過磅：最佳車牌、穩定重量 (從未靜止則記錄最大讀值) 與同車牌進出場配對的淨重"""
+        frame = trans.frame
+        if frame is None:
+            print(f"[SystemController] 過磅 #{trans.visit_id} 沒有任何畫面，略過 ({trans.peak_weight} kg)")
+            return
+        lane = trans.lane
+        plate = trans.plate
+        crop = None
+        if plate and trans.box is not None:
+            crop = self._db.crop_plate(frame, trans.box)
+            self._detect.draw(frame, [(trans.box, plate)])
+
+        if trans.weight is not None:
+            scale_status, weight = STATUS_STABLE, trans.weight
+        elif trans.weighed:
+            scale_status, weight = STATUS_UNSTABLE, trans.peak_weight
+        else:
+            scale_status, weight = STATUS_NOT_WEIGHED, None
+
+        direction = lane.direction if lane is not None else None
+        tare, net = self._pairing.pair(plate, trans.weight, trans.start_ts, direction)
+        self._db.save_record(
+            plate_status=self._plate_status(plate) if plate else "未辨識",
+            plate=plate or "UNKNOWN",
+            frame=frame,
+            scale_status=scale_status,
+            weight=weight,
+            lane=lane.name if self._multi_lane and lane is not None else None,
+            direction=direction,
+            tare_weight=tare,
+            net_weight=net,
+            plate_crop=crop
+        )
+        print(f"[SystemController] 過磅 #{trans.visit_id} 完成: {plate or '未辨識'} | {scale_status} {weight} kg"
+              + (f" | 淨重 {net} kg" if net is not None else ""))
+
+    def _restore_pairing(self):
+        """從已寫入的紀錄重建等待出場配對的車牌，重新啟動前進場的車出場時仍能算出淨重"""
+        since = time.time() - self._pair_window
+        try:
+            records = self._db.store.query_time_range(since)
+        except Exception as e:
+            print(f"[SystemController] 無法讀取過磅紀錄，進出場配對從頭開始: {e}")
+            return
+        # 與 _save_transaction 相同：只有辨識到車牌且有穩定重量的過磅參與配對 (紀錄時間為完成時間)
+        weighings = [(rec["plate"], rec["weight"], rec["ts"], rec.get("direction") or None)
+                     for rec in records
+                     if rec.get("scale_status") == STATUS_STABLE and rec.get("weight") is not None
+                     and rec.get("plate_status") != "未辨識"]
+        count = self._pairing.restore(weighings)
+        if count:
+            print(f"[SystemController] 已從紀錄重建 {count} 個等待配對的車牌")
+
+    def _plate_status(self, plate):
+        """紀錄的車牌狀態：沒有登記名單時與舊版相同，否則標記 登記車輛 / 校正為登記車輛 / 未登記車輛"""
+        if self._registry is None:
+            return "辨識成功"
+        return STATUS_LABELS[self._registry.settle(plate)]
+
+    @staticmethod
+    def _weigh(lane):
+        """
+        地磅狀態與重量：優先使用最近的穩定重量，否則記錄當下讀值與實際狀態 (不穩定 / 無訊號)
+        以牆上時間查詢，影片重播的畫面時間戳不是真實時間
+        """
+        weight = lane.scale.stable_weight_at(time.time())
+        if weight is not None:
+            return STATUS_STABLE, weight
+        return lane.scale.status(), lane.scale.get_weight()
+
+    def _show(self, job):
+        """
+        畫面顯示與離開判定 (每個車道一個視窗)
+        無螢幕且沒有人看預覽時直接返回，不做任何畫框與編碼
+        Returns: False 代表使用者按下 ESC 要求離開
+        """
+        to_preview = self._preview is not None and self._preview.wants_frame(job.lane.name)
+        if self._headless and not to_preview:
+            return True
+
+        # 一律畫在複本上：管線模式下存檔階段可能同時在裁切同一張畫面的車牌特寫
+        display_frame = job.frame.copy()
+        if self._status == "show":
+            # 純顯示模式 (僅供監視)
+            cv2.putText(display_frame, "VIEW ONLY MODE", (10, 50),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 165, 255), 2)
+        self._detect.draw(display_frame, job.detections)
+
+        if to_preview:
+            self._preview.publish(display_frame, job.lane.name)
+        if self._headless:
+            return True
+
+        title = "Smart LPR System"
+        if self._multi_lane:
+            title = f"{title} - {job.lane.name}"
+        cv2.imshow(title, display_frame)
+        if cv2.waitKey(1) & 0xFF == 27: # 按下 ESC 鍵離開
+            return False
+        return True
+
     def _ListenMainButton(self):
         """獨立執行緒：監聽主程式傳來的按鈕切換訊號"""
         while True:
@@ -124,10 +747,40 @@ class SystemController(Process):
     def cleanup(self):
         """優雅關機：釋放所有硬體與系統資源"""
         print("[SystemController] 準備關閉系統與釋放資源...")
+        self._stop_event.set()
         try:
-            self._cam.cleanup()
-            self._scale.close()
-            cv2.destroyAllWindows()
+            if getattr(self, "_retention", None) is not None:
+                self._retention.close()
+                print(f"[SystemController] 容量保留統計: {self._retention.stats()}")
+            for lane in self._lanes:
+                if lane.cam is not None:
+                    lane.cam.cleanup()
+                    print(f"[SystemController] 車道 {lane.name} 相機統計: {lane.cam.stats()}，"
+                          f"處理端跳過 {lane.dropped_frames} 張")
+                if lane.gate is not None:
+                    print(f"[SystemController] 車道 {lane.name} 畫面過濾統計: {lane.gate.stats()}")
+            # 磅上還有車或還在等車牌的過磅，以目前為止的結果寫入
+            for monitor in getattr(self, "_monitors", []):
+                for trans in monitor.close():
+                    self._save_transaction(trans)
+                print(f"[SystemController] 過磅交易統計: {monitor.stats()}")
+            for scale in self._scales:
+                scale.close()
+            # 在期限內把尚未寫入的紀錄排空
+            self._db.close(timeout=5.0)
+            print(f"[SystemController] 資料庫寫入統計: {self._db.stats()}")
+            if self._detect.ocr_cache is not None:
+                print(f"[SystemController] OCR 快取統計: {self._detect.ocr_cache.stats()}")
+            if self._registry is not None:
+                print(f"[SystemController] 登記車輛比對統計: {self._registry.stats()}")
+            if getattr(self, "_metrics_writer", None) is not None:
+                self._metrics_writer.close()
+            if getattr(self, "_metrics_server", None) is not None:
+                self._metrics_server.close()
+            if getattr(self, "_preview", None) is not None:
+                self._preview.close()
+            if not self._headless:
+                cv2.destroyAllWindows()
             print("[SystemController] 資源釋放完畢。")
         except Exception as e:
             print(f"[SystemController] 釋放資源時發生錯誤: {e}")
@@ -0,0 +1,16 @@
+"""
+測試共用設定：在專案根目錄執行 python -m pytest
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# tools/ 底下的查詢工具 (例如 query_history) 也當作模組匯入
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
@@ -0,0 +1,151 @@
+"""
+歷史封存檔 (modules/archive.py) 與查詢工具 (tools/query_history.py) 的測試
+
+建立 30 天的封存 CSV (每天一份) 與目前的 data_log.csv，以 DataMaintenance.compress_archive
+轉成封存檔 (保留一份未轉換的 CSV)，查詢結果與逐列掃描封存前的內容比對
+"""
+import csv
+import os
+import random
+import time
+
+import pytest
+
+from modules.archive import ARCHIVE_EXT, ArchiveReader
+from modules.maintenance import DataMaintenance
+from modules.record_store import FIELDS, CsvRecordStore, SqliteRecordStore, make_record, to_timestamp
+from query_history import history_files, query
+
+CSV_FIELDS = [name for name, _, _ in FIELDS]
+DAYS = 30
+PER_DAY = 500
+
+
+def make_history(runs, days, per_day):
+    """每天一份封存 CSV，最後一天為目前的 data_log.csv；車牌從 500 個常客與偶爾出現的車牌中抽"""
+    rng = random.Random(0)
+    regulars = [f"REG-{i:04d}" for i in range(500)]
+    start = to_timestamp("2025-01-01 00:00:00")
+    history = os.path.join(runs, "history")
+    os.makedirs(history, exist_ok=True)
+    for d in range(days):
+        day_start = start + d * 86400
+        store = CsvRecordStore(os.path.join(runs, "data_log.csv"), CSV_FIELDS)
+        records = []
+        for i in range(per_day):
+            ts = day_start + i * 86400 // per_day
+            plate = rng.choice(regulars) if rng.random() < 0.8 else f"ONE-{d:03d}{i:04d}"
+            records.append(make_record("辨識成功", plate, f"runs/images/2025/01/01/{plate}_{int(ts)}.jpg", "穩定",
+                                       float(rng.randint(8000, 45000)), ts=ts))
+        store.append(records)
+        store.close()
+        if d < days - 1:
+            name = time.strftime("data_log_%Y%m%d.csv", time.localtime(day_start))
+            os.replace(os.path.join(runs, "data_log.csv"), os.path.join(history, name))
+
+
+def scan(paths, plate, since, until):
+    """不用索引、逐列掃描的對照結果"""
+    rows = []
+    for path in paths:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for rec in csv.DictReader(f):
+                ts = to_timestamp(rec["時間(Time)"])
+                if plate is not None and rec["車牌(Plate)"] != plate:
+                    continue
+                if (since is not None and ts < since) or (until is not None and ts > until):
+                    continue
+                rows.append((rec["時間(Time)"], rec["車牌(Plate)"]))
+    return rows
+
+
+@pytest.fixture(scope="module")
+def archived(tmp_path_factory):
+    """
+    Returns: dict
+        archives: 轉換後的封存檔；originals: 封存前的 CSV 路徑 -> 內容
+        reference: 對照組 (封存前的 CSV 內容 + 未轉換的 CSV + 目前的 data_log.csv)；paths: 查詢的檔案
+    """
+    workdir = tmp_path_factory.mktemp("archive")
+    runs = str(workdir / "runs")
+    make_history(runs, DAYS, PER_DAY)
+    csv_paths = history_files(runs)
+    originals = {path: open(path, "rb").read() for path in csv_paths[:-2]}
+
+    cleaner = DataMaintenance(img_dir=os.path.join(runs, "images"), csv_path=os.path.join(runs, "data_log.csv"),
+                              archive_dir=os.path.join(runs, "history"))
+    archives = [cleaner.compress_archive(path) for path in originals]
+
+    reference_dir = workdir / "reference"
+    reference_dir.mkdir()
+    reference = []
+    for i, data in enumerate(originals.values()):
+        ref = reference_dir / f"{i:04d}.csv"
+        ref.write_bytes(data)
+        reference.append(str(ref))
+    reference += csv_paths[-2:]
+    return {"archives": archives, "originals": originals,
+            "reference": reference, "paths": history_files(runs)}
+
+
+def run_query(paths, plate, since, until):
+    stats = {"files": 0, "files_pruned": 0, "files_scanned": 0, "blocks_read": 0, "blocks_skipped": 0}
+    got = [(rec["time"], rec["plate"]) for rec in query(paths, plate, since, until, stats)]
+    return got, stats
+
+
+def test_round_trip(archived):
+    assert all(archived["archives"])
+    for (path, data), archive in zip(archived["originals"].items(), archived["archives"]):
+        reader = ArchiveReader(archive)
+        expected = list(csv.reader(data.decode("utf-8-sig").replace("\r\n", "\n").splitlines()))
+        assert [reader.header] + list(reader.iter_rows()) == expected, path
+
+
+def test_smaller_than_csv(archived):
+    csv_bytes = sum(len(data) for data in archived["originals"].values())
+    archive_bytes = sum(os.path.getsize(p) for p in archived["archives"])
+    assert archive_bytes < csv_bytes / 2
+    assert not any(os.path.exists(p) for p in archived["originals"])
+
+
+def test_query_by_time(archived):
+    since = to_timestamp("2025-01-10 06:00:00")
+    until = to_timestamp("2025-01-12 18:00:00")
+    got, stats = run_query(archived["paths"], None, since, until)
+    assert got == scan(archived["reference"], None, since, until)
+    # 時間範圍外的檔案只讀索引
+    assert stats["files_pruned"] >= len(archived["archives"]) - 4
+
+
+def test_query_by_plate(archived):
+    # 只出現一次的車牌：其他封存檔由 bloom filter 排除 (約 1% 誤判，誤判的檔案多讀一個區塊)
+    reference = archived["reference"]
+    plate = next(p for _, p in scan(reference[3:4], None, None, None) if p.startswith("ONE-"))
+    got, stats = run_query(archived["paths"], plate, None, None)
+    assert got == scan(reference, plate, None, None) and len(got) == 1
+    assert stats["blocks_read"] <= 2 + stats["files"] // 20
+
+
+def test_query_by_plate_and_time(archived):
+    since = to_timestamp("2025-01-10 06:00:00")
+    until = to_timestamp("2025-01-12 18:00:00")
+    got, _ = run_query(archived["paths"], "REG-0042", since, until)
+    assert got == scan(archived["reference"], "REG-0042", since, until)
+
+
+def test_truncated_archive_rejected(archived, tmp_path):
+    broken = tmp_path / ("broken" + ARCHIVE_EXT)
+    with open(archived["archives"][0], "rb") as src:
+        broken.write_bytes(src.read()[:-10])
+    with pytest.raises(ValueError):
+        ArchiveReader(str(broken))
+
+
+def test_import_into_record_db(archived, tmp_path):
+    store = SqliteRecordStore(str(tmp_path / "records.db"))
+    reader = ArchiveReader(archived["archives"][0])
+    inserted = store.import_rows(reader.header, reader.iter_rows())
+    again = store.import_rows(reader.header, reader.iter_rows())
+    store.close()
+    assert inserted == reader.index["rows"] and again == 0
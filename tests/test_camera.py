@@ -0,0 +1,150 @@
+"""
+相機環形緩衝 (modules/camera.py) 的測試，以逐張放行的假影像來源取代相機
+
+確認 get_next 依序號取得最新一張、不重複並回報跳過的張數、租用中的緩衝區不會被覆寫，
+以及消費者一直不歸還時強制收回最舊的租用並計數、來源結束時 get_next 返回
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from modules.camera import Camera
+from modules.capture_source import CaptureSource
+
+
+class StepSource(CaptureSource):
+    """每呼叫一次 step() 放行一張影像，內容填入該張的序號 (寫進 Camera 給的緩衝區)"""
+    name = "step"
+
+    def __init__(self, frames=100):
+        super().__init__()
+        self.frames = frames
+        self.count = 0
+        self._permits = threading.Semaphore(0)
+        self._closed = False
+
+    def open(self):
+        return True
+
+    def is_opened(self):
+        return True
+
+    def step(self, n=1):
+        for _ in range(n):
+            self._permits.release()
+
+    def read(self, buf=None):
+        while not self._permits.acquire(timeout=0.05):
+            if self._closed:
+                self.eof = True
+                return False, None, time.time()
+        if self.count >= self.frames:
+            self.eof = True
+            return False, None, time.time()
+        self.count += 1
+        frame = np.empty((4, 4), np.uint8) if buf is None else buf
+        frame[:] = self.count
+        return True, frame, time.time()
+
+    def release(self):
+        self._closed = True
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待逾時"
+        time.sleep(0.005)
+
+
+def deliver(cam, source, n=1):
+    target = cam.frames_read + n
+    source.step(n)
+    wait_until(lambda: cam.frames_read >= target)
+
+
+@pytest.fixture
+def camera():
+    source = StepSource()
+    cam = Camera(src=source, buffers=3)
+    yield cam, source
+    source.release()
+    cam.cleanup()
+
+
+def test_get_next_order_and_drops(camera):
+    cam, source = camera
+    deliver(cam, source)
+    packet = cam.get_next(0, timeout=1)
+    assert (packet.seq, packet.dropped, int(packet.frame[0, 0])) == (1, 0, 1)
+
+    # 處理端落後時直接拿最新一張，並回報跳過幾張
+    deliver(cam, source, 3)
+    packet = cam.get_next(packet.seq, timeout=1)
+    assert (packet.seq, packet.dropped, int(packet.frame[0, 0])) == (4, 2, 4)
+
+    # 沒有新影像時不會重複拿到同一張
+    assert cam.get_next(packet.seq, timeout=0.05) is None
+
+    # 等待中的消費者在下一張到達時被喚醒
+    result = []
+    t = threading.Thread(target=lambda: result.append(cam.get_next(4, timeout=2)))
+    t.start()
+    time.sleep(0.05)
+    deliver(cam, source)
+    t.join()
+    assert result[0].seq == 5 and result[0].dropped == 0
+
+
+def test_leased_buffer_is_not_overwritten():
+    # 4 個緩衝區：長期持有的一張、另一個消費者正在用的一張、最新一張，還剩一個可寫入
+    source = StepSource()
+    cam = Camera(src=source, buffers=4)
+    try:
+        deliver(cam, source)
+        held = cam.get_next(0, timeout=1)
+        seq = 0
+        for expected in range(2, 10):
+            deliver(cam, source)
+            packet = cam.get_next(seq, timeout=1)
+            assert packet.seq == expected
+            seq = packet.seq
+        assert int(held.frame[0, 0]) == 1
+        assert cam.reclaimed == 0
+    finally:
+        source.release()
+        cam.cleanup()
+
+
+def test_lease_exhaustion_reclaims_oldest(camera):
+    cam, source = camera
+    # 消費者拿了三張都沒有歸還 (每次都以 after_seq=0 呼叫)
+    leases = []
+    for _ in range(3):
+        deliver(cam, source)
+        leases.append(cam.get_next(0, timeout=1))
+    assert [p.seq for p in leases] == [1, 2, 3]
+    # 第 3 張寫入後挑選下一個緩衝區時已沒有可用的，強制收回最舊的租用 (序號 1)
+    wait_until(lambda: cam.reclaimed == 1)
+    assert 1 not in cam._leases
+    assert cam.stats()["reclaimed"] == 1
+
+    deliver(cam, source)
+    assert int(leases[0].frame[0, 0]) == 4  # 被收回的緩衝區已寫入新影像
+    assert [int(p.frame[0, 0]) for p in leases[1:]] == [2, 3]
+
+
+def test_finished_wakes_consumer():
+    source = StepSource(frames=1)
+    cam = Camera(src=source, buffers=3)
+    try:
+        deliver(cam, source)
+        packet = cam.get_next(0, timeout=1)
+        source.step()
+        wait_until(lambda: cam.finished)
+        assert cam.get_next(packet.seq, timeout=1) is None
+    finally:
+        source.release()
+        cam.cleanup()
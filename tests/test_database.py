@@ -0,0 +1,93 @@
+"""
+DatabaseManager (modules/database.py) 的測試：同步與非同步寫入、佇列已滿時的處理、
+flush / close 的期限
+"""
+import csv
+import threading
+
+import numpy as np
+import pytest
+
+from modules.database import DatabaseManager
+
+FRAME = np.zeros((120, 160, 3), np.uint8)
+
+
+def rows(db):
+    with open(db.file_path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def stall_store(db):
+    """讓紀錄寫入卡住 (模擬 SD 卡停頓)，回傳放行用的 Event"""
+    release = threading.Event()
+    append = db.store.append
+
+    def slow_append(records):
+        release.wait(5.0)
+        append(records)
+    db.store.append = slow_append
+    return release
+
+
+@pytest.fixture
+def make_db(tmp_path):
+    dbs = []
+
+    def make(**options):
+        db = DatabaseManager(base_dir=str(tmp_path / "runs"), **options)
+        dbs.append(db)
+        return db
+    yield make
+    for db in dbs:
+        db.close(timeout=1.0)
+
+
+def test_sync_write(make_db):
+    db = make_db()
+    assert db.save_record("辨識成功", "ABC-1234", FRAME, "穩定", 12345.0)
+    (row,) = rows(db)
+    assert row["車牌(Plate)"] == "ABC-1234" and db.written_count == 1
+
+
+def test_async_flush_and_close(make_db):
+    db = make_db(async_write=True, flush_rows=100, flush_interval=60.0)
+    for i in range(5):
+        assert db.save_record("辨識成功", f"ABC-{i:04d}", FRAME, "穩定", 1000.0 + i)
+    assert db.flush(timeout=5.0)
+    assert len(rows(db)) == 5
+    db.save_record("辨識成功", "ABC-0005", FRAME, "穩定", 1005.0)
+    assert db.close(timeout=5.0)
+    assert db.stats()["written"] == 6 and len(rows(db)) == 6
+
+
+def test_full_queue_falls_back_to_direct_write(make_db):
+    db = make_db(async_write=True, max_pending=2, enqueue_timeout=0.05, flush_rows=1)
+    release = stall_store(db)
+    threading.Timer(0.3, release.set).start()
+    for i in range(8):
+        assert db.save_record("辨識成功", f"ABC-{i:04d}", FRAME, "穩定", 1000.0)
+    assert db.close(timeout=5.0)
+    stats = db.stats()
+    assert stats["dropped"] == 0 and stats["sync_writes"] > 0 and stats["written"] == 8
+    assert len(rows(db)) == 8
+
+
+def test_full_queue_drops_without_fallback(make_db):
+    db = make_db(async_write=True, max_pending=2, enqueue_timeout=0.05, flush_rows=1, sync_fallback=False)
+    release = stall_store(db)
+    saved = [db.save_record("辨識成功", f"ABC-{i:04d}", FRAME, "穩定", 1000.0) for i in range(8)]
+    release.set()
+    assert db.close(timeout=5.0)
+    stats = db.stats()
+    assert stats["dropped"] == saved.count(False) > 0
+    assert stats["written"] == saved.count(True) == len(rows(db))
+
+
+def test_flush_and_close_respect_deadline(make_db):
+    db = make_db(async_write=True, flush_rows=1)
+    release = stall_store(db)
+    db.save_record("辨識成功", "ABC-0001", FRAME, "穩定", 1000.0)
+    assert not db.flush(timeout=0.2)
+    assert not db.close(timeout=0.2)
+    release.set()
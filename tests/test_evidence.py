@@ -0,0 +1,117 @@
+"""
+證據圖片設定 (modules/evidence.py) 的測試，不需要相機
+
+確認預設設定與參數的轉換、現場畫面縮小 (保持比例、不放大)、車牌特寫的邊界與複本、各編碼格式可解碼，
+以及 DatabaseManager 依設定存出縮小的現場畫面與特寫並寫入紀錄
+"""
+import csv
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from modules.database import DatabaseManager
+from modules.evidence import EVIDENCE_PRESETS, EvidenceProfile
+
+
+def scene_frame(w=1280, h=720):
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(frame, (9, 9), 0)
+
+
+def test_from_config():
+    default = EvidenceProfile.from_config(None)
+    assert (default.scene_width, default.crop, default.codec, default.quality) == (None, False, "jpg", 95)
+    assert default.crop_quality == default.quality
+
+    compact = EvidenceProfile.from_config("compact")
+    assert (compact.scene_width, compact.crop, compact.quality) == (640, True, 80)
+    minimal = EvidenceProfile.from_config("minimal")
+    assert (minimal.codec, minimal.ext, minimal.grayscale) == ("webp", ".webp", True)
+    assert set(EVIDENCE_PRESETS) == {"full", "compact", "minimal"}
+
+    custom = EvidenceProfile.from_config({"scene_width": 800, "crop_quality": 90, "quality": 70})
+    assert (custom.scene_width, custom.quality, custom.crop_quality) == (800, 70, 90)
+    assert EvidenceProfile.from_config(custom) is custom
+
+    with pytest.raises(ValueError):
+        EvidenceProfile.from_config("tiny")
+    with pytest.raises(ValueError):
+        EvidenceProfile(codec="png")
+
+
+def test_scene():
+    frame = scene_frame()
+    assert EvidenceProfile().scene(frame) is frame
+    small = EvidenceProfile(scene_width=640).scene(frame)
+    assert small.shape == (360, 640, 3)
+    # 比設定還小的畫面不放大，直接回傳原畫面
+    narrow = scene_frame(320, 240)
+    assert EvidenceProfile(scene_width=640).scene(narrow) is narrow
+
+
+def test_crop_plate():
+    frame = scene_frame()
+    profile = EvidenceProfile(crop=True, crop_margin=0.1)
+    assert EvidenceProfile().crop_plate(frame, (100, 100, 200, 150)) is None
+    assert profile.crop_plate(frame, None) is None
+    assert profile.crop_plate(None, (100, 100, 200, 150)) is None
+
+    crop = profile.crop_plate(frame, (100, 100, 200, 150))
+    assert crop.shape == (60, 120, 3)  # 寬高各多留 10%
+    assert np.array_equal(crop, frame[95:155, 90:210])
+    # 複本：之後在原畫面上畫框不影響特寫
+    frame[95:155, 90:210] = 0
+    assert crop.any()
+
+    # 靠近邊界時裁切到畫面內；框在畫面外則沒有特寫
+    edge = profile.crop_plate(frame, (0, 0, 50, 20))
+    assert edge.shape == (22, 55, 3)
+    assert profile.crop_plate(frame, (2000, 2000, 2100, 2050)) is None
+
+
+@pytest.mark.parametrize("preset", ["full", "compact", "minimal"])
+def test_encode_round_trip(preset):
+    profile = EvidenceProfile.from_config(preset)
+    frame = profile.scene(scene_frame())
+    data, seconds = profile.encode(frame)
+    assert seconds >= 0
+    decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    assert decoded.shape[:2] == frame.shape[:2]
+    if profile.grayscale:
+        # WebP 解碼後一律是 3 通道，灰階時三個通道相同
+        assert decoded.ndim == 2 or (decoded.max(axis=2) == decoded.min(axis=2)).all()
+    else:
+        assert decoded.ndim == 3 and (decoded[..., 0] != decoded[..., 2]).any()
+
+
+def test_quality_changes_size():
+    profile = EvidenceProfile()
+    frame = scene_frame()
+    high, _ = profile.encode(frame)
+    low, _ = profile.encode(frame, quality=30)
+    assert len(low) < len(high)
+
+
+def test_database_compact(tmp_path):
+    db = DatabaseManager(base_dir=str(tmp_path / "runs"), evidence="compact")
+    frame = scene_frame()
+    box = (600, 400, 760, 450)
+    crop = db.crop_plate(frame, box)
+    assert db.save_record("辨識成功", "ABC-1234", frame, "穩定", 32000.0, plate_crop=crop)
+    # 沒有車牌框時特寫欄位記錄 N/A
+    assert db.save_record("辨識成功", "XYZ-9999", frame, "穩定", 1000.0)
+    db.close()
+
+    with open(db.file_path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    first, second = rows
+    scene = cv2.imread(os.path.join(db.base_dir, first["車牌照片(Plate_Image)"][len("runs/"):]))
+    assert scene.shape == (360, 640, 3)
+    close_up = cv2.imread(os.path.join(db.base_dir, first["車牌特寫(Plate_Crop)"][len("runs/"):]))
+    assert close_up.shape == crop.shape
+    assert os.path.basename(first["車牌特寫(Plate_Crop)"]).startswith("crop_ABC-1234_")
+    assert second["車牌特寫(Plate_Crop)"] == "N/A"
+    assert db.stats()["written"] == 2
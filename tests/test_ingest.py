@@ -0,0 +1,155 @@
+"""
+車隊匯入服務 (modules/ingest.py) 的測試，完全在本機 loopback 執行
+
+啟動 IngestServer (127.0.0.1，隨機埠號)，兩台假裝置各自以 IncrementalSync + HttpTransport 上傳
+"""
+import json
+import os
+from datetime import datetime
+from urllib.request import urlopen
+
+import pytest
+
+from modules.ingest import IngestStore, IngestServer
+from modules.maintenance import DataMaintenance
+from modules.record_store import CsvRecordStore, make_record
+from modules.sync import IncrementalSync, HttpTransport
+
+CSV_FIELDS = ["time", "plate_status", "plate", "plate_image", "scale_status", "weight"]
+T0 = datetime(2025, 2, 7, 8, 0, 0).timestamp()
+
+
+def add_records(runs, plates, start_ts, image_bytes=None):
+    """在假的 runs 中新增紀錄與對應的圖片"""
+    store = CsvRecordStore(os.path.join(runs, "data_log.csv"), CSV_FIELDS)
+    records = []
+    for i, plate in enumerate(plates):
+        ts = start_ts + i
+        name = f"{plate}_{int(ts)}.jpg"
+        os.makedirs(os.path.join(runs, "images"), exist_ok=True)
+        with open(os.path.join(runs, "images", name), "wb") as f:
+            f.write(image_bytes if image_bytes is not None else os.urandom(20000))
+        records.append(make_record("辨識成功", plate, f"runs/images/{name}", "穩定", 35000.0 + i, ts=ts))
+    store.append(records)
+    store.close()
+
+
+def get_json(url):
+    with urlopen(url, timeout=10) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+class Fleet:
+    """匯入服務與兩台已完成第一次同步的裝置；兩台各有一張內容完全相同的圖片"""
+
+    def __init__(self, workdir):
+        self.store = IngestStore(os.path.join(workdir, "server"))
+        self.server = IngestServer(self.store, port=0, host="127.0.0.1")
+        self.url = f"http://127.0.0.1:{self.server.port}"
+        self.shared_image = os.urandom(30000)
+        self.devices = {}
+        for device in ("gate-a", "gate-b"):
+            runs = os.path.join(workdir, device, "runs")
+            add_records(runs, [f"ABC-{i:04d}" for i in range(10)], T0)
+            add_records(runs, ["SAME-0001"], T0 + 100, image_bytes=self.shared_image)
+            transport = HttpTransport(self.url, device, chunk_size=16384)
+            self.devices[device] = (runs, transport, IncrementalSync(runs, transport, batch_bytes=100000))
+        for _, _, sync in self.devices.values():
+            sync.run()
+
+    def stats(self):
+        return get_json(f"{self.url}/v1/stats")
+
+    def records(self, query):
+        return get_json(f"{self.url}/v1/records?{query}")
+
+    def close(self):
+        for _, _, sync in self.devices.values():
+            sync.close()
+        self.server.close()
+        self.store.close()
+
+
+@pytest.fixture
+def fleet(tmp_path):
+    f = Fleet(str(tmp_path))
+    yield f
+    f.close()
+
+
+def test_records_from_both_devices(fleet):
+    stats = fleet.stats()
+    assert stats["records"] == 22 and len(stats["devices"]) == 2
+    # 22 張圖片中有 2 張內容相同，只存一份
+    assert stats["objects"] == 21
+
+
+def test_appended_rows_only(fleet):
+    runs, _, sync = fleet.devices["gate-a"]
+    add_records(runs, ["NEW-0001", "NEW-0002"], T0 + 200)
+    r = sync.run()
+    assert r["error"] is None and fleet.stats()["records"] == 24
+
+
+def test_resume_after_interrupt(fleet):
+    runs, transport, sync = fleet.devices["gate-a"]
+    add_records(runs, ["LATE-0001"], T0 + 300)
+    upload = transport.upload
+
+    # 只送一段就停止，再重新執行
+    def partial_upload(path, name, offset=0):
+        with open(path, "rb") as f:
+            f.seek(offset)
+            transport._request("PUT", f"{name}?offset={offset}", f.read(1000))
+        raise ConnectionError("模擬中斷")
+    transport.upload = partial_upload
+    assert sync.run()["error"] is not None
+    transport.upload = upload
+    r = sync.run()
+    assert r["error"] is None and r["resumed"] == 1
+    # 重複 commit 不會重複匯入
+    assert fleet.stats()["records"] == 23
+
+
+def test_hash_mismatch_rejected(fleet):
+    _, transport, _ = fleet.devices["gate-a"]
+    status, _ = transport._request("POST", "unknown.tar.gz/commit?sha256=00", b"")
+    assert status == 422
+
+
+def test_query_and_object(fleet):
+    rows = fleet.records("plate=SAME-0001")
+    assert sorted(r["device"] for r in rows) == ["gate-a", "gate-b"]
+    with urlopen(f"{fleet.url}/v1/objects/{rows[0]['image_sha256']}") as resp:
+        assert resp.read() == fleet.shared_image
+
+
+def test_moved_images_update_path(fleet):
+    """模擬 tools/migrate_images.py：圖片搬到日期分區並改寫 CSV 中的路徑"""
+    runs, _, sync = fleet.devices["gate-b"]
+    old_rel = f"images/SAME-0001_{int(T0 + 100)}.jpg"
+    new_rel = f"images/2025/02/07/SAME-0001_{int(T0 + 100)}.jpg"
+    os.makedirs(os.path.dirname(os.path.join(runs, new_rel)))
+    os.rename(os.path.join(runs, old_rel), os.path.join(runs, new_rel))
+    csv_path = os.path.join(runs, "data_log.csv")
+    with open(csv_path, encoding="utf-8-sig") as f:
+        text = f.read().replace(f"runs/{old_rel}", f"runs/{new_rel}")
+    with open(csv_path, "w", encoding="utf-8-sig") as f:
+        f.write(text)
+    r = sync.run()
+    rows = fleet.records("plate=SAME-0001&device=gate-b")
+    assert r["error"] is None and len(rows) == 1
+    assert rows[0]["plate_image"] == f"runs/{new_rel}" and rows[0]["image_sha256"] is not None
+    assert fleet.stats()["records"] == 22
+
+
+def test_archived_records_imported(fleet):
+    """最後一次同步之後才寫入的紀錄，隨著 CSV 一起封存成 .lpa"""
+    runs, _, sync = fleet.devices["gate-b"]
+    csv_path = os.path.join(runs, "data_log.csv")
+    add_records(runs, ["ARC-0001", "ARC-0002"], T0 + 400)
+    DataMaintenance(img_dir=os.path.join(runs, "images"), csv_path=csv_path,
+                    archive_dir=os.path.join(runs, "history")).archive_csv()
+    r = sync.run()
+    assert r["error"] is None and len(fleet.records("plate=ARC-0002&device=gate-b")) == 1
+    assert fleet.stats()["records"] == 24
@@ -0,0 +1,170 @@
+"""
+圖片清理 (modules/maintenance.py 的 clean_old_images) 與日期分區遷移 (tools/migrate_images.py) 的測試
+
+確認過期的日期 / 小時分區整個刪除、未過期與尚未同步的圖片保留、清空的年月資料夾一併移除、舊版平面結構逐檔判斷，
+以及遷移工具把平面圖片搬進分區並同步改寫 CSV、封存檔與 records.db 的路徑 (可重複執行、--dry-run 不變更)
+"""
+import csv
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import migrate_images
+from conftest import write
+from modules.archive import ArchiveReader, ArchiveWriter
+from modules.database import image_partition
+from modules.maintenance import DataMaintenance
+from modules.record_store import FIELD_LABELS, LEGACY_FIELDS, SqliteRecordStore, make_record
+
+DAY = 86400
+
+
+def image(img_dir, ts, name=None, layout="day", mtime=None):
+    name = name or f"ABC-1234_{int(ts)}.jpg"
+    path = os.path.join(img_dir, *image_partition(ts, layout).split("/"), name)
+    write(path, b"jpeg")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def maint(tmp_path):
+    runs = str(tmp_path / "runs")
+    return DataMaintenance(img_dir=os.path.join(runs, "images"), csv_path=os.path.join(runs, "data_log.csv"),
+                           archive_dir=os.path.join(runs, "history"))
+
+
+def test_expired_day_partitions(maint):
+    now = time.time()
+    old = [image(maint.img_dir, now - d * DAY) for d in (30, 10, 5)]
+    recent = [image(maint.img_dir, now - d * DAY) for d in (2, 1, 0)]
+    flat_old = image(maint.img_dir, 0, "XYZ-0001_1.jpg", layout="flat", mtime=now - 10 * DAY)
+    flat_new = image(maint.img_dir, 0, "XYZ-0002_2.webp", layout="flat", mtime=now)
+    other = image(maint.img_dir, 0, "notes.txt", layout="flat", mtime=now - 10 * DAY)
+
+    maint.clean_old_images(days_to_keep=3)
+    assert not any(os.path.exists(p) for p in old + [flat_old])
+    assert all(os.path.exists(p) for p in recent + [flat_new, other])
+    # 清空的日 / 月 / 年資料夾也一併移除
+    for p in old:
+        assert not os.path.exists(os.path.dirname(p))
+    year = time.strftime("%Y", time.localtime(now - 30 * DAY))
+    if year not in {time.strftime("%Y", time.localtime(now - d * DAY)) for d in (0, 1, 2, 5, 10)}:
+        assert not os.path.exists(os.path.join(maint.img_dir, year))
+
+
+def test_expired_hour_partitions(maint):
+    now = time.time()
+    cutoff = datetime.fromtimestamp(now - 3 * DAY)
+    midnight = cutoff.replace(hour=0, minute=0, second=0, microsecond=0)
+    expired = [image(maint.img_dir, (midnight + timedelta(hours=h)).timestamp(), layout="hour")
+               for h in range(cutoff.hour)]
+    kept = [image(maint.img_dir, (midnight + timedelta(hours=h)).timestamp(), layout="hour")
+            for h in range(cutoff.hour + 1, 24)]
+
+    maint.clean_old_images(days_to_keep=3)
+    assert not any(os.path.exists(p) for p in expired)
+    assert all(os.path.exists(p) for p in kept)
+
+
+def test_unsynced_images_are_kept(maint):
+    now = time.time()
+    synced = [image(maint.img_dir, now - 10 * DAY + i) for i in range(3)]
+    unsynced = image(maint.img_dir, now - 10 * DAY + 3)
+    flat_unsynced = image(maint.img_dir, 0, "XYZ-0001_1.jpg", layout="flat", mtime=now - 10 * DAY)
+
+    maint.clean_old_images(days_to_keep=3, is_synced=lambda path: path in synced)
+    assert not any(os.path.exists(p) for p in synced)
+    assert os.path.exists(unsynced)
+    assert os.path.exists(flat_unsynced)
+
+
+# ========================
+# tools/migrate_images.py
+# ========================
+TS = [int(datetime(2025, 2, d, 8, 30).timestamp()) for d in (6, 7)]
+
+
+def test_paths():
+    ts = TS[0]
+    part = image_partition(ts, "day")
+    assert migrate_images.file_timestamp(f"ABC-1234_{ts}.jpg") == ts
+    assert migrate_images.file_timestamp(f"crop_ABC-1234_{ts}.webp") == ts
+    assert migrate_images.file_timestamp("ABC-1234.jpg") is None
+    assert migrate_images.file_timestamp(f"ABC_{ts}.txt") is None
+    assert migrate_images.migrated_path(f"runs/images/A_{ts}.jpg", "day") == f"runs/images/{part}/A_{ts}.jpg"
+    assert migrate_images.migrated_path(f"runs/images/{part}/A_{ts}.jpg", "day") is None
+    assert migrate_images.migrated_path("runs/images/no_time.jpg", "day") is None
+    assert migrate_images.migrated_path("N/A", "day") is None
+    assert migrate_images.migrated_path(None, "day") is None
+
+
+@pytest.fixture
+def flat_runs(tmp_path, monkeypatch):
+    """舊版平面結構的 runs/：圖片、data_log.csv、封存檔與 records.db 都指向 runs/images/*.jpg"""
+    monkeypatch.chdir(tmp_path)
+    runs = "runs"
+    names = [f"ABC-1234_{TS[0]}.jpg", f"crop_ABC-1234_{TS[0]}.jpg", f"XYZ-9999_{TS[1]}.jpg"]
+    for name in names + ["readme.jpg"]:
+        write(os.path.join(runs, "images", name), b"jpeg")
+
+    header = [FIELD_LABELS[name] for name in LEGACY_FIELDS + ["plate_crop"]]
+    rows = [["2025-02-06 08:30:00", "辨識成功", "ABC-1234", f"runs/images/{names[0]}", "穩定", "1.0",
+             f"runs/images/{names[1]}"],
+            ["2025-02-07 08:30:00", "辨識成功", "XYZ-9999", f"runs/images/{names[2]}", "穩定", "2.0", ""]]
+    with open(os.path.join(runs, "data_log.csv"), "w", newline="", encoding="utf-8-sig") as f:
+        csv.writer(f).writerows([header] + rows)
+
+    os.makedirs(os.path.join(runs, "history"))
+    writer = ArchiveWriter(os.path.join(runs, "history", "data_log_20250207.lpa"), header)
+    for row in rows:
+        writer.write_row(list(row))
+    writer.close()
+
+    store = SqliteRecordStore(os.path.join(runs, "records.db"))
+    rec = make_record("辨識成功", "XYZ-9999", f"runs/images/{names[2]}", "穩定", 2.0, ts=TS[1])
+    store.append([rec])
+    store.close()
+    return names
+
+
+def run_tool(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["migrate_images.py", *args])
+    migrate_images.main()
+
+
+def csv_paths():
+    with open(os.path.join("runs", "data_log.csv"), newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    return [rows[1][3], rows[1][6], rows[2][3]]
+
+
+def test_migrate(flat_runs, monkeypatch):
+    names = flat_runs
+    parts = [image_partition(TS[0], "day"), image_partition(TS[0], "day"), image_partition(TS[1], "day")]
+    expected = [f"runs/images/{part}/{name}" for part, name in zip(parts, names)]
+
+    run_tool(monkeypatch, "--dry-run")
+    assert csv_paths() == [f"runs/images/{name}" for name in names]
+    assert all(os.path.exists(os.path.join("runs", "images", name)) for name in names)
+
+    for _ in range(2):  # 可重複執行
+        run_tool(monkeypatch)
+        assert csv_paths() == expected
+        assert all(os.path.exists(path) for path in expected)
+        assert os.path.exists(os.path.join("runs", "images", "readme.jpg"))  # 沒有時間戳記的保留原處
+
+        reader = ArchiveReader(os.path.join("runs", "history", "data_log_20250207.lpa"))
+        rows = list(reader.iter_rows())
+        assert [rows[0][3], rows[0][6], rows[1][3]] == expected
+
+        conn = sqlite3.connect(os.path.join("runs", "records.db"))
+        try:
+            assert conn.execute("SELECT plate_image FROM records").fetchone()[0] == expected[2]
+        finally:
+            conn.close()
@@ -0,0 +1,49 @@
+"""
+畫面變化過濾 (modules/motion_gate.py) 與 SystemController._gate_allows 的測試，不需要相機與模型
+
+確認預設不啟用過濾 (與舊版相同)，以及車道設定 roi 時只有 roi 內的變化會喚醒偵測
+"""
+import time
+
+import numpy as np
+
+from modules.motion_gate import MotionGate
+from modules.pipeline import FrameJob
+from system_controller import SystemController
+
+
+def frame(left=0, right=0):
+    f = np.zeros((240, 320, 3), np.uint8)
+    f[:, :160] = left
+    f[:, 160:] = right
+    return f
+
+
+def make_controller(roi):
+    controller = SystemController(None, "best.engine", lanes=[{"name": "gate", "roi": roi}])
+    lane = controller._lanes[0]
+    lane.gate = MotionGate(force_interval=1e9, hold_time=0.5)
+    controller._last_gate_report = time.time()
+    return controller, lane
+
+
+def test_gate_disabled_by_default():
+    controller = SystemController(None, "best.engine")
+    assert not controller._lanes[0].motion_gate
+    assert not controller._use_tracker
+
+
+def test_motion_outside_roi_is_ignored():
+    controller, lane = make_controller((0.5, 0.0, 1.0, 1.0))
+    now = time.time()
+    # 第一張建立背景模型
+    controller._gate_allows(FrameJob(frame(), timestamp=now, lane=lane))
+    assert not controller._gate_allows(FrameJob(frame(left=255), timestamp=now + 1, lane=lane))
+    assert controller._gate_allows(FrameJob(frame(left=255, right=255), timestamp=now + 2, lane=lane))
+
+
+def test_full_frame_without_roi():
+    controller, lane = make_controller(None)
+    now = time.time()
+    controller._gate_allows(FrameJob(frame(), timestamp=now, lane=lane))
+    assert controller._gate_allows(FrameJob(frame(left=255), timestamp=now + 1, lane=lane))
@@ -0,0 +1,196 @@
+"""
+OCR 批次辨識 (ai/ocrprocess.py、ai/paddle_batch.py) 與 Detect_License_Plate.read_boxes 的測試
+
+假的 OCR 引擎依 ROI 左上角的像素值決定讀到的文字，用來確認結果對應回正確的 ROI / 車牌框
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from ai import paddle_batch
+from ai.lpr_engine import Detect_License_Plate
+from ai.ocrprocess import OCRBatcher, OCRProcess
+
+# 像素值 -> OCR 原始文字 (0 為雜訊，驗證後沒有結果)
+TEXTS = {0: "HELLO", 1: "ABC-1234", 2: "KLM-5678", 3: "1234-AB", 4: "XYZ-9999"}
+
+
+def roi(value):
+    # 以像素值為種子的雜訊：不同 ROI 的感知雜湊不同 (快取不會互相命中)
+    img = np.random.default_rng(value).integers(0, 255, (40, 120, 3), dtype=np.uint8)
+    img[0, 0, 0] = value
+    return img
+
+
+class FakeEngine:
+    """介面同 PaddleOCR：ocr() 為公開 API，text_classifier / text_recognizer 為 2.x 的內部介面"""
+
+    def __init__(self):
+        self.ocr_calls = 0
+        self.batches = []
+
+    def _read(self, img):
+        return TEXTS[int(img[0, 0, 0])], 0.9
+
+    def ocr(self, img, cls=True):
+        self.ocr_calls += 1
+        return [[(None, self._read(img))]]
+
+    def text_classifier(self, img_list):
+        return img_list, [["0", 1.0] for _ in img_list], 0.0
+
+    def text_recognizer(self, img_list):
+        self.batches.append(len(img_list))
+        return [self._read(img) for img in img_list], 0.0
+
+
+def test_run_batch_keeps_roi_order():
+    engine = FakeEngine()
+    ocr = OCRProcess(engine=engine)
+    results = ocr.run_batch([roi(v) for v in (2, 0, 1, 3)])
+    assert results == [[("KLM5678", 0.9)], [], [("ABC1234", 0.9)], [("1234AB", 0.9)]]
+    assert engine.batches == [4] and engine.ocr_calls == 0
+
+
+def test_run_batch_with_cache_hits():
+    from ai.ocr_cache import OCRResultCache
+    engine = FakeEngine()
+    ocr = OCRProcess(engine=engine, cache=OCRResultCache(max_distance=0))
+    ocr.run_batch([roi(1), roi(3)])
+    # 命中快取的 ROI 夾在中間，只有沒命中的送進模型
+    results = ocr.run_batch([roi(2), roi(1), roi(4), roi(3)])
+    assert results == [[("KLM5678", 0.9)], [("ABC1234", 0.9)], [("XYZ9999", 0.9)], [("1234AB", 0.9)]]
+    assert engine.batches == [2, 2]
+
+
+def test_unsupported_paddleocr_version_uses_public_api(monkeypatch):
+    class PaddleOCR(FakeEngine):
+        pass
+    PaddleOCR.__module__ = "paddleocr.paddleocr"
+    monkeypatch.setattr(paddle_batch, "paddleocr_version", lambda: "3.0.0")
+    engine = PaddleOCR()
+    ocr = OCRProcess(engine=engine)
+    assert ocr.run_batch([roi(1), roi(2)]) == [[("ABC1234", 0.9)], [("KLM5678", 0.9)]]
+    assert engine.batches == [] and engine.ocr_calls == 2
+
+    monkeypatch.setattr(paddle_batch, "paddleocr_version", lambda: "2.7.3")
+    assert paddle_batch.BatchRecognizer.from_engine(PaddleOCR()) is not None
+
+
+def test_unexpected_return_shape_falls_back():
+    class Changed(FakeEngine):
+        def text_recognizer(self, img_list):
+            self.batches.append(len(img_list))
+            return [self._read(img) for img in img_list]    # 少了 elapse
+    engine = Changed()
+    ocr = OCRProcess(engine=engine)
+    assert ocr.run_batch([roi(1), roi(2)]) == [[("ABC1234", 0.9)], [("KLM5678", 0.9)]]
+    # 之後不再呼叫內部介面
+    ocr.run_batch([roi(3)])
+    assert engine.batches == [2] and engine.ocr_calls == 3
+
+
+class RecordingOCR:
+    """記錄每一批送進 run_batch 的 ROI 數量"""
+
+    def __init__(self):
+        self.batches = []
+
+    def run_batch(self, rois):
+        self.batches.append(len(rois))
+        return [[(TEXTS[int(r[0, 0, 0])], 0.9)] for r in rois]
+
+
+def test_batcher_without_wait_runs_each_request():
+    ocr = RecordingOCR()
+    batcher = OCRBatcher(ocr, max_batch=2, max_wait=0.0)
+    assert batcher.run([roi(1), roi(2), roi(3)]) == [[("ABC-1234", 0.9)], [("KLM-5678", 0.9)], [("1234-AB", 0.9)]]
+    # 單一請求不拆開
+    assert ocr.batches == [3]
+
+
+def test_batcher_merges_requests_up_to_max_batch():
+    ocr = RecordingOCR()
+    batcher = OCRBatcher(ocr, max_batch=4, max_wait=0.2)
+    requests = [[roi(1), roi(2)], [roi(3)], [roi(4), roi(1)], [roi(2)]]
+    results = [None] * len(requests)
+
+    def worker(i):
+        results[i] = batcher.run(requests[i])
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(requests))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5.0)
+    batcher.close()
+    for rois, got in zip(requests, results):
+        assert got == [[(TEXTS[int(r[0, 0, 0])], 0.9)] for r in rois]
+    assert sum(ocr.batches) == 6 and max(ocr.batches) <= 4 and len(ocr.batches) < len(requests)
+
+
+def test_batcher_waits_at_most_max_wait():
+    ocr = RecordingOCR()
+    batcher = OCRBatcher(ocr, max_batch=4, max_wait=0.1)
+    t = time.monotonic()
+    batcher.run([roi(1)])
+    waited = time.monotonic() - t
+    # 湊滿 max_batch 立即送出
+    batcher_full = OCRBatcher(ocr, max_batch=2, max_wait=5.0)
+    t = time.monotonic()
+    batcher_full.run([roi(1), roi(2)])
+    full = time.monotonic() - t
+    batcher.close()
+    batcher_full.close()
+    assert 0.08 <= waited < 1.0 and full < 1.0
+
+
+def test_batcher_after_close_runs_inline():
+    ocr = RecordingOCR()
+    batcher = OCRBatcher(ocr, max_batch=4, max_wait=0.05)
+    batcher.close()
+    batcher._thread.join(1.0)
+    assert batcher.submit([roi(1)]).result(timeout=1.0) == [[("ABC-1234", 0.9)]]
+
+
+class StubDetector:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+def test_read_boxes_maps_results_to_boxes():
+    frame = np.zeros((200, 400, 3), np.uint8)
+    boxes = [(0, 0, 119, 39), (10, 300, 5, 320), (200, 100, 319, 139), (0, 100, 119, 139)]
+    for (x1, y1, x2, y2), value in zip(boxes, (1, 0, 2, 0)):
+        if x2 > x1:
+            frame[y1:y2 + 1, x1:x2 + 1] = roi(value)
+    detect = Detect_License_Plate("unused", ocr_batch_size=8, ocr_cache_size=0, use_gpu=False,
+                                  detector=StubDetector(boxes), ocr_engine=FakeEngine())
+    try:
+        # 第二個框是空的 ROI (不送進 OCR)，第四個框讀到雜訊
+        assert detect.read_boxes(frame, boxes) == [[("ABC1234", 0.9)], [], [("KLM5678", 0.9)], []]
+        assert detect.recognize(frame, boxes) == [(boxes[0], "ABC1234"), (boxes[2], "KLM5678")]
+    finally:
+        detect.cleanup()
+
+
+def test_cache_revalidates_after_registry_reload(tmp_path):
+    """OCR 快取存的是原始結果：命中時以目前的名單驗證，重新載入後不會取到舊的修正結果"""
+    from ai.ocr_cache import OCRResultCache
+    from ai.plate_registry import PlateRegistry
+
+    path = tmp_path / "registered.txt"
+    path.write_text("ABD-1234\n", encoding="utf-8")
+    registry = PlateRegistry(str(path), reload_interval=None)
+    engine = FakeEngine()
+    ocr = OCRProcess(engine=engine, cache=OCRResultCache(), registry=registry)
+    try:
+        assert ocr.run_with_scores(roi(1)) == [("ABD1234", 0.9)]
+        path.write_text("ABC-1234\n", encoding="utf-8")
+        registry.reload()
+        assert ocr.run_with_scores(roi(1)) == [("ABC1234", 0.9)]
+        assert ocr.run_batch([roi(1)]) == [[("ABC1234", 0.9)]]
+        assert engine.ocr_calls == 1 and engine.batches == []
+    finally:
+        registry.close()
@@ -0,0 +1,175 @@
+"""
+管線元件 (modules/pipeline.py) 的測試，不需要相機與模型
+
+確認 DropOldestQueue 滿了丟最舊的項目並計數、BlockingQueue 滿了讓生產者等待且不丟項目、
+StageWorker 的單筆/批次處理與錯誤計數，以及 join() 等到處理中的項目也完成、結果已放進下游佇列才返回
+"""
+import threading
+import time
+
+from modules.pipeline import BlockingQueue, DropOldestQueue, StageWorker
+
+
+def start(worker):
+    worker.start()
+    return worker
+
+
+def stop(worker):
+    worker.stop()
+    worker.join(timeout=2)
+    assert not worker.is_alive()
+
+
+def test_drop_oldest():
+    q = DropOldestQueue(maxsize=2)
+    assert q.put(1) is None
+    assert q.put(2) is None
+    assert q.put(3) == 1
+    assert q.put(4) == 2
+    assert q.drop_count == 2
+    assert q.put_count == 4
+    assert [q.get(timeout=0), q.get(timeout=0)] == [3, 4]
+    assert q.get(timeout=0) is None
+
+
+def test_dropped_items_do_not_block_join():
+    # 被丟掉的項目不會再有消費者處理，不能留在未完成計數中
+    q = DropOldestQueue(maxsize=1)
+    for i in range(5):
+        q.put(i)
+    assert q.get(timeout=0) == 4
+    assert not q.join(timeout=0)
+    q.task_done()
+    assert q.join(timeout=0)
+
+
+def test_get_batch_and_close():
+    q = DropOldestQueue(maxsize=10)
+    for i in range(5):
+        q.put(i)
+    assert q.get_batch(3, timeout=0) == [0, 1, 2]
+    assert q.get_batch(3, timeout=0) == [3, 4]
+
+    # 關閉後等待中的消費者立即返回
+    result = []
+    t = threading.Thread(target=lambda: result.append(q.get(timeout=5)))
+    t.start()
+    time.sleep(0.05)
+    q.close()
+    t.join(timeout=1)
+    assert result == [None]
+
+
+def test_blocking_queue_waits_for_space():
+    q = BlockingQueue(maxsize=2)
+    q.put(1)
+    q.put(2)
+    done = threading.Event()
+    t = threading.Thread(target=lambda: (q.put(3), done.set()))
+    t.start()
+    assert not done.wait(0.1)
+    assert q.get(timeout=0) == 1
+    assert done.wait(1)
+    t.join()
+    assert q.drop_count == 0
+    assert q.block_count == 1
+    assert q.blocked_seconds > 0
+    assert q.drain() == [2, 3]
+    # 取出的 1 還沒 task_done，drain 出的項目由呼叫端處理、不再計入
+    assert not q.join(timeout=0)
+    q.task_done()
+    assert q.join(timeout=0)
+
+
+def test_blocking_queue_close_releases_producer():
+    q = BlockingQueue(maxsize=1)
+    q.put(1)
+    t = threading.Thread(target=q.put, args=(2,))
+    t.start()
+    time.sleep(0.05)
+    q.close()
+    t.join(timeout=1)
+    assert not t.is_alive()
+    # 關閉後的 put 仍放入，留給關閉流程排空
+    assert q.drain() == [1, 2]
+
+
+def test_stage_worker_forwards_and_counts_errors():
+    in_q, out_q = DropOldestQueue(maxsize=10), DropOldestQueue(maxsize=10)
+
+    def func(x):
+        if x == 2:
+            raise RuntimeError("boom")
+        return None if x == 3 else x * 10
+
+    worker = start(StageWorker("test", func, in_q, out_q))
+    for i in range(5):
+        in_q.put(i)
+    assert in_q.join(timeout=2)
+    stop(worker)
+    assert worker.processed == 4
+    assert worker.errors == 1
+    assert out_q.get_batch(10, timeout=0) == [0, 10, 40]
+
+
+def test_stage_worker_batches():
+    in_q, out_q = DropOldestQueue(maxsize=10), DropOldestQueue(maxsize=10)
+    sizes = []
+
+    def func(batch):
+        sizes.append(len(batch))
+        return [x + 1 for x in batch]
+
+    for i in range(7):
+        in_q.put(i)
+    worker = start(StageWorker("batch", func, in_q, out_q, batch_size=3))
+    assert in_q.join(timeout=2)
+    stop(worker)
+    assert sizes == [3, 3, 1]
+    assert out_q.get_batch(10, timeout=0) == list(range(1, 8))
+
+
+def test_join_waits_for_item_in_flight():
+    # 佇列已空但項目仍在處理中時 join 不能返回；返回時結果已在下游佇列
+    in_q, out_q = DropOldestQueue(maxsize=10), BlockingQueue(maxsize=10)
+    release = threading.Event()
+
+    def slow(x):
+        release.wait(2)
+        return x
+
+    worker = start(StageWorker("slow", slow, in_q, out_q))
+    in_q.put("job")
+    deadline = time.monotonic() + 1
+    while in_q.qsize() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert in_q.qsize() == 0
+    assert not in_q.join(timeout=0.1)
+    release.set()
+    assert in_q.join(timeout=2)
+    assert out_q.qsize() == 1
+    stop(worker)
+
+
+def test_chained_join_drains_every_stage():
+    # 依序 join 每個階段的輸入佇列即可確認整條管線閒置 (與 SystemController._drain_and_stop 相同)
+    q1, q2, q3 = DropOldestQueue(maxsize=100), BlockingQueue(maxsize=2), BlockingQueue(maxsize=2)
+    stored = []
+
+    def persist(x):
+        time.sleep(0.005)
+        stored.append(x)
+
+    workers = [
+        start(StageWorker("a", lambda x: x, q1, q2)),
+        start(StageWorker("b", lambda x: x, q2, q3)),
+        start(StageWorker("c", persist, q3)),
+    ]
+    for i in range(20):
+        q1.put(i)
+    for q in (q1, q2, q3):
+        assert q.join(timeout=5)
+    assert stored == list(range(20))
+    for w in workers:
+        stop(w)
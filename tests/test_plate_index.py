@@ -0,0 +1,142 @@
+"""
+車牌模糊搜尋索引 (modules/plate_index.py) 的測試
+
+以隨機車牌建立進場紀錄，確認編輯距離與萬用字元查詢的結果與逐一比對相同、
+DatabaseManager 寫入的紀錄立即可查到、重複建立索引不會重複，以及重新開啟後內容相同
+"""
+import random
+import re
+import string
+import time
+
+import numpy as np
+import pytest
+
+from modules.database import DatabaseManager
+from modules.plate_index import PlateIndex, edit_distance, plate_key
+from modules.record_store import CsvRecordStore, FIELDS, make_record, to_timestamp
+
+CSV_FIELDS = [name for name, _, _ in FIELDS]
+VISITS = 20000
+N_PLATES = 5000
+
+
+def random_plate(rng):
+    letters = "".join(rng.choice(string.ascii_uppercase) for _ in range(3))
+    digits = "".join(rng.choice(string.digits) for _ in range(4))
+    return f"{letters}-{digits}" if rng.random() < 0.7 else f"{digits}-{letters[:2]}"
+
+
+def brute_match(plates, query, max_distance):
+    key = plate_key(query)
+    found = []
+    for plate in plates:
+        d = edit_distance(key, plate_key(plate), max_distance)
+        if d <= max_distance:
+            found.append((plate, d))
+    return sorted(found, key=lambda m: (m[1], m[0]))
+
+
+def brute_wildcard(plates, query):
+    pattern = "".join(c for c in query.upper() if c.isalnum() or c in "*?")
+    regex = re.compile("".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern))
+    return sorted((p, 0) for p in plates if regex.fullmatch(plate_key(p)))
+
+
+@pytest.fixture(scope="module")
+def history(tmp_path_factory):
+    """Returns: (CSV 路徑, 索引路徑, 出現過的車牌)"""
+    workdir = tmp_path_factory.mktemp("plate_index")
+    rng = random.Random(0)
+    plates = sorted({random_plate(rng) for _ in range(N_PLATES)})
+    start = to_timestamp("2025-01-01 00:00:00")
+
+    csv_path = str(workdir / "data_log.csv")
+    store = CsvRecordStore(csv_path, CSV_FIELDS)
+    records, used = [], set()
+    for i in range(VISITS):
+        plate = rng.choice(plates)
+        used.add(plate)
+        records.append(make_record("辨識成功", plate, "N/A", "穩定", float(rng.randint(8000, 45000)),
+                                   ts=start + i * 30))
+    store.append(records)
+    store.close()
+
+    index_path = str(workdir / "plate_index.db")
+    index = PlateIndex(index_path)
+    added = index.index_file(csv_path)
+    index.close()
+    assert added == VISITS
+    return csv_path, index_path, sorted(used)
+
+
+@pytest.fixture
+def index(history):
+    idx = PlateIndex(history[1])
+    yield idx
+    idx.close()
+
+
+def fuzzy_queries(plates, n=50):
+    """隨機挑車牌並改 1~2 個字 (替換、刪除、插入)"""
+    rng = random.Random(1)
+    queries = []
+    for _ in range(n):
+        chars = list(plate_key(rng.choice(plates)))
+        for _ in range(rng.randint(1, 2)):
+            op, pos = rng.random(), rng.randrange(len(chars))
+            if op < 0.5:
+                chars[pos] = rng.choice(string.ascii_uppercase + string.digits)
+            elif op < 0.75:
+                del chars[pos]
+            else:
+                chars.insert(pos, rng.choice(string.digits))
+        queries.append("".join(chars))
+    return queries
+
+
+def test_build(index, history):
+    plates = history[2]
+    assert len(index) == len(plates) and index.stats()["visits"] == VISITS
+
+
+def test_match_same_as_brute_force(index, history):
+    plates = history[2]
+    for q in fuzzy_queries(plates):
+        for d in (1, 2):
+            assert index.match(q, d) == brute_match(plates, q, d), (q, d)
+
+
+def test_wildcard_same_as_regex(index, history):
+    plates = history[2]
+    rng = random.Random(2)
+    for plate in rng.sample(plates, 20):
+        key = plate_key(plate)
+        pos = rng.randrange(len(key))
+        for q in (key[:pos] + "?" + key[pos + 1:], key[:3] + "*", "*" + key[-3:]):
+            assert index.match(q) == brute_wildcard(plates, q), q
+
+
+def test_search_ordered_with_weight(index, history):
+    query = fuzzy_queries(history[2], 1)[0]
+    t = time.perf_counter()
+    found = index.search(query, 1, limit=100)
+    assert time.perf_counter() - t < 0.5
+    assert all((a["distance"], -a["ts"]) <= (b["distance"], -b["ts"]) for a, b in zip(found, found[1:]))
+    assert all(r["weight"] is not None for r in found)
+
+
+def test_reindex_is_idempotent(index, history):
+    csv_path = history[0]
+    assert index.index_file(csv_path) is None
+    assert index.index_file(csv_path, force=True) == 0
+    assert index.stats()["visits"] == VISITS
+
+
+def test_database_manager_indexes_on_write(tmp_path):
+    db = DatabaseManager(base_dir=str(tmp_path / "runs"), plate_index=True)
+    saved = db.save_record("辨識成功", "NEW-4321", np.zeros((120, 320, 3), np.uint8), "穩定", 12345.0)
+    hits = db.plate_index.search("NEW-4S21", 1)
+    db.close()
+    assert saved
+    assert len(hits) == 1 and hits[0]["plate"] == "NEW-4321" and hits[0]["weight"] == 12345.0
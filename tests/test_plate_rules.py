@@ -0,0 +1,91 @@
+"""
+車牌格式驗證 (ai/plate_rules.py) 的測試，不需要 OCR 模型
+
+確認依格式遮罩的位置相關修正 (數字位置 O -> 0、字母位置 8 -> B ...)、字母位置不接受 I / O、
+多條規則都能修正時取修正字元最少者 (同分取規則優先者)，以及自訂規則檔
+"""
+import json
+import os
+
+import pytest
+
+from ai.plate_rules import PlateValidator
+
+
+@pytest.fixture(scope="module")
+def validator():
+    return PlateValidator()
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("ABC-1234", "ABC1234"),
+    ("abc 1234", "ABC1234"),
+    ("EA-1234", "EA1234"),
+    ("123-AB", "123AB"),
+])
+def test_valid_formats(validator, raw, expected):
+    ok, text, rule = validator.validate(raw)
+    assert ok and text == expected
+    assert rule != "Unknown"
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("8BC-1234", "BBC1234"),   # 字母位置 8 -> B
+    ("ABC-12S4", "ABC1254"),   # 數字位置 S -> 5
+    ("ABC1O34", "ABC1034"),    # 數字位置 O -> 0 (舊版的全域 O -> 0)
+    ("ABC-I234", "ABC1234"),   # 數字位置 I -> 1
+    ("2B-1234", "ZB1234"),     # 字母位置 2 -> Z
+])
+def test_positional_correction(validator, raw, expected):
+    ok, text, _ = validator.validate(raw)
+    assert ok and text == expected
+
+
+@pytest.mark.parametrize("raw", ["AIC-1234", "AOC-1234", "IOA-123", "ABI1234"])
+def test_letters_i_and_o_are_never_plates(validator, raw):
+    # 台灣車牌的字母不含 I / O：出現在字母位置時沒有對應的修正，只有數字位置會改成 1 / 0
+    ok, _, rule = validator.validate(raw)
+    assert not ok and rule == "Unknown"
+    assert validator.match(raw.replace("-", "")) is None
+
+
+def test_minimum_cost_candidate(validator):
+    # 00S01: ###@# 要改 2 個字元、@@### 要改 3 個，@#@## 只要改 1 個 (0 -> D)
+    corrected, idx = validator._correct("00S01")
+    assert corrected == "D0S01"
+    assert validator.rules[idx][1] == "@#@##"
+    assert validator.validate("00S01")[1] == "D0S01"
+
+
+def test_tie_prefers_rule_order(validator):
+    # 0S0S: ##@@ 與 @@## 都只要改 2 個字元，取設定檔中較前面的 ##@@
+    corrected, idx = validator._correct("0S0S")
+    assert corrected == "05DS"
+    assert validator.rules[idx][1] == "##@@"
+
+
+def test_rejections_and_stats():
+    validator = PlateValidator()
+    assert validator.validate("") == (False, "", "")
+    assert validator.validate("---") == (False, "", "不含任何英數內容")
+    assert validator.validate("HELLO")[0] is False
+    assert validator.validate("12")[0] is False
+    validator.validate("ABC-1234")
+    validator.validate("ABC-12S4")
+    stats = validator.stats()
+    assert stats["corrected"] == 1
+    assert stats["rejected"] == 2
+    assert sum(stats["hits"].values()) == 2
+
+
+def test_custom_rules_file(tmp_path):
+    path = os.path.join(str(tmp_path), "rules.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"letter_class": "ABC", "rules": [{"name": "test", "mask": "@-##"}],
+                   "confusions": {"digit": {"O": "0"}, "letter": {"8": "B"}}}, f)
+    validator = PlateValidator(path)
+    # 固定字元 "-" 在清除符號後不會出現，這條規則永遠不會命中
+    assert validator.validate("A-12")[0] is False
+    assert validator.match("A-12") == 0
+    assert validator._correct("8-1O") == ("B-10", 0)
+    assert validator._correct("D-10") == (None, None)
@@ -0,0 +1,12 @@
+"""
+MJPEG 預覽 (modules/preview.py) 的測試
+"""
+from modules.preview import PreviewServer
+
+
+def test_binds_loopback_by_default():
+    preview = PreviewServer(port=0)
+    try:
+        assert preview._server.server_address[0] == "127.0.0.1"
+    finally:
+        preview.close()
@@ -0,0 +1,123 @@
+"""
+紀錄儲存 (modules/record_store.py) 的測試，不需要相機與地磅
+
+確認 SqliteRecordStore 的車牌 / 時間區間 / 總重量 / 未同步查詢，匯入舊版 data_log.csv (重複匯入不會重複新增、
+格式錯誤的列略過)，以及 export_csv 預設輸出舊版欄位、可再匯入還原
+"""
+import csv
+import os
+from datetime import datetime
+
+import pytest
+
+from conftest import write
+from modules.record_store import FIELDS, LEGACY_FIELDS, FIELD_LABELS, SqliteRecordStore, make_record
+
+T0 = datetime(2025, 2, 7, 8, 0, 0).timestamp()
+LEGACY_HEADER = ["時間(Time)", "車牌狀態(Plate_Status)", "車牌(Plate)", "車牌照片(Plate_Image)",
+                 "地磅狀態(Scale_Status)", "重量(Weight_KG)"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = SqliteRecordStore(os.path.join(str(tmp_path), "records.db"))
+    yield s
+    s.close()
+
+
+def record(plate, minutes, weight=1000.0, **extra):
+    rec = make_record("辨識成功", plate, f"images/{plate}_{minutes}.jpg", "穩定", weight, ts=T0 + minutes * 60)
+    rec.update(extra)
+    return rec
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.reader(f))
+
+
+def test_queries(store):
+    assert store.append([record("ABC-1234", 0, 12000.0), record("XYZ-9999", 10, 30000.0),
+                         record("ABC-1234", 20, 32000.0), record("ABC-1234", 70, 500.0)]) == 4
+    # 相同 (時間, 車牌, 圖片) 的紀錄只保留一筆
+    assert store.append([record("ABC-1234", 0, 12000.0)]) == 0
+
+    rows = store.query_by_plate("ABC-1234")
+    assert [r["ts"] for r in rows] == [T0 + 4200, T0 + 1200, T0]
+    assert len(store.query_by_plate("ABC-1234", limit=2)) == 2
+    assert store.last_seen("ABC-1234")["weight"] == 500.0
+    assert store.last_seen("NOPE") is None
+
+    # start <= ts < end，時間可為字串、datetime 或 epoch 秒數
+    rows = store.query_time_range("2025-02-07 08:10:00", datetime(2025, 2, 7, 9, 10))
+    assert [r["plate"] for r in rows] == ["XYZ-9999", "ABC-1234"]
+    assert len(store.query_time_range(T0, limit=3)) == 3
+    assert store.total_weight(T0, T0 + 3600) == 74000.0
+    assert store.total_weight() == 74500.0
+    assert store.total_weight(T0 + 99999) == 0
+
+
+def test_unsynced_and_mark_synced(store):
+    store.append([record(f"ABC-{i:04d}", i) for i in range(5)])
+    ids = [r["id"] for r in store.unsynced()]
+    assert len(ids) == 5
+    store.mark_synced(ids[:3])
+    assert [r["id"] for r in store.unsynced()] == ids[3:]
+    assert [r["id"] for r in store.unsynced(after_id=ids[3])] == ids[4:]
+    assert len(store.unsynced(limit=1)) == 1
+
+
+def test_import_legacy_csv(store, tmp_path):
+    path = os.path.join(str(tmp_path), "data_log.csv")
+    rows = [LEGACY_HEADER,
+            ["2025-02-07 08:00:00", "辨識成功", "ABC-1234", "images/a.jpg", "穩定", "12000.0"],
+            ["2025-02-07 08:05:00", "辨識成功", "XYZ-9999", "images/b.jpg", "無訊號", "N/A"],
+            ["not a time", "辨識成功", "BAD-0000", "images/c.jpg", "穩定", "1.0"]]
+    write(path, "\n".join(",".join(r) for r in rows).encode("utf-8-sig"))
+
+    assert store.import_csv(path) == 2
+    assert store.import_csv(path) == 0  # 可重複執行
+    first = store.last_seen("ABC-1234")
+    assert first["ts"] == T0 and first["weight"] == 12000.0 and first["plate_image"] == "images/a.jpg"
+    assert store.last_seen("XYZ-9999")["weight"] is None
+    assert store.last_seen("BAD-0000") is None
+
+
+def test_export_legacy_layout_and_round_trip(store, tmp_path):
+    store.append([record("ABC-1234", 0, 12000.0, lane="entry", direction="in"),
+                  record("ABC-1234", 30, 32000.0, lane="exit", direction="out", tare_weight=12000.0,
+                         net_weight=20000.0),
+                  record("XYZ-9999", 90, None)])
+    out = os.path.join(str(tmp_path), "export.csv")
+    assert store.export_csv(out, T0, T0 + 3600) == 2
+
+    rows = read_csv(out)
+    assert rows[0] == LEGACY_HEADER
+    assert [FIELD_LABELS[name] for name in LEGACY_FIELDS] == LEGACY_HEADER
+    assert rows[1] == ["2025-02-07 08:00:00", "辨識成功", "ABC-1234", "images/ABC-1234_0.jpg", "穩定", "12000.0"]
+
+    # 匯出的檔案可以匯入另一個資料庫還原
+    other = SqliteRecordStore(os.path.join(str(tmp_path), "other.db"))
+    try:
+        assert other.import_csv(out) == 2
+        assert [(r["ts"], r["weight"]) for r in other.query_time_range()] == [(T0, 12000.0), (T0 + 1800, 32000.0)]
+    finally:
+        other.close()
+
+
+def test_export_all_fields(store, tmp_path):
+    store.append([record("ABC-1234", 30, 32000.0, lane="exit", direction="out", tare_weight=12000.0,
+                         net_weight=20000.0),
+                  record("XYZ-9999", 40, None)])
+    out = os.path.join(str(tmp_path), "export.csv")
+    assert store.export_csv(out, fields="all") == 2
+    rows = read_csv(out)
+    assert rows[0] == [label for _, label, _ in FIELDS]
+    rec = dict(zip(rows[0], rows[1]))
+    assert rec[FIELD_LABELS["net_weight"]] == "20000.0"
+    assert rec[FIELD_LABELS["lane"]] == "exit"
+    # 沒有值的欄位輸出空字串
+    assert dict(zip(rows[0], rows[2]))[FIELD_LABELS["weight"]] == ""
+
+    assert store.export_csv(out, fields=["plate", "weight"]) == 2
+    assert read_csv(out)[0] == [FIELD_LABELS["plate"], FIELD_LABELS["weight"]]
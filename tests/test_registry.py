@@ -0,0 +1,148 @@
+"""
+登記車輛名單 (ai/plate_registry.py) 的測試
+
+以隨機車牌建立名單檔，確認修正結果與逐一比對整份名單相同、易混淆字元優先、
+兩台一樣接近時不猜、寫入紀錄時的狀態，以及名單檔變更後自動重新載入
+"""
+import os
+import random
+import string
+import time
+
+import pytest
+
+from ai.plate_registry import (PlateRegistry, REGISTERED, SNAPPED, UNKNOWN, load_confusions,
+                               weighted_distance)
+
+LETTERS = "ABCDEFGHJKLMNPQRSTUVWXYZ"
+N_PLATES = 5000
+
+
+def random_plate(rng):
+    letters = "".join(rng.choice(LETTERS) for _ in range(3))
+    digits = "".join(rng.choice(string.digits) for _ in range(4))
+    return f"{letters}-{digits}" if rng.random() < 0.8 else f"{digits[:3]}-{letters[:2]}"
+
+
+def brute_lookup(plates, key, confusions, confusion_cost, max_cost):
+    """逐一比對整份名單的對照結果"""
+    if key in plates:
+        return key, REGISTERED
+    costs = sorted((weighted_distance(key, p, confusions, confusion_cost, max_cost), p) for p in plates)
+    costs = [c for c in costs if c[0] <= max_cost]
+    if not costs or (len(costs) > 1 and costs[0][0] == costs[1][0]):
+        return key, UNKNOWN
+    return costs[0][1], SNAPPED
+
+
+def one_edit(rng, plate):
+    """隨機改一個字 (替換、漏字、多字)"""
+    chars = list(plate.replace("-", ""))
+    op, pos = rng.random(), rng.randrange(len(chars))
+    if op < 0.6:
+        chars[pos] = rng.choice(LETTERS + string.digits)
+    elif op < 0.8:
+        del chars[pos]
+    else:
+        chars.insert(pos, rng.choice(string.digits))
+    return "".join(chars)
+
+
+@pytest.fixture(scope="module")
+def plates():
+    rng = random.Random(0)
+    return sorted({random_plate(rng) for _ in range(N_PLATES)})
+
+
+@pytest.fixture
+def registry_path(tmp_path, plates):
+    path = str(tmp_path / "registered.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# 登記車輛名單\n" + "\n".join(plates) + "\n")
+    return path
+
+
+@pytest.fixture
+def registry(registry_path):
+    reg = PlateRegistry(registry_path, reload_interval=0.2)
+    yield reg
+    reg.close()
+
+
+@pytest.fixture
+def small(tmp_path):
+    path = tmp_path / "small.txt"
+    path.write_text("ABC-1234\nAXC-1234\nKLM-5678\nKLM-5679\n", encoding="utf-8")
+    reg = PlateRegistry(str(path), reload_interval=None)
+    yield reg
+    reg.close()
+
+
+def test_load(registry, plates):
+    assert len(registry) == len({p.replace("-", "") for p in plates})
+
+
+def test_registered_plates(registry, plates):
+    sample = random.Random(1).sample(plates, 200)
+    assert all(registry.lookup(p.replace("-", " ").lower())[1] == REGISTERED for p in sample)
+
+
+def test_snap_matches_brute_force(registry, plates):
+    rng = random.Random(2)
+    keys = {p.replace("-", "") for p in plates}
+    confusions = load_confusions()
+    queries = [one_edit(rng, p) for p in rng.sample(plates, 100)]
+    for q in queries:
+        plate, status, _ = registry.lookup(q)
+        assert (plate, status) == brute_lookup(keys, q, confusions, registry.confusion_cost,
+                                               registry.max_cost), q
+    assert any(registry.lookup(q)[1] == SNAPPED for q in queries)
+
+
+def test_confusion_preferred(small):
+    assert small.lookup("A8C1234")[:2] == ("ABC1234", SNAPPED)
+
+
+def test_tie_is_unknown(small):
+    assert small.lookup("KLM5670")[1] == UNKNOWN
+
+
+def test_over_max_cost_is_unknown(small):
+    assert small.lookup("XYZ9999")[1] == UNKNOWN
+
+
+def test_settle(small):
+    # 全部修正來的為校正，曾直接讀到為登記，名單外為未登記
+    small.lookup("A8C1234")
+    small.lookup("A8C1234")
+    assert small.settle("ABC1234") == SNAPPED
+    small.lookup("A8C1234")
+    small.lookup("ABC-1234")
+    assert small.settle("ABC1234") == REGISTERED
+    assert small.settle("XYZ9999") == UNKNOWN
+
+
+def test_hot_reload(registry, registry_path):
+    count = len(registry)
+    time.sleep(0.05)
+    with open(registry_path, "a", encoding="utf-8") as f:
+        f.write("NEW-0001\n")
+    future = time.time() + 1
+    os.utime(registry_path, (future, future))
+    deadline = time.monotonic() + 3.0
+    while "NEW0001" not in registry and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert registry.lookup("NEW-0001")[1] == REGISTERED and len(registry) == count + 1
+
+
+def test_lookup_time(registry, plates):
+    rng = random.Random(3)
+    queries = [one_edit(rng, p) for p in rng.sample(plates, 200)]
+    secs = []
+    for q in queries * 5:
+        t = time.perf_counter()
+        registry.lookup(q)
+        secs.append(time.perf_counter() - t)
+    secs.sort()
+    assert secs[len(secs) // 2] < 0.001
+
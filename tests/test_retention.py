@@ -0,0 +1,129 @@
+"""
+容量保留 (modules/retention.py) 的測試，不需要相機與伺服器
+
+建立 10 天的日期分區圖片與 CSV，先以 LocalDirTransport 同步一部分，確認由最舊的日期開始清理、
+尚未同步的圖片 (沒有同步清單時為全部圖片) 與非圖片檔案一律保留、過去的分區大小有快取，以及停止訊號可以中止清理
+"""
+import os
+import shutil
+import time
+
+import pytest
+
+from conftest import write
+from modules.retention import RetentionDaemon, _Stopped
+from modules.sync import IncrementalSync, LocalDirTransport
+
+IMAGE_SIZE = 10000
+PER_DAY = 50
+
+
+def make_runs(runs, days=10):
+    now = time.time()
+    paths = []
+    for d in range(days, 0, -1):
+        ts = int(now - d * 86400)
+        partition = time.strftime("%Y/%m/%d", time.localtime(ts))
+        for i in range(PER_DAY):
+            path = os.path.join(runs, "images", *partition.split("/"), f"ABC-{i:04d}_{ts + i}.jpg")
+            write(path, os.urandom(IMAGE_SIZE))
+            paths.append(path)
+    write(os.path.join(runs, "data_log.csv"), b"x" * 50000)
+    return paths
+
+
+@pytest.fixture
+def synced(tmp_path):
+    """
+    只同步前 8 天，最後 2 天 (較新) 尚未同步；另外最舊那天有一張同步後又被修改
+    Returns: (runs, 全部圖片, 尚未同步的圖片)
+    """
+    runs = str(tmp_path / "runs")
+    paths = make_runs(runs)
+    late = paths[-2 * PER_DAY:]
+    hidden = tmp_path / "hidden"
+    hidden.mkdir()
+    for p in late:
+        shutil.move(p, str(hidden / os.path.basename(p)))
+    sync = IncrementalSync(runs, LocalDirTransport(str(tmp_path / "server")))
+    sync.run()
+    sync.close()
+    for p in late:
+        shutil.move(str(hidden / os.path.basename(p)), p)
+    with open(paths[0], "ab") as f:
+        f.write(b"changed")
+    return runs, paths, late
+
+
+@pytest.fixture
+def daemon(synced):
+    # 上限設在約 6 天的圖片量：需要刪掉最舊的 4 天左右
+    d = RetentionDaemon(synced[0], budget_bytes=6 * PER_DAY * IMAGE_SIZE + 200000, min_free_bytes=0,
+                        interval=None, slice_files=50, slice_pause=0.001)
+    yield d
+    d.close()
+
+
+def test_no_manifest_deletes_nothing_by_default(tmp_path):
+    """從未同步 (或同步清單遺失) 的裝置：預設一律要確認同步，容量超過也不刪任何圖片"""
+    runs = str(tmp_path / "runs")
+    paths = make_runs(runs, days=4)
+    daemon = RetentionDaemon(runs, budget_bytes=0, min_free_bytes=0, interval=None)
+    r = daemon.run_once()
+    daemon.close()
+    assert r["deleted"] == 0 and r["skipped"] == len(paths)
+    assert all(os.path.exists(p) for p in paths)
+
+
+def test_without_sync_configured(tmp_path):
+    """沒有設定同步的裝置明確指定 require_sync=False，不需確認即可清理"""
+    runs = str(tmp_path / "runs")
+    paths = make_runs(runs, days=4)
+    daemon = RetentionDaemon(runs, budget_bytes=2 * PER_DAY * IMAGE_SIZE + 200000, min_free_bytes=0,
+                             interval=None, require_sync=False)
+    r = daemon.run_once()
+    daemon.close()
+    assert r["deleted"] > 0 and r["skipped"] == 0
+    assert os.path.exists(paths[-1]) and not os.path.exists(paths[0])
+
+
+def test_oldest_first(synced, daemon):
+    runs, paths, _ = synced
+    modified = paths[0]
+    r = daemon.run_once()
+    assert r["usage"] <= daemon.budget_bytes and r["deleted"] > 0
+    deleted_days = {os.path.dirname(p) for p in paths if not os.path.exists(p)}
+    kept_days = {os.path.dirname(p) for p in paths if os.path.exists(p)}
+    assert max(deleted_days) <= min(kept_days - {os.path.dirname(modified)})
+    # 同步後又修改的圖片保留
+    assert os.path.exists(modified) and r["skipped"] >= 1
+    assert os.path.exists(os.path.join(runs, "data_log.csv"))
+
+
+def test_unsynced_kept(synced, daemon):
+    late = synced[2]
+    daemon.budget_bytes = 0
+    r = daemon.run_once()
+    assert all(os.path.exists(p) for p in late) and r["skipped"] >= len(late)
+
+
+def test_past_partitions_cached(synced, daemon):
+    runs = synced[0]
+    daemon.budget_bytes = 1 << 40
+    daemon.run_once()
+    listed = []
+    original = daemon._iter_files
+
+    def counting_iter(path, skip=()):
+        listed.append(path)
+        return original(path, skip)
+    daemon._iter_files = counting_iter
+    daemon.run_once()
+    assert all(not p.startswith(os.path.join(runs, "images", "2")) for p in listed)
+
+
+def test_stop_interrupts(daemon):
+    daemon.budget_bytes = 1 << 40
+    daemon._stop_event.set()
+    with pytest.raises(_Stopped):
+        daemon.run_once()
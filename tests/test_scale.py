@@ -0,0 +1,113 @@
+"""
+地磅驅動 (modules/scale.py) 的測試，不需要地磅與虛擬終端
+
+以 tools/fake_scale.py 的劇本產生儀表輸出，經 StreamParser 分框後直接交給 ScaleDriver 處理 (與背景讀取相同的流程)，
+確認上磅中不穩定、靜止後穩定、stable_weight_at 取得上磅重量，以及淨重、不認得的單位、超載與無訊號的處理
+"""
+import time
+
+import pytest
+
+from fake_scale import format_line, scenario
+from modules.scale import ScaleDriver
+from modules.scale_protocol import StreamParser
+
+RATE = 20.0
+
+
+@pytest.fixture
+def driver():
+    # 模擬模式的背景執行緒先停掉，讀值全部由測試餵入
+    d = ScaleDriver(simulate=True, window=1.0, tolerance=10.0, settle_time=1.0)
+    d.close()
+    d._ring.clear()
+    d._latest = None
+    d._settle_start = None
+    d.samples = 0
+    return d
+
+
+def feed(driver, data, ts):
+    for frame in StreamParser("csv").feed(data):
+        driver._on_frame(frame, ts)
+
+
+def play(driver, gross=35000.0, noise=2.0):
+    """
+    依劇本餵入讀值，時間戳安排成剛好結束於現在
+    Returns: {階段: (該階段最後一筆的時間, 當時是否穩定)}
+    """
+    steps = scenario(gross)
+    total = sum(int(duration * RATE) for _, duration, _, _, _ in steps)
+    ts = time.time() - total / RATE
+    marks = {}
+    for i, (name, duration, start, end, still) in enumerate(steps):
+        n = int(duration * RATE)
+        for k in range(n):
+            weight = start + (end - start) * (k + 1) / n + (noise if k % 2 else -noise)
+            feed(driver, format_line(weight, still), ts)
+            marks[(i, name)] = (ts, driver._latest.stable)
+            ts += 1.0 / RATE
+    return marks
+
+
+def test_scenario_stability(driver):
+    marks = play(driver)
+    assert not marks[(1, "loading")][1]
+    assert marks[(2, "stable")][1]
+    assert not marks[(3, "leaving")][1]
+    assert driver.status() == "穩定"
+    assert driver.parse_errors == 0
+    assert driver.samples == sum(int(d * RATE) for _, d, _, _, _ in scenario())
+
+    weight = driver.stable_weight_at(marks[(2, "stable")][0])
+    assert weight == pytest.approx(35000.0, abs=10.0)
+    # 下磅後回到空磅，最新的穩定重量是空磅
+    assert driver.stable_weight_at(time.time()) == pytest.approx(0.0, abs=10.0)
+
+
+def test_settle_time_required(driver):
+    # 靜止未滿 settle_time 不算穩定
+    ts = time.time() - 1.0
+    for k in range(int(0.8 * RATE)):
+        feed(driver, format_line(30000.0, True), ts + k / RATE)
+    assert driver.status() == "不穩定"
+    assert driver.stable_weight_at(time.time()) is None
+
+
+def test_stable_weight_at_bounds(driver):
+    marks = play(driver)
+    stable_ts = marks[(2, "stable")][0]
+    # 比任何穩定讀值都早
+    assert driver.stable_weight_at(marks[(0, "empty")][0] - 10) is None
+    # 上磅中的時間點往前找不到 max_age 內的穩定讀值 (空磅的穩定讀值已超過 max_age)
+    assert driver.stable_weight_at(marks[(1, "loading")][0], max_age=0.5) is None
+    # 下磅中的時間點可找到剛才的上磅重量
+    assert driver.stable_weight_at(stable_ts + 1.0) == pytest.approx(35000.0, abs=10.0)
+    # 查詢時間點之後的讀值不採用
+    assert driver.stable_weight_at(stable_ts + 1.0, max_age=0.01) is None
+
+
+def test_net_and_unknown_unit_rejected(driver):
+    ts = time.time()
+    feed(driver, b"ST,NT,+0001200kg\r\n", ts)
+    feed(driver, b"ST,GS,+0001200xx\r\n", ts)
+    assert driver.samples == 0
+    assert driver.net_frames == 1
+    assert driver.unit_errors == 1
+    assert driver.parse_errors == 1
+
+
+def test_overload_keeps_last_weight(driver):
+    ts = time.time()
+    feed(driver, format_line(42000.0, True), ts)
+    feed(driver, b"OL,GS,+-------kg\r\n", ts + 0.05)
+    assert driver.status() == "超載"
+    assert driver.get_weight() == 42000.0
+
+
+def test_no_signal(driver):
+    assert driver.status() == "無訊號"
+    feed(driver, format_line(1000.0, True), time.time() - driver.signal_timeout - 1)
+    assert driver.status() == "無訊號"
+    assert driver.get_weight() == 0.0
@@ -0,0 +1,70 @@
+"""
+地磅儀表格式解析器 (modules/scale_protocol.py) 與 ScaleDriver 單位處理的測試
+
+tests/scale_corpus/cases.json 的每個案例分別以原始切段與逐位元組餵入，結果必須一致；
+新儀表的片段以 tools/scale_capture.py 錄下後加進 cases.json
+"""
+import json
+import os
+
+import pytest
+
+from modules.scale import ScaleDriver
+from modules.scale_protocol import Protocol, ScaleFrame, StreamParser, to_kg
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scale_corpus", "cases.json")
+
+with open(CORPUS, encoding="utf-8") as _f:
+    CASES = json.load(_f)
+
+
+def replay(case, chunks):
+    parser = StreamParser(case["protocol"], **case.get("options", {}))
+    frames = []
+    for chunk in chunks:
+        frames.extend(parser.feed(chunk))
+    return [list(f) for f in frames], parser
+
+
+@pytest.mark.parametrize("mode", ["chunks", "bytewise"])
+@pytest.mark.parametrize("case", CASES, ids=[c["name"] for c in CASES])
+def test_corpus(case, mode):
+    chunks = [c.encode("latin-1") for c in case["chunks"]]
+    if mode == "bytewise":
+        whole = b"".join(chunks)
+        chunks = [whole[i:i + 1] for i in range(len(whole))]
+    frames, parser = replay(case, chunks)
+    assert frames == case["expected"]
+    if "errors" in case:
+        assert parser.errors == case["errors"]
+
+
+def test_protocol_is_abstract():
+    with pytest.raises(TypeError):
+        Protocol()
+
+
+@pytest.mark.parametrize("unit, weight, expected", [
+    ("kg", 35000.0, 35000.0),
+    ("", 35000.0, 35000.0),
+    ("t", 35.5, 35500.0),
+    ("lb", 1000.0, 453.592),
+])
+def test_to_kg(unit, weight, expected):
+    frame = to_kg(ScaleFrame(weight, True, False, False, unit))
+    assert frame.weight == expected and frame.unit == "kg"
+
+
+def test_to_kg_rejects_unknown_unit():
+    assert to_kg(ScaleFrame(1000.0, True, False, False, "oz")) is None
+
+
+def test_driver_converts_units_and_refuses_net():
+    driver = ScaleDriver(simulate=True)
+    driver.close()
+    parser = StreamParser("csv")
+    accepted = [driver._accept(f) for f in parser.feed(b"ST,GS,+35.5t\r\nST,NT,+1000kg\r\nST,GS,+1000oz\r\n")]
+    assert accepted[0].weight == 35500.0
+    assert accepted[1:] == [None, None]
+    stats = driver.stats()
+    assert stats["net_frames"] == 1 and stats["parse_errors"] == 1
@@ -0,0 +1,178 @@
+"""
+增量同步 (modules/sync.py) 的測試，以 LocalDirTransport 同步到暫存資料夾，不需要伺服器
+
+確認只送出新增與修改的檔案、傳輸中斷後續傳、清理只刪除遠端已確認的圖片，
+以及 SQLite 後端的紀錄匯出成 CSV 同步，遠端確認後才標記為已同步
+SshTransport 的遠端指令改以本機 sh 執行，確認路徑與批次名稱都有加上引號
+"""
+import io
+import os
+import subprocess
+import tarfile
+import time
+
+import pytest
+
+from conftest import write
+from modules.maintenance import DataMaintenance
+from modules.record_store import SqliteRecordStore, make_record
+from modules.sync import (BATCH_MANIFEST, IncrementalSync, LocalDirTransport, SshTransport, Transport,
+                          file_sha256)
+
+IMAGES = [f"images/ABC-{i:04d}_{1700000000 + i}.jpg" for i in range(20)]
+
+
+def same_tree(local, remote, rel_paths):
+    return all(os.path.exists(os.path.join(remote, p)) and
+               file_sha256(os.path.join(local, p)) == file_sha256(os.path.join(remote, p))
+               for p in rel_paths)
+
+
+class Gate:
+    """假的閘口：20 張圖片、CSV 與 3 筆 SQLite 紀錄，同步到本機的 server 資料夾"""
+
+    def __init__(self, workdir):
+        self.runs = os.path.join(workdir, "runs")
+        self.remote = os.path.join(workdir, "server")
+        self.remote_runs = os.path.join(self.remote, "runs")
+        for i, rel in enumerate(IMAGES):
+            write(os.path.join(self.runs, rel), os.urandom(50000 + i))
+        write(os.path.join(self.runs, "data_log.csv"), "時間(Time),車牌(Plate)\n".encode("utf-8-sig"))
+        self.store = SqliteRecordStore(os.path.join(self.runs, "records.db"))
+        self.store.append([make_record("辨識成功", f"DB-{i:04d}", "N/A", "穩定", 1000.0 + i, ts=1700000000 + i)
+                           for i in range(3)])
+        self.transport = LocalDirTransport(self.remote)
+        self.sync = IncrementalSync(self.runs, self.transport, batch_bytes=400000)
+
+    def close(self):
+        self.sync.close()
+        self.store.close()
+
+
+@pytest.fixture
+def gate(tmp_path):
+    g = Gate(str(tmp_path))
+    yield g
+    g.close()
+
+
+def test_transport_is_abstract():
+    with pytest.raises(TypeError):
+        Transport()
+
+
+def test_first_sync(gate):
+    r = gate.sync.run()
+    # 21 個檔案與 1 個紀錄匯出檔
+    assert r["error"] is None and r["files"] == 22 and r["batches"] > 1
+    assert same_tree(gate.runs, gate.remote_runs, IMAGES + ["data_log.csv"])
+    # 執行中的資料庫不同步
+    assert not os.path.exists(os.path.join(gate.remote_runs, "records.db"))
+    assert os.path.exists(os.path.join(gate.remote_runs, "records", "records_1-3.csv"))
+    assert not gate.store.unsynced() and not os.listdir(os.path.join(gate.runs, "records"))
+
+
+def test_only_changes_are_sent(gate):
+    gate.sync.run()
+    r = gate.sync.run()
+    assert r["files"] == 0 and r["bytes_sent"] == 0
+
+    # 只 touch 的檔案不重送
+    os.utime(os.path.join(gate.runs, IMAGES[0]), (time.time() + 5, time.time() + 5))
+    assert gate.sync.run()["files"] == 0
+
+    with open(os.path.join(gate.runs, "data_log.csv"), "ab") as f:
+        f.write("2025-02-07 10:00:00,ABC-0001\n".encode("utf-8"))
+    new_image = "images/NEW-0001_1700000100.jpg"
+    write(os.path.join(gate.runs, new_image), os.urandom(30000))
+    assert gate.sync.run()["files"] == 2
+    assert same_tree(gate.runs, gate.remote_runs, ["data_log.csv", new_image])
+
+
+def test_resume_after_interrupt(gate):
+    gate.sync.run()
+    big = [f"images/BIG-{i:04d}_1700000200.jpg" for i in range(3)]
+    for rel in big:
+        write(os.path.join(gate.runs, rel), os.urandom(100000))
+    gate.store.append([make_record("辨識成功", "DB-0100", "N/A", "穩定", 2000.0, ts=1700000100)])
+
+    gate.transport.fail_after = 120000
+    r = gate.sync.run()
+    # 中斷時回報錯誤且不確認；期間新增的 SQLite 紀錄要等確認後才標記為已同步
+    assert r["error"] is not None and r["files"] == 0
+    assert [rec["plate"] for rec in gate.store.unsynced()] == ["DB-0100"]
+    assert os.listdir(os.path.join(gate.remote, "incoming"))
+
+    gate.transport.fail_after = None
+    r = gate.sync.run()
+    # 3 張圖片與 1 個紀錄匯出檔
+    assert r["error"] is None and r["resumed"] == 1 and r["files"] == len(big) + 1
+    assert same_tree(gate.runs, gate.remote_runs, big)
+    # 不重複匯出
+    assert not gate.store.unsynced()
+    assert os.path.exists(os.path.join(gate.remote_runs, "records", "records_4-4.csv"))
+
+
+def test_clean_only_synced_images(gate):
+    gate.sync.run()
+    old = time.time() - 10 * 86400
+    for rel in IMAGES:
+        os.utime(os.path.join(gate.runs, rel), (old, old))
+    # 修改時間變了，先同步一次讓清單記錄新的時間 (內容相同不重送)
+    gate.sync.run()
+    # 同步之後才出現的過期圖片 (例如時鐘校正前寫入)
+    unsynced = "images/LATE-0001_1700000300.jpg"
+    write(os.path.join(gate.runs, unsynced), os.urandom(1000))
+    os.utime(os.path.join(gate.runs, unsynced), (old, old))
+
+    cleaner = DataMaintenance(img_dir=os.path.join(gate.runs, "images"),
+                              csv_path=os.path.join(gate.runs, "data_log.csv"),
+                              archive_dir=os.path.join(gate.runs, "history"))
+    cleaner.clean_old_images(days_to_keep=3, is_synced=gate.sync.is_synced)
+    assert not any(os.path.exists(os.path.join(gate.runs, p)) for p in IMAGES)
+    assert os.path.exists(os.path.join(gate.runs, unsynced))
+
+
+class LocalShellTransport(SshTransport):
+    """以本機 sh 執行 SshTransport 組出的遠端指令，home 為 ssh 登入後的家目錄"""
+
+    def __init__(self, home, remote_dir):
+        super().__init__("nobody@localhost", remote_dir)
+        self.home = home
+
+    def _ssh(self, command, stdin=None):
+        return subprocess.run(["sh", "-c", command], cwd=self.home, stdin=stdin, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, text=stdin is None, timeout=self.timeout)
+
+
+def test_ssh_commands_are_quoted(tmp_path):
+    # 路徑與批次名稱含有空白與 shell 語法時，只能被當成檔名
+    home = tmp_path / "home"
+    home.mkdir()
+    hostile = "b $(touch pwned); touch pwned2 'x"
+    transport = LocalShellTransport(str(home), "~/lpr server/$(touch pwned3)")
+
+    batch = tmp_path / "batch.tar.gz"
+    with tarfile.open(batch, "w:gz") as tar:
+        for name, data in (("images/ABC-0001_1700000000.jpg", b"jpeg"), (BATCH_MANIFEST, b"{}")):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+    assert transport.received_bytes(hostile) == 0
+    transport.upload(str(batch), hostile, offset=0)
+    assert transport.received_bytes(hostile) == batch.stat().st_size
+    assert not transport.is_committed(hostile)
+    assert transport.commit(hostile, file_sha256(str(batch)))
+    assert transport.is_committed(hostile)
+
+    remote = home / "lpr server" / "$(touch pwned3)"
+    assert (remote / "runs" / "images" / "ABC-0001_1700000000.jpg").read_bytes() == b"jpeg"
+    assert not (remote / "runs" / BATCH_MANIFEST).exists()
+    assert (remote / "batches" / f"{hostile}.ok").exists()
+    assert not any(p.name.startswith("pwned") for p in tmp_path.rglob("*"))
+
+    # 雜湊不符時刪除 .part
+    transport.upload(str(batch), "bad", offset=0)
+    assert not transport.commit("bad", "0" * 64)
+    assert transport.received_bytes("bad") == 0
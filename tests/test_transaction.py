@@ -0,0 +1,192 @@
+"""
+過磅交易 (modules/transaction.py) 的測試，以假地磅與指定的時間推進狀態機，不需要地磅與相機
+
+確認 空磅 -> 上磅中 -> 靜止 -> 下磅中 -> 空磅 的轉換、不穩定與低於門檻的讀值不會成為過磅重量、
+上磅前後的車牌歸屬 (pre_roll / post_roll / plate_timeout)，以及空重配對的時間窗與重新啟動後的重建
+"""
+import os
+
+import numpy as np
+
+from modules.record_store import CsvRecordStore, make_record
+from modules.scale import ScaleReading
+from modules.transaction import (STATE_EMPTY, STATE_LEAVING, STATE_LOADING, STATE_STABLE, TarePairing,
+                                 TransactionMonitor)
+
+T0 = 1700000000.0
+FRAME = np.zeros((4, 4, 3), np.uint8)
+
+
+class FakeScale:
+    def __init__(self):
+        self.reading = None
+
+    def set(self, weight, stable=False, mean=None):
+        self.reading = ScaleReading(0.0, weight, stable, weight if mean is None else mean, False)
+
+    def latest(self):
+        return self.reading
+
+
+def make_monitor(**options):
+    scale = FakeScale()
+    scale.set(0.0, stable=True)
+    return scale, TransactionMonitor(scale, **options)
+
+
+def drive(monitor, scale, steps):
+    """steps: [(秒數, 重量, 是否穩定), ...]；Returns: 完成的過磅與每一步之後的狀態"""
+    done, states = [], []
+    for t, weight, stable in steps:
+        scale.set(weight, stable)
+        done += monitor.update(now=T0 + t)
+        states.append(monitor.state)
+    return done, states
+
+
+def test_full_cycle():
+    scale, monitor = make_monitor()
+    monitor.observe("ABC-1234", 1.0, FRAME, (0, 0, 2, 2), None, now=T0)
+    done, states = drive(monitor, scale, [
+        (1, 100.0, True),      # 低於上磅門檻
+        (2, 20000.0, False),   # 上磅中
+        (3, 30000.0, True),    # 靜止
+        (4, 30000.0, True),
+        (5, 15000.0, False),   # 下磅中
+        (6, 0.0, True),
+        (8, 0.0, True),        # 連續空磅 empty_hold 秒
+        (9, 0.0, True),
+    ])
+    assert states == [STATE_EMPTY, STATE_LOADING, STATE_STABLE, STATE_STABLE, STATE_LEAVING,
+                      STATE_LEAVING, STATE_EMPTY, STATE_EMPTY]
+    assert len(done) == 1
+    trans = done[0]
+    assert trans.weighed and trans.plate == "ABC-1234"
+    assert trans.weight == 30000.0
+    assert trans.peak_weight == 30000.0
+    assert monitor.stats()["visits"] == 1
+
+
+def test_unstable_readings_are_not_weights():
+    scale, monitor = make_monitor()
+    monitor.observe("ABC-1234", 1.0, FRAME, None, None, now=T0)
+    done, states = drive(monitor, scale, [
+        (1, 20000.0, False),
+        (2, 31000.0, False),
+        (3, 400.0, True),      # 穩定但在遲滯區 (低於 occupied_weight)，不是過磅重量
+        (4, 0.0, False),
+        (7, 0.0, False),
+        (8, 0.0, False),
+    ])
+    assert STATE_STABLE not in states
+    assert len(done) == 1
+    assert done[0].weighed
+    assert done[0].weight is None
+    assert done[0].peak_weight == 31000.0
+
+
+def test_restable_uses_last_stable_weight():
+    scale, monitor = make_monitor()
+    monitor.observe("ABC-1234", 1.0, FRAME, None, None, now=T0)
+    done, _ = drive(monitor, scale, [
+        (1, 30000.0, True),
+        (2, 25000.0, False),   # 車輛前後調整位置
+        (3, 30500.0, True),
+        (4, 0.0, True),
+        (7, 0.0, True),
+        (8, 0.0, True),
+    ])
+    assert done[0].weight == 30500.0
+
+
+def test_pre_roll_and_plate_timeout():
+    scale, monitor = make_monitor(pre_roll=20.0, plate_timeout=60.0)
+    monitor.observe("OLD-0001", 1.0, FRAME, None, None, now=T0)
+    monitor.observe("NEW-0002", 1.0, FRAME, None, None, now=T0 + 25)
+    # 上磅時只有 pre_roll 內的車牌歸入過磅，較早的單獨輸出沒有重量的紀錄
+    done, _ = drive(monitor, scale, [(30, 30000.0, True)])
+    assert [(t.plate, t.weighed) for t in done] == [("OLD-0001", False)]
+    assert monitor._visit.plate == "NEW-0002"
+
+    # 看到車牌卻一直沒有上磅
+    scale2, monitor2 = make_monitor(plate_timeout=60.0)
+    monitor2.observe("XYZ-9999", 1.0, FRAME, None, None, now=T0)
+    assert drive(monitor2, scale2, [(30, 0.0, True)])[0] == []
+    done, _ = drive(monitor2, scale2, [(61, 0.0, True)])
+    assert [(t.plate, t.weighed, t.weight) for t in done] == [("XYZ-9999", False, None)]
+    assert monitor2.stats()["unweighed"] == 1
+
+
+def test_post_roll_plate_after_leaving():
+    # 出口相機在下磅後才看到車牌
+    scale, monitor = make_monitor(post_roll=10.0)
+    done, _ = drive(monitor, scale, [(0, 30000.0, True), (1, 0.0, True), (4, 0.0, True)])
+    assert done == []
+    monitor.observe("ABC-1234", 1.0, FRAME, None, None, now=T0 + 5)
+    done, _ = drive(monitor, scale, [(6, 0.0, True)])
+    assert [(t.plate, t.weight) for t in done] == [("ABC-1234", 30000.0)]
+
+    # post_roll 內都沒有車牌：輸出未辨識的過磅
+    done, _ = drive(monitor, scale, [(20, 30000.0, True), (21, 0.0, True), (24, 0.0, True), (34, 0.0, True)])
+    assert len(done) == 1 and done[0].plate is None
+    assert monitor.stats()["unidentified"] == 1
+
+
+def test_pairing_in_and_out():
+    pairing = TarePairing(max_gap=3600.0)
+    assert pairing.pair("ABC-1234", 12000.0, T0, "in") == (None, None)
+    assert pairing.pair("ABC-1234", 32000.0, T0 + 600, "out") == (12000.0, 20000.0)
+    # 配對後就結束，下一趟重新開始
+    assert pairing.pair("ABC-1234", 12000.0, T0 + 700, "in") == (None, None)
+
+
+def test_pairing_rejects_same_direction_and_missing_weight():
+    pairing = TarePairing(max_gap=3600.0)
+    assert pairing.pair("ABC-1234", None, T0, "in") == (None, None)
+    assert pairing.pair(None, 12000.0, T0, "in") == (None, None)
+    pairing.pair("ABC-1234", 12000.0, T0, "in")
+    assert pairing.pair("ABC-1234", 12500.0, T0 + 60, "in") == (None, None)
+    assert pairing.pair("ABC-1234", 30000.0, T0 + 120, "out") == (12500.0, 17500.0)
+
+
+def test_pair_window_expiry():
+    pairing = TarePairing(max_gap=3600.0)
+    pairing.pair("ABC-1234", 12000.0, T0, "in")
+    # 超過時間窗：不配對，這次成為新的進場
+    assert pairing.pair("ABC-1234", 32000.0, T0 + 3601, "out") == (None, None)
+    assert pairing.pair("ABC-1234", 12000.0, T0 + 4000, "in") == (12000.0, 20000.0)
+
+
+def test_max_open_evicts_oldest():
+    pairing = TarePairing(max_gap=3600.0, max_open=2)
+    for i, plate in enumerate(("A-1", "B-2", "C-3")):
+        pairing.pair(plate, 10000.0, T0 + i)
+    assert pairing.pair("A-1", 30000.0, T0 + 10) == (None, None)
+    assert pairing.pair("C-3", 30000.0, T0 + 10) == (10000.0, 20000.0)
+
+
+def test_restore_from_csv_records(tmp_path):
+    # 重新啟動前寫入的紀錄：ABC 已完成配對，DEF 進場後尚未出場，GHI 超過時間窗
+    store = CsvRecordStore(os.path.join(str(tmp_path), "data_log.csv"),
+                           ["time", "plate_status", "plate", "plate_image", "scale_status", "weight",
+                            "direction", "tare_weight", "net_weight"])
+    rows = [("GHI-0003", 11000.0, T0 - 7200, "in"),
+            ("ABC-1234", 12000.0, T0 - 600, "in"),
+            ("DEF-5678", 13000.0, T0 - 500, "in"),
+            ("ABC-1234", 30000.0, T0 - 300, "out")]
+    records = []
+    for plate, weight, ts, direction in rows:
+        rec = make_record("辨識成功", plate, "x.jpg", "穩定", weight, ts=ts)
+        rec["direction"] = direction
+        records.append(rec)
+    store.append(records)
+
+    loaded = store.query_time_range(T0 - 3600)
+    assert [rec["plate"] for rec in loaded] == ["ABC-1234", "DEF-5678", "ABC-1234"]
+    assert loaded[0]["weight"] == 12000.0 and loaded[0]["net_weight"] is None
+    store.close()
+
+    pairing = TarePairing(max_gap=3600.0)
+    assert pairing.restore([(r["plate"], r["weight"], r["ts"], r["direction"]) for r in loaded], now=T0) == 1
+    assert pairing.pair("DEF-5678", 33000.0, T0 + 60, "out") == (13000.0, 20000.0)
+    assert pairing.pair("ABC-1234", 33000.0, T0 + 60, "out") == (None, None)
@@ -0,0 +1,64 @@
+"""
+車隊匯入服務 (modules/ingest.py) 的匯入速度量測
+
+單一 CSV 分 10 次附加匯入，量測每次匯入只處理新列的速度與依車牌查詢的時間
+(功能測試見 tests/test_ingest.py)
+
+用法 (在專案根目錄執行):
+    python tools/bench_ingest.py --records 200000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.ingest import IngestStore
+from modules.record_store import CsvRecordStore, make_record
+
+CSV_FIELDS = ["time", "plate_status", "plate", "plate_image", "scale_status", "weight"]
+
+
+def bench(workdir, n_records):
+    """單一 CSV 分 10 次附加匯入，量測每次匯入只處理新列的速度"""
+    store = IngestStore(os.path.join(workdir, "server"))
+    csv_path = os.path.join(workdir, "data_log.csv")
+    csv_store = CsvRecordStore(csv_path, CSV_FIELDS)
+    t0 = datetime(2025, 1, 1).timestamp()
+    step = n_records // 10
+    for round_no in range(10):
+        csv_store.append([make_record("辨識成功", f"P{i % 5000:05d}", "runs/images/x.jpg", "穩定", 1000.0,
+                                      ts=t0 + i) for i in range(round_no * step, (round_no + 1) * step)])
+        archive = os.path.join(workdir, f"b{round_no}.tar.gz")
+        with tarfile.open(archive, "w:gz", compresslevel=1) as tar:
+            tar.add(csv_path, "data_log.csv")
+        start = time.perf_counter()
+        result = store.ingest_archive("bench", f"b{round_no}", archive, "-", os.path.getsize(archive))
+        elapsed = time.perf_counter() - start
+        print(f"[BenchIngest] 第 {round_no + 1} 次: 新增 {result['records']} 筆，"
+              f"{elapsed:.2f}s ({result['records'] / elapsed:.0f} 筆/秒)")
+    t = time.perf_counter()
+    rows = store.query(plate="P01234", limit=1000)
+    print(f"[BenchIngest] 依車牌查詢 {len(rows)} 筆: {(time.perf_counter() - t) * 1000:.1f} ms")
+    csv_store.close()
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="車隊匯入服務的匯入速度量測")
+    parser.add_argument("--records", type=int, default=200000, help="匯入的紀錄數")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="lpr_ingest_")
+    try:
+        bench(workdir, args.records)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+LPR 各階段效能量測 (不需要相機，可在只有 CPU 的 Linux 電腦上執行)
+
+分別量測 Detect_License_Plate.run、OCRProcess.run / run_batch、車牌格式驗證、
+DatabaseManager.save_record 與 ScaleDriver.get_weight 的吞吐量與 p50/p95/p99 延遲，
+結果寫成 JSON，可以在不同 commit 之間比對，某個階段變慢時在上線前就能發現
+
+後端:
+    stub  以假模型取代 YOLO 與 PaddleOCR，只量測本專案自己的程式碼 (裁切、驗證、快取、畫框、存檔)
+    cpu   以 CPU 載入真正的模型 (YOLO 請用 .pt 或 .onnx，TensorRT .engine 只能在 Jetson 上跑)
+
+用法 (在專案根目錄執行):
+    python tools/benchmark.py --out bench.json                        # stub 後端、合成畫面
+    python tools/benchmark.py --images runs/images --out bench.json   # 使用錄下來的車牌照片
+    python tools/benchmark.py --backend cpu --model models/best.pt --stages detect,ocr
+    python tools/benchmark.py --out new.json --compare bench.json     # 與基準比對，p95 變慢超過容許值則回傳 1
+"""
+import argparse
+import glob
+import itertools
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai.lpr_engine import Detect_License_Plate
+from ai.ocrprocess import OCRProcess
+from modules.database import DatabaseManager
+from modules.scale import ScaleDriver
+
+STAGES = ["detect", "ocr", "ocr_batch", "validate", "db_csv", "db_sqlite", "db_async", "scale"]
+
+# 驗證階段的輸入：正確、需要修正、格式錯誤的 OCR 原始字串各佔一部分
+RAW_TEXTS = [
+    "ABC-1234", "abc 1234", "AB-1234", "1234-AB", "ABC1234", "KLA-0O21",
+    "8CD-I234", "RAB-5678", "TW-ABC-1234", "123", "!!!", "HELLO WORLD",
+]
+
+
+# ==========================================
+# Stub 後端：介面與 YOLO / PaddleOCR 相同，回傳固定結果
+# ==========================================
+def plate_box(frame):
+    """stub 偵測器回傳的車牌框：畫面中央下方"""
+    h, w = frame.shape[:2]
+    return (w * 3 // 8, h * 5 // 8, w * 5 // 8, h * 3 // 4)
+
+
+class _StubBoxes:
+    def __init__(self, xyxy):
+        self.xyxy = xyxy
+
+
+class _StubResult:
+    def __init__(self, xyxy):
+        self.boxes = _StubBoxes(xyxy)
+
+
+class StubYOLO:
+    def predict(self, source, verbose=False):
+        frames = source if isinstance(source, list) else [source]
+        return [_StubResult([plate_box(frame)]) for frame in frames]
+
+
+class StubPaddleOCR:
+    def __init__(self, texts=RAW_TEXTS, score=0.95):
+        self._texts = itertools.cycle(texts)
+        self._score = score
+
+    def ocr(self, img, cls=True):
+        h, w = img.shape[:2]
+        return [[[[[0, 0], [w, 0], [w, h], [0, h]], (next(self._texts), self._score)]]]
+
+    def text_classifier(self, img_list):
+        return img_list, [["0", 1.0] for _ in img_list], 0.0
+
+    def text_recognizer(self, img_list):
+        return [(next(self._texts), self._score) for _ in img_list], 0.0
+
+
+# ==========================================
+# 量測
+# ==========================================
+def percentile(sorted_values, p):
+    """nearest-rank 百分位數 (sorted_values 需已排序)"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, int(math.ceil(p / 100.0 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def measure(func, inputs, iterations, warmup):
+    """
+    對 inputs 循環呼叫 func，只計時 func 本身 (inputs 的準備不計入)
+    inputs 為回傳輸入值的函式 list，例如複製一張畫面
+    """
+    source = itertools.cycle(inputs)
+    for _ in range(warmup):
+        func(next(source)())
+
+    latencies = []
+    for _ in range(iterations):
+        arg = next(source)()
+        t0 = time.perf_counter()
+        func(arg)
+        latencies.append(time.perf_counter() - t0)
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "calls": iterations,
+        "total_s": round(total, 6),
+        "throughput_per_s": round(iterations / total, 2) if total > 0 else None,
+        "mean_ms": round(total / iterations * 1000, 4),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+        "max_ms": round(latencies[-1] * 1000, 4),
+    }
+
+
+def load_frames(images_dir, count, width, height):
+    """讀取錄下來的照片；沒有指定時產生固定亂數種子的合成畫面 (每次結果一致)"""
+    if images_dir:
+        paths = sorted(glob.glob(os.path.join(images_dir, "*.jpg")) +
+                       glob.glob(os.path.join(images_dir, "*.png")))[:count]
+        frames = [f for f in (cv2.imread(p) for p in paths) if f is not None]
+        if not frames:
+            raise SystemExit(f"[Benchmark] {images_dir} 中沒有可讀取的影像")
+        return frames, f"{len(frames)} images from {images_dir}"
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+    return frames, f"{count} synthetic {width}x{height} frames"
+
+
+def crop(frame):
+    x1, y1, x2, y2 = plate_box(frame)
+    return frame[y1:y2 + 1, x1:x2 + 1]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(args, stages):
+    frames, source = load_frames(args.images, args.frames, args.width, args.height)
+    rois = [crop(f) for f in frames]
+    results = {}
+
+    def bench(name, func, inputs):
+        print(f"[Benchmark] {name} ...")
+        results[name] = measure(func, inputs, args.iterations, args.warmup)
+        r = results[name]
+        print(f"[Benchmark] {name}: {r['throughput_per_s']}/s, "
+              f"p50 {r['p50_ms']} ms, p95 {r['p95_ms']} ms, p99 {r['p99_ms']} ms")
+
+    # run 會在畫面上畫框，每次都給一張新的複本
+    frame_inputs = [lambda f=f: f.copy() for f in frames]
+    roi_inputs = [lambda r=r: r for r in rois]
+
+    stub = args.backend == "stub"
+    use_gpu = False
+
+    if "detect" in stages:
+        detector = Detect_License_Plate(
+            args.model, ocr_batch_size=args.ocr_batch, ocr_cache_size=args.ocr_cache,
+            use_gpu=use_gpu,
+            detector=StubYOLO() if stub else None,
+            ocr_engine=StubPaddleOCR() if stub else None)
+        bench("detect", detector.run, frame_inputs)
+        detector.cleanup()
+
+    if "ocr" in stages or "ocr_batch" in stages or "validate" in stages:
+        ocr = OCRProcess(use_gpu=use_gpu, rec_batch_num=max(1, args.ocr_batch),
+                         engine=StubPaddleOCR() if stub else None)
+        if "ocr" in stages:
+            bench("ocr", ocr.run, roi_inputs)
+        if "ocr_batch" in stages:
+            size = max(1, args.ocr_batch)
+            batches = [rois[i:i + size] for i in range(0, len(rois), size)]
+            bench("ocr_batch", ocr.run_batch, [lambda b=b: b for b in batches])
+        if "validate" in stages:
+            bench("validate", ocr._validate_license_plate, [lambda t=t: t for t in RAW_TEXTS])
+
+    for name, backend, async_write in (("db_csv", "csv", False), ("db_sqlite", "sqlite", False),
+                                       ("db_async", "csv", True)):
+        if name not in stages:
+            continue
+        with tempfile.TemporaryDirectory(prefix="lpr_bench_") as tmp:
+            db = DatabaseManager(base_dir=tmp, backend=backend, async_write=async_write,
+                                 max_pending=args.iterations + args.warmup)
+            plates = itertools.cycle(["ABC-1234", "XYZ-5678", "KLA-0021"])
+            bench(name, lambda frame: db.save_record("辨識成功", next(plates), frame, "穩定", 3500.0),
+                  [lambda f=f: f for f in frames])
+            # 非同步模式量測的是 save_record 的排隊延遲；等背景寫完才能刪除暫存資料夾
+            db.close(timeout=60.0)
+            if async_write:
+                results[name]["db_stats"] = db.stats()
+
+    if "scale" in stages:
+        scale = ScaleDriver(simulate=True)
+        bench("scale", lambda _: scale.get_weight(), [lambda: None])
+        scale.close()
+
+    meta = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "backend": args.backend,
+        "model": None if stub else args.model,
+        "input": source,
+        "iterations": args.iterations,
+        "warmup": args.warmup,
+        "ocr_batch": args.ocr_batch,
+        "ocr_cache": args.ocr_cache,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+    }
+    return {"meta": meta, "stages": results}
+
+
+def compare(report, baseline_path, tolerance):
+    """
+    與基準結果比對 p95 延遲
+    Returns: 變慢超過容許值的階段名稱 list
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = []
+    print(f"\n[Benchmark] 與 {baseline_path} (commit {baseline['meta'].get('commit')}) 比對 p95:")
+    for name, now in sorted(report["stages"].items()):
+        old = baseline["stages"].get(name)
+        if old is None or not old.get("p95_ms"):
+            print(f"  {name:<10} {now['p95_ms']:>10.4f} ms  (基準中沒有此階段)")
+            continue
+        ratio = now["p95_ms"] / old["p95_ms"]
+        flag = ""
+        if ratio > 1.0 + tolerance:
+            flag = "  <-- 變慢"
+            regressions.append(name)
+        print(f"  {name:<10} {old['p95_ms']:>10.4f} -> {now['p95_ms']:>10.4f} ms  ({ratio - 1.0:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LPR 各階段效能量測")
+    parser.add_argument("--backend", choices=["stub", "cpu"], default="stub", help="模型後端")
+    parser.add_argument("--model", default="models/best.pt", help="YOLO 模型路徑 (cpu 後端)")
+    parser.add_argument("--images", help="錄下來的照片資料夾 (例如 runs/images)，未指定則使用合成畫面")
+    parser.add_argument("--frames", type=int, default=16, help="最多使用幾張照片 / 合成幾張畫面")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("-n", "--iterations", type=int, default=200, help="每個階段量測的呼叫次數")
+    parser.add_argument("--warmup", type=int, default=10, help="不計入結果的暖機次數")
+    parser.add_argument("--ocr-batch", type=int, default=8, help="OCR 批次大小 (0 代表逐框辨識)")
+    parser.add_argument("--ocr-cache", type=int, default=0,
+                        help="OCR 快取筆數 (預設 0，避免重複的輸入全部命中快取)")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"要量測的階段，逗號分隔: {','.join(STAGES)}")
+    parser.add_argument("--out", default="benchmark.json", help="結果 JSON 路徑")
+    parser.add_argument("--compare", help="基準 JSON，p95 變慢超過 --tolerance 時回傳 1")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="容許的變慢比例 (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"未知的階段: {', '.join(sorted(unknown))}")
+
+    report = run_benchmarks(args, stages)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write("\n")
+    print(f"[Benchmark] 結果已寫入 {args.out}")
+
+    if args.compare:
+        regressions = compare(report, args.compare, args.tolerance)
+        if regressions:
+            print(f"[Benchmark] 變慢超過 {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
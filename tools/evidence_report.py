@@ -0,0 +1,117 @@
+"""
+比較不同證據圖片設定 (modules/evidence.py) 每筆紀錄的大小與編碼時間，用來替每個閘口挑選設定
+
+每個設定以非同步模式的 DatabaseManager 實際寫入一次 (寫到暫存資料夾)，量測：
+    - 每筆紀錄所有證據圖片的大小 (KB)，直接對應 SD 卡寫入量與同步頻寬
+    - 每筆紀錄的編碼時間 (在編碼執行緒中，不影響辨識)
+    - save_record 本身的耗時 (辨識流程實際等待的時間：縮圖、裁切與排隊)
+
+用法 (在專案根目錄執行):
+    python tools/evidence_report.py                                   # 合成畫面，比較所有預設設定
+    python tools/evidence_report.py --images runs/images/2025/02/07   # 使用錄下來的照片
+    python tools/evidence_report.py --profile '{"scene_width": 800, "crop": true, "quality": 70}'
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.database import DatabaseManager
+from modules.evidence import EVIDENCE_PRESETS, EvidenceProfile
+
+
+def plate_box(frame):
+    """沒有偵測器時假設車牌在畫面中央下方 (與 tools/benchmark.py 的 stub 相同)"""
+    h, w = frame.shape[:2]
+    return (w * 3 // 8, h * 5 // 8, w * 5 // 8, h * 3 // 4)
+
+
+def load_frames(images_dir, count):
+    if images_dir:
+        paths = []
+        for ext in ("jpg", "png", "webp"):
+            paths += glob.glob(os.path.join(images_dir, "**", f"*.{ext}"), recursive=True)
+        # 只用現場畫面，略過特寫與地磅照片
+        paths = sorted(p for p in paths if not os.path.basename(p).startswith(("crop_", "scale_")))[:count]
+        frames = [f for f in (cv2.imread(p) for p in paths) if f is not None]
+        if not frames:
+            raise SystemExit(f"[EvidenceReport] {images_dir} 中沒有可讀取的影像")
+        return frames, f"{len(frames)} 張 {images_dir}"
+
+    # 合成畫面：有雜訊與漸層的 1280x720 背景加上一塊白底黑字的車牌 (固定亂數種子)
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        base = np.linspace(40, 200, 1280, dtype=np.uint8)[None, :, None].repeat(720, 0).repeat(3, 2)
+        frame = np.clip(base.astype(np.int16) + rng.integers(-25, 25, base.shape), 0, 255).astype(np.uint8)
+        x1, y1, x2, y2 = plate_box(frame)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (235, 235, 235), -1)
+        cv2.putText(frame, f"ABC-{i:04d}", (x1 + 10, y2 - 20), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (20, 20, 20), 4)
+        frames.append(frame)
+    return frames, f"{count} 張合成畫面 1280x720"
+
+
+def measure(name, profile, frames, workdir):
+    db = DatabaseManager(base_dir=os.path.join(workdir, name), async_write=True, evidence=profile,
+                         max_pending=len(frames) + 1)
+    hot = []
+    for i, frame in enumerate(frames):
+        frame = frame.copy()
+        t0 = time.perf_counter()
+        crop = db.crop_plate(frame, plate_box(frame))
+        db.save_record("辨識成功", f"ABC-{i:04d}", frame, "穩定", 35000.0, plate_crop=crop)
+        hot.append(time.perf_counter() - t0)
+        time.sleep(0.001)  # 讓 ts 不同，檔名不重複
+    db.close(timeout=60.0)
+    stats = db.stats()
+    hot.sort()
+    return {
+        "profile": name,
+        "settings": profile.describe(),
+        "kb_per_record": stats["image_kb_per_record"],
+        "encode_ms_per_record": stats["encode_ms_per_record"],
+        "save_record_p50_ms": round(hot[len(hot) // 2] * 1000, 3),
+        "errors": stats["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較證據圖片設定的大小與編碼時間")
+    parser.add_argument("--images", help="錄下來的照片資料夾 (含子資料夾)")
+    parser.add_argument("--count", type=int, default=50, help="使用幾張畫面")
+    parser.add_argument("--profile", action="append", default=[],
+                        help="額外比較的設定 (JSON，參數見 EvidenceProfile)，可重複指定")
+    parser.add_argument("--out", help="結果另存成 JSON")
+    args = parser.parse_args()
+
+    frames, source = load_frames(args.images, args.count)
+    profiles = [(name, EvidenceProfile.from_config(name)) for name in EVIDENCE_PRESETS]
+    profiles += [(f"custom{i + 1}", EvidenceProfile.from_config(json.loads(p))) for i, p in enumerate(args.profile)]
+
+    workdir = tempfile.mkdtemp(prefix="lpr_evidence_")
+    try:
+        results = [measure(name, profile, frames, workdir) for name, profile in profiles]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n[EvidenceReport] 畫面來源: {source}")
+    print(f"{'設定':<10}{'KB/筆':>10}{'編碼 ms/筆':>14}{'save_record p50 ms':>22}  內容")
+    for r in results:
+        print(f"{r['profile']:<10}{r['kb_per_record']:>10}{r['encode_ms_per_record']:>14}"
+              f"{r['save_record_p50_ms']:>22}  {r['settings']}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"source": source, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"[EvidenceReport] 結果已寫入 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+模擬地磅儀表 (虛擬終端 pty)，不需要實體地磅就能測試 ScaleDriver
+
+建立一組虛擬終端，依劇本 (空磅 -> 上磅 -> 靜止 -> 下磅) 持續輸出儀表格式的重量，
+ScaleDriver 以 port=<印出的路徑>, simulate=False 連線，走的是真正的 Serial 讀取流程
+
+用法 (在專案根目錄執行):
+    python tools/fake_scale.py                       # 印出虛擬終端路徑後持續輸出
+    python -m modules.scale /dev/pts/5               # 另一個終端機連線查看
+
+ScaleDriver 穩定判斷的測試不需要虛擬終端，見 tests/test_scale.py
+"""
+import argparse
+import os
+import random
+import threading
+import time
+import tty
+
+
+# 劇本：(階段名稱, 秒數, 起始重量, 結束重量, 是否靜止)
+def scenario(gross=35000.0, tare=0.0):
+    return [
+        ("empty", 3.0, tare, tare, True),
+        ("loading", 2.0, tare, gross, False),
+        ("stable", 5.0, gross, gross, True),
+        ("leaving", 2.0, gross, tare, False),
+        ("empty", 3.0, tare, tare, True),
+    ]
+
+
+def format_line(weight, stable):
+    """常見的連續輸出格式，例如 "ST,GS,+0035000kg" (US 代表不穩定)"""
+    status = "ST" if stable else "US"
+    sign = "-" if weight < 0 else "+"
+    return f"{status},GS,{sign}{abs(weight):07.0f}kg\r\n".encode("ascii")
+
+
+class FakeIndicator:
+    def __init__(self, rate=10.0, noise=2.0, gross=35000.0, loop=True, garbage=0.0):
+        """
+        Args:
+            rate (float): 每秒輸出幾行
+            noise (float): 重量雜訊 (kg)
+            gross (float): 上磅後的重量
+            loop (bool): 劇本結束後從頭重播
+            garbage (float): 每行插入亂碼的機率 (測試解析容錯)
+        """
+        self.rate = rate
+        self.noise = noise
+        self.steps = scenario(gross)
+        self.loop = loop
+        self.garbage = garbage
+
+        self._master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave
+
+        self.phase = None
+        self.phase_started = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            for name, duration, start, end, still in self.steps:
+                self.phase, self.phase_started = name, time.time()
+                n = max(1, int(duration * self.rate))
+                for i in range(n):
+                    if self._stop_event.is_set():
+                        return
+                    weight = start + (end - start) * (i + 1) / n + random.uniform(-self.noise, self.noise)
+                    line = format_line(weight, still)
+                    if self.garbage and random.random() < self.garbage:
+                        line = bytes(random.getrandbits(8) for _ in range(5)) + line
+                    os.write(self._master, line)
+                    time.sleep(1.0 / self.rate)
+            if not self.loop:
+                self.phase = "done"
+                return
+
+    def close(self):
+        self._stop_event.set()
+        self._thread.join(timeout=2.0)
+        os.close(self._master)
+        os.close(self._slave)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模擬地磅儀表 (虛擬終端)")
+    parser.add_argument("--rate", type=float, default=10.0, help="每秒輸出幾行")
+    parser.add_argument("--noise", type=float, default=2.0, help="重量雜訊 (kg)")
+    parser.add_argument("--gross", type=float, default=35000.0, help="上磅重量 (kg)")
+    parser.add_argument("--garbage", type=float, default=0.0, help="插入亂碼的機率")
+    args = parser.parse_args()
+
+    fake = FakeIndicator(args.rate, args.noise, args.gross, garbage=args.garbage).start()
+    print(f"[FakeScale] 虛擬地磅已啟動: {fake.port} (Ctrl+C 結束)")
+    try:
+        last = None
+        while True:
+            if fake.phase != last:
+                last = fake.phase
+                print(f"[FakeScale] 階段: {last}")
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.close()
+
+
+if __name__ == "__main__":
+    main()
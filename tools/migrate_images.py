@@ -0,0 +1,185 @@
+"""
+把舊版平面結構的圖片 (runs/images/*.jpg) 搬到日期分區 (runs/images/YYYY/MM/DD/)
+
+請先停止辨識系統再執行 (DatabaseManager 執行中會保持 data_log.csv 開啟)
+分區依檔名中的時間戳記 ({plate}_{ts}.jpg / scale_{plate}_{ts}.jpg / crop_{plate}_{ts}.jpg) 決定，與 DatabaseManager 相同；
+CSV (data_log.csv、history/ 的封存) 與 records.db 中的照片路徑用同一規則改寫，因此：
+    - 可以重複執行，已搬過的檔案與路徑不會再動
+    - 中途中斷後再執行一次即可補完
+    - 檔名沒有時間戳記的圖片保留在原處 (清理時仍由 scandir 逐檔檢查)
+
+搬移後的圖片在下次同步時會重送一次，伺服器端以內容雜湊去重，不會多佔空間
+
+用法 (在專案根目錄執行):
+    python tools/migrate_images.py --dry-run
+    python tools/migrate_images.py
+    python tools/migrate_images.py --layout hour
+"""
+import argparse
+import csv
+import glob
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.archive import ARCHIVE_EXT, ArchiveReader, ArchiveWriter
+from modules.database import IMAGE_LAYOUTS, image_partition
+from modules.maintenance import IMAGE_EXTS
+from modules.record_store import FIELD_LABELS
+
+FLAT_PREFIX = "runs/images/"
+PATH_FIELDS = ("plate_image", "scale_image", "plate_crop")
+
+
+def file_timestamp(name):
+    """從 {plate}_{ts}.jpg (或 .webp) 取出時間戳記，沒有則回傳 None"""
+    stem, ext = os.path.splitext(name)
+    if ext.lower() not in IMAGE_EXTS or "_" not in stem:
+        return None
+    ts = stem.rsplit("_", 1)[1]
+    return int(ts) if ts.isdigit() else None
+
+
+def migrated_path(path, layout):
+    """紀錄中的平面路徑 runs/images/x.jpg 對應的分區路徑；不需改寫時回傳 None"""
+    if not path or not path.startswith(FLAT_PREFIX):
+        return None
+    name = path[len(FLAT_PREFIX):]
+    if "/" in name:
+        return None  # 已經在分區中
+    ts = file_timestamp(name)
+    if ts is None:
+        return None
+    return f"{FLAT_PREFIX}{image_partition(ts, layout)}/{name}"
+
+
+def move_images(img_dir, layout, dry_run):
+    moved = kept = 0
+    created = set()
+    with os.scandir(img_dir) as it:
+        entries = [e for e in it if e.is_file()]
+    for entry in entries:
+        ts = file_timestamp(entry.name)
+        if ts is None:
+            kept += 1
+            continue
+        partition = image_partition(ts, layout)
+        dest_dir = os.path.join(img_dir, *partition.split("/"))
+        if not dry_run:
+            if partition not in created:
+                os.makedirs(dest_dir, exist_ok=True)
+            os.rename(entry.path, os.path.join(dest_dir, entry.name))
+        created.add(partition)
+        moved += 1
+    print(f"[Migrate] 圖片: 搬移 {moved} 張到 {len(created)} 個分區，{kept} 個檔案保留原處")
+    return moved
+
+
+def rewrite_csv(path, layout, dry_run):
+    """改寫 CSV 中的照片路徑 (先寫暫存檔再取代，中斷不會留下寫一半的 CSV)"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    if not rows:
+        return 0
+    header = rows[0]
+    columns = [header.index(FIELD_LABELS[name]) for name in PATH_FIELDS if FIELD_LABELS[name] in header]
+    changed = 0
+    for row in rows[1:]:
+        for col in columns:
+            if col < len(row):
+                new = migrated_path(row[col], layout)
+                if new is not None:
+                    row[col] = new
+                    changed += 1
+    if changed and not dry_run:
+        tmp = path + ".migrate.tmp"
+        with open(tmp, "w", newline="", encoding="utf-8-sig") as f:
+            csv.writer(f).writerows(rows)
+        os.replace(tmp, path)
+    print(f"[Migrate] {path}: 改寫 {changed} 個路徑")
+    return changed
+
+
+def rewrite_archive(path, layout, dry_run):
+    """改寫封存檔 (.lpa) 中的照片路徑：逐區塊讀出、改寫後寫成新的封存檔 (索引重新產生)"""
+    reader = ArchiveReader(path)
+    header = reader.header
+    columns = [header.index(FIELD_LABELS[name]) for name in PATH_FIELDS if FIELD_LABELS[name] in header]
+    writer = None if dry_run else ArchiveWriter(path, header)
+    changed = 0
+    try:
+        for row in reader.iter_rows():
+            for col in columns:
+                if col < len(row):
+                    new = migrated_path(row[col], layout)
+                    if new is not None:
+                        row[col] = new
+                        changed += 1
+            if writer is not None:
+                writer.write_row(row)
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is not None:
+        if changed:
+            writer.close()
+        else:
+            writer.abort()
+    print(f"[Migrate] {path}: 改寫 {changed} 個路徑")
+    return changed
+
+
+def rewrite_db(path, layout, dry_run):
+    conn = sqlite3.connect(path)
+    try:
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(records)")}
+        columns = [name for name in PATH_FIELDS if name in existing]
+        where = " OR ".join(f"{name} LIKE 'runs/images/%'" for name in columns)
+        updates = []
+        for row in conn.execute(f"SELECT id, {', '.join(columns)} FROM records WHERE {where}"):
+            new = [migrated_path(value, layout) for value in row[1:]]
+            if any(v is not None for v in new):
+                updates.append([n if n is not None else old for n, old in zip(new, row[1:])] + [row[0]])
+        if updates and not dry_run:
+            with conn:
+                conn.executemany(f"UPDATE records SET {', '.join(f'{name} = ?' for name in columns)} WHERE id = ?",
+                                 updates)
+    finally:
+        conn.close()
+    print(f"[Migrate] {path}: 改寫 {len(updates)} 筆紀錄")
+    return len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="圖片搬移到日期分區")
+    parser.add_argument("--runs", default="runs", help="runs 資料夾路徑")
+    parser.add_argument("--layout", default="day", choices=[k for k in IMAGE_LAYOUTS if k != "flat"],
+                        help="分區方式，需與 DatabaseManager 的 image_layout 相同")
+    parser.add_argument("--dry-run", action="store_true", help="只統計，不實際搬移或改寫")
+    args = parser.parse_args()
+
+    img_dir = os.path.join(args.runs, "images")
+    if not os.path.isdir(img_dir):
+        print(f"[Migrate] 找不到圖片資料夾: {img_dir}")
+        sys.exit(1)
+    if args.dry_run:
+        print("[Migrate] --dry-run：只統計，不會變更任何檔案")
+
+    # 先改寫紀錄再搬圖片：中斷時紀錄指向尚未搬移的路徑，再執行一次即可補完
+    csv_paths = [os.path.join(args.runs, "data_log.csv")]
+    csv_paths += sorted(glob.glob(os.path.join(args.runs, "history", "*.csv")))
+    for path in csv_paths:
+        if os.path.exists(path):
+            rewrite_csv(path, args.layout, args.dry_run)
+    for path in sorted(glob.glob(os.path.join(args.runs, "history", f"*{ARCHIVE_EXT}"))):
+        rewrite_archive(path, args.layout, args.dry_run)
+    db_path = os.path.join(args.runs, "records.db")
+    if os.path.exists(db_path):
+        rewrite_db(db_path, args.layout, args.dry_run)
+    move_images(img_dir, args.layout, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+車牌模糊搜尋 (modules/plate_index.py)：用誤讀的車牌或萬用字元找出進場紀錄
+
+系統執行時每筆紀錄都會增量寫入 runs/plate_index.db；啟用之前的紀錄用 build 補建一次
+(可重複執行，已建過且沒有變更的檔案會略過)
+
+用法 (在專案根目錄執行):
+    python tools/plate_search.py build                   # 建入 data_log.csv、history/ 的封存與 records.db
+    python tools/plate_search.py find ABC1284            # 編輯距離 1 以內 (錯、漏、多一個字)
+    python tools/plate_search.py find ABC1284 -d 2 --since "2025-01-01 00:00:00"
+    python tools/plate_search.py find "ABC-12?4"         # ? 代表任一字元，* 代表任意長度
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.archive import ARCHIVE_EXT
+from modules.plate_index import PlateIndex
+
+
+def build(index, runs):
+    paths = sorted(glob.glob(os.path.join(runs, "history", f"*{ARCHIVE_EXT}")))
+    paths += sorted(glob.glob(os.path.join(runs, "history", "*.csv")))
+    paths.append(os.path.join(runs, "data_log.csv"))
+    total = 0
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        t0 = time.perf_counter()
+        added = index.index_file(path)
+        if added is None:
+            continue
+        total += added
+        print(f"[PlateSearch] {path}: 新增 {added} 筆 ({time.perf_counter() - t0:.2f}s)")
+
+    # SQLite 後端的紀錄
+    db_path = os.path.join(runs, "records.db")
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            cursor = conn.execute("SELECT ts, plate, weight FROM records")
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows:
+                    break
+                total += index.add({"ts": ts, "plate": plate, "weight": weight} for ts, plate, weight in rows)
+        except sqlite3.OperationalError as e:
+            print(f"[PlateSearch] 無法讀取 {db_path}: {e}")
+        finally:
+            conn.close()
+    print(f"[PlateSearch] 建立完成，共新增 {total} 筆；索引統計: {index.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="車牌模糊搜尋")
+    parser.add_argument("--runs", default="runs", help="runs 資料夾路徑")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sub.add_parser("build", help="把既有的紀錄建入索引")
+
+    p_find = sub.add_parser("find", help="搜尋車牌")
+    p_find.add_argument("plate", help="車牌，可含 ? (任一字元) 與 * (任意長度)")
+    p_find.add_argument("-d", "--distance", type=int, default=1, help="允許錯幾個字 (編輯距離)")
+    p_find.add_argument("--since")
+    p_find.add_argument("--until")
+    p_find.add_argument("--limit", type=int, default=50)
+
+    args = parser.parse_args()
+    index = PlateIndex(os.path.join(args.runs, "plate_index.db"))
+    try:
+        if args.cmd == "build":
+            build(index, args.runs)
+
+        elif args.cmd == "find":
+            t0 = time.perf_counter()
+            results = index.search(args.plate, args.distance, args.since, args.until, args.limit)
+            elapsed = time.perf_counter() - t0
+            for r in results:
+                weight = "-" if r["weight"] is None else f"{r['weight']:g} kg"
+                print(f"{r['time']} | {r['plate']:<12} | 差 {r['distance']} 字 | {weight}")
+            print(f"[PlateSearch] {len(results)} 筆 ({elapsed * 1000:.1f} ms)")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
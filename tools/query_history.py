@@ -0,0 +1,144 @@
+"""
+查詢歷史紀錄 (runs/history 的封存檔與目前的 data_log.csv)
+
+封存檔 (.lpa) 檔尾有索引 (時間範圍與車牌 bloom filter)，不符合的檔案與區塊完全不解壓；
+一次只解壓一個區塊並逐列輸出，數年的紀錄在 Jetson 上查詢也只用固定的記憶體
+尚未轉換的舊封存 CSV 仍可查詢 (逐列掃描)，可用 convert 一次轉成封存檔
+
+用法 (在專案根目錄執行):
+    python tools/query_history.py query --plate ABC-1234 --since "2025-01-01 00:00:00"
+    python tools/query_history.py query --since "2025-02-01 00:00:00" --until "2025-02-07 23:59:59" --out feb.csv
+    python tools/query_history.py convert          # 把 history/*.csv 轉成封存檔
+    python tools/query_history.py info             # 各封存檔的筆數、時間範圍與壓縮率
+"""
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.archive import ARCHIVE_EXT, ArchiveReader, iter_csv_rows
+from modules.maintenance import DataMaintenance
+from modules.record_store import FIELDS, FIELD_LABELS, LABEL_FIELDS, TIME_FORMAT, to_timestamp
+
+
+def history_files(runs, include_current=True):
+    history = os.path.join(runs, "history")
+    paths = sorted(glob.glob(os.path.join(history, f"*{ARCHIVE_EXT}")) + glob.glob(os.path.join(history, "*.csv")))
+    current = os.path.join(runs, "data_log.csv")
+    if include_current and os.path.exists(current):
+        paths.append(current)
+    return paths
+
+
+def query(paths, plate, since, until, stats):
+    """
+    依序產生符合條件的紀錄 (dict：欄位名稱 -> 字串)
+    封存檔先以索引判斷，整個檔案不可能符合時不讀取任何區塊
+    """
+    for path in paths:
+        stats["files"] += 1
+        if path.endswith(ARCHIVE_EXT):
+            try:
+                reader = ArchiveReader(path)
+            except (OSError, ValueError) as e:
+                print(f"[History] 略過無法讀取的封存檔 {path}: {e}", file=sys.stderr)
+                continue
+            if not reader.may_contain(plate, since, until):
+                stats["files_pruned"] += 1
+                continue
+            header, rows = reader.header, reader.iter_rows(plate, since, until, stats)
+        else:
+            stats["files_scanned"] += 1
+            header, rows = iter_csv_rows(path, plate, since, until)
+        names = [LABEL_FIELDS.get(label.strip()) for label in header]
+        for row in rows:
+            yield {name: value for name, value in zip(names, row) if name}
+
+
+def cmd_query(args):
+    since = to_timestamp(args.since)
+    until = to_timestamp(args.until)
+    plate = args.plate.strip().upper() if args.plate else None
+    fields = args.fields.split(",") if args.fields else [name for name, _, _ in FIELDS]
+    unknown = [name for name in fields if name not in FIELD_LABELS]
+    if unknown:
+        raise SystemExit(f"[History] 不認得的欄位: {unknown}")
+
+    stats = {"files": 0, "files_pruned": 0, "files_scanned": 0, "blocks_read": 0, "blocks_skipped": 0}
+    out = open(args.out, "w", newline="", encoding="utf-8-sig") if args.out else sys.stdout
+    t0 = time.perf_counter()
+    count = 0
+    try:
+        writer = csv.writer(out)
+        writer.writerow([FIELD_LABELS[name] for name in fields])
+        for rec in query(history_files(args.runs, not args.no_current), plate, since, until, stats):
+            writer.writerow([rec.get(name, "") for name in fields])
+            count += 1
+            if args.limit and count >= args.limit:
+                break
+    finally:
+        if args.out:
+            out.close()
+    print(f"[History] {count} 筆符合 ({time.perf_counter() - t0:.2f}s)；檔案 {stats['files']} 個，"
+          f"索引排除 {stats['files_pruned']} 個，逐列掃描的 CSV {stats['files_scanned']} 個；"
+          f"區塊讀取 {stats['blocks_read']} / 略過 {stats['blocks_skipped']}", file=sys.stderr)
+
+
+def cmd_convert(args):
+    cleaner = DataMaintenance(img_dir=os.path.join(args.runs, "images"), csv_path=os.path.join(args.runs, "data_log.csv"),
+                              archive_dir=os.path.join(args.runs, "history"))
+    paths = sorted(glob.glob(os.path.join(args.runs, "history", "*.csv")))
+    if not paths:
+        print("[History] 沒有需要轉換的 CSV")
+    for path in paths:
+        cleaner.compress_archive(path)
+
+
+def cmd_info(args):
+    def fmt(ts):
+        return datetime.fromtimestamp(ts).strftime(TIME_FORMAT) if ts is not None else "-"
+
+    total_rows = total_raw = total_size = 0
+    for path in history_files(args.runs, include_current=False):
+        size = os.path.getsize(path)
+        if not path.endswith(ARCHIVE_EXT):
+            print(f"{os.path.basename(path)}: 尚未轉換的 CSV ({size / 1024:.0f} KB)")
+            continue
+        index = ArchiveReader(path).index
+        total_rows += index["rows"]
+        total_raw += index["raw_bytes"]
+        total_size += size
+        print(f"{os.path.basename(path)}: {index['rows']} 筆，{index['plates']} 個車牌，"
+              f"{fmt(index['t_min'])} ~ {fmt(index['t_max'])}，{len(index['blocks'])} 個區塊，"
+              f"{index['raw_bytes'] / 1024:.0f} KB -> {size / 1024:.0f} KB")
+    if total_size:
+        print(f"[History] 封存檔合計 {total_rows} 筆，{total_raw / 2**20:.1f} MB -> {total_size / 2**20:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查詢歷史紀錄")
+    parser.add_argument("--runs", default="runs", help="runs 資料夾路徑")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_query = sub.add_parser("query", help="依車牌與時間查詢 (輸出 CSV)")
+    p_query.add_argument("--plate")
+    p_query.add_argument("--since")
+    p_query.add_argument("--until")
+    p_query.add_argument("--fields", help="輸出欄位 (逗號分隔，例如 time,plate,weight)，預設全部")
+    p_query.add_argument("--limit", type=int)
+    p_query.add_argument("--out", help="輸出到檔案 (預設印在螢幕上)")
+    p_query.add_argument("--no-current", action="store_true", help="不查詢目前的 data_log.csv")
+
+    sub.add_parser("convert", help="把 history/*.csv 轉成有索引的封存檔")
+    sub.add_parser("info", help="列出封存檔的索引資訊")
+
+    args = parser.parse_args()
+    {"query": cmd_query, "convert": cmd_convert, "info": cmd_info}[args.cmd](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+SQLite 紀錄資料庫工具
+
+用法 (在專案根目錄執行):
+    python tools/record_db.py import                     # 匯入 runs/data_log.csv 與 runs/history/ 的封存
+    python tools/record_db.py export out.csv --since "2025-02-01 00:00:00"   # 舊版 CSV 欄位
+    python tools/record_db.py export out.csv --all-fields                    # 含車道、方向、空重等欄位
+    python tools/record_db.py plate ABC1234              # 查詢某車牌的進場紀錄
+    python tools/record_db.py weight --since "2025-02-07 00:00:00"
+"""
+import argparse
+import glob
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.archive import ARCHIVE_EXT, ArchiveReader
+from modules.record_store import SqliteRecordStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 紀錄資料庫工具")
+    parser.add_argument("--runs", default="runs", help="runs 資料夾路徑")
+    parser.add_argument("--db", default=None, help="資料庫路徑 (預設 runs/records.db)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sub.add_parser("import", help="匯入既有的 CSV 紀錄")
+
+    p_export = sub.add_parser("export", help="匯出成 CSV")
+    p_export.add_argument("out")
+    p_export.add_argument("--since")
+    p_export.add_argument("--until")
+    p_export.add_argument("--all-fields", action="store_true", help="匯出所有欄位 (預設只有舊版 CSV 的欄位)")
+
+    p_plate = sub.add_parser("plate", help="依車牌查詢")
+    p_plate.add_argument("plate")
+    p_plate.add_argument("--limit", type=int, default=20)
+
+    p_weight = sub.add_parser("weight", help="計算時間區間內的總重量")
+    p_weight.add_argument("--since")
+    p_weight.add_argument("--until")
+
+    args = parser.parse_args()
+    store = SqliteRecordStore(args.db or os.path.join(args.runs, "records.db"))
+
+    try:
+        if args.cmd == "import":
+            paths = [os.path.join(args.runs, "data_log.csv")]
+            paths += sorted(glob.glob(os.path.join(args.runs, "history", "*.csv")))
+            total = 0
+            for path in paths:
+                if os.path.exists(path):
+                    total += store.import_csv(path)
+            for path in sorted(glob.glob(os.path.join(args.runs, "history", f"*{ARCHIVE_EXT}"))):
+                reader = ArchiveReader(path)
+                inserted = store.import_rows(reader.header, reader.iter_rows())
+                print(f"[RecordDB] 已匯入 {path}: 新增 {inserted} 筆")
+                total += inserted
+            print(f"[RecordDB] 匯入完成，共新增 {total} 筆")
+
+        elif args.cmd == "export":
+            store.export_csv(args.out, args.since, args.until, fields="all" if args.all_fields else None)
+
+        elif args.cmd == "plate":
+            for rec in store.query_by_plate(args.plate, args.limit):
+                print(f"{rec['time']} | {rec['plate']} | {rec['weight']} kg | {rec['plate_image']}")
+
+        elif args.cmd == "weight":
+            print(f"[RecordDB] 總重量: {store.total_weight(args.since, args.until)} kg")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+地磅儀表原始輸出的錄製、重播與解析器 (modules/scale_protocol.py) 的效能量測
+
+用法 (在專案根目錄執行):
+    python tools/scale_capture.py --record /dev/ttyUSB0 --seconds 30 --out capture.bin
+    python tools/scale_capture.py --replay capture.bin --protocol toledo
+    python tools/scale_capture.py --bench                 # 各格式每秒可解析幾框
+
+新儀表上線時先 --record 錄下原始位元組，再以 --replay 確認解析結果，
+最後把代表性的片段與預期結果加進 tests/scale_corpus/cases.json (python -m pytest 重播比對)
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.scale_protocol import StreamParser
+
+# 效能量測用的範例框
+SAMPLES = {
+    "csv": ({}, b"ST,GS,+0035000kg\r\n"),
+    "stx_etx": ({}, b"\x02ST+0035000kg\x03"),
+    "toledo": ({"checksum": False}, b"\x02\x22\x30\x20035000000000\r"),
+}
+
+
+def bench(frames=100000, chunk_size=64):
+    for name, (options, sample) in SAMPLES.items():
+        data = sample * frames
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        parser = StreamParser(name, **options)
+        t0 = time.perf_counter()
+        count = 0
+        for chunk in chunks:
+            count += len(parser.feed(chunk))
+        elapsed = time.perf_counter() - t0
+        print(f"[ScaleProtocol] {name:<8} {count / elapsed:>10.0f} 框/秒 ({count} 框, 每段 {chunk_size} bytes)")
+
+
+def record(port, baud, seconds, out):
+    import serial
+    ser = serial.Serial(port, baud, timeout=0.2)
+    deadline = time.monotonic() + seconds
+    total = 0
+    with open(out, "wb") as f:
+        while time.monotonic() < deadline:
+            data = ser.read(ser.in_waiting or 1)
+            if data:
+                f.write(data)
+                total += len(data)
+    ser.close()
+    print(f"[ScaleProtocol] 已錄製 {total} bytes 至 {out}")
+
+
+def replay_file(path, protocol):
+    parser = StreamParser(protocol)
+    with open(path, "rb") as f:
+        # 以 Serial 常見的小段大小餵入
+        while True:
+            chunk = f.read(32)
+            if not chunk:
+                break
+            for frame in parser.feed(chunk):
+                print(frame)
+    print(f"[ScaleProtocol] {parser.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="地磅儀表原始輸出的錄製與重播")
+    parser.add_argument("--bench", action="store_true", help="量測解析速度")
+    parser.add_argument("--record", metavar="PORT", help="從 Serial Port 錄下原始位元組")
+    parser.add_argument("--baud", type=int, default=9600)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--out", default="capture.bin")
+    parser.add_argument("--replay", metavar="FILE", help="解析錄下來的原始位元組")
+    parser.add_argument("--protocol", default="csv")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.baud, args.seconds, args.out)
+    elif args.replay:
+        replay_file(args.replay, args.protocol)
+    elif args.bench:
+        bench()
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()